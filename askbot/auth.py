@@ -9,7 +9,10 @@ User.assert_can...
 """
 import datetime
 from django.db import transaction
+from django.db.models import F
+from askbot import const
 from askbot.models import Repute
+from askbot.models import daily_counters
 #from askbot.models import Answer
 from askbot.models import signals
 from askbot.conf import settings as askbot_settings
@@ -255,76 +258,126 @@ def onAnswerAcceptCanceled(answer, user, timestamp=None):
                reputation=user.reputation)
     reputation.save()
 
+###########################################
+## votes - the score of the post and the reputation
+## are changed with UPDATE queries of the changed columns,
+## so that the concurrent votes are not lost
+###########################################
+def get_question(post):
+    if post.post_type == 'question':
+        return post
+    return post.thread._question_post()
+
+def change_post_votes(post, score_delta, up_delta = 0, down_delta = 0):
+    """adds the deltas to the score and the vote counts of the post,
+    the vote counts do not go below zero, the score of the question
+    is also changed on the thread
+
+    the post object is refreshed with the values from the database
+    """
+    from askbot.models import Post, Thread
+    posts = Post.objects.filter(id = post.id)
+    changes = {'score': F('score') + score_delta}
+    if up_delta:
+        changes['vote_up_count'] = F('vote_up_count') + up_delta
+        if up_delta < 0:
+            posts = posts.filter(vote_up_count__gte = -up_delta)
+    if down_delta:
+        changes['vote_down_count'] = F('vote_down_count') + down_delta
+        if down_delta < 0:
+            posts = posts.filter(vote_down_count__gte = -down_delta)
+    if posts.update(**changes) == 0:
+        #the vote count is already zero, only the score is changed
+        Post.objects.filter(id = post.id).update(score = F('score') + score_delta)
+    if post.post_type == 'question':
+        Thread.objects.filter(
+                    id = post.thread_id
+                ).update(score = F('score') + score_delta)
+
+    post.score, post.vote_up_count, post.vote_down_count = \
+        Post.objects.filter(id = post.id).values_list(
+            'score', 'vote_up_count', 'vote_down_count'
+        )[0]
+
+def change_reputation(user_id, delta):
+    """adds delta to the reputation of the user, the reputation
+    does not go below the minimum, returns the new reputation"""
+    from askbot.models import User
+    users = User.objects.filter(id = user_id)
+    if delta >= 0:
+        users.update(reputation = F('reputation') + delta)
+    elif users.filter(
+                reputation__gt = -delta
+            ).update(reputation = F('reputation') + delta) == 0:
+        users.filter(
+                reputation__lte = -delta
+            ).update(reputation = const.MIN_REPUTATION)
+    return users.values_list('reputation', flat = True)[0]
+
+def record_reputation_change(user_id, delta, question, timestamp, reputation_type):
+    """changes the reputation and saves the record of the change"""
+    reputation = change_reputation(user_id, delta)
+    if delta > 0:
+        amounts = {'positive': delta}
+    else:
+        amounts = {'negative': delta}
+    Repute(
+        user_id = user_id,
+        question = question,
+        reputed_at = timestamp,
+        reputation_type = reputation_type,
+        reputation = reputation,
+        **amounts
+    ).save()
+    return reputation
+
 @transaction.commit_on_success
 def onUpVoted(vote, post, user, timestamp=None):
     if timestamp is None:
         timestamp = datetime.datetime.now()
     vote.save()
 
-    if post.post_type != 'comment':
-        post.vote_up_count = int(post.vote_up_count) + 1
-    post.score = int(post.score) + 1
-    post.save()
-
     if post.post_type == 'comment':
+        change_post_votes(post, 1)
         #reputation is not affected by the comment votes
         return
 
+    change_post_votes(post, 1, up_delta = 1)
+
     if not (post.wiki or post.is_anonymous):
-        author = post.author
-        todays_rep_gain = Repute.objects.get_reputation_by_upvoted_today(author)
-        if todays_rep_gain <  askbot_settings.MAX_REP_GAIN_PER_USER_PER_DAY:
-            author.receive_reputation(
-                askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE
+        gain = askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE
+        #upvote reputation per day is limited
+        within_limit = daily_counters.add_within_limit(
+                            'upvote_reputation',
+                            post.author_id,
+                            gain,
+                            askbot_settings.MAX_REP_GAIN_PER_USER_PER_DAY
+                        )
+        if within_limit:
+            record_reputation_change(
+                post.author_id, gain, get_question(post), timestamp, 1
             )
-            author.save()
-
-            question = post.thread._question_post() # TODO: this is suboptimal if post is already a question
-
-            reputation = Repute(user=author,
-                       positive=askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE,
-                       question=question,
-                       reputed_at=timestamp,
-                       reputation_type=1,
-                       reputation=author.reputation)
-            reputation.save()
 
 @transaction.commit_on_success
 def onUpVotedCanceled(vote, post, user, timestamp=None):
     if timestamp is None:
         timestamp = datetime.datetime.now()
     vote.delete()
-
-    if post.post_type != 'comment':
-        post.vote_up_count = int(post.vote_up_count) - 1
-        if post.vote_up_count < 0:
-            post.vote_up_count  = 0
-
-    post.score = int(post.score) - 1
-    post.save()
+    daily_counters.uncount_vote(vote)
 
     if post.post_type == 'comment':
+        change_post_votes(post, -1)
         #comment votes do not affect reputation
         return
 
-    if not (post.wiki or post.is_anonymous):
-        author = post.author
-        author.receive_reputation(
-            askbot_settings.REP_LOSS_FOR_RECEIVING_UPVOTE_CANCELATION
-        )
-        author.save()
-
-        question = post.thread._question_post() # TODO: this is suboptimal if post is already a question
+    change_post_votes(post, -1, up_delta = -1)
 
-        reputation = Repute(
-            user=author,
-            negative=askbot_settings.REP_LOSS_FOR_RECEIVING_UPVOTE_CANCELATION,
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=-8,
-            reputation=author.reputation
+    if not (post.wiki or post.is_anonymous):
+        loss = askbot_settings.REP_LOSS_FOR_RECEIVING_UPVOTE_CANCELATION
+        record_reputation_change(
+            post.author_id, loss, get_question(post), timestamp, -8
         )
-        reputation.save()
+        daily_counters.change_counter('upvote_reputation', post.author_id, loss)
 
 @transaction.commit_on_success
 def onDownVoted(vote, post, user, timestamp=None):
@@ -332,76 +385,47 @@ def onDownVoted(vote, post, user, timestamp=None):
         timestamp = datetime.datetime.now()
     vote.save()
 
-    post.vote_down_count = int(post.vote_down_count) + 1
-    post.score = int(post.score) - 1
-    post.save()
+    change_post_votes(post, -1, down_delta = 1)
 
     if not (post.wiki or post.is_anonymous):
-        author = post.author
-        author.receive_reputation(askbot_settings.REP_LOSS_FOR_DOWNVOTING)
-        author.save()
-
-        question = post.thread._question_post() # TODO: this is suboptimal if post is already a question
-
-        reputation = Repute(user=author,
-                   negative=askbot_settings.REP_LOSS_FOR_DOWNVOTING,
-                   question=question,
-                   reputed_at=timestamp,
-                   reputation_type=-3,
-                   reputation=author.reputation)
-        reputation.save()
-
-        user.receive_reputation(
-            askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE
+        question = get_question(post)
+        record_reputation_change(
+            post.author_id,
+            askbot_settings.REP_LOSS_FOR_DOWNVOTING,
+            question,
+            timestamp,
+            -3
+        )
+        user.reputation = record_reputation_change(
+            user.id,
+            askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE,
+            question,
+            timestamp,
+            -5
         )
-        user.save()
-
-        reputation = Repute(user=user,
-                   negative=askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE,
-                   question=question,
-                   reputed_at=timestamp,
-                   reputation_type=-5,
-                   reputation=user.reputation)
-        reputation.save()
 
 @transaction.commit_on_success
 def onDownVotedCanceled(vote, post, user, timestamp=None):
     if timestamp is None:
         timestamp = datetime.datetime.now()
     vote.delete()
+    daily_counters.uncount_vote(vote)
 
-    post.vote_down_count = int(post.vote_down_count) - 1
-    if post.vote_down_count < 0:
-        post.vote_down_count  = 0
-    post.score = post.score + 1
-    post.save()
+    change_post_votes(post, 1, down_delta = -1)
 
     if not (post.wiki or post.is_anonymous):
-        author = post.author
-        author.receive_reputation(
-            askbot_settings.REP_GAIN_FOR_RECEIVING_DOWNVOTE_CANCELATION
+        question = get_question(post)
+        record_reputation_change(
+            post.author_id,
+            askbot_settings.REP_GAIN_FOR_RECEIVING_DOWNVOTE_CANCELATION,
+            question,
+            timestamp,
+            4
+        )
+        user.reputation = record_reputation_change(
+            user.id,
+            askbot_settings.REP_GAIN_FOR_CANCELING_DOWNVOTE,
+            question,
+            timestamp,
+            5
         )
-        author.save()
-
-        question = post.thread._question_post() # TODO: this is suboptimal if post is already a question
-
-        reputation = Repute(user=author,
-                positive=\
-                    askbot_settings.REP_GAIN_FOR_RECEIVING_DOWNVOTE_CANCELATION,
-                question=question,
-                reputed_at=timestamp,
-                reputation_type=4,
-                reputation=author.reputation
-            )
-        reputation.save()
-
-        user.receive_reputation(askbot_settings.REP_GAIN_FOR_CANCELING_DOWNVOTE)
-        user.save()
-
-        reputation = Repute(user=user,
-                   positive=askbot_settings.REP_GAIN_FOR_CANCELING_DOWNVOTE,
-                   question=question,
-                   reputed_at=timestamp,
-                   reputation_type=5,
-                   reputation=user.reputation)
-        reputation.save()
@@ -19,12 +19,27 @@ for the most part, so actual values are reliably available only
 at run time
 
 askbot.deps.livesettings is a module developed for satchmo project
+
+Values of all settings are read from a snapshot kept in the
+process, the snapshot is replaced when the version stamp
+in the cache changes. The stamp is changed when any setting
+is updated, other processes check it at most once in
+``ASKBOT_LIVESETTINGS_CHECK_INTERVAL`` seconds (5 by default).
 """
+import time
+import uuid
+from django.conf import settings as django_settings
 from django.core.cache import cache
 from askbot.deps.livesettings import SortedDotDict, config_register
 from askbot.deps.livesettings.functions import config_get
 from askbot.deps.livesettings import signals
 
+SETTINGS_KEY = 'askbot-livesettings'
+VERSION_KEY = 'askbot-livesettings-version'
+
+def get_check_interval():
+    return getattr(django_settings, 'ASKBOT_LIVESETTINGS_CHECK_INTERVAL', 5)
+
 class ConfigSettings(object):
     """A very simple Singleton wrapper for settings
     a limitation is that all settings names using this class
@@ -33,6 +48,11 @@ class ConfigSettings(object):
     """
     __instance = None
     __group_map = {}
+    #dictionary of all values, it is replaced
+    #as a whole and must not be modified
+    __snapshot = None
+    __snapshot_version = None
+    __snapshot_checked_at = 0
 
     def __init__(self):
         """assigns SortedDotDict to self.__instance if not set"""
@@ -47,6 +67,14 @@ class ConfigSettings(object):
         will be required in code to convert an app
         depending on django.conf.settings to askbot.deps.livesettings
         """
+        snapshot = self.get_snapshot()
+        if key in snapshot:
+            return snapshot[key]
+        return self.get_stored_value(key)
+
+    def get_stored_value(self, key):
+        """returns value read from livesettings,
+        bypassing the snapshot"""
         return getattr(self.__instance, key).value
 
     def get_default(self, key):
@@ -81,14 +109,36 @@ class ConfigSettings(object):
         if key not in self.__instance:
             self.__instance[key] = config_register(value)
             self.__group_map[key] = group_key
+            #snapshot will be reloaded with the new setting
+            ConfigSettings.__snapshot = None
 
     def as_dict(self):
-        settings = cache.get('askbot-livesettings')
-        if settings:
-            return settings
-        else:
-            self.prime_cache()
-            return cache.get('askbot-livesettings')
+        """returns a copy of the dictionary of all values"""
+        return dict(self.get_snapshot())
+
+    @classmethod
+    def get_snapshot(cls):
+        """returns dictionary of all values, the dictionary
+        is reloaded when the version stamp in the cache changes"""
+        now = time.time()
+        if cls.__snapshot is not None \
+            and now - cls.__snapshot_checked_at < get_check_interval():
+            return cls.__snapshot
+
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            #stamp expired from the cache or was never set
+            cache.add(VERSION_KEY, uuid.uuid4().hex)
+            version = cache.get(VERSION_KEY)
+
+        if cls.__snapshot is None or version != cls.__snapshot_version:
+            values = cache.get(SETTINGS_KEY)
+            if values is None or len(values) < len(cls.__instance):
+                values = cls.prime_cache()
+            cls.__snapshot = values
+            cls.__snapshot_version = version
+        cls.__snapshot_checked_at = now
+        return cls.__snapshot
 
     @classmethod
     def prime_cache(cls, **kwargs):
@@ -98,9 +148,23 @@ class ConfigSettings(object):
         for key in cls.__instance.keys():
             #todo: this is odd that I could not use self.__instance.items() mapping here
             out[key] = cls.__instance[key].value
-        cache.set('askbot-livesettings', out)
+        cache.set(SETTINGS_KEY, out)
+        return out
+
+    @classmethod
+    def bump_version(cls, **kwargs):
+        """called when a setting is changed, makes all
+        processes reload the values"""
+        cls.prime_cache()
+        cache.set(VERSION_KEY, uuid.uuid4().hex)
+        cls.reset_snapshot()
+
+    @classmethod
+    def reset_snapshot(cls):
+        """values will be reloaded on the next read"""
+        cls.__snapshot = None
 
 
-signals.configuration_value_changed.connect(ConfigSettings.prime_cache)
+signals.configuration_value_changed.connect(ConfigSettings.bump_version)
 #settings instance to be used elsewhere in the project
 settings = ConfigSettings()
@@ -0,0 +1,266 @@
+"""Streaming loader of the xml files of the StackExchange dump
+into the stackexchange tables
+
+* the xml is parsed incrementally with ``iterparse`` and every
+  parsed row is cleared, so memory use does not grow with
+  the size of the file
+* field converters are looked up once per table
+  (see ``parse_models.get_converter``)
+* rows are inserted with ``executemany`` in chunks of
+  ``chunk_size`` rows and the transaction is committed
+  after every chunk
+* rows whose ids are already in the table (placeholders created
+  for forward references, or rows loaded from a repeated file)
+  are updated, as ``Model.save()`` would do
+* foreign keys to missing objects get empty placeholder
+  objects, the same as in ``parse_models.parse_value``
+* after every chunk the number of loaded rows is written
+  into the checkpoint file, so that an interrupted load
+  is resumed after the last committed chunk
+"""
+import os
+import sys
+import time
+try:
+    from xml.etree import cElementTree as et
+except ImportError:
+    from xml.etree import ElementTree as et
+from django.db import models, transaction
+from django.db.models import fields
+from django.utils import simplejson
+import askbot.importers.stackexchange.parse_models as se_parser
+from askbot.utils.console import print_action
+from askbot.utils.db import bulk_insert, bulk_update
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class Checkpoint(object):
+    """progress of the import stored in a json file:
+
+    * ``loaded_rows`` - number of committed rows per xml file key
+    * ``loaded_files`` - keys of the completely loaded xml files
+    * ``transfer_started`` - True once the data is being
+      transferred into the askbot tables
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = {
+            'loaded_rows': {},
+            'loaded_files': [],
+            'transfer_started': False
+        }
+        if path and os.path.isfile(path):
+            self.data.update(simplejson.load(open(path)))
+
+    def save(self):
+        if not self.path:
+            return
+        temp_path = self.path + '.tmp'
+        temp_file = open(temp_path, 'w')
+        simplejson.dump(self.data, temp_file)
+        temp_file.close()
+        os.rename(temp_path, self.path)
+
+    def is_file_loaded(self, key):
+        return key in self.data['loaded_files']
+
+    def get_loaded_rows(self, key):
+        return self.data['loaded_rows'].get(key, 0)
+
+    def set_loaded_rows(self, key, count):
+        self.data['loaded_rows'][key] = count
+        self.save()
+
+    def set_file_loaded(self, key):
+        self.data['loaded_files'].append(key)
+        self.save()
+
+    def is_transfer_started(self):
+        return self.data['transfer_started']
+
+    def set_transfer_started(self):
+        self.data['transfer_started'] = True
+        self.save()
+
+
+class TableLoader(object):
+    """loads rows of one xml file into the table of the model"""
+
+    def __init__(self, model, chunk_size = DEFAULT_CHUNK_SIZE):
+        self.model = model
+        self.chunk_size = chunk_size
+        opts = model._meta
+        #auto primary keys are left to the database
+        self.fields = [
+            field for field in opts.fields
+            if not isinstance(field, fields.AutoField)
+        ]
+        self.field_names = [field.name for field in self.fields]
+        self.field_positions = dict(
+            (name, position) for position, name in enumerate(self.field_names)
+        )
+        if isinstance(opts.pk, fields.AutoField):
+            self.pk_position = None
+        else:
+            self.pk_position = self.field_positions[opts.pk.name]
+        #positions of the foreign keys and the related models
+        self.foreign_keys = [
+            (self.field_positions[field.name], field.rel.to)
+            for field in self.fields
+            if isinstance(field, models.ForeignKey)
+        ]
+        #xml tag -> (position, converter), None for unknown tags
+        self.columns = dict()
+        #model -> set of ids in the table
+        self.known_ids = dict()
+
+    def get_column(self, tag):
+        """returns position and converter of the column
+        or ``None`` if the model has no such field"""
+        if tag not in self.columns:
+            field_name = se_parser.parse_field_name(tag)
+            if field_name in self.field_positions:
+                field = self.fields[self.field_positions[field_name]]
+                self.columns[tag] = (
+                    self.field_positions[field_name],
+                    se_parser.get_converter(field)
+                )
+            else:
+                print u"Warning: %s has no field named '%s'" % (
+                                        self.model.__name__,
+                                        field_name
+                                    )
+                self.columns[tag] = None
+        return self.columns[tag]
+
+    def get_known_ids(self, model):
+        if model not in self.known_ids:
+            self.known_ids[model] = set(
+                model.objects.values_list('id', flat = True)
+            )
+        return self.known_ids[model]
+
+    def parse_row(self, element):
+        row = [None] * len(self.fields)
+        for col in element:
+            column = self.get_column(col.tag)
+            if column is not None:
+                position, convert = column
+                row[position] = convert(col.text)
+        return row
+
+    def flush(self, rows):
+        """saves the rows, placeholders of the missing
+        related objects are inserted first"""
+        placeholders = dict()
+        inserted = list()
+        updated = list()
+        for row in rows:
+            for position, related_model in self.foreign_keys:
+                related_id = row[position]
+                if related_id is None:
+                    continue
+                known_ids = self.get_known_ids(related_model)
+                if related_id not in known_ids:
+                    known_ids.add(related_id)
+                    placeholders.setdefault(related_model, list()).append(
+                                                                (related_id,)
+                                                            )
+            if self.pk_position is None:
+                inserted.append(row)
+                continue
+            known_ids = self.get_known_ids(self.model)
+            row_id = row[self.pk_position]
+            if row_id in known_ids:
+                updated.append(
+                    row[:self.pk_position] + row[self.pk_position + 1:] + [row_id]
+                )
+            else:
+                known_ids.add(row_id)
+                inserted.append(row)
+
+        for related_model, ids in placeholders.items():
+            bulk_insert(related_model, ('id',), ids)
+        bulk_insert(self.model, self.field_names, inserted)
+        if updated:
+            updated_names = list(self.field_names)
+            del updated_names[self.pk_position]
+            bulk_update(self.model, updated_names, updated)
+
+    def load(self, xml_file, skip_rows = 0, chunk_callback = None):
+        """loads rows from the file object, the first ``skip_rows``
+        rows are skipped, the transaction is committed after
+        every chunk, then ``chunk_callback`` is called
+        with the number of rows read so far
+
+        returns number of rows read"""
+        count = 0
+        rows = list()
+        context = iter(et.iterparse(xml_file, events = ('start', 'end')))
+        event, root = context.next()
+        for event, element in context:
+            if event != 'end' or element.tag != 'row':
+                continue
+            count += 1
+            if count > skip_rows:
+                rows.append(self.parse_row(element))
+            #parsed rows are dropped from the tree
+            element.clear()
+            root.clear()
+            if len(rows) == self.chunk_size:
+                self.flush(rows)
+                transaction.commit()
+                rows = list()
+                if chunk_callback:
+                    chunk_callback(count)
+        self.flush(rows)
+        transaction.commit()
+        if chunk_callback:
+            chunk_callback(count)
+        return count
+
+
+def load_xml_file(
+        dump, item, key, checkpoint, chunk_size = DEFAULT_CHUNK_SIZE
+    ):
+    """loads the xml file of the ``item`` from the zip file ``dump``
+    into the stackexchange table, resuming after the rows
+    recorded in the checkpoint under the ``key``"""
+    xml_path = item + '.xml'
+    table_name = se_parser.get_table_name(item)
+    model = models.get_model('stackexchange', table_name)
+    loader = TableLoader(model, chunk_size = chunk_size)
+
+    skip_rows = checkpoint.get_loaded_rows(key)
+    start = time.time()
+
+    def report_progress(count):
+        checkpoint.set_loaded_rows(key, count)
+        loaded = count - skip_rows
+        print_action(
+            '%s: %d rows, %.0f rows/s' % (
+                                xml_path,
+                                loaded,
+                                loaded / max(time.time() - start, 0.001)
+                            )
+        )
+
+    print 'loading from %s to %s' % (xml_path, table_name),
+    if skip_rows:
+        print '(resuming after row %d)' % skip_rows,
+    sys.stdout.flush()
+    count = loader.load(
+                    dump.open(xml_path),
+                    skip_rows = skip_rows,
+                    chunk_callback = report_progress
+                )
+    checkpoint.set_file_loaded(key)
+    elapsed = time.time() - start
+    loaded = max(count - skip_rows, 0)
+    print '... %d objects saved in %.1f seconds (%.0f rows/s)' % (
+                                    loaded,
+                                    elapsed,
+                                    loaded / max(elapsed, 0.001)
+                                )
+    sys.stdout.flush()
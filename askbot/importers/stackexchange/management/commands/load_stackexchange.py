@@ -6,12 +6,11 @@ import sys
 from unidecode import unidecode
 import zipfile
 from datetime import datetime
+from optparse import make_option
 from django.core.management.base import BaseCommand, CommandError
 import askbot.importers.stackexchange.parse_models as se_parser
-from xml.etree import ElementTree as et
-from django.db.models import fields
+from askbot.importers.stackexchange import bulk_loader
 from django.db.utils import IntegrityError
-from django.db import models
 import askbot.models as askbot
 import askbot.deps.django_authopenid.models as askbot_openid
 import askbot.importers.stackexchange.models as se
@@ -283,6 +282,31 @@ class Command(BaseCommand):
     help = 'Loads StackExchange data from unzipped directory of XML files into the ASKBOT database'
     args = 'se_dump_dir'
 
+    option_list = BaseCommand.option_list + (
+            make_option('--chunk-size',
+                action='store',
+                type='int',
+                dest='chunk_size',
+                default=bulk_loader.DEFAULT_CHUNK_SIZE,
+                help='Number of rows inserted and committed at once'
+                ),
+            make_option('--checkpoint',
+                action='store',
+                type='string',
+                dest='checkpoint',
+                default=None,
+                help='Path of the checkpoint file, '
+                    'by default the path of the dump with .checkpoint added'
+                ),
+            make_option('--resume',
+                action='store_true',
+                dest='resume',
+                default=False,
+                help='Continue the interrupted loading of the xml files '
+                    'from the checkpoint'
+                ),
+            )
+
     @transaction.commit_manually
     def handle(self, *arg, **kwarg):
 
@@ -300,16 +324,31 @@ class Command(BaseCommand):
             raise CommandError('Error: first argument must be a zip file with the SE forum data')
 
         self.zipfile = self.open_dump(arg[0]) 
+
+        checkpoint_path = kwarg['checkpoint'] or arg[0] + '.checkpoint'
+        if not kwarg['resume'] and os.path.isfile(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.checkpoint = bulk_loader.Checkpoint(checkpoint_path)
+        if self.checkpoint.is_transfer_started():
+            raise CommandError(
+                'The import was interrupted after the transfer of data '
+                'into the askbot tables had started, it cannot be resumed.\n'
+                'Please restore the database and run the import again.'
+            )
+        self.chunk_size = kwarg['chunk_size']
+
         #read the data into SE tables
-        for item in xml_read_order:
+        for index, item in enumerate(xml_read_order):
             time_before = datetime.now()
-            self.load_xml_file(item)
+            self.load_xml_file(item, '%d-%s' % (index, item))
             transaction.commit()
             time_after = datetime.now()
             if DEBUGME == True:
                 print time_after - time_before
                 print HEAP.heap()
 
+        self.checkpoint.set_transfer_started()
+
         #this is important so that when we clean up messages
         #automatically generated by the procedures below
         #we do not delete old messages
@@ -366,6 +405,7 @@ class Command(BaseCommand):
         transaction.commit()
         self.transfer_meta_pages()
         transaction.commit()
+        os.remove(checkpoint_path)
         print 'done.'
 
     def open_dump(self, path):
@@ -813,34 +853,20 @@ class Command(BaseCommand):
         #so we can't do this
         pass
 
-    def load_xml_file(self, item):
-        """read data from the zip file for the item
+    def load_xml_file(self, item, key):
+        """read data from the zip file for the item,
+        ``key`` identifies the item in the checkpoint
         """
-        xml_path = self.get_xml_path(item)
-        table_name = self.get_table_name(item)
-
-        xml_data = self.zipfile.read(xml_path)
-
-        tree = et.fromstring(xml_data)
-        print 'loading from %s to %s' % (xml_path, table_name) ,
-        model = models.get_model('stackexchange', table_name)
-        i = 0
-        for row in tree.findall('.//row'):
-            model_entry = model()
-            i += 1
-            for col in row.getchildren():
-                field_name = se_parser.parse_field_name(col.tag)
-                try:
-                    field_type = model._meta.get_field(field_name)
-                except fields.FieldDoesNotExist, e:
-                    print u"Warning: %s" % unicode(e)
-                    continue
-                field_value = se_parser.parse_value(col.text, field_type)
-                setattr(model_entry, field_name, field_value)
-            model_entry.save()
-            #transaction.commit()
-        print '... %d objects saved' % i
-        sys.stdout.flush()
+        if self.checkpoint.is_file_loaded(key):
+            print 'skipping %s, loaded before' % self.get_xml_path(item)
+            return
+        bulk_loader.load_xml_file(
+                        self.zipfile,
+                        item,
+                        key,
+                        self.checkpoint,
+                        chunk_size = self.chunk_size
+                    )
 
     def get_table_name(self, xml_file_basename):
         return se_parser.get_table_name(xml_file_basename)
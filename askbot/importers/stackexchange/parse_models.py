@@ -177,10 +177,7 @@ def parse_field_name(input):
 
 def parse_value(input, field_object):
     if isinstance(field_object, models.ForeignKey):
-        try:
-            id = int(input)
-        except:
-            raise Exception('non-numeric foreign key %s' % input)
+        id = parse_foreign_key(input)
         related_model = field_object.rel.to
         try:
             return related_model.objects.get(id=id)
@@ -188,26 +185,58 @@ def parse_value(input, field_object):
             obj = related_model(id=id)
             obj.save()#save fake empty object
             return obj
+    return get_converter(field_object)(input)
+
+def parse_foreign_key(input):
+    try:
+        return int(input)
+    except:
+        raise Exception('non-numeric foreign key %s' % input)
+
+def parse_integer(input):
+    try:
+        return int(input)
+    except:
+        raise Exception('expected integer, found %s' % input)
+
+def parse_text(input):
+    return input
+
+def parse_boolean(input):
+    try:
+        return bool(input)
+    except:
+        raise Exception('boolean value expected %s found' % input)
+
+def parse_datetime(input):
+    input = time_re.sub('', input)
+    try:
+        return datetime.strptime(input, date_time_format)
+    except:
+        raise Exception('datetime expected "%s" found' % input)
+
+def parse_unsupported(input):
+    return None
+
+def get_converter(field_object):
+    """returns function converting the text of the xml
+    element into the value of the field, the foreign keys
+    are converted into the ids of the related objects
+
+    the converter is looked up once per field, so that
+    the type checks are not repeated for every row
+    """
+    if isinstance(field_object, models.ForeignKey):
+        return parse_foreign_key
     elif isinstance(field_object, models.IntegerField):
-        try:
-            return int(input)
-        except:
-            raise Exception('expected integer, found %s' % input)
-    elif isinstance(field_object, models.CharField):
-        return input
-    elif isinstance(field_object, models.TextField):
-        return input
+        return parse_integer
+    elif isinstance(field_object, (models.CharField, models.TextField)):
+        return parse_text
     elif isinstance(field_object, models.BooleanField):
-        try:
-            return bool(input)
-        except:
-            raise Exception('boolean value expected %s found' % input)
+        return parse_boolean
     elif isinstance(field_object, models.DateTimeField):
-        input = time_re.sub('', input)
-        try:
-            return datetime.strptime(input, date_time_format)
-        except:
-            raise Exception('datetime expected "%s" found' % input)
+        return parse_datetime
+    return parse_unsupported
 
 print 'from django.db import models'
 for file in sys.argv:
@@ -0,0 +1,554 @@
+"""Bulk import of the zendesk users and posts into askbot
+
+The regular import creates every user and post through the
+askbot api, so each row runs the full chain of signal handlers.
+The bulk import (``import_zendesk --bulk``) works differently:
+
+* username collisions are resolved against one in-memory set
+  of the existing usernames, instead of one query per attempt
+* primary keys of the new users, threads, posts, revisions
+  and activities are assigned by the importer, starting after
+  the largest id in the table, so that the rows are linked
+  before they are saved; the rows are inserted with
+  ``executemany`` and the transaction is committed after
+  every batch
+* no signals are sent - html and summaries of the posts,
+  tag use counts, email subscriptions of the new users,
+  the timeline, the tag index, profile tag usage and
+  similar threads are updated by one rebuild pass at the end
+  (see ``BulkImporter.rebuild``)
+* imported posts are history, so no notifications are sent,
+  no mentions are recorded and the response counts
+  are not changed, permissions of the authors are not checked
+
+Nothing else may write to the askbot tables while the bulk
+import runs, because the importer assigns the primary keys.
+"""
+import hashlib
+import itertools
+from django.conf import settings as django_settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils.html import strip_tags
+from askbot import const
+from askbot import models as askbot_models
+from askbot.conf import settings as askbot_settings
+from askbot.importers.zendesk import models as zendesk_models
+from askbot.models import profile_stats, timeline
+from askbot.models.tag import recount_use_counts
+from askbot.search import similarity, tag_index
+from askbot.utils import console, markup
+from askbot.utils.db import bulk_insert, bulk_insert_objects, bulk_update
+from askbot.utils.html import unescape
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class UsernameSet(object):
+    """usernames of the existing users, compared case
+    insensitively, because some databases compare them so"""
+
+    def __init__(self):
+        usernames = askbot_models.User.objects.values_list(
+                                                    'username', flat = True
+                                                )
+        self.names = set([name.lower() for name in usernames.iterator()])
+
+    def add(self, name):
+        self.names.add(name.lower())
+
+    def get_unique_username(self, name_seed):
+        """returns unique user name, by modifying the
+        name if the same name is taken, until
+        the modified name is unique
+        """
+        original_name = name_seed
+        attempt_no = 1
+        while name_seed.lower() in self.names:
+            name_seed = original_name + str(attempt_no)
+            attempt_no += 1
+        return name_seed
+
+    def clean_username(self, name_seed):
+        """makes sure that the name is unique
+        and is no longer than 30 characters"""
+        username = self.get_unique_username(name_seed)
+        if len(username) > 30:
+            username = self.get_unique_username(username[:28])
+            if len(username) > 30:
+                #will allow about a million extra possible unique names
+                username = self.get_unique_username(username[:24])
+        return username
+
+
+class IdSequence(object):
+    """primary keys for the new rows of the model,
+    ``first_id`` is the id of the first new row"""
+
+    def __init__(self, model):
+        max_id = model._base_manager.aggregate(models.Max('id'))['id__max']
+        self.first_id = (max_id or 0) + 1
+        self.next_id = self.first_id
+
+    def get_next(self):
+        next_id = self.next_id
+        self.next_id += 1
+        return next_id
+
+
+class ContentBatch(object):
+    """new rows of a batch of threads"""
+
+    def __init__(self):
+        self.tags = list()
+        self.threads = list()
+        self.thread_tags = list()
+        self.posts = list()
+        self.revisions = list()
+        self.activities = list()
+        self.zendesk_post_ids = list()
+
+    def save(self):
+        bulk_insert_objects(self.tags)
+        bulk_insert_objects(self.threads)
+        bulk_insert(
+            askbot_models.Thread.tags.through,
+            ('thread', 'tag'),
+            self.thread_tags
+        )
+        bulk_insert_objects(self.posts)
+        bulk_insert_objects(self.revisions)
+        bulk_insert_objects(self.activities)
+        zendesk_models.Post.objects.filter(
+                                id__in = self.zendesk_post_ids
+                            ).update(is_processed = True)
+
+
+class BulkImporter(object):
+    """imports the zendesk users and posts
+    from the zendesk tables, the methods must be called
+    in the order: ``import_users``, ``import_content``, ``rebuild``
+    """
+
+    def __init__(self, batch_size = DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.user_ids = IdSequence(askbot_models.User)
+        self.tag_ids = IdSequence(askbot_models.Tag)
+        self.thread_ids = IdSequence(askbot_models.Thread)
+        self.post_ids = IdSequence(askbot_models.Post)
+        self.revision_ids = IdSequence(askbot_models.PostRevision)
+        self.activity_ids = IdSequence(askbot_models.Activity)
+        self.post_content_type = ContentType.objects.get_for_model(
+                                                    askbot_models.Post
+                                                )
+        #tag name -> tag id
+        self.tags = dict()
+
+    def reset_sequences(self):
+        """the database sequences must continue
+        after the ids assigned by the importer"""
+        imported_models = (
+            askbot_models.User, askbot_models.Tag, askbot_models.Thread,
+            askbot_models.Post, askbot_models.PostRevision,
+            askbot_models.Activity
+        )
+        cursor = connection.cursor()
+        for sql in connection.ops.sequence_reset_sql(no_style(), imported_models):
+            cursor.execute(sql)
+
+    def build_user(self, zd_user, usernames):
+        """returns unsaved askbot user for the zendesk user
+        or ``None`` if the username cannot be made unique"""
+        #special treatment for the user name
+        raw_username = unescape(zd_user.name)
+        username = usernames.clean_username(raw_username)
+        if len(username) > 30:#nearly impossible skip such user
+            print "Warning: could not import user %s" % raw_username
+            return None
+        usernames.add(username)
+
+        if zd_user.email is None:
+            email = ''
+        else:
+            email = zd_user.email
+
+        return askbot_models.User(
+            id = self.user_ids.get_next(),
+            email = email,
+            email_isvalid = zd_user.is_verified,
+            date_joined = zd_user.created_at,
+            last_seen = zd_user.created_at,#add initial date for now
+            username = username,
+            is_active = zd_user.is_active,
+            gravatar = hashlib.md5(email.strip().lower()).hexdigest()
+        )
+
+    @transaction.commit_manually
+    def import_users(self):
+        """creates askbot users for the zendesk users
+        whose emails are not yet known, records the askbot
+        user ids in the zendesk user table"""
+        usernames = UsernameSet()
+        user_ids_by_email = dict(
+            askbot_models.User.objects.exclude(
+                                    email = ''
+                                ).values_list(
+                                    'email', 'id'
+                                ).iterator()
+        )
+
+        known_associations = None
+        if 'askbot.deps.django_authopenid' in django_settings.INSTALLED_APPS:
+            from askbot.deps.django_authopenid.models import UserAssociation
+            known_associations = set()
+            rows = UserAssociation.objects.values_list(
+                                    'user', 'openid_url', 'provider_name'
+                                )
+            for user_id, openid_url, provider_name in rows.iterator():
+                known_associations.add((user_id, provider_name))
+                known_associations.add((openid_url, provider_name))
+
+        added_users = 0
+        last_id = 0
+        zd_users = zendesk_models.User.objects.order_by('id')
+        while True:
+            chunk = list(zd_users.filter(id__gt = last_id)[:self.batch_size])
+            if len(chunk) == 0:
+                break
+            last_id = chunk[-1].id
+            added_users += self.import_user_chunk(
+                                        chunk,
+                                        usernames,
+                                        user_ids_by_email,
+                                        known_associations
+                                    )
+            transaction.commit()
+            console.print_action('%d users added' % added_users)
+
+        self.reset_sequences()
+        transaction.commit()
+        console.print_action('%d users added' % added_users, nowipe = True)
+
+    def import_user_chunk(
+            self, zd_users, usernames, user_ids_by_email, known_associations
+        ):
+        """saves the new askbot users and the links of the zendesk
+        users to the askbot users, returns number of the new users
+
+        ``known_associations`` - set of the tuples
+        ``(user id, provider name)`` and ``(openid url, provider name)``
+        of the saved openid associations, ``None`` if the
+        associations are not imported
+        """
+        if known_associations is not None:
+            from askbot.deps.django_authopenid.models import UserAssociation
+            from askbot.deps.django_authopenid.util import get_provider_name
+
+        added_users = 0
+        new_users = list()
+        associations = list()
+        zd_user_links = list()
+        for zd_user in zd_users:
+            #if email is blank, just create a new user
+            #else only create new askbot user if email
+            #is not yet in the database
+            ab_user_id = None
+            if zd_user.email:
+                ab_user_id = user_ids_by_email.get(zd_user.email, None)
+            if ab_user_id is None:
+                ab_user = self.build_user(zd_user, usernames)
+                if ab_user is None:
+                    continue
+                new_users.append(ab_user)
+                ab_user_id = ab_user.id
+                if zd_user.email:
+                    user_ids_by_email[zd_user.email] = ab_user_id
+                added_users += 1
+            zd_user_links.append((ab_user_id, zd_user.id))
+
+            if zd_user.openid_url != None and known_associations is not None:
+                provider_name = get_provider_name(zd_user.openid_url)
+                user_key = (ab_user_id, provider_name)
+                url_key = (zd_user.openid_url, provider_name)
+                #associations breaking the unique constraints are dropped
+                if user_key not in known_associations \
+                    and url_key not in known_associations:
+                    known_associations.add(user_key)
+                    known_associations.add(url_key)
+                    associations.append(
+                        UserAssociation(
+                            user_id = ab_user_id,
+                            openid_url = zd_user.openid_url,
+                            provider_name = provider_name
+                        )
+                    )
+
+        bulk_insert_objects(new_users)
+        bulk_insert_objects(associations)
+        bulk_update(zendesk_models.User, ('askbot_user_id',), zd_user_links)
+        return added_users
+
+    def get_tag_id(self, tag_name, author_id, batch):
+        """returns id of the tag, the new tag is added
+        to the batch, with the ``author_id`` as the creator"""
+        if tag_name not in self.tags:
+            tag_ids = askbot_models.Tag.objects.filter(
+                                            name = tag_name
+                                        ).values_list('id', flat = True)
+            if len(tag_ids) == 1:
+                self.tags[tag_name] = tag_ids[0]
+            else:
+                tag = askbot_models.Tag(
+                            id = self.tag_ids.get_next(),
+                            name = tag_name,
+                            created_by_id = author_id
+                        )
+                batch.tags.append(tag)
+                self.tags[tag_name] = tag.id
+        return self.tags[tag_name]
+
+    def add_post(
+            self, batch, thread, zd_post, author_id, question_id = None
+        ):
+        """adds the question (when ``question_id`` is not given)
+        or the answer to the batch, with the first revision
+        and the activity record,
+        html and summary are filled in by ``rebuild``
+        """
+        added_at = zd_post.created_at
+        text = zd_post.get_body_text()
+        post = askbot_models.Post(
+                    id = self.post_ids.get_next(),
+                    thread_id = thread.id,
+                    author_id = author_id,
+                    added_at = added_at,
+                    text = text,
+                    html = ''
+                )
+        revision = askbot_models.PostRevision(
+                    id = self.revision_ids.get_next(),
+                    post_id = post.id,
+                    revision = 1,
+                    author_id = author_id,
+                    revised_at = added_at,
+                    summary = const.POST_STATUS['default_version'],
+                    text = text
+                )
+        activity = askbot_models.Activity(
+                    id = self.activity_ids.get_next(),
+                    user_id = author_id,
+                    active_at = added_at,
+                    content_type = self.post_content_type,
+                    object_id = post.id
+                )
+        if question_id is None:
+            if post.text == '':#a hack to allow bodyless question
+                post.text = revision.text = ' '
+            post.post_type = 'question'
+            revision.revision_type = askbot_models.PostRevision.QUESTION_REVISION
+            revision.title = thread.title
+            revision.tagnames = thread.tagnames
+            activity.activity_type = const.TYPE_ACTIVITY_ASK_QUESTION
+            activity.question_id = post.id
+        else:
+            post.post_type = 'answer'
+            revision.revision_type = askbot_models.PostRevision.ANSWER_REVISION
+            activity.activity_type = const.TYPE_ACTIVITY_ANSWER
+            activity.question_id = question_id
+        batch.posts.append(post)
+        batch.revisions.append(revision)
+        batch.activities.append(activity)
+        return post
+
+    def add_thread(self, zd_posts, author_ids, batch):
+        """adds the thread of the zendesk posts to the batch,
+        the first post is the question"""
+        batch.zendesk_post_ids.extend([zd_post.id for zd_post in zd_posts])
+        posts = list()
+        for zd_post in zd_posts:
+            author_id = author_ids.get(zd_post.user_id, None)
+            if author_id is None:
+                print "Warning: post %d dropped: author is not imported" % \
+                                                            zd_post.post_id
+                if len(posts) == 0:
+                    #the question is dropped with its answers
+                    return
+                continue
+            posts.append((zd_post, author_id))
+
+        question_post, question_author_id = posts[0]
+        tag_name = question_post.get_tag_name()
+        last_post, last_author_id = posts[-1]
+        thread = askbot_models.Thread(
+                        id = self.thread_ids.get_next(),
+                        title = question_post.get_fake_title(),
+                        tagnames = tag_name,
+                        answer_count = len(posts) - 1,
+                        last_activity_at = last_post.created_at,
+                        last_activity_by_id = last_author_id,
+                        added_at = question_post.created_at
+                    )
+        batch.threads.append(thread)
+        batch.thread_tags.append(
+            (thread.id, self.get_tag_id(tag_name, question_author_id, batch))
+        )
+        question = self.add_post(
+                            batch, thread, question_post, question_author_id
+                        )
+        for answer_post, author_id in posts[1:]:
+            self.add_post(
+                batch, thread, answer_post, author_id,
+                question_id = question.id
+            )
+
+    @transaction.commit_manually
+    def import_content(self):
+        """creates the threads from the zendesk posts,
+        posts with the same entry id make one thread"""
+        author_ids = dict(
+            zendesk_models.User.objects.exclude(
+                                askbot_user_id = None
+                            ).values_list(
+                                'user_id', 'askbot_user_id'
+                            ).iterator()
+        )
+        entry_ids = list(
+            zendesk_models.Post.objects.values_list(
+                                    'entry_id', flat = True
+                                ).distinct()
+        )
+        threads_posted = 0
+        for start in xrange(0, len(entry_ids), self.batch_size):
+            batch = ContentBatch()
+            zd_posts = zendesk_models.Post.objects.filter(
+                                entry_id__in = entry_ids[start:start + self.batch_size]
+                            ).order_by('entry_id', 'created_at')
+            thread_posts = itertools.groupby(
+                                list(zd_posts),
+                                lambda zd_post: zd_post.entry_id
+                            )
+            for entry_id, zd_thread_posts in thread_posts:
+                self.add_thread(list(zd_thread_posts), author_ids, batch)
+            batch.save()
+            transaction.commit()
+            threads_posted += len(batch.threads)
+            console.print_action(str(threads_posted))
+
+        self.reset_sequences()
+        transaction.commit()
+        console.print_action(str(threads_posted), nowipe = True)
+
+    def render_posts(self):
+        """renders html and summaries of the imported posts,
+        the summaries of their activities are the snippets
+        of the html, as the regular post creation makes them"""
+        posts = askbot_models.Post.objects.filter(
+                                    id__gte = self.post_ids.first_id
+                                ).order_by('id').values_list('id', 'text')
+        activities = askbot_models.Activity.objects.filter(
+                                    id__gte = self.activity_ids.first_id,
+                                    content_type = self.post_content_type
+                                )
+        done = 0
+        last_id = 0
+        while True:
+            chunk = list(posts.filter(id__gt = last_id)[:self.batch_size])
+            if len(chunk) == 0:
+                break
+            post_ids = [post_id for post_id, text in chunk]
+            activity_ids = dict(
+                activities.filter(
+                            object_id__in = post_ids
+                        ).values_list('object_id', 'id')
+            )
+            html_by_text = markup.markdown_to_html_many(
+                                    set([text for post_id, text in chunk])
+                                )
+            post_rows = list()
+            activity_rows = list()
+            for post_id, text in chunk:
+                html = html_by_text[text]
+                summary = strip_tags(html)[:120]
+                post_rows.append((html, summary, post_id))
+                if post_id in activity_ids:
+                    activity_rows.append(
+                        (summary + ' ...', activity_ids[post_id])
+                    )
+            bulk_update(askbot_models.Post, ('html', 'summary'), post_rows)
+            bulk_update(askbot_models.Activity, ('summary',), activity_rows)
+            done += len(chunk)
+            last_id = chunk[-1][0]
+            console.print_action('%d posts' % done)
+        console.print_action('%d posts' % done, nowipe = True)
+
+    def update_tags(self):
+        """undeletes the tags of the imported threads
+        and recounts their use, returns their names"""
+        thread_tags = askbot_models.Thread.tags.through.objects
+        tag_ids = list(
+            thread_tags.filter(
+                        thread__gte = self.thread_ids.first_id
+                    ).values_list(
+                        'tag', flat = True
+                    ).distinct()
+        )
+        tags = askbot_models.Tag.objects.filter(id__in = tag_ids)
+        tags.update(deleted = False, deleted_by = None, deleted_at = None)
+        recount_use_counts(tag_ids)
+        return list(tags.values_list('name', flat = True))
+
+    def add_subscriptions(self):
+        """adds the default email subscriptions of the new users"""
+        from askbot import forms#need to avoid circular dependency
+        form = forms.EditUserEmailFeedsForm()
+        frequencies = list()
+        for feed_type in form.get_db_model_subscription_type_names():
+            attr_key = 'DEFAULT_NOTIFICATION_DELIVERY_SCHEDULE_%s' % feed_type.upper()
+            frequencies.append((feed_type, getattr(askbot_settings, attr_key)))
+
+        user_ids = list(
+            askbot_models.User.objects.filter(
+                                id__gte = self.user_ids.first_id
+                            ).values_list('id', flat = True)
+        )
+        for start in xrange(0, len(user_ids), self.batch_size):
+            bulk_insert_objects([
+                askbot_models.EmailFeedSetting(
+                    subscriber_id = user_id,
+                    feed_type = feed_type,
+                    frequency = frequency
+                )
+                for user_id in user_ids[start:start + self.batch_size]
+                for feed_type, frequency in frequencies
+            ])
+
+    def update_profile_tag_usage(self):
+        """recounts tag usage of the users who had profile statistics
+        before the import, the others are counted when
+        their profiles are shown"""
+        user_ids = list(
+            askbot_models.ProfileStats.objects.filter(
+                        user__posts__id__gte = self.post_ids.first_id
+                    ).values_list(
+                        'user', flat = True
+                    ).distinct()
+        )
+        for start in xrange(0, len(user_ids), self.batch_size):
+            profile_stats.update_tag_usage(
+                                user_ids[start:start + self.batch_size]
+                            )
+
+    def rebuild(self):
+        """updates the data normally maintained by the signal
+        handlers, for all imported rows at once"""
+        print "Rendering posts: "
+        self.render_posts()
+        print "Updating tags, subscriptions and profiles"
+        tag_names = self.update_tags()
+        self.add_subscriptions()
+        self.update_profile_tag_usage()
+        timeline.rebuild(first_activity_id = self.activity_ids.first_id)
+        tag_index.rebuild(tag_names = tag_names)
+        print "Computing similar threads: "
+        similarity.rebuild()
@@ -5,6 +5,9 @@ with all the .xml files.
 Run this command as::
 
     python manage.py import_zendesk path/to/dump.tgz
+
+With the option ``--bulk`` users and posts are inserted in batches,
+see :mod:`askbot.importers.zendesk.bulk`.
 """
 import os
 import re
@@ -12,6 +15,7 @@ import sys
 import tarfile
 import tempfile
 from datetime import datetime, date
+from optparse import make_option
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.db import transaction
@@ -20,6 +24,7 @@ from askbot import models as askbot_models
 from askbot.utils import console
 from askbot.utils.html import unescape
 
+from askbot.importers.zendesk import bulk
 from askbot.importers.zendesk import models as zendesk_models
 
 #a hack, did not know how to parse timezone offset
@@ -143,6 +148,23 @@ def get_val(elem, field_name):
         return raw_val
 
 class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+            make_option('--bulk',
+                action = 'store_true',
+                dest = 'bulk',
+                default = False,
+                help = 'Insert users and posts in batches and update '
+                    'the derived data in one pass at the end'
+                ),
+            make_option('--batch-size',
+                type = 'int',
+                dest = 'batch_size',
+                default = bulk.DEFAULT_BATCH_SIZE,
+                help = 'Number of users or threads inserted at once '
+                    'with --bulk'
+                ),
+            )
+
     def handle(self, *args, **kwargs):
         if len(args) != 1:
             raise CommandError('please provide path to tarred and gzipped cnprog dump')
@@ -156,6 +178,15 @@ class Command(BaseCommand):
         #sys.stdout.write('Reading forums.xml: ')
         #self.read_forums()
 
+        if kwargs['bulk']:
+            importer = bulk.BulkImporter(batch_size = kwargs['batch_size'])
+            sys.stdout.write("Importing user accounts: ")
+            importer.import_users()
+            sys.stdout.write("Loading threads: ")
+            importer.import_content()
+            importer.rebuild()
+            return
+
         sys.stdout.write("Importing user accounts: ")
         self.import_users()
         sys.stdout.write("Loading threads: ")
@@ -264,7 +295,7 @@ class Command(BaseCommand):
             #if email is blank, just create a new user
             if zd_user.email == '':
                 ab_user = create_askbot_user(zd_user)
-                if ab_user in None:
+                if ab_user is None:
                     print 'Warning: could not create user %s ' % zd_user.name
                     continue
                 console.print_action(ab_user.username)
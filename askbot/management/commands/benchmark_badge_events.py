@@ -0,0 +1,67 @@
+"""counts database queries made by the badge checks
+of the answer upvote event, with the badge counters
+turned off and on
+
+database changes (badge awards) are rolled back
+"""
+from optparse import make_option
+from django.conf import settings as django_settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection, transaction
+from askbot import models
+from askbot.models.badges import award_badges_signal
+
+def count_queries(event, actor, post, repeat):
+    """returns average number of queries per event"""
+    query_count = len(connection.queries)
+    for i in xrange(repeat):
+        award_badges_signal.send(None,
+                        event = event,
+                        actor = actor,
+                        context_object = post
+                    )
+    return float(len(connection.queries) - query_count) / repeat
+
+class Command(NoArgsCommand):
+    help = 'Counts database queries per badge event with ' + \
+            'and without the badge counters'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--events',
+                action='store',
+                type='int',
+                dest='events',
+                default=100,
+                help='Number of events to send'
+                ),
+            )
+
+    @transaction.commit_manually
+    def handle_noargs(self, **options):
+        answers = models.Post.objects.get_answers().order_by('-id')
+        if answers.count() == 0:
+            raise CommandError('There are no answers to vote for')
+        answer = answers[0]
+        voters = models.User.objects.exclude(id = answer.author_id)
+        if voters.count() == 0:
+            raise CommandError('There are no users to vote')
+        voter = voters[0]
+
+        repeat = options['events']
+        debug = django_settings.DEBUG
+        use_counters = getattr(django_settings, 'ASKBOT_BADGE_COUNTERS', True)
+        #queries are only recorded in the debug mode
+        django_settings.DEBUG = True
+        try:
+            django_settings.ASKBOT_BADGE_COUNTERS = False
+            before = count_queries('upvote_answer', voter, answer, repeat)
+            django_settings.ASKBOT_BADGE_COUNTERS = True
+            after = count_queries('upvote_answer', voter, answer, repeat)
+        finally:
+            django_settings.DEBUG = debug
+            django_settings.ASKBOT_BADGE_COUNTERS = use_counters
+            transaction.rollback()
+
+        print 'Sent %d upvote_answer events for answer %d' % (repeat, answer.id)
+        print 'queries per event without counters: %.1f' % before
+        print 'queries per event with counters: %.1f' % after
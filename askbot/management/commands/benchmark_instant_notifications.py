@@ -0,0 +1,106 @@
+"""measures throughput of the instant notification emails
+about a new question, the messages are delivered to a
+dummy smtp server running in this process
+
+database changes (reply addresses) are rolled back
+"""
+import asyncore
+import itertools
+import smtpd
+import threading
+import time
+from optparse import make_option
+from django.core import mail as django_mail
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import transaction
+from askbot import const
+from askbot import models
+
+
+class CountingSMTPServer(smtpd.SMTPServer):
+    """smtp server that only counts the received messages"""
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None)
+        self.message_count = 0
+
+    def get_port(self):
+        return self.socket.getsockname()[1]
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        self.message_count += 1
+
+
+class Command(NoArgsCommand):
+    help = 'Measures number of instant notification emails ' + \
+            'about a question sent per second'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--recipients',
+                action='store',
+                type='int',
+                dest='recipients',
+                default=10000,
+                help='Number of notification recipients, ' + \
+                    'existing users are repeated to reach this number'
+                ),
+            make_option('--question-id',
+                action='store',
+                type='int',
+                dest='question_id',
+                default=None,
+                help='Id of the question post, the latest one by default'
+                ),
+            )
+
+    @transaction.commit_manually
+    def handle_noargs(self, **options):
+        questions = models.Post.objects.get_questions().order_by('-id')
+        if options['question_id']:
+            questions = questions.filter(id = options['question_id'])
+        if questions.count() == 0:
+            raise CommandError('There are no questions to notify about')
+        question = questions[0]
+
+        users = list(models.User.objects.all()[:options['recipients']])
+        recipients = list(
+            itertools.islice(itertools.cycle(users), options['recipients'])
+        )
+        activity = models.Activity(
+                        user = question.author,
+                        activity_type = const.TYPE_ACTIVITY_ASK_QUESTION
+                    )
+
+        server = CountingSMTPServer()
+        server_thread = threading.Thread(
+                                target = asyncore.loop,
+                                kwargs = {'timeout': 0.1}
+                            )
+        server_thread.daemon = True
+        server_thread.start()
+        connection = django_mail.get_connection(
+                        'django.core.mail.backends.smtp.EmailBackend',
+                        host = '127.0.0.1',
+                        port = server.get_port(),
+                        username = '',
+                        password = '',
+                        use_tls = False
+                    )
+        try:
+            start = time.time()
+            models.send_instant_notifications_about_activity_in_post(
+                                    update_activity = activity,
+                                    post = question,
+                                    recipients = recipients,
+                                    connection = connection
+                                )
+            elapsed = time.time() - start
+        finally:
+            transaction.rollback()
+            server.close()
+
+        print 'Sent %d notifications (%d received by the smtp server) in %.2fs' % (
+                                                len(recipients),
+                                                server.message_count,
+                                                elapsed
+                                            )
+        print '%.1f emails per second' % (server.message_count / elapsed)
@@ -0,0 +1,71 @@
+"""measures time of the @mention resolution
+for the texts of growing size, time per kilobyte
+of text should stay flat when the resolution is linear
+"""
+import random
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from askbot.models import User
+from askbot.utils import markup
+
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'e-mail@example.com')
+
+def get_authors(count):
+    """returns list of unsaved users with similar usernames"""
+    return [
+        User(id = number + 1, username = 'user%d' % number)
+        for number in xrange(count)
+    ]
+
+def get_text(authors, kilobytes):
+    """returns text of about ``kilobytes`` size where about
+    one word in five is an @mention, some of them unknown"""
+    words = list()
+    size = 0
+    while size < kilobytes * 1024:
+        if random.randint(0, 4) == 0:
+            author = random.choice(authors)
+            word = '@' + random.choice((author.username, 'nobody'))
+        else:
+            word = random.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return ' '.join(words)
+
+class Command(NoArgsCommand):
+    help = 'Measures time of the @mention resolution per kilobyte of text'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--authors',
+                action='store',
+                type='int',
+                dest='authors',
+                default=200,
+                help='Number of the anticipated authors'
+                ),
+            make_option('--max-size',
+                action='store',
+                type='int',
+                dest='max_size',
+                default=256,
+                help='Size of the largest text in kilobytes'
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        authors = get_authors(options['authors'])
+        print 'Resolving @mentions of %d anticipated authors' % len(authors)
+        kilobytes = 1
+        while kilobytes <= options['max_size']:
+            text = get_text(authors, kilobytes)
+            start = time.time()
+            mentioned_authors, output = markup.mentionize_text(text, authors)
+            elapsed = time.time() - start
+            print '%6dKB %6d mentions %10.2fms %8.3fms/KB' % (
+                                                kilobytes,
+                                                len(mentioned_authors),
+                                                1000 * elapsed,
+                                                1000 * elapsed / kilobytes
+                                            )
+            kilobytes *= 4
@@ -0,0 +1,144 @@
+"""measures rendering of the permission template filters
+for all posts and comments of the largest thread:
+
+* with the permission assertions called for every filter,
+  as the filters used to do
+* with a new permission matrix for every filter,
+  as outside of the requests
+* with one permission matrix for the whole rendering,
+  as within a request
+"""
+import time
+from optparse import make_option
+from django.conf import settings as django_settings
+from django.core import exceptions
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from askbot import models
+from askbot.models import permissions
+from askbot.skins.loaders import get_skin
+
+TEMPLATE = """{% for post in posts %}
+{{ user|can_edit_post(post) }}{{ user|can_delete_post(post) }}
+{% if post.post_type == 'comment' %}
+{{ user|can_edit_comment(post) }}{{ user|can_delete_comment(post) }}
+{% else %}
+{{ user|can_flag_offensive(post) }}{{ user|can_remove_flag_offensive(post) }}
+{{ user|can_remove_all_flags_offensive(post) }}{{ user|can_post_comment(post) }}
+{% endif %}
+{% if post.post_type == 'question' %}
+{{ user|can_retag_question(post) }}{{ user|can_close_question(post) }}
+{{ user|can_reopen_question(post) }}
+{% endif %}
+{% if post.post_type == 'answer' %}{{ user|can_accept_best_answer(post) }}{% endif %}
+{% endfor %}"""
+
+#assertion, post types
+ASSERTIONS = (
+    ('assert_can_edit_post', ('question', 'answer', 'comment')),
+    ('assert_can_delete_post', ('question', 'answer', 'comment')),
+    ('assert_can_edit_comment', ('comment',)),
+    ('assert_can_delete_comment', ('comment',)),
+    ('assert_can_flag_offensive', ('question', 'answer')),
+    ('assert_can_remove_flag_offensive', ('question', 'answer')),
+    ('assert_can_remove_all_flags_offensive', ('question', 'answer')),
+    ('assert_can_post_comment', ('question', 'answer')),
+    ('assert_can_retag_question', ('question',)),
+    ('assert_can_close_question', ('question',)),
+    ('assert_can_reopen_question', ('question',)),
+    ('assert_can_accept_best_answer', ('answer',)),
+)
+
+def check_assertions(user, posts):
+    """evaluates the assertions the way the filters used to"""
+    for post in posts:
+        for assertion_name, post_types in ASSERTIONS:
+            if post.post_type not in post_types:
+                continue
+            try:
+                getattr(user, assertion_name)(post)
+            except exceptions.PermissionDenied:
+                pass
+
+def measure(function, repeat):
+    """returns tuple of the average time in seconds
+    and of the average number of queries"""
+    query_count = len(connection.queries)
+    start = time.time()
+    for i in xrange(repeat):
+        function()
+    elapsed = time.time() - start
+    queries = len(connection.queries) - query_count
+    return elapsed / repeat, float(queries) / repeat
+
+class Command(NoArgsCommand):
+    help = 'Measures rendering of the permission template filters ' + \
+            'with and without the permission matrix'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--repeat',
+                action='store',
+                type='int',
+                dest='repeat',
+                default=10,
+                help='Number of the renderings'
+                ),
+            make_option('--user-id',
+                action='store',
+                type='int',
+                dest='user_id',
+                default=None,
+                help='Id of the visitor, by default the first user'
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        threads = models.Thread.objects.annotate(
+                            post_count = Count('posts')
+                        ).order_by('-post_count')
+        if threads.count() == 0:
+            raise CommandError('There are no questions')
+        thread = threads[0]
+        posts = list(thread.posts.all())
+
+        users = models.User.objects.order_by('id')
+        if options['user_id']:
+            users = users.filter(id = options['user_id'])
+        if users.count() == 0:
+            raise CommandError('There is no such user')
+        user = users[0]
+
+        template = get_skin().from_string(TEMPLATE)
+        data = {'user': user, 'posts': posts}
+        repeat = options['repeat']
+
+        def render_per_request():
+            permissions.start_request()
+            try:
+                template.render(data)
+            finally:
+                permissions.finish_request()
+
+        debug = django_settings.DEBUG
+        #queries are only recorded in the debug mode
+        django_settings.DEBUG = True
+        try:
+            permissions.finish_request()
+            before = measure(lambda: check_assertions(user, posts), repeat)
+            per_call = measure(lambda: template.render(data), repeat)
+            per_request = measure(render_per_request, repeat)
+        finally:
+            django_settings.DEBUG = debug
+
+        print 'Thread %d with %d posts and comments, user %s' % (
+                                thread.id, len(posts), user.username
+                            )
+        for label, result in (
+            ('assertions', before),
+            ('matrix per filter', per_call),
+            ('matrix per request', per_request),
+        ):
+            print '%s: %.1f ms, %.1f queries per rendering' % (
+                                    label, 1000 * result[0], result[1]
+                                )
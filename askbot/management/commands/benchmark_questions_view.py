@@ -0,0 +1,102 @@
+"""measures rendering time of the main questions
+listing with cold and warm question summary caches
+"""
+import time
+from optparse import make_option
+from django.conf import settings as django_settings
+from django.core import cache
+from django.core.management.base import NoArgsCommand
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.client import Client
+from askbot.conf import settings as askbot_settings
+from askbot.models import Thread
+from askbot.search.state_manager import SearchState
+
+def get_page_urls_and_keys(page_count):
+    """returns list of (url, summary cache keys) tuples
+    for the first pages of the default listing"""
+    search_state = SearchState.get_empty()
+    threads, meta_data = Thread.objects.run_advanced_search(
+                                        request_user = None,
+                                        search_state = search_state
+                                    )
+    page_size = int(askbot_settings.DEFAULT_QUESTIONS_PAGE_SIZE)
+    pages = list()
+    for page in range(1, page_count + 1):
+        start = (page - 1) * page_size
+        thread_ids = threads[start:start + page_size].values_list('id', flat = True)
+        keys = [Thread.SUMMARY_CACHE_KEY_TPL % thread_id for thread_id in thread_ids]
+        if len(keys) == 0:
+            break
+        url = reverse('questions') + search_state.change_page(page).query_string()
+        pages.append((url, keys))
+    return pages
+
+def time_requests(client, pages, cold, ajax):
+    """returns list of (seconds, query count) tuples"""
+    extra = dict()
+    if ajax:
+        extra['HTTP_X_REQUESTED_WITH'] = 'XMLHttpRequest'
+    results = list()
+    for url, keys in pages:
+        if cold:
+            cache.cache.delete_many(keys)
+        query_count = len(connection.queries)
+        start = time.time()
+        response = client.get(url, **extra)
+        elapsed = time.time() - start
+        assert(response.status_code == 200)
+        results.append((elapsed, len(connection.queries) - query_count))
+    return results
+
+def format_results(label, results):
+    timings = [result[0] for result in results]
+    queries = [result[1] for result in results]
+    return '%-20s mean %8.2fms  max %8.2fms  queries per page %6.1f' % (
+                label,
+                1000 * sum(timings) / len(timings),
+                1000 * max(timings),
+                float(sum(queries)) / len(queries)
+            )
+
+class Command(NoArgsCommand):
+    help = 'Measures rendering time of the questions page ' + \
+            'with cold and warm thread summary caches'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--pages',
+                action='store',
+                type='int',
+                dest='pages',
+                default=10,
+                help='Number of listing pages to request'
+                ),
+            make_option('--ajax',
+                action='store_true',
+                dest='ajax',
+                default=False,
+                help='Request the pages the way the live search does'
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        pages = get_page_urls_and_keys(options['pages'])
+        if len(pages) == 0:
+            print 'There are no questions to run the benchmark on'
+            return
+
+        debug = django_settings.DEBUG
+        django_settings.DEBUG = True#to count the queries
+        try:
+            client = Client()
+            #the first round warms up templates and other caches
+            time_requests(client, pages, cold = True, ajax = options['ajax'])
+            cold_results = time_requests(client, pages, cold = True, ajax = options['ajax'])
+            warm_results = time_requests(client, pages, cold = False, ajax = options['ajax'])
+        finally:
+            django_settings.DEBUG = debug
+
+        print 'Requested %d pages of the questions listing' % len(pages)
+        print format_results('cold summaries:', cold_results)
+        print format_results('warm summaries:', warm_results)
@@ -0,0 +1,52 @@
+"""measures number of livesettings reads per second
+from the process snapshot and directly from livesettings
+"""
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from askbot.conf import settings as askbot_settings
+
+#settings read on the hot paths
+KEYS = (
+    'ENABLE_MATHJAX',
+    'MARKUP_CODE_FRIENDLY',
+    'ENABLE_VIDEO_EMBEDDING',
+    'ENABLE_AUTO_LINKING',
+    'MIN_REP_TO_VOTE_UP',
+    'APP_SHORT_NAME',
+    'APP_URL',
+    'MAX_ALERTS_PER_EMAIL',
+)
+
+def time_reads(read, reads):
+    """returns number of reads per second"""
+    keys = [key for key in KEYS if key in askbot_settings.as_dict()]
+    rounds = max(reads / len(keys), 1)
+    start = time.time()
+    for i in xrange(rounds):
+        for key in keys:
+            read(key)
+    return rounds * len(keys) / (time.time() - start)
+
+class Command(NoArgsCommand):
+    help = 'Measures livesettings reads per second'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--reads',
+                action='store',
+                type='int',
+                dest='reads',
+                default=100000,
+                help='Number of reads'
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        reads = options['reads']
+        snapshot_speed = time_reads(
+                            lambda key: getattr(askbot_settings, key),
+                            reads
+                        )
+        stored_speed = time_reads(askbot_settings.get_stored_value, reads)
+        print 'snapshot:     %12.0f reads per second' % snapshot_speed
+        print 'livesettings: %12.0f reads per second' % stored_speed
@@ -0,0 +1,82 @@
+"""measures the time of importing ``askbot.models``
+and ``askbot.urls`` in the fresh python processes,
+as it happens in every new web server worker and
+on every run of a management command
+
+the first import is made with the media manifest and
+the startup stamp removed, the following ones - with
+them in place, the difference shows up when
+``ASKBOT_STARTUP_PROCEDURES = 'once'`` is set
+"""
+import os
+import subprocess
+import sys
+from optparse import make_option
+from django.conf import settings as django_settings
+from django.core.management.base import NoArgsCommand, CommandError
+from askbot import startup_procedures
+from askbot.skins import utils as skin_utils
+
+#the child process prints the import times in seconds
+IMPORT_SCRIPT = """import time
+start = time.time()
+import askbot.models
+models_loaded = time.time()
+import askbot.urls
+print '%f %f' % (models_loaded - start, time.time() - models_loaded)
+"""
+
+def remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+def time_imports():
+    """returns tuple of the seconds spent importing
+    ``askbot.models`` and ``askbot.urls`` in a new process"""
+    environment = dict(os.environ)
+    environment['DJANGO_SETTINGS_MODULE'] = django_settings.SETTINGS_MODULE
+    process = subprocess.Popen(
+                    [sys.executable, '-c', IMPORT_SCRIPT],
+                    stdout = subprocess.PIPE,
+                    env = environment
+                )
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        raise CommandError('import failed, the output was:\n' + output)
+    lines = output.strip().split('\n')
+    return tuple([float(value) for value in lines[-1].split()])
+
+class Command(NoArgsCommand):
+    help = 'Measures import time of askbot.models and askbot.urls ' + \
+            'in the new processes'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--repeat',
+                action='store',
+                type='int',
+                dest='repeat',
+                default=5,
+                help='Number of the imports with the recorded startup'
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        remove_file(startup_procedures.get_stamp_path())
+        remove_file(skin_utils.get_media_manifest_path())
+        cold = time_imports()
+
+        repeat = max(options['repeat'], 1)
+        models_total = urls_total = 0
+        for i in xrange(repeat):
+            models_time, urls_time = time_imports()
+            models_total += models_time
+            urls_total += urls_time
+
+        mode = getattr(django_settings, 'ASKBOT_STARTUP_PROCEDURES', 'always')
+        print 'startup procedures mode: %s' % mode
+        print 'first start: askbot.models %.2f s, askbot.urls %.2f s' % cold
+        print 'next starts (average of %d): ' % repeat + \
+                'askbot.models %.2f s, askbot.urls %.2f s' % (
+                                    models_total / repeat,
+                                    urls_total / repeat
+                                )
@@ -0,0 +1,122 @@
+"""compares performance of the tag selections
+on the questions page with and without the tag index
+"""
+import random
+import time
+from optparse import make_option
+from django.conf import settings as django_settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import NoArgsCommand
+from askbot import const
+from askbot.models import Thread
+from askbot.search.state_manager import SearchState
+
+def get_tag_selections(sample_size, max_tags):
+    """returns list of tag name lists, taken from
+    randomly picked threads, so that the selections
+    are not empty"""
+    thread_count = Thread.objects.count()
+    selections = list()
+    if thread_count == 0:
+        return selections
+    attempts = 0
+    while len(selections) < sample_size and attempts < sample_size * 10:
+        attempts += 1
+        offset = random.randint(0, thread_count - 1)
+        thread = Thread.objects.all().order_by('id')[offset]
+        tag_names = thread.get_tag_names()
+        if len(tag_names) == 0:
+            continue
+        random.shuffle(tag_names)
+        selections.append(tag_names[:random.randint(1, max_tags)])
+    return selections
+
+def run_search(tag_names, scope):
+    """runs search and evaluates the first page
+    the same way as the questions view does"""
+    search_state = SearchState(
+                        scope = scope,
+                        sort = None,
+                        query = None,
+                        tags = const.TAG_SEP.join(tag_names),
+                        author = None,
+                        page = None,
+                        user_logged_in = False
+                    )
+    qs, meta_data = Thread.objects.run_advanced_search(
+                                        request_user = AnonymousUser(),
+                                        search_state = search_state
+                                    )
+    qs.count()
+    return list(qs[:30])
+
+def time_searches(selections, scope):
+    timings = list()
+    for tag_names in selections:
+        start = time.time()
+        run_search(tag_names, scope)
+        timings.append(time.time() - start)
+    return timings
+
+def format_timings(label, timings):
+    timings = sorted(timings)
+    mean = sum(timings)/len(timings)
+    median = timings[len(timings)/2]
+    return '%-22s mean %8.2fms  median %8.2fms  max %8.2fms' % (
+                label, 1000*mean, 1000*median, 1000*timings[-1]
+            )
+
+class Command(NoArgsCommand):
+    help = 'Measures time of tag-filtered question searches ' + \
+            'with the ORM joins and with the tag index'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--samples',
+                action='store',
+                type='int',
+                dest='samples',
+                default=50,
+                help='Number of random tag selections to try'
+                ),
+            make_option('--max-tags',
+                action='store',
+                type='int',
+                dest='max_tags',
+                default=3,
+                help='Maximum number of tags in the selection'
+                ),
+            make_option('--scope',
+                action='store',
+                dest='scope',
+                default='all',
+                help='Search scope, "all" or "unanswered"'
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        selections = get_tag_selections(
+                                options['samples'],
+                                options['max_tags']
+                            )
+        if len(selections) == 0:
+            print 'There are no tagged threads to run the benchmark on'
+            return
+
+        scope = options['scope']
+        use_tag_index = getattr(django_settings, 'ASKBOT_USE_TAG_INDEX', False)
+        try:
+            django_settings.ASKBOT_USE_TAG_INDEX = False
+            orm_timings = time_searches(selections, scope)
+            django_settings.ASKBOT_USE_TAG_INDEX = True
+            cold_timings = time_searches(selections, scope)
+            warm_timings = time_searches(selections, scope)
+        finally:
+            django_settings.ASKBOT_USE_TAG_INDEX = use_tag_index
+
+        print 'Ran %d tag selections of up to %d tags' % (
+                                            len(selections),
+                                            options['max_tags']
+                                        )
+        print format_timings('ORM joins:', orm_timings)
+        print format_timings('tag index (cold):', cold_timings)
+        print format_timings('tag index (warm):', warm_timings)
@@ -0,0 +1,87 @@
+"""measures throughput of the file upload view with large files:
+
+* upload of a new file
+* upload of the same contents again, which is not stored twice
+* upload over the size limit, stopped by the upload handler
+
+the files are stored in a temporary ``MEDIA_ROOT``
+with the default file storage of the site
+"""
+import os
+import shutil
+import tempfile
+import time
+from optparse import make_option
+from django.conf import settings as django_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import NoArgsCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+from askbot import models
+
+def measure_upload(client, name, content, repeat):
+    """returns average seconds per upload"""
+    start = time.time()
+    for i in xrange(repeat):
+        data = {'file-upload': SimpleUploadedFile(name, content)}
+        response = client.post(reverse('upload'), data)
+        if response.status_code != 200:
+            raise CommandError('upload failed: %d' % response.status_code)
+    return (time.time() - start) / repeat
+
+class Command(NoArgsCommand):
+    help = 'Measures throughput of the file uploads with large files'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--size',
+                action='store',
+                type='int',
+                dest='size',
+                default=16,
+                help='Size of the uploaded file in megabytes'
+                ),
+            make_option('--repeat',
+                action='store',
+                type='int',
+                dest='repeat',
+                default=3,
+                help='Number of the uploads of each kind'
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        admins = models.User.objects.filter(is_superuser = True)
+        if admins.count() == 0:
+            raise CommandError('There is no administrator to upload files')
+        client = Client()
+        client.login(method = 'force', user_id = admins[0].id)
+
+        size = options['size'] * 1024 * 1024
+        repeat = max(options['repeat'], 1)
+        content = os.urandom(size)
+
+        media_root = django_settings.MEDIA_ROOT
+        max_size = django_settings.ASKBOT_MAX_UPLOAD_FILE_SIZE
+        django_settings.MEDIA_ROOT = tempfile.mkdtemp()
+        try:
+            django_settings.ASKBOT_MAX_UPLOAD_FILE_SIZE = size
+            new_file = measure_upload(client, 'new.png', content, 1)
+            duplicate = measure_upload(client, 'same.png', content, repeat)
+            django_settings.ASKBOT_MAX_UPLOAD_FILE_SIZE = size / 2
+            rejected = measure_upload(client, 'large.png', content, repeat)
+            stored_count = len(os.listdir(django_settings.MEDIA_ROOT))
+        finally:
+            shutil.rmtree(django_settings.MEDIA_ROOT)
+            django_settings.MEDIA_ROOT = media_root
+            django_settings.ASKBOT_MAX_UPLOAD_FILE_SIZE = max_size
+
+        megabytes = float(size) / (1024 * 1024)
+        for label, seconds in (
+            ('new file', new_file),
+            ('same contents', duplicate),
+            ('over the limit', rejected),
+        ):
+            print '%s: %.2f s per %d MB upload, %.1f MB/s' % (
+                        label, seconds, options['size'], megabytes / seconds
+                    )
+        print 'stored files (must be 1): %d' % stored_count
@@ -0,0 +1,118 @@
+"""measures the number of votes per second processed
+by many threads voting on one post and checks
+that no score changes were lost
+
+every thread upvotes the post and cancels the vote
+in a loop, so the score of the post must stay the same
+
+the votes and the reputation records are written to the
+database, the reputation of the post author is restored
+at the end - run this on a copy of the database
+served by postgresql or mysql
+"""
+import threading
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+from askbot import models
+
+def vote_in_loop(voter_id, post_id, votes, errors):
+    """upvotes the post and cancels the vote ``votes`` times"""
+    try:
+        voter = models.User.objects.get(id = voter_id)
+        post = models.Post.objects.get(id = post_id)
+        for i in xrange(votes):
+            voter.upvote(post)
+            voter.upvote(post, cancel = True)
+    except Exception, e:
+        errors.append(unicode(e))
+    finally:
+        connection.close()
+
+class Command(NoArgsCommand):
+    help = 'Measures votes per second with many threads voting on one post'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--threads',
+                action='store',
+                type='int',
+                dest='threads',
+                default=10,
+                help='Number of the voting threads, one voter per thread'
+                ),
+            make_option('--votes',
+                action='store',
+                type='int',
+                dest='votes',
+                default=50,
+                help='Number of the votes and cancelations per thread'
+                ),
+            make_option('--post-id',
+                action='store',
+                type='int',
+                dest='post_id',
+                default=None,
+                help='Id of the post, by default the latest question'
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        if options['post_id']:
+            posts = models.Post.objects.filter(id = options['post_id'])
+        else:
+            posts = models.Post.objects.get_questions().order_by('-id')
+        if posts.count() == 0:
+            raise CommandError('There is no post to vote for')
+        post = posts[0]
+
+        voter_ids = list(
+            models.User.objects.exclude(
+                id = post.author_id
+            ).values_list('id', flat = True)[:options['threads']]
+        )
+        if len(voter_ids) < options['threads']:
+            raise CommandError(
+                'There are only %d users to vote' % len(voter_ids)
+            )
+        #existing votes of the voters would turn upvotes into cancelations
+        old_votes = models.Vote.objects.filter(
+                                user__in = voter_ids,
+                                voted_post = post
+                            )
+        for vote in old_votes:
+            vote.cancel()
+        post = models.Post.objects.get(id = post.id)
+        author_reputation = post.author.reputation
+
+        errors = list()
+        threads = [
+            threading.Thread(
+                target = vote_in_loop,
+                args = (voter_id, post.id, options['votes'], errors)
+            )
+            for voter_id in voter_ids
+        ]
+        connection.close()
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        final = models.Post.objects.get(id = post.id)
+        models.User.objects.filter(
+                        id = post.author_id
+                    ).update(reputation = author_reputation)
+
+        vote_count = 2 * options['votes'] * len(threads)
+        print 'Processed %d votes in %d threads in %.2f seconds' % (
+                                        vote_count, len(threads), elapsed
+                                    )
+        print 'votes per second: %.1f' % (vote_count / elapsed)
+        print 'score change (must be 0): %d' % (final.score - post.score)
+        print 'upvote count change (must be 0): %d' % \
+                            (final.vote_up_count - post.vote_up_count)
+        if errors:
+            print '%d threads failed, first error: %s' % (len(errors), errors[0])
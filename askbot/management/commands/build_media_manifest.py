@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import NoArgsCommand
+from optparse import make_option
+from askbot.skins import utils as skin_utils
+
+class Command(NoArgsCommand):
+    help = 'Hashes the media files of all skins and saves the hashes ' + \
+        'into the media manifest, to be run after the deployment'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--quiet',
+                action='store_true',
+                dest='quiet',
+                default=False,
+                help="Do not print anything when called."
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        start = time.time()
+        skin_count = 0
+        for skin_name, label in skin_utils.get_skin_choices():
+            if skin_name == 'common':
+                continue
+            skin_utils.get_media_hash(
+                        skin_utils.get_media_dirs(skin_name),
+                        rebuild = True
+                    )
+            skin_count += 1
+        if not options.get('quiet', False):
+            print 'Hashed media of %d skins into %s in %.2f seconds' % (
+                                    skin_count,
+                                    skin_utils.get_media_manifest_path(),
+                                    time.time() - start
+                                )
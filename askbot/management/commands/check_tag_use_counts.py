@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import NoArgsCommand
+from optparse import make_option
+from askbot.models import tag as tag_model
+
+class Command(NoArgsCommand):
+    help = 'Compares stored use counts of the tags with the numbers ' \
+        'of the questions with the tags, optionally fixes them'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--fix',
+                action='store_true',
+                dest='fix',
+                default=False,
+                help="Recount use counts of all tags."
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        start = time.time()
+        errors = tag_model.get_use_count_errors()
+        for name, used_count, actual_count in errors[:50]:
+            print '%s: stored %d, actual %d' % (name, used_count, actual_count)
+        if len(errors) > 50:
+            print '... and %d more' % (len(errors) - 50)
+        print 'Found %d tags with wrong use counts in %.2f seconds' % (
+                                            len(errors),
+                                            time.time() - start
+                                        )
+        if errors and options.get('fix', False):
+            start = time.time()
+            tag_model.recount_use_counts()
+            print 'Recounted use counts in %.2f seconds' % (time.time() - start)
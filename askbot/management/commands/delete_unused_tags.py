@@ -1,26 +1,23 @@
 from django.core.management.base import NoArgsCommand
 from django.db import transaction
 from askbot import models
-from askbot.utils import console
 import sys
 
 class Command(NoArgsCommand):
     @transaction.commit_manually
     def handle_noargs(self, **options):
-        tags = models.Tag.objects.all()
-        count = 0
         print "Searching for unused tags:",
-        total = tags.count()
-        deleted_tags = list()
-        for tag in tags:
-            if not tag.threads.exists():
-                deleted_tags.append(tag.name)
-                tag.delete()
-            transaction.commit()
-            count += 1
-            progress = 100*float(count)/float(total)
-            console.print_progress('%6.2f%%', progress)
-        print '%6.2f%%' % 100
+        unused_tags = list(
+            models.Tag.objects.filter(
+                            threads__isnull = True
+                        ).values_list('id', 'name')
+        )
+        deleted_tags = [name for tag_id, name in unused_tags]
+        models.Tag.objects.filter(
+                    id__in = [tag_id for tag_id, name in unused_tags]
+                ).delete()
+        transaction.commit()
+        print ''
 
         if deleted_tags:
             found_count = len(deleted_tags)
@@ -1,36 +1,53 @@
+import os
 import sys
+import time
 import optparse
-from django.core import management
-from django.core.management.base import BaseCommand
-from askbot.utils import console
+from django.core.management.base import BaseCommand, CommandError
+from askbot.utils import forum_dump
 
 class Command(BaseCommand):
-    help = """Dumps askbot forum data into the file for the later use with "load_forum".
-The extension ".json" will be added automatically."""
+    help = """Dumps askbot forum data into the directory for the later use with "load_forum".
+Every table is saved into a separate gzipped file, the tables are exported in parallel."""
 
     option_list = BaseCommand.option_list + (
             optparse.make_option('--dump-name',
                 type = 'str',
-                dest = 'dump_file'
+                dest = 'dump_file',
+                help = 'name of the dump directory'
+            ),
+            optparse.make_option('--workers',
+                type = 'int',
+                dest = 'workers',
+                default = forum_dump.DEFAULT_WORKERS,
+                help = 'number of tables exported at the same time'
+            ),
+            optparse.make_option('--batch-size',
+                type = 'int',
+                dest = 'batch_size',
+                default = forum_dump.DEFAULT_BATCH_SIZE,
+                help = 'number of rows read from the database at once'
             ),
         )
     def handle(self, *args, **options):
-        dump_file = console.open_new_file(
-                        'Please enter file name (no extension): ',
-                        hint = options.get('dump_file', None),
-                        extension = '.json'
-                    )
-        print "Saving file %s ..." % dump_file.name
-        stdout_orig = sys.stdout
+        dump_dir = options.get('dump_file', None)
+        if not dump_dir:
+            dump_dir = raw_input('Please enter name of the dump directory: ')
+        if os.path.exists(dump_dir):
+            raise CommandError('%s already exists' % dump_dir)
+
+        def report_table(result):
+            print '%s: %d rows' % result
+            sys.stdout.flush()
+
+        print "Saving directory %s ..." % dump_dir
+        start = time.time()
         try:
-            sys.stdout = dump_file
-            management.call_command(
-                                'dumpdata',
-                                #exclude = ('contenttypes',),
-                                indent = 4
-                            )
-            sys.stdout = stdout_orig
-            print "Done."
+            forum_dump.dump(
+                dump_dir,
+                batch_size = options['batch_size'],
+                workers = options['workers'],
+                callback = report_table
+            )
+            print "Done in %.1f seconds." % (time.time() - start)
         except KeyboardInterrupt:
-            sys.stdout = stdout_orig
             print "\nCanceled."
@@ -0,0 +1,42 @@
+import sys
+from django.core.management.base import NoArgsCommand, CommandError
+from django.utils import simplejson
+from optparse import make_option
+from askbot.skins import utils as skin_utils
+
+class Command(NoArgsCommand):
+    help = 'Prints json manifest of the skin media files - ' + \
+        'url and path of every file, for example for the upload to a CDN'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--skin',
+                action='store',
+                type='str',
+                dest='skin',
+                default=None,
+                help='Name of the skin, by default the skin of the site'
+                ),
+            make_option('--output',
+                action='store',
+                type='str',
+                dest='output',
+                default=None,
+                help='Path to the output file, by default the standard output'
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        skin = options['skin']
+        if skin and skin not in dict(skin_utils.get_skin_choices()):
+            raise CommandError('Skin %s not found' % skin)
+        manifest = skin_utils.export_media_url_manifest(skin)
+        if options['output']:
+            output = open(options['output'], 'w')
+        else:
+            output = sys.stdout
+        try:
+            simplejson.dump(manifest, output, indent = 2, sort_keys = True)
+            output.write('\n')
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -5,9 +5,11 @@ from askbot import models
 from askbot import forms
 from askbot.utils import console
 from askbot.models import signals
+from askbot.models.tag import recount_use_counts
 from askbot.conf import settings as askbot_settings
 
 FORMAT_STRING = '%6.2f%%'
+CHUNK_SIZE = 1000
 
 class Command(NoArgsCommand):
     def handle_noargs(self, **options):
@@ -19,60 +21,92 @@ class Command(NoArgsCommand):
     def run_command(self):
         """method that runs the actual command"""
         #go through tags and find character case duplicates and eliminate them
-        tagnames = models.Tag.objects.values_list('name', flat = True)
-        for name in tagnames:
-            dupes = models.Tag.objects.filter(name__iexact = name)
-            first_tag = dupes[0]
-            if dupes.count() > 1:
-                line = 'Found duplicate tags for %s: ' % first_tag.name
+        #the most used tag of the duplicates is kept
+        tags_by_name = dict()
+        tags = models.Tag.objects.order_by('-used_count', 'name')
+        for tag_id, name in tags.values_list('id', 'name').iterator():
+            tags_by_name.setdefault(name.lower(), list()).append((tag_id, name))
+
+        for lowercased_name, dupes in tags_by_name.items():
+            first_tag_id, first_tag_name = dupes[0]
+            if len(dupes) > 1:
+                line = 'Found duplicate tags for %s: ' % first_tag_name
                 print line,
-                for idx in xrange(1, dupes.count()):
-                    print dupes[idx].name + ' ',
-                    dupes[idx].delete()
+                for tag_id, name in dupes[1:]:
+                    print name + ' ',
                 print ''
+                models.Tag.objects.filter(
+                            id__in = [tag_id for tag_id, name in dupes[1:]]
+                        ).delete()
             if askbot_settings.FORCE_LOWERCASE_TAGS:
-                lowercased_name = first_tag.name.lower()
-                if first_tag.name != lowercased_name:
-                    print 'Converting tag %s to lower case' % first_tag.name
-                    first_tag.name = lowercased_name
-                    first_tag.save()
+                if first_tag_name != lowercased_name:
+                    print 'Converting tag %s to lower case' % first_tag_name
+                    models.Tag.objects.filter(
+                                id = first_tag_id
+                            ).update(name = lowercased_name)
         transaction.commit()
 
-        #go through questions and fix tag records on each
-        questions = models.Question.objects.all()
+        #go through threads and fix tag records on each
+        threads = models.Thread.objects.order_by('id')
+        thread_tags = models.Thread.tags.through.objects
         checked_count = 0
         found_count = 0
-        total_count = questions.count()
+        total_count = threads.count()
+        last_id = 0
         print "Searching for questions with inconsistent tag records:",
-        for question in questions:
-            tags = question.thread.tags.all()
-            denorm_tag_set = set(question.get_tag_names())
-            norm_tag_set = set(question.thread.tags.values_list('name', flat=True))
-            if norm_tag_set != denorm_tag_set:
+        while True:
+            chunk = list(
+                threads.filter(
+                        id__gt = last_id
+                    ).values_list(
+                        'id', 'tagnames'
+                    )[:CHUNK_SIZE]
+            )
+            if len(chunk) == 0:
+                break
+            last_id = chunk[-1][0]
+
+            norm_tag_sets = dict()
+            rows = thread_tags.filter(
+                            thread__in = [thread_id for thread_id, tagnames in chunk]
+                        ).values_list('thread', 'tag__name')
+            for thread_id, tag_name in rows:
+                norm_tag_sets.setdefault(thread_id, set()).add(tag_name)
 
-                if question.last_edited_by:
-                    user = question.last_edited_by
-                    timestamp = question.last_edited_at
-                else:
-                    user = question.author
-                    timestamp = question.added_at
+            for thread_id, tagnames in chunk:
+                denorm_tag_set = set(tagnames.split())
+                norm_tag_set = norm_tag_sets.get(thread_id, set())
+                if norm_tag_set != denorm_tag_set:
+                    thread = models.Thread.objects.get(id = thread_id)
+                    question = thread._question_post()
+                    if question.last_edited_by:
+                        user = question.last_edited_by
+                        timestamp = question.last_edited_at
+                    else:
+                        user = question.author
+                        timestamp = question.added_at
 
-                tagnames = forms.TagNamesField().clean(question.tagnames)
+                    tagnames = forms.TagNamesField().clean(tagnames)
 
-                question.thread.update_tags(
-                    tagnames = tagnames,
-                    user = user,
-                    timestamp = timestamp
-                )
-                question.thread.tagnames = tagnames
-                question.thread.save()
-                found_count += 1
+                    thread.update_tags(
+                        tagnames = tagnames,
+                        user = user,
+                        timestamp = timestamp
+                    )
+                    thread.tagnames = tagnames
+                    thread.save()
+                    found_count += 1
 
             transaction.commit()
-            checked_count += 1
+            checked_count += len(chunk)
             progress = 100*float(checked_count)/float(total_count)
             console.print_progress(FORMAT_STRING, progress)
         print FORMAT_STRING % 100
+
+        #use counts of all tags are recounted with one statement
+        recount_use_counts()
+        transaction.commit()
+
         if found_count:
             print '%d problem questions found, tag records restored' % found_count
         else:
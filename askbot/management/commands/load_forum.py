@@ -1,16 +1,55 @@
+import sys
+import time
+import optparse
 from django.core import management
-from django.db.models import signals
 from django.contrib.contenttypes.models import ContentType
 from django.core.management.base import BaseCommand
 from askbot import models
+from askbot.models import signals
+from askbot.utils import forum_dump
 
 class Command(BaseCommand):
-    args = '<data file>'
-    help = 'Loads askbot forum data from the dump file obtained with command "dump_forum"'
+    args = '<dump directory>'
+    help = 'Loads askbot forum data from the dump obtained with command "dump_forum"'
+
+    option_list = BaseCommand.option_list + (
+            optparse.make_option('--workers',
+                type = 'int',
+                dest = 'workers',
+                default = forum_dump.DEFAULT_WORKERS,
+                help = 'number of tables loaded at the same time'
+            ),
+            optparse.make_option('--batch-size',
+                type = 'int',
+                dest = 'batch_size',
+                default = forum_dump.DEFAULT_BATCH_SIZE,
+                help = 'number of rows inserted at once'
+            ),
+        )
     def handle(self, *args, **options):
         #need to remove badge data b/c they are aslo in the dump
         models.BadgeData.objects.all().delete()
         ContentType.objects.all().delete()
-        #turn off the post_save signal so than Activity can be copied
-        signals.post_save.receivers = []
-        management.call_command('loaddata', args[0])
+
+        if not forum_dump.is_dump(args[0]):
+            #the json file made by the older versions of "dump_forum"
+            #turn off the signals so than Activity can be copied
+            receivers = signals.pop_all_db_signal_receivers()
+            try:
+                management.call_command('loaddata', args[0])
+            finally:
+                signals.set_all_db_signal_receivers(receivers)
+            return
+
+        def report_table(result):
+            print '%s: %d rows' % result
+            sys.stdout.flush()
+
+        start = time.time()
+        forum_dump.load(
+            args[0],
+            batch_size = options['batch_size'],
+            workers = options['workers'],
+            callback = report_table
+        )
+        print "Done in %.1f seconds." % (time.time() - start)
@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import NoArgsCommand
+from optparse import make_option
+from askbot.search import sidebar
+
+class Command(NoArgsCommand):
+    help = 'Caches related tags and contributors of the questions sidebar ' + \
+        'for the first pages of the most used tags'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--tags',
+                action='store',
+                type='int',
+                dest='tags',
+                default=50,
+                help='Number of the most used tags to precompute, 50 by default'
+                ),
+            make_option('--quiet',
+                action='store_true',
+                dest='quiet',
+                default=False,
+                help="Do not print anything when called."
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        start = time.time()
+        page_count = sidebar.precompute_popular_tags(options['tags'])
+        if not options.get('quiet', False):
+            print 'Cached sidebar data of %d pages in %.2f seconds' % (
+                                            page_count,
+                                            time.time() - start
+                                        )
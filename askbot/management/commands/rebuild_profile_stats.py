@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import NoArgsCommand
+from optparse import make_option
+from askbot.models import User
+from askbot.models import profile_stats
+from askbot.utils.console import print_progress
+
+class Command(NoArgsCommand):
+    help = 'Checks the user profile statistics against the database ' + \
+            'and corrects the records which differ'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--quiet',
+                action='store_true',
+                dest='quiet',
+                default=False,
+                help="Do not print anything when called."
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        quiet = options.get('quiet', False)
+        total = User.objects.count()
+
+        def report_progress(done):
+            if not quiet and (done % 100 == 0 or done == total):
+                print_progress(done, total)
+
+        start = time.time()
+        corrected_count = profile_stats.rebuild(
+                                    progress_callback = report_progress
+                                )
+        if not quiet:
+            print '\nChecked %d users in %.2f seconds, corrected %d' % (
+                                            total,
+                                            time.time() - start,
+                                            corrected_count
+                                        )
@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import NoArgsCommand
+from optparse import make_option
+from askbot.models import Thread
+from askbot.search import similarity
+from askbot.utils.console import print_progress
+
+class Command(NoArgsCommand):
+    help = 'Recomputes similar threads of all threads'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--quiet',
+                action='store_true',
+                dest='quiet',
+                default=False,
+                help="Do not print anything when called."
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        quiet = options.get('quiet', False)
+        total = Thread.objects.count()
+
+        def report_progress(done):
+            if not quiet and (done % 100 == 0 or done == total):
+                print_progress(done, total)
+
+        start = time.time()
+        thread_count = similarity.rebuild(progress_callback = report_progress)
+        if not quiet:
+            print '\nComputed similar threads of %d threads in %.2f seconds' % (
+                                            thread_count,
+                                            time.time() - start
+                                        )
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from askbot.search import tag_index
+
+class Command(BaseCommand):
+    help = 'Rebuilds lists of thread ids per tag stored in the tag index'
+    args = '[tag_name tag_name ...]'
+
+    option_list = BaseCommand.option_list + (
+            make_option('--quiet',
+                action='store_true',
+                dest='quiet',
+                default=False,
+                help="Do not print anything when called."
+                ),
+            )
+
+    def handle(self, *args, **options):
+        """rebuilds index for the given tags,
+        or for all tags if none are given"""
+        if args:
+            tag_names = [name.decode('utf-8') for name in args]
+        else:
+            tag_names = None
+        start = time.time()
+        tag_count = tag_index.rebuild(tag_names = tag_names)
+        if not options.get('quiet', False):
+            print 'Indexed %d tags in %.2f seconds' % (
+                                            tag_count,
+                                            time.time() - start
+                                        )
@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import NoArgsCommand
+from optparse import make_option
+from askbot.models import Activity
+from askbot.models import timeline
+from askbot.utils.console import print_progress
+
+class Command(NoArgsCommand):
+    help = 'Rebuilds the user activity timelines from the activity history'
+
+    option_list = NoArgsCommand.option_list + (
+            make_option('--quiet',
+                action='store_true',
+                dest='quiet',
+                default=False,
+                help="Do not print anything when called."
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        quiet = options.get('quiet', False)
+        total = Activity.objects.filter(
+                    activity_type__in = timeline.TIMELINE_ACTIVITY_TYPES
+                ).count()
+
+        def report_progress(done):
+            if not quiet:
+                print_progress(done, total)
+
+        start = time.time()
+        event_count = timeline.rebuild(progress_callback = report_progress)
+        if not quiet:
+            print '\nRecorded %d timeline events in %.2f seconds' % (
+                                            event_count,
+                                            time.time() - start
+                                        )
@@ -1,4 +1,22 @@
+"""sends delayed (daily and weekly) email digests
+of the updated questions
+
+The digests are built for the users who have at least one
+subscription due for the report. Users are processed in chunks
+of ``ASKBOT_EMAIL_ALERTS_CHUNK_SIZE`` (100 by default),
+data for the whole chunk is read with a few queries, the emails
+are rendered and then sent through ``--workers`` connections
+to the email backend.
+
+With ``--dry-run`` nothing is written to the database and
+no email is sent, instead the timing of the stages is printed.
+"""
 import datetime
+import Queue
+import threading
+import time
+from optparse import make_option
+from django.core import mail as django_mail
 from django.core.management.base import NoArgsCommand
 from django.core.urlresolvers import reverse
 from django.db import connection
@@ -17,16 +35,71 @@ from askbot.utils.slug import slugify
 
 DEBUG_THIS_COMMAND = False
 
-def get_all_origin_posts(mentions):
-    origin_posts = set()
-    for mention in mentions:
-        post = mention.content_object
-        origin_posts.add(post.get_origin_post())
-    return list(origin_posts)
+def get_chunk_size():
+    return getattr(django_settings, 'ASKBOT_EMAIL_ALERTS_CHUNK_SIZE', 100)
+
+def get_origin_question_ids(post_ids):
+    """returns ids of the questions of the threads
+    of the posts with the given ids"""
+    thread_ids = Post.objects.filter(id__in = post_ids).values('thread')
+    return list(
+        Post.objects.get_questions().filter(
+                                thread__in = thread_ids
+                            ).values_list('id', flat = True)
+    )
+
+def get_users_missing_subscriptions():
+    """returns ids of users who do not have
+    some of the email feed settings"""
+    from askbot import forms#need to avoid circular dependency
+    form = forms.EditUserEmailFeedsForm()
+    user_ids = set()
+    for feed_type in form.get_db_model_subscription_type_names():
+        user_ids.update(
+            User.objects.exclude(
+                notification_subscriptions__feed_type = feed_type
+            ).values_list('id', flat = True)
+        )
+    return user_ids
+
+def get_due_subscriber_ids():
+    """returns ids of users, ordered, who have at least one
+    delayed email feed due for the report"""
+    now = datetime.datetime.now()
+    due_filter = None
+    for frequency, delta in EmailFeedSetting.DELTA_TABLE.items():
+        if frequency in ('n', 'i'):
+            continue
+        frequency_filter = Q(frequency = frequency) & (
+            Q(reported_at__isnull = True) | Q(reported_at__lte = now - delta)
+        )
+        if due_filter is None:
+            due_filter = frequency_filter
+        else:
+            due_filter = due_filter | frequency_filter
+    subscriber_ids = EmailFeedSetting.objects.filter(
+                                        due_filter
+                                    ).values_list(
+                                        'subscriber', flat = True
+                                    ).distinct()
+    return sorted(subscriber_ids)
+
+def get_feeds_by_subscriber(user_ids):
+    """returns dictionary user id -> list of the
+    delayed email feed settings"""
+    feeds = EmailFeedSetting.objects.filter(
+                                subscriber__in = user_ids
+                            ).exclude(
+                                frequency__in = ('n', 'i')
+                            )
+    feeds_by_subscriber = dict()
+    for feed in feeds:
+        feeds_by_subscriber.setdefault(feed.subscriber_id, list()).append(feed)
+    return feeds_by_subscriber
 
 #todo: refactor this as class
 def extend_question_list(
-                    src, dst, cutoff_time = None, 
+                    src, dst, cutoff_time = None,
                     limit=False, add_mention=False,
                     add_comment = False
                 ):
@@ -73,8 +146,61 @@ def format_action_count(string, number, output):
     if number > 0:
         output.append(_(string) % {'num':number})
 
+def send_in_parallel(messages, workers):
+    """sends the messages in chunks through
+    ``workers`` connections to the email backend,
+    returns number of sent messages"""
+    chunk_size = mail.get_chunk_size()
+    chunks = Queue.Queue()
+    for start in xrange(0, len(messages), chunk_size):
+        chunks.put(messages[start:start + chunk_size])
+    sent_counts = list()
+
+    def send_chunks():
+        email_connection = django_mail.get_connection()
+        while True:
+            try:
+                chunk = chunks.get_nowait()
+            except Queue.Empty:
+                break
+            sent_counts.append(mail.send_messages(chunk, email_connection))
+
+    if workers <= 1:
+        send_chunks()
+    else:
+        threads = [threading.Thread(target = send_chunks) for i in xrange(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return sum(sent_counts)
+
+
 class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+            make_option('--dry-run',
+                action='store_true',
+                dest='dry_run',
+                default=False,
+                help='Do not send email nor save anything, ' + \
+                    'print timing of the digest building instead'
+                ),
+            make_option('--workers',
+                action='store',
+                type='int',
+                dest='workers',
+                default=1,
+                help='Number of connections used to send the email'
+                ),
+            )
+
     def handle_noargs(self, **options):
+        self.dry_run = options.get('dry_run', False)
+        self.workers = options.get('workers', 1)
+        #seconds spent per stage of the digest building
+        self.timings = SortedDict()
+        for stage in ('subscriptions', 'collect', 'render', 'send'):
+            self.timings[stage] = 0.0
         if askbot_settings.ENABLE_EMAIL_ALERTS:
             try:
                 try:
@@ -84,18 +210,17 @@ class Command(NoArgsCommand):
             finally:
                 connection.close()
 
-    def get_updated_questions_for_user(self,user):
+    def should_save(self):
+        return DEBUG_THIS_COMMAND == False and self.dry_run == False
+
+    def get_updated_questions_for_user(self, user, user_feeds):
         """
         retreive relevant question updates for the user
         according to their subscriptions and recorded question
         views
-        """
 
-        user_feeds = EmailFeedSetting.objects.filter(
-                                                subscriber=user
-                                            ).exclude(
-                                                frequency__in=('n', 'i')
-                                            )
+        ``user_feeds`` - list of the delayed email feed settings of the user
+        """
 
         should_proceed = False
         for feed in user_feeds:
@@ -135,8 +260,10 @@ class Command(NoArgsCommand):
                                 deleted=True
                             ).exclude(
                                 thread__closed=True
+                            ).select_related(
+                                'thread'
                             ).order_by('-thread__last_activity_at')
-        #todo: for some reason filter on did not work as expected ~Q(viewed__who=user) | 
+        #todo: for some reason filter on did not work as expected ~Q(viewed__who=user) |
         #      Q(viewed__who=user,viewed__when__lt=F('thread__last_activity_at'))
         #returns way more questions than you might think it should
         #so because of that I've created separate query sets Q_set2 and Q_set3
@@ -174,9 +301,10 @@ class Command(NoArgsCommand):
             #we won't send email for a given question if an email has been
             #sent after that cutoff_time
             if feed.should_send_now():
-                if DEBUG_THIS_COMMAND == False:
-                    feed.mark_reported_now()
-                cutoff_time = feed.get_previous_report_cutoff_time() 
+                #feeds are marked as reported
+                #for the whole chunk of users at once
+                self.reported_feed_ids.append(feed.id)
+                cutoff_time = feed.get_previous_report_cutoff_time()
 
                 if feed.feed_type == 'q_sel':
                     q_sel_A = Q_set_A.filter(thread__followed_by=user)
@@ -221,55 +349,51 @@ class Command(NoArgsCommand):
         #mention responses could be collected in the loop above, but
         #it is inconvenient, because feed_type m_and_c bundles the two
         #also we collect metadata for these here
-        try:
-            feed = user_feeds.get(feed_type='m_and_c')
-            if feed.should_send_now():
-                cutoff_time = feed.get_previous_report_cutoff_time()
-                comments = Post.objects.get_comments().filter(
-                                            added_at__lt = cutoff_time,
-                                        ).exclude(
-                                            author = user
-                                        )
-                q_commented = list() 
-                for c in comments:
-                    post = c.parent
-                    if post.author != user:
-                        continue
-
-                    #skip is post was seen by the user after
-                    #the comment posting time
-                    q_commented.append(post.get_origin_post())
-
-                extend_question_list(
-                                q_commented,
-                                q_list,
-                                cutoff_time = cutoff_time,
-                                add_comment = True
+        m_and_c_feeds = [feed for feed in user_feeds if feed.feed_type == 'm_and_c']
+        if m_and_c_feeds and m_and_c_feeds[0].should_send_now():
+            feed = m_and_c_feeds[0]
+            cutoff_time = feed.get_previous_report_cutoff_time()
+            #one entry per comment to the posts of the user,
+            #the comment is reported on the question of its thread
+            commented_thread_ids = Post.objects.get_comments().filter(
+                                        added_at__lt = cutoff_time,
+                                        parent__author = user
+                                    ).exclude(
+                                        author = user
+                                    ).values_list('thread', flat = True)
+            commented_thread_ids = list(commented_thread_ids)
+            questions = Post.objects.get_questions().filter(
+                                        thread__in = set(commented_thread_ids)
+                                    ).select_related('thread')
+            questions_by_thread = dict([(q.thread_id, q) for q in questions])
+            q_commented = [
+                questions_by_thread[thread_id]
+                for thread_id in commented_thread_ids
+                if thread_id in questions_by_thread
+            ]
+
+            extend_question_list(
+                            q_commented,
+                            q_list,
+                            cutoff_time = cutoff_time,
+                            add_comment = True
+                        )
+
+            mentions = Activity.objects.get_mentions(
+                                                mentioned_at__lt = cutoff_time,
+                                                mentioned_whom = user
+                                            )
+            q_mentions_id = get_origin_question_ids(
+                                mentions.values_list('object_id', flat = True)
                             )
 
-                mentions = Activity.objects.get_mentions(
-                                                    mentioned_at__lt = cutoff_time,
-                                                    mentioned_whom = user
-                                                )
-
-                #print 'have %d mentions' % len(mentions)
-                #MM = Activity.objects.filter(activity_type = const.TYPE_ACTIVITY_MENTION)
-                #print 'have %d total mentions' % len(MM)
-                #for m in MM:
-                #    print m
-
-                mention_posts = get_all_origin_posts(mentions)
-                q_mentions_id = [q.id for q in mention_posts]
+            q_mentions_A = Q_set_A.filter(id__in = q_mentions_id)
+            q_mentions_A.cutoff_time = cutoff_time
+            extend_question_list(q_mentions_A, q_list, add_mention=True)
 
-                q_mentions_A = Q_set_A.filter(id__in = q_mentions_id)
-                q_mentions_A.cutoff_time = cutoff_time
-                extend_question_list(q_mentions_A, q_list, add_mention=True)
-
-                q_mentions_B = Q_set_B.filter(id__in = q_mentions_id)
-                q_mentions_B.cutoff_time = cutoff_time
-                extend_question_list(q_mentions_B, q_list, add_mention=True)
-        except EmailFeedSetting.DoesNotExist:
-            pass
+            q_mentions_B = Q_set_B.filter(id__in = q_mentions_id)
+            q_mentions_B.cutoff_time = cutoff_time
+            extend_question_list(q_mentions_B, q_list, add_mention=True)
 
         if user.email_tag_filter_strategy == const.INCLUDE_INTERESTING:
             extend_question_list(q_all_A, q_list)
@@ -285,44 +409,91 @@ class Command(NoArgsCommand):
             extend_question_list(q_all_A, q_list, limit=True)
             extend_question_list(q_all_B, q_list, limit=True)
 
+        if len(q_list) == 0:
+            return q_list
+
+        self.add_news_counts(user, q_list)
+        return q_list
+
+    def add_news_counts(self, user, q_list):
+        """up to this point we still don't know if emails about
+        collected questions were sent recently, this method examines
+        activity records and decides for each question,
+        whether it needs to be included or not into the report
+
+        it edits meta_data for each question
+        so that user will receive counts on new edits new answers, etc
+        and marks questions that need to be skipped
+        because an email about them was sent recently enough
+
+        also it keeps a record of latest email activity per question per user
+
+        news for all questions are read with one query per kind of news
+        """
         ctype = ContentType.objects.get_for_model(Post)
         EMAIL_UPDATE_ACTIVITY = const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT
 
-        #up to this point we still don't know if emails about
-        #collected questions were sent recently
-        #the next loop examines activity record and decides
-        #for each question, whether it needs to be included or not
-        #into the report
-
-        for q, meta_data in q_list.items():
-            #this loop edits meta_data for each question
-            #so that user will receive counts on new edits new answers, etc
-            #and marks questions that need to be skipped
-            #because an email about them was sent recently enough
+        question_ids = [q.id for q in q_list.keys()]
+        thread_ids = [q.thread_id for q in q_list.keys()]
 
-            #also it keeps a record of latest email activity per question per user
-            try:
-                #todo: is it possible to use content_object here, instead of
-                #content type and object_id pair?
-                update_info = Activity.objects.get(
-                                            user=user,
-                                            content_type=ctype,
-                                            object_id=q.id,
-                                            activity_type=EMAIL_UPDATE_ACTIVITY
-                                        )
-                emailed_at = update_info.active_at
-            except Activity.DoesNotExist:
-                update_info = Activity(
-                                        user=user, 
-                                        content_object=q, 
+        #todo: is it possible to use content_object here, instead of
+        #content type and object_id pair?
+        update_activities = Activity.objects.filter(
+                                        user=user,
+                                        content_type=ctype,
+                                        object_id__in=question_ids,
                                         activity_type=EMAIL_UPDATE_ACTIVITY
                                     )
-                emailed_at = datetime.datetime(1970, 1, 1)#long time ago
-            except Activity.MultipleObjectsReturned:
+        update_info_by_question = dict()
+        for update_info in update_activities:
+            if update_info.object_id in update_info_by_question:
                 raise Exception(
                                 'server error - multiple question email activities '
                                 'found per user-question pair'
                                 )
+            update_info_by_question[update_info.object_id] = update_info
+
+        #revision data, in the order of the revisions
+        q_revs = PostRevision.objects.question_revisions().filter(
+                                            post__in=question_ids
+                                        ).exclude(
+                                            author=user
+                                        ).values_list('post', 'revised_at')
+        q_revs_by_question = dict()
+        for question_id, revised_at in q_revs:
+            q_revs_by_question.setdefault(question_id, list()).append(revised_at)
+
+        new_answers = Post.objects.get_answers().filter(
+                                            thread__in=thread_ids,
+                                            deleted=False,
+                                        ).exclude(
+                                            author=user
+                                        ).values_list('thread', 'added_at')
+        new_answers_by_thread = dict()
+        for thread_id, added_at in new_answers:
+            new_answers_by_thread.setdefault(thread_id, list()).append(added_at)
+
+        ans_revs = PostRevision.objects.answer_revisions().filter(
+                                            post__thread__in=thread_ids,
+                                            post__deleted = False,
+                                        ).exclude(
+                                            author=user
+                                        ).values_list('id', 'post__thread', 'revised_at').distinct()
+        ans_revs_by_thread = dict()
+        for revision_id, thread_id, revised_at in ans_revs:
+            ans_revs_by_thread.setdefault(thread_id, list()).append(revised_at)
+
+        for q, meta_data in q_list.items():
+            update_info = update_info_by_question.get(q.id)
+            if update_info is None:
+                update_info = Activity(
+                                        user=user,
+                                        content_object=q,
+                                        activity_type=EMAIL_UPDATE_ACTIVITY
+                                    )
+                emailed_at = datetime.datetime(1970, 1, 1)#long time ago
+            else:
+                emailed_at = update_info.active_at
 
             cutoff_time = meta_data['cutoff_time']#cutoff time for the question
 
@@ -335,159 +506,200 @@ class Command(NoArgsCommand):
 
             #collect info on all sorts of news that happened after
             #the most recent emailing to the user about this question
-            q_rev = PostRevision.objects.question_revisions().filter(
-                                                post=q,
-                                                revised_at__gt=emailed_at
-                                            )
-
-            q_rev = q_rev.exclude(author=user)
+            q_rev = [
+                revised_at for revised_at in q_revs_by_question.get(q.id, ())
+                if revised_at > emailed_at
+            ]
 
             #now update all sorts of metadata per question
             meta_data['q_rev'] = len(q_rev)
-            if len(q_rev) > 0 and q.added_at == q_rev[0].revised_at:
+            if len(q_rev) > 0 and q.added_at == q_rev[0]:
                 meta_data['q_rev'] = 0
                 meta_data['new_q'] = True
             else:
                 meta_data['new_q'] = False
-                
-            new_ans = Post.objects.get_answers().filter(
-                                            thread=q.thread,
-                                            added_at__gt=emailed_at,
-                                            deleted=False,
-                                        )
 
-            new_ans = new_ans.exclude(author=user)
+            new_ans = [
+                added_at for added_at in new_answers_by_thread.get(q.thread_id, ())
+                if added_at > emailed_at
+            ]
             meta_data['new_ans'] = len(new_ans)
-            ans_rev = PostRevision.objects.answer_revisions().filter(
-                                            # answer__question = q
-                                            post__thread=q.thread,
-
-                                            post__deleted = False,
-                                            revised_at__gt = emailed_at
-                                        ).distinct()
-            ans_rev = ans_rev.exclude(author=user)
+            ans_rev = [
+                revised_at for revised_at in ans_revs_by_thread.get(q.thread_id, ())
+                if revised_at > emailed_at
+            ]
             meta_data['ans_rev'] = len(ans_rev)
 
             comments = meta_data.get('comments', 0)
             mentions = meta_data.get('mentions', 0)
 
-            #print meta_data
             #finally skip question if there are no news indeed
             if len(q_rev) + len(new_ans) + len(ans_rev) + comments + mentions == 0:
                 meta_data['skip'] = True
-                #print 'skipping'
             else:
                 meta_data['skip'] = False
-                #print 'not skipping'
-                update_info.active_at = datetime.datetime.now() 
-                if DEBUG_THIS_COMMAND == False:
-                    update_info.save() #save question email update activity 
-        #q_list is actually an ordered dictionary
-        #print 'user %s gets %d' % (user.username, len(q_list.keys()))
-        #todo: sort question list by update time
-        return q_list 
+                update_info.active_at = datetime.datetime.now()
+                if self.should_save():
+                    update_info.save() #save question email update activity
+
+    def render_email(self, user, q_list):
+        """returns email message with the report
+        about the questions that are not skipped in the ``q_list``
+        or ``None`` if there is nothing to report"""
+        num_q = 0
+        for question, meta_data in q_list.items():
+            if meta_data['skip']:
+                del q_list[question]
+            else:
+                num_q += 1
+        if num_q == 0:
+            return None
+
+        url_prefix = askbot_settings.APP_URL
+
+        threads = Thread.objects.filter(id__in=[qq.thread_id for qq in q_list.keys()])
+        tag_summary = Thread.objects.get_tag_summary_from_threads(threads)
+
+        question_count = len(q_list.keys())
+
+        subject_line = ungettext(
+            '%(question_count)d updated question about %(topics)s',
+            '%(question_count)d updated questions about %(topics)s',
+            question_count
+        ) % {
+            'question_count': question_count,
+            'topics': tag_summary
+        }
+
+        #todo: send this to special log
+        #print 'have %d updated questions for %s' % (num_q, user.username)
+        text = ungettext(
+            '<p>Dear %(name)s,</p><p>The following question has been updated '
+            '%(sitename)s</p>',
+            '<p>Dear %(name)s,</p><p>The following %(num)d questions have been '
+            'updated on %(sitename)s:</p>',
+            num_q
+        ) % {
+            'num':num_q,
+            'name':user.username,
+            'sitename': askbot_settings.APP_SHORT_NAME
+        }
+
+        text += '<ul>'
+        items_added = 0
+        items_unreported = 0
+        for q, meta_data in q_list.items():
+            act_list = []
+            if meta_data['skip']:
+                continue
+            if items_added >= askbot_settings.MAX_ALERTS_PER_EMAIL:
+                items_unreported = num_q - items_added #may be inaccurate actually, but it's ok
+
+            else:
+                items_added += 1
+                if meta_data['new_q']:
+                    act_list.append(_('new question'))
+                format_action_count('%(num)d rev', meta_data['q_rev'],act_list)
+                format_action_count('%(num)d ans', meta_data['new_ans'],act_list)
+                format_action_count('%(num)d ans rev',meta_data['ans_rev'],act_list)
+                act_token = ', '.join(act_list)
+                text += '<li><a href="%s?sort=latest">%s</a> <font color="#777777">(%s)</font></li>' \
+                            % (url_prefix + q.get_absolute_url(), q.thread.title, act_token)
+        text += '</ul>'
+        text += '<p></p>'
+        #if len(q_list.keys()) >= askbot_settings.MAX_ALERTS_PER_EMAIL:
+        #    text += _('There may be more questions updated since '
+        #                'you have logged in last time as this list is '
+        #                'abridged for your convinience. Please visit '
+        #                'the askbot and see what\'s new!<br>'
+        #              )
+
+        link = url_prefix + reverse(
+                                'user_subscriptions',
+                                kwargs = {
+                                    'id': user.id,
+                                    'slug': slugify(user.username)
+                                }
+                            )
+
+        text += _(
+            '<p>Please remember that you can always <a '
+            'hrefl"%(email_settings_link)s">adjust</a> frequency of the email updates or '
+            'turn them off entirely.<br/>If you believe that this message was sent in an '
+            'error, please email about it the forum administrator at %(admin_email)s.</'
+            'p><p>Sincerely,</p><p>Your friendly %(sitename)s server.</p>'
+        ) % {
+            'email_settings_link': link,
+            'admin_email': django_settings.ADMINS[0][1],
+            'sitename': askbot_settings.APP_SHORT_NAME
+        }
+        if DEBUG_THIS_COMMAND == True:
+            recipient_email = django_settings.ADMINS[0][1]
+        else:
+            recipient_email = user.email
+
+        return mail.create_message(
+            subject_line = subject_line,
+            body_text = text,
+            recipient_list = [recipient_email]
+        )
 
     def send_email_alerts(self):
-        #does not change the database, only sends the email
-        #todo: move this to template
-        for user in User.objects.all():
-            user.add_missing_askbot_subscriptions()
+        start = time.time()
+        if self.dry_run == False:
+            for user in User.objects.filter(
+                            id__in = get_users_missing_subscriptions()
+                        ):
+                user.add_missing_askbot_subscriptions()
+        self.timings['subscriptions'] += time.time() - start
+
+        subscriber_ids = get_due_subscriber_ids()
+        chunk_size = get_chunk_size()
+        sent_count = 0
+        for chunk_start in xrange(0, len(subscriber_ids), chunk_size):
+            chunk_ids = subscriber_ids[chunk_start:chunk_start + chunk_size]
+            sent_count += self.send_email_alerts_to_users(chunk_ids)
+
+        if self.dry_run:
+            print 'Subscribers due for the report: %d' % len(subscriber_ids)
+            print 'Email digests: %d' % sent_count
+            for stage, seconds in self.timings.items():
+                print '%-14s %8.2fs' % (stage + ':', seconds)
+
+    def send_email_alerts_to_users(self, user_ids):
+        """builds and sends email digests to the users,
+        returns number of the emails"""
+        start = time.time()
+        self.reported_feed_ids = list()
+        feeds_by_subscriber = get_feeds_by_subscriber(user_ids)
+        q_lists = list()
+        for user in User.objects.filter(id__in = user_ids).order_by('id'):
             #todo: q_list is a dictionary, not a list
-            q_list = self.get_updated_questions_for_user(user)
-            if len(q_list.keys()) == 0:
-                continue
-            num_q = 0
-            for question, meta_data in q_list.items():
-                if meta_data['skip']:
-                    del q_list[question]
-                else:
-                    num_q += 1
-            if num_q > 0:
-                url_prefix = askbot_settings.APP_URL
-
-                threads = Thread.objects.filter(id__in=[qq.thread_id for qq in q_list.keys()])
-                tag_summary = Thread.objects.get_tag_summary_from_threads(threads)
-
-                question_count = len(q_list.keys())
-
-                subject_line = ungettext(
-                    '%(question_count)d updated question about %(topics)s',
-                    '%(question_count)d updated questions about %(topics)s',
-                    question_count
-                ) % {
-                    'question_count': question_count,
-                    'topics': tag_summary
-                }
-
-                #todo: send this to special log
-                #print 'have %d updated questions for %s' % (num_q, user.username)
-                text = ungettext(
-                    '<p>Dear %(name)s,</p><p>The following question has been updated '
-                    '%(sitename)s</p>',
-                    '<p>Dear %(name)s,</p><p>The following %(num)d questions have been '
-                    'updated on %(sitename)s:</p>',
-                    num_q
-                ) % {
-                    'num':num_q,
-                    'name':user.username,
-                    'sitename': askbot_settings.APP_SHORT_NAME
-                }
-
-                text += '<ul>'
-                items_added = 0
-                items_unreported = 0
-                for q, meta_data in q_list.items():
-                    act_list = []
-                    if meta_data['skip']:
-                        continue
-                    if items_added >= askbot_settings.MAX_ALERTS_PER_EMAIL:
-                        items_unreported = num_q - items_added #may be inaccurate actually, but it's ok
-                        
-                    else:
-                        items_added += 1
-                        if meta_data['new_q']:
-                            act_list.append(_('new question'))
-                        format_action_count('%(num)d rev', meta_data['q_rev'],act_list)
-                        format_action_count('%(num)d ans', meta_data['new_ans'],act_list)
-                        format_action_count('%(num)d ans rev',meta_data['ans_rev'],act_list)
-                        act_token = ', '.join(act_list)
-                        text += '<li><a href="%s?sort=latest">%s</a> <font color="#777777">(%s)</font></li>' \
-                                    % (url_prefix + q.get_absolute_url(), q.thread.title, act_token)
-                text += '</ul>'
-                text += '<p></p>'
-                #if len(q_list.keys()) >= askbot_settings.MAX_ALERTS_PER_EMAIL:
-                #    text += _('There may be more questions updated since '
-                #                'you have logged in last time as this list is '
-                #                'abridged for your convinience. Please visit '
-                #                'the askbot and see what\'s new!<br>'
-                #              )
-
-                link = url_prefix + reverse(
-                                        'user_subscriptions', 
-                                        kwargs = {
-                                            'id': user.id,
-                                            'slug': slugify(user.username)
-                                        }
+            q_list = self.get_updated_questions_for_user(
+                                        user,
+                                        feeds_by_subscriber.get(user.id, ())
                                     )
-
-                text += _(
-                    '<p>Please remember that you can always <a '
-                    'hrefl"%(email_settings_link)s">adjust</a> frequency of the email updates or '
-                    'turn them off entirely.<br/>If you believe that this message was sent in an '
-                    'error, please email about it the forum administrator at %(admin_email)s.</'
-                    'p><p>Sincerely,</p><p>Your friendly %(sitename)s server.</p>'
-                ) % {
-                    'email_settings_link': link,
-                    'admin_email': django_settings.ADMINS[0][1],
-                    'sitename': askbot_settings.APP_SHORT_NAME
-                }
-                if DEBUG_THIS_COMMAND == True:
-                    recipient_email = django_settings.ADMINS[0][1]
-                else:
-                    recipient_email = user.email
-
-                mail.send_mail(
-                    subject_line = subject_line,
-                    body_text = text,
-                    recipient_list = [recipient_email]
-                )
+            if len(q_list.keys()) != 0:
+                q_lists.append((user, q_list))
+
+        if self.reported_feed_ids and self.should_save():
+            EmailFeedSetting.objects.filter(
+                id__in = self.reported_feed_ids
+            ).update(
+                reported_at = datetime.datetime.now()
+            )
+        self.timings['collect'] += time.time() - start
+
+        start = time.time()
+        messages = list()
+        for user, q_list in q_lists:
+            message = self.render_email(user, q_list)
+            if message is not None:
+                messages.append(message)
+        self.timings['render'] += time.time() - start
+
+        if self.dry_run == False:
+            start = time.time()
+            send_in_parallel(messages, self.workers)
+            self.timings['send'] += time.time() - start
+        return len(messages)
@@ -2,6 +2,10 @@ from django.http import HttpResponseRedirect
 from askbot.utils.forms import get_next_url
 class CancelActionMiddleware(object):
     def process_view(self, request, view_func, view_args, view_kwargs):
+        #the views with HANDLES_UPLOADS attribute install their own
+        #upload handlers, so the request body must not be parsed here
+        if getattr(view_func, 'HANDLES_UPLOADS', False):
+            return None
         if 'cancel' in request.REQUEST:
             #todo use session messages for the anonymous users
             try:
@@ -3,10 +3,13 @@ startup_procedures.run()
 
 import logging
 import hashlib
+import re
+import uuid
 import datetime
 import urllib
 from django.core.urlresolvers import reverse, NoReverseMatch
 from django.db.models import signals as django_signals
+from django.core import signals as core_signals
 from django.template import Context
 from django.utils.translation import ugettext as _
 from django.utils.translation import ungettext
@@ -17,6 +20,7 @@ from django.conf import settings as django_settings
 from django.contrib.contenttypes.models import ContentType
 from django.core import cache
 from django.core import exceptions as django_exceptions
+from django.core import mail as django_mail
 from django_countries.fields import CountryField
 from askbot import exceptions as askbot_exceptions
 from askbot import const
@@ -25,7 +29,7 @@ from askbot.conf import settings as askbot_settings
 from askbot.models.question import Thread
 from askbot.skins import utils as skin_utils
 from askbot.models.question import QuestionView, AnonymousQuestion
-from askbot.models.question import FavoriteQuestion
+from askbot.models.question import FavoriteQuestion, SimilarThread
 from askbot.models.answer import AnonymousAnswer
 from askbot.models.tag import Tag, MarkedTag
 from askbot.models.meta import Vote
@@ -33,6 +37,15 @@ from askbot.models.user import EmailFeedSetting, ActivityAuditStatus, Activity
 from askbot.models.post import Post, PostRevision
 from askbot.models.reply_by_email import ReplyAddress
 from askbot.models import signals
+from askbot.models import visit_buffer
+from askbot.models import badge_counters
+from askbot.models import daily_counters
+from askbot.models import permissions
+from askbot.models import badges
+from askbot.models import timeline
+from askbot.models.timeline import TimelineEvent
+from askbot.models import profile_stats
+from askbot.models.profile_stats import ProfileStats, ProfileTagUsage
 from askbot.models.badges import award_badges_signal, get_badge, BadgeData
 from askbot.models.repute import Award, Repute
 from askbot import auth
@@ -41,6 +54,8 @@ from askbot.utils.slug import slugify
 from askbot.utils.diff import textDiff as htmldiff
 from askbot.utils.url_utils import strip_path
 from askbot.utils import mail
+from askbot.search import tag_index
+from askbot.search import wildcard_index
 
 def get_model(model_name):
     return models.get_model('askbot', model_name)
@@ -957,16 +972,7 @@ def user_get_unused_votes_today(self):
     """returns number of votes that are
     still available to the user today
     """
-    today = datetime.date.today()
-    one_day_interval = (today, today + datetime.timedelta(1))
-
-    used_votes = Vote.objects.filter(
-                                user = self,
-                                voted_at__range = one_day_interval
-                            ).count()
-
-    available_votes = askbot_settings.MAX_VOTES_PER_USER_PER_DAY - used_votes
-    return max(0, available_votes)
+    return daily_counters.get_votes_left(self.id)
 
 def user_post_comment(
                     self,
@@ -992,7 +998,7 @@ def user_post_comment(
                     comment = body_text,
                     added_at = timestamp,
                 )
-    parent_post.thread.invalidate_cached_data()
+    parent_post.thread.invalidate_cached_data(lazy = True)
     award_badges_signal.send(None,
         event = 'post_comment',
         actor = self,
@@ -1202,19 +1208,26 @@ def user_delete_question(
                 ):
     self.assert_can_delete_question(question = question)
 
+    was_deleted = question.deleted
     question.deleted = True
     question.deleted_by = self
     question.deleted_at = timestamp
     question.save()
 
-    for tag in list(question.thread.tags.all()):
-        if tag.used_count == 1:
-            tag.deleted = True
-            tag.deleted_by = self
-            tag.deleted_at = timestamp
-        else:
-            tag.used_count = tag.used_count - 1
-        tag.save()
+    #tags of the deleted question are used one time less,
+    #tags that are no longer used are marked deleted,
+    #the counts are not changed when the question was deleted already
+    if not was_deleted:
+        tags = question.thread.tags.all()
+        tags.change_use_counts(-1)
+        tags.filter(
+                used_count = 0,
+                deleted = False
+            ).update(
+                deleted = True,
+                deleted_by = self,
+                deleted_at = timestamp
+            )
 
     signals.delete_question_or_answer.send(
         sender = question.__class__,
@@ -1276,23 +1289,28 @@ def user_restore_post(
     #here timestamp is not used, I guess added for consistency
     self.assert_can_restore_post(post)
     if post.post_type in ('question', 'answer'):
+        was_deleted = post.deleted
         post.deleted = False
         post.deleted_by = None
         post.deleted_at = None
         post.save()
         post.thread.invalidate_cached_data()
+        timeline.update_post_visibility(post)
         if post.post_type == 'answer':
             post.thread.update_answer_count()
-        else:
+        elif was_deleted:
+            #tags are used one time more, as in the
+            #user_delete_question the counts are changed
+            #only when the question was actually deleted
             #todo: make sure that these tags actually exist
             #some may have since been deleted for good
             #or merged into others
-            for tag in list(post.thread.tags.all()):
-                if tag.used_count == 1 and tag.deleted:
-                    tag.deleted = False
-                    tag.deleted_by = None
-                    tag.deleted_at = None
-                    tag.save()
+            post.thread.tags.all().update(
+                                    used_count = models.F('used_count') + 1,
+                                    deleted = False,
+                                    deleted_by = None,
+                                    deleted_at = None
+                                )
     else:
         raise NotImplementedError()
 
@@ -1345,7 +1363,7 @@ def user_edit_comment(self, comment_post=None, body_text = None):
     self.assert_can_edit_comment(comment_post)
     comment_post.text = body_text
     comment_post.parse_and_save(author = self)
-    comment_post.thread.invalidate_cached_data()
+    comment_post.thread.invalidate_cached_data(lazy = True)
 
 def user_edit_post(self,
                 post = None,
@@ -1402,7 +1420,7 @@ def user_edit_question(
         wiki = wiki,
         edit_anonymously = edit_anonymously,
     )
-    question.thread.invalidate_cached_data()
+    question.thread.invalidate_cached_data(lazy = True)
     award_badges_signal.send(None,
         event = 'edit_question',
         actor = self,
@@ -1429,7 +1447,7 @@ def user_edit_answer(
         comment = revision_comment,
         wiki = wiki,
     )
-    answer.thread.invalidate_cached_data()
+    answer.thread.invalidate_cached_data(lazy = True)
     award_badges_signal.send(None,
         event = 'edit_answer',
         actor = self,
@@ -1961,9 +1979,15 @@ VOTES_TO_EVENTS = {
     (Vote.VOTE_UP, 'comment'): 'upvote_comment',
 }
 @auto_now_timestamp
-def _process_vote(user, post, timestamp=None, cancel=False, vote_type=None):
+def _process_vote(
+                user, post, timestamp=None, cancel=False,
+                vote_type=None, limit_votes=False
+            ):
     """"private" wrapper function that applies post upvotes/downvotes
     and cancelations
+
+    if ``limit_votes`` is True, new votes are refused with
+    PermissionDenied when the user has no votes left for today
     """
     #get or create the vote object
     #return with noop in some situations
@@ -1984,6 +2008,13 @@ def _process_vote(user, post, timestamp=None, cancel=False, vote_type=None):
             pass
     else:
         if vote == None:
+            if limit_votes:
+                if not daily_counters.take_vote(user.id):
+                    raise django_exceptions.PermissionDenied(
+                        _('Sorry you ran out of votes for today')
+                    )
+            else:
+                daily_counters.count_vote(user.id)
             vote = Vote(
                     user = user,
                     voted_post=post,
@@ -2006,14 +2037,9 @@ def _process_vote(user, post, timestamp=None, cancel=False, vote_type=None):
             auth.onDownVotedCanceled(vote, post, user, timestamp)
         else:
             auth.onDownVoted(vote, post, user, timestamp)
-            
-    post.thread.invalidate_cached_data()
 
-    if post.post_type == 'question':
-        #denormalize the question post score on the thread
-        post.thread.score = post.score
-        post.thread.save()
-        post.thread.update_summary_html()
+    #votes come in bursts, so the summary re-rendering is coalesced
+    post.thread.invalidate_cached_data(lazy = True)
 
     if cancel:
         return None
@@ -2039,24 +2065,26 @@ def user_is_following_question(user, question):
     return question.thread.followed_by.filter(id=user.id).exists()
 
 
-def upvote(self, post, timestamp=None, cancel=False, force = False):
+def upvote(self, post, timestamp=None, cancel=False, force = False, limit_votes = False):
     #force parameter not used yet
     return _process_vote(
         self,
         post,
         timestamp=timestamp,
         cancel=cancel,
-        vote_type=Vote.VOTE_UP
+        vote_type=Vote.VOTE_UP,
+        limit_votes=limit_votes
     )
 
-def downvote(self, post, timestamp=None, cancel=False, force = False):
+def downvote(self, post, timestamp=None, cancel=False, force = False, limit_votes = False):
     #force not used yet
     return _process_vote(
         self,
         post,
         timestamp=timestamp,
         cancel=cancel,
-        vote_type=Vote.VOTE_DOWN
+        vote_type=Vote.VOTE_DOWN,
+        limit_votes=limit_votes
     )
 
 @auto_now_timestamp
@@ -2171,7 +2199,7 @@ def user_update_wildcard_tag_selections(
 
     self.interesting_tags = ' '.join(interesting)
     self.ignored_tags = ' '.join(ignored)
-    self.save()
+    self.save()#the wildcard index is invalidated on save
     return new_tags
 
 
@@ -2298,33 +2326,20 @@ User.add_to_class(
     )
 
 #todo: move this to askbot/utils ??
-def format_instant_notification_email(
-                                        to_user = None,
+def get_instant_notification_post_data(
                                         from_user = None,
                                         post = None,
                                         update_type = None,
-                                        template = None,
                                     ):
-    """
-    returns text of the instant notification body
-    and subject line
+    """returns the part of the instant notification
+    template data that is the same for all recipients
+    of the notification about the post update
 
-    that is built when post is updated
     only update_types in const.RESPONSE_ACTIVITY_TYPE_MAP_FOR_TEMPLATES
     are supported
     """
-
     site_url = askbot_settings.APP_URL
     origin_post = post.get_origin_post()
-    #todo: create a better method to access "sub-urls" in user views
-    user_subscriptions_url = site_url + \
-                                reverse(
-                                    'user_subscriptions',
-                                    kwargs = {
-                                        'id': to_user.id,
-                                        'slug': slugify(to_user.username)
-                                    }
-                                )
 
     if update_type == 'question_comment':
         assert(isinstance(post, Post) and post.is_comment())
@@ -2374,31 +2389,123 @@ def format_instant_notification_email(
                 content_preview += '<span style="%s">%s</span>' % (tag_style, tag_name)
             content_preview += '</div>'
 
-    update_data = {
+    return {
         'update_author_name': from_user.username,
-        'receiving_user_name': to_user.username,
-        'receiving_user_karma': to_user.reputation,
         'reply_by_email_karma_threshold': askbot_settings.MIN_REP_TO_POST_BY_EMAIL,
-        'can_reply': to_user.reputation > askbot_settings.MIN_REP_TO_POST_BY_EMAIL,
         'content_preview': content_preview,#post.get_snippet()
         'update_type': update_type,
         'post_url': strip_path(site_url) + post.get_absolute_url(),
         'origin_post_title': origin_post.thread.title,
+    }
+
+def get_instant_notification_recipient_data(to_user):
+    """returns the part of the instant notification
+    template data that is specific to the recipient"""
+    #todo: create a better method to access "sub-urls" in user views
+    user_subscriptions_url = askbot_settings.APP_URL + \
+                                reverse(
+                                    'user_subscriptions',
+                                    kwargs = {
+                                        'id': to_user.id,
+                                        'slug': slugify(to_user.username)
+                                    }
+                                )
+    return {
+        'receiving_user_name': to_user.username,
+        'receiving_user_karma': to_user.reputation,
+        'can_reply': to_user.reputation > askbot_settings.MIN_REP_TO_POST_BY_EMAIL,
         'user_subscriptions_url': user_subscriptions_url,
     }
-    subject_line = _('"%(title)s"') % {'title': origin_post.thread.title}
+
+def get_instant_notification_subject_line(post):
+    origin_post = post.get_origin_post()
+    return _('"%(title)s"') % {'title': origin_post.thread.title}
+
+def format_instant_notification_email(
+                                        to_user = None,
+                                        from_user = None,
+                                        post = None,
+                                        update_type = None,
+                                        template = None,
+                                    ):
+    """
+    returns text of the instant notification body
+    and subject line
+
+    that is built when post is updated
+    only update_types in const.RESPONSE_ACTIVITY_TYPE_MAP_FOR_TEMPLATES
+    are supported
+    """
+    update_data = get_instant_notification_post_data(
+                                        from_user = from_user,
+                                        post = post,
+                                        update_type = update_type
+                                    )
+    update_data.update(get_instant_notification_recipient_data(to_user))
+    subject_line = get_instant_notification_subject_line(post)
     return subject_line, template.render(Context(update_data))
 
+
+class InstantNotificationRenderer(object):
+    """renders instant notification bodies for many recipients
+    of the same post update
+
+    The template is rendered once per variant of the
+    ``can_reply`` flag with markers in place of the recipient
+    specific values, and the markers are substituted for each
+    recipient. Therefore the template must output the
+    recipient values as is, without filters.
+    """
+    RECIPIENT_FIELDS = (
+        'receiving_user_name',
+        'receiving_user_karma',
+        'user_subscriptions_url'
+    )
+
+    def __init__(self, template = None, post_data = None):
+        self.template = template
+        self.post_data = post_data
+        self.marker = uuid.uuid4().hex
+        self.marker_re = re.compile(r'%s(\w+?)%s' % (self.marker, self.marker))
+        self.skeletons = dict()
+
+    def get_skeleton(self, can_reply):
+        skeleton = self.skeletons.get(can_reply)
+        if skeleton is None:
+            data = dict(self.post_data)
+            data['can_reply'] = can_reply
+            for field in self.RECIPIENT_FIELDS:
+                data[field] = self.marker + field + self.marker
+            skeleton = self.template.render(Context(data))
+            self.skeletons[can_reply] = skeleton
+        return skeleton
+
+    def render(self, to_user):
+        recipient_data = get_instant_notification_recipient_data(to_user)
+        skeleton = self.get_skeleton(recipient_data['can_reply'])
+        return self.marker_re.sub(
+            lambda match: unicode(recipient_data[match.group(1)]),
+            skeleton
+        )
+
+
 #todo: action
 def send_instant_notifications_about_activity_in_post(
                                                 update_activity = None,
                                                 post = None,
                                                 recipients = None,
+                                                connection = None,
                                             ):
     """
     function called when posts are updated
     newly mentioned users are carried through to reduce
     database hits
+
+    parts of the message common for all recipients are
+    computed once, messages are sent in chunks
+    of ``ASKBOT_EMAIL_CHUNK_SIZE`` through one connection
+    to the email backend (``connection`` - optional,
+    the default backend is used otherwise)
     """
 
     if recipients is None:
@@ -2409,48 +2516,81 @@ def send_instant_notifications_about_activity_in_post(
     if update_activity.activity_type not in acceptable_types:
         return
 
+    recipients = list(recipients)
+    if len(recipients) == 0:
+        return
+
     from askbot.skins.loaders import get_template
-    template = get_template('instant_notification.html')
+    if askbot_settings.REPLY_BY_EMAIL:
+        template = get_template('instant_notification_reply_by_email.html')
+    else:
+        template = get_template('instant_notification.html')
 
     update_type_map = const.RESPONSE_ACTIVITY_TYPE_MAP_FOR_TEMPLATES
     update_type = update_type_map[update_activity.activity_type]
 
     origin_post = post.get_origin_post()
-    for user in recipients:
-
-        if askbot_settings.REPLY_BY_EMAIL:
-            template = get_template('instant_notification_reply_by_email.html')
-      
-        subject_line, body_text = format_instant_notification_email(
-                            to_user = user,
-                            from_user = update_activity.user,
-                            post = post,
-                            update_type = update_type,
-                            template = template,
-                        )
-      
-        #todo: this could be packaged as an "action" - a bundle
-        #of executive function with the activity log recording
-        #TODO check user reputation
-        headers = mail.thread_headers(post, origin_post, update_activity.activity_type)
-        if askbot_settings.REPLY_BY_EMAIL:
-            reply_address = "noreply"
-            if user.reputation >= askbot_settings.MIN_REP_TO_POST_BY_EMAIL:
-                reply_address = ReplyAddress.objects.create_new(post, user).address
-            reply_to = 'reply-%s@%s' % (reply_address, askbot_settings.REPLY_BY_EMAIL_HOSTNAME)
-            headers.update({'Reply-To': reply_to})
-        else:
-            reply_to = django_settings.DEFAULT_FROM_EMAIL
-        mail.send_mail(
-            subject_line = subject_line,
-            body_text = body_text,
-            recipient_list = [user.email],
-            related_object = origin_post,
-            activity_type = const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT,
-            headers = headers
-        )
+    renderer = InstantNotificationRenderer(
+                    template = template,
+                    post_data = get_instant_notification_post_data(
+                                            from_user = update_activity.user,
+                                            post = post,
+                                            update_type = update_type
+                                        )
+                )
+    subject_line = get_instant_notification_subject_line(post)
+    #todo: this could be packaged as an "action" - a bundle
+    #of executive function with the activity log recording
+    headers = mail.thread_headers(post, origin_post, update_activity.activity_type)
+
+    if connection is None:
+        connection = django_mail.get_connection()
 
+    chunk_size = mail.get_chunk_size()
+    try:
+        try:
+            connection.open()
+        except Exception, error:
+            #email failures must not break the caller
+            logging.critical(
+                'cannot connect to the email server: %s' % unicode(error)
+            )
+            return
+        for chunk_start in xrange(0, len(recipients), chunk_size):
+            chunk = recipients[chunk_start:chunk_start + chunk_size]
+
+            reply_addresses = dict()
+            if askbot_settings.REPLY_BY_EMAIL:
+                #TODO check user reputation
+                reply_addresses = ReplyAddress.objects.create_many(
+                    post,
+                    [
+                        user for user in chunk
+                        if user.reputation >= askbot_settings.MIN_REP_TO_POST_BY_EMAIL
+                    ]
+                )
 
+            messages = list()
+            for user in chunk:
+                user_headers = headers.copy()
+                if askbot_settings.REPLY_BY_EMAIL:
+                    reply_address = reply_addresses.get(user.id, 'noreply')
+                    reply_to = 'reply-%s@%s' % (
+                                            reply_address,
+                                            askbot_settings.REPLY_BY_EMAIL_HOSTNAME
+                                        )
+                    user_headers.update({'Reply-To': reply_to})
+                messages.append(
+                    mail.create_message(
+                        subject_line = subject_line,
+                        body_text = renderer.render(user),
+                        recipient_list = [user.email],
+                        headers = user_headers
+                    )
+                )
+            mail.send_messages(messages, connection = connection)
+    finally:
+        connection.close()
 
 
 #todo: move to utils
@@ -2500,6 +2640,12 @@ def record_post_update_activity(
     #)
 
 
+BADGE_LEVEL_FIELDS = {
+    const.GOLD_BADGE: 'gold',
+    const.SILVER_BADGE: 'silver',
+    const.BRONZE_BADGE: 'bronze',
+}
+
 def record_award_event(instance, created, **kwargs):
     """
     After we awarded a badge to user, we need to
@@ -2515,20 +2661,70 @@ def record_award_event(instance, created, **kwargs):
                         activity_type=const.TYPE_ACTIVITY_PRIZE
                     )
         activity.save()
+        timeline.record_activity(activity)
         activity.add_recipients([instance.user])
 
-        instance.badge.awarded_count += 1
-        instance.badge.save()
+        #badge data objects are shared in the process, so the
+        #count is updated without saving the possibly stale object
+        BadgeData.objects.filter(
+            id = instance.badge_id
+        ).update(
+            awarded_count = models.F('awarded_count') + 1
+        )
 
         badge = get_badge(instance.badge.slug)
 
-        if badge.level == const.GOLD_BADGE:
-            instance.user.gold += 1
-        if badge.level == const.SILVER_BADGE:
-            instance.user.silver += 1
-        if badge.level == const.BRONZE_BADGE:
-            instance.user.bronze += 1
-        instance.user.save()
+        badge_field = BADGE_LEVEL_FIELDS.get(badge.level)
+        if badge_field:
+            #the user row may be changed concurrently by the votes
+            User.objects.filter(
+                id = instance.user_id
+            ).update(**{badge_field: models.F(badge_field) + 1})
+            user = instance.user
+            setattr(user, badge_field, getattr(user, badge_field) + 1)
+
+def forget_awarded_badges(instance, **kwargs):
+    """drops cached list of badges of the user
+    when an award is added or deleted"""
+    badges.forget_awarded_badges(instance.user_id)
+
+def increment_badge_counters(instance, created, **kwargs):
+    if created:
+        badge_counters.record_change(instance, 1)
+
+def decrement_badge_counters(instance, **kwargs):
+    badge_counters.record_change(instance, -1)
+
+def update_profile_badges(instance, created, **kwargs):
+    if created:
+        profile_stats.add_award(instance)
+
+def recount_profile_badges(instance, **kwargs):
+    profile_stats.recount_badges(instance.user_id)
+
+def update_profile_vote_counts(instance, created, **kwargs):
+    """new votes are added to the totals of the voter,
+    a saved vote has changed direction, so the totals are recounted"""
+    if created:
+        profile_stats.change_vote_count(instance, 1)
+    else:
+        profile_stats.recount_votes(instance.user_id)
+
+def decrement_profile_vote_counts(instance, **kwargs):
+    profile_stats.change_vote_count(instance, -1)
+
+def update_profile_tag_usage(instance, created, **kwargs):
+    """counts the thread for the tags of the author of the new post"""
+    if created and instance.thread_id is not None:
+        tag_ids = list(instance.thread.tags.values_list('id', flat = True))
+        profile_stats.update_tag_usage([instance.author_id], tag_ids)
+
+def update_thread_profile_tag_usage(thread, tags, **kwargs):
+    """recounts the retagged tags of all authors in the thread"""
+    author_ids = list(
+        set(thread.posts.values_list('author', flat = True))
+    )
+    profile_stats.update_tag_usage(author_ids, [tag.id for tag in tags])
 
 def notify_award_message(instance, created, **kwargs):
     """
@@ -2567,6 +2763,7 @@ def record_answer_accepted(instance, created, **kwargs):
                         question=question
                     )
         activity.save()
+        timeline.record_activity(activity)
         recipients = instance.get_author_list(
                                     exclude_list = [question.author]
                                 )
@@ -2578,6 +2775,11 @@ def record_user_visit(user, timestamp, **kwargs):
     consecutive_days_visit_count
     """
     prev_last_seen = user.last_seen or datetime.datetime.now()
+    if visit_buffer.is_enabled():
+        #the value in the database may be behind the buffer
+        buffered_last_seen = visit_buffer.get_last_seen(user.id)
+        if buffered_last_seen is not None:
+            prev_last_seen = max(prev_last_seen, buffered_last_seen)
     user.last_seen = timestamp
     if (user.last_seen - prev_last_seen).days == 1:
         user.consecutive_days_visit_count += 1
@@ -2587,8 +2789,13 @@ def record_user_visit(user, timestamp, **kwargs):
             context_object = user,
             timestamp = timestamp
         )
+    elif visit_buffer.is_enabled():
+        visit_buffer.set_last_seen(user.id, timestamp)
+        return
     #somehow it saves on the query as compared to user.save()
     User.objects.filter(id = user.id).update(last_seen = timestamp)
+    if visit_buffer.is_enabled():
+        visit_buffer.set_last_seen(user.id, timestamp)
 
 
 def record_vote(instance, created, **kwargs):
@@ -2647,6 +2854,7 @@ def record_delete_question(instance, delete_by, **kwargs):
                 )
     #no need to set receiving user here
     activity.save()
+    timeline.update_post_visibility(instance)
 
 def record_flag_offensive(instance, mark_by, **kwargs):
     activity = Activity(
@@ -2704,6 +2912,15 @@ def record_update_tags(thread, tags, user, timestamp, **kwargs):
                 )
     activity.save()
 
+def update_similar_threads(thread, **kwargs):
+    """recomputes similar threads around the retagged thread"""
+    from askbot import tasks
+    tasks.update_similar_threads_celery_task.delay(thread.id)
+
+def update_tag_index_thread_status(instance, **kwargs):
+    """updates the unanswered thread lists of the tag index"""
+    tag_index.update_thread_status(instance)
+
 def record_favorite_question(instance, created, **kwargs):
     """
     when user add the question in him favorite questions list.
@@ -2794,10 +3011,18 @@ django_signals.pre_save.connect(make_admin_if_first_user, sender=User)
 django_signals.pre_save.connect(calculate_gravatar_hash, sender=User)
 django_signals.post_save.connect(add_missing_subscriptions, sender=User)
 django_signals.post_save.connect(record_award_event, sender=Award)
+django_signals.post_save.connect(forget_awarded_badges, sender=Award)
+django_signals.post_delete.connect(forget_awarded_badges, sender=Award)
 django_signals.post_save.connect(notify_award_message, sender=Award)
+django_signals.post_save.connect(update_profile_badges, sender=Award)
+django_signals.post_delete.connect(recount_profile_badges, sender=Award)
+django_signals.post_save.connect(update_profile_vote_counts, sender=Vote)
+django_signals.post_delete.connect(decrement_profile_vote_counts, sender=Vote)
+django_signals.post_save.connect(update_profile_tag_usage, sender=Post)
 django_signals.post_save.connect(record_answer_accepted, sender=Post)
 django_signals.post_save.connect(record_vote, sender=Vote)
 django_signals.post_save.connect(record_favorite_question, sender=FavoriteQuestion)
+django_signals.post_save.connect(update_tag_index_thread_status, sender=Thread)
 
 if 'avatar' in django_settings.INSTALLED_APPS:
     from avatar.models import Avatar
@@ -2806,17 +3031,37 @@ if 'avatar' in django_settings.INSTALLED_APPS:
 
 django_signals.post_delete.connect(record_cancel_vote, sender=Vote)
 
+for counted_model in (Activity, FavoriteQuestion, Post, Vote):
+    django_signals.post_save.connect(
+                            increment_badge_counters,
+                            sender = counted_model
+                        )
+    django_signals.post_delete.connect(
+                            decrement_badge_counters,
+                            sender = counted_model
+                        )
+
 #change this to real m2m_changed with Django1.2
 signals.delete_question_or_answer.connect(record_delete_question, sender=Post)
 signals.flag_offensive.connect(record_flag_offensive, sender=Post)
 signals.remove_flag_offensive.connect(remove_flag_offensive, sender=Post)
 signals.tags_updated.connect(record_update_tags)
+signals.tags_updated.connect(update_similar_threads)
+signals.tags_updated.connect(update_thread_profile_tag_usage)
 signals.user_updated.connect(record_user_full_updated, sender=User)
 signals.user_logged_in.connect(complete_pending_tag_subscriptions)#todo: add this to fake onlogin middleware
 signals.user_logged_in.connect(post_anonymous_askbot_content)
 signals.post_updated.connect(record_post_update_activity)
 signals.site_visited.connect(record_user_visit)
 
+#permission matrices of the template filters live for one request
+core_signals.request_started.connect(permissions.start_request)
+core_signals.request_finished.connect(permissions.finish_request)
+django_signals.post_init.connect(wildcard_index.remember_selections, sender=User)
+django_signals.post_save.connect(wildcard_index.user_saved, sender=User)
+core_signals.request_started.connect(wildcard_index.start_request)
+core_signals.request_finished.connect(wildcard_index.finish_request)
+
 #set up a possibility for the users to follow others
 try:
     import followit
@@ -2831,6 +3076,7 @@ __all__ = [
 
         'QuestionView',
         'FavoriteQuestion',
+        'SimilarThread',
         'AnonymousQuestion',
 
         'AnonymousAnswer',
@@ -2849,6 +3095,9 @@ __all__ = [
         'Activity',
         'ActivityAuditStatus',
         'EmailFeedSetting',
+        'TimelineEvent',
+        'ProfileStats',
+        'ProfileTagUsage',
 
         'User',
 
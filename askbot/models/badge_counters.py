@@ -0,0 +1,123 @@
+"""Counters used by the badge checks
+
+Some badges are awarded when a user reaches a number of votes,
+edits or comments, or when a question is favorited by a number
+of users. Instead of counting the rows on every event, the
+counters are kept in the cache:
+
+* a counter is loaded from the database when it is read
+  for the first time
+* creation and deletion of the counted rows change the
+  cached counter (see ``increment_badge_counters`` and
+  ``decrement_badge_counters`` in ``askbot.models``)
+* cached counters expire after ``ASKBOT_BADGE_COUNTER_TIMEOUT``
+  seconds (one day by default), so any drift is corrected
+
+A change made while the counter is being loaded may be missed,
+so the badge checks compare the counters with ``>=`` and rely on
+``Badge.award`` to not award the same badge twice.
+
+Counters are turned off by setting ``ASKBOT_BADGE_COUNTERS``
+to ``False``, then all counts are read from the database.
+"""
+from django.conf import settings as django_settings
+from django.core import cache
+from askbot import const
+
+COUNTER_KEY_TPL = 'badge-counter-%s-%d'
+EDIT_ACTIVITY_TYPES = (
+    const.TYPE_ACTIVITY_UPDATE_QUESTION,
+    const.TYPE_ACTIVITY_UPDATE_ANSWER
+)
+
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_BADGE_COUNTERS', True)
+
+def get_timeout():
+    return getattr(django_settings, 'ASKBOT_BADGE_COUNTER_TIMEOUT', 24*3600)
+
+def count_votes(user_id):
+    from askbot.models import Vote
+    return Vote.objects.filter(user = user_id).count()
+
+def count_edits(user_id):
+    from askbot.models import Activity
+    return Activity.objects.filter(
+                            user = user_id,
+                            activity_type__in = EDIT_ACTIVITY_TYPES
+                        ).count()
+
+def count_comments(user_id):
+    from askbot.models import Post
+    return Post.objects.get_comments().filter(author = user_id).count()
+
+def get_question_author_id(thread_id):
+    from askbot.models import Post
+    author_ids = Post.objects.get_questions().filter(
+                                    thread = thread_id
+                                ).values_list('author', flat = True)
+    if len(author_ids) == 0:
+        return None
+    return author_ids[0]
+
+def count_faves(thread_id):
+    """number of users other than the author
+    who have the question among the favorites"""
+    from askbot.models import FavoriteQuestion
+    return FavoriteQuestion.objects.filter(
+                                    thread = thread_id
+                                ).exclude(
+                                    user = get_question_author_id(thread_id)
+                                ).count()
+
+#counter name -> function that counts the value in the database
+COUNTERS = {
+    'votes': count_votes,#per user
+    'edits': count_edits,#per user
+    'comments': count_comments,#per user
+    'faves': count_faves,#per thread
+}
+
+def get_counter(name, object_id):
+    """returns value of the counter for the user or thread id"""
+    if not is_enabled():
+        return COUNTERS[name](object_id)
+    key = COUNTER_KEY_TPL % (name, object_id)
+    value = cache.cache.get(key)
+    if value is None:
+        value = COUNTERS[name](object_id)
+        cache.cache.add(key, value, get_timeout())
+    return value
+
+def change_counter(name, object_id, delta):
+    """applies the change to the cached counter,
+    a counter that is not cached will be loaded from the
+    database when it is needed"""
+    key = COUNTER_KEY_TPL % (name, object_id)
+    try:
+        if delta > 0:
+            cache.cache.incr(key, delta)
+        else:
+            cache.cache.decr(key, -delta)
+    except ValueError:
+        pass
+
+def record_change(instance, delta):
+    """updates the counters affected by creation (``delta = 1``)
+    or deletion (``delta = -1``) of the model instance"""
+    from askbot.models import Activity, FavoriteQuestion, Post, Vote
+    if isinstance(instance, Vote):
+        change_counter('votes', instance.user_id, delta)
+    elif isinstance(instance, Activity):
+        if instance.activity_type in EDIT_ACTIVITY_TYPES:
+            change_counter('edits', instance.user_id, delta)
+    elif isinstance(instance, Post):
+        if instance.post_type == 'comment':
+            change_counter('comments', instance.author_id, delta)
+    elif isinstance(instance, FavoriteQuestion):
+        key = COUNTER_KEY_TPL % ('faves', instance.thread_id)
+        if cache.cache.get(key) is None:
+            return
+        if instance.user_id != get_question_author_id(instance.thread_id):
+            change_counter('faves', instance.thread_id, delta)
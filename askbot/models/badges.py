@@ -16,20 +16,63 @@ adde it to BADGES dictionary, register with event in EVENTS_TO_BADGES
 and make sure that a signal `award_badges_signal` is sent with the
 corresponding event name, actor (user object), context_object and optionally
 - timestamp
+
+Badge checks avoid the database where possible: the counts
+of votes, edits, comments and favorites are read from
+the counters in :mod:`askbot.models.badge_counters`, slugs of
+the badges awarded to a user are cached and the ``BadgeData``
+rows are kept in memory of the process.
 """
 import datetime
+from django.core import cache
 from django.template.defaultfilters import slugify
 from django.contrib.contenttypes.models import ContentType
 from django.utils.translation import ugettext as _
 from django.dispatch import Signal
 from askbot.models.repute import BadgeData, Award
-from askbot.models.user import Activity
-from askbot.models.question import FavoriteQuestion as Fave#name collision
-from askbot.models.post import Post
+from askbot.models import badge_counters
 from askbot import const
 from askbot.conf import settings as askbot_settings
 from askbot.utils.decorators import auto_now_timestamp
 
+AWARDED_BADGES_KEY_TPL = 'user-awarded-badges-%d'
+
+#slug -> BadgeData, rows are cached in the process, because
+#they are only read here, the awarded_count is updated with
+#the queries that do not depend on the cached value
+_badge_data = dict()
+
+def get_badge_data(slug):
+    data = _badge_data.get(slug)
+    if data is None:
+        data, created = BadgeData.objects.get_or_create(slug = slug)
+        _badge_data[slug] = data
+    return data
+
+def clear_cached_badge_data():
+    _badge_data.clear()
+
+def load_awarded_badges(user_id):
+    return set(
+        Award.objects.filter(
+                    user = user_id
+                ).values_list('badge__slug', flat = True)
+    )
+
+def get_awarded_badges(user_id):
+    """returns set of slugs of the badges awarded to the user"""
+    if not badge_counters.is_enabled():
+        return load_awarded_badges(user_id)
+    key = AWARDED_BADGES_KEY_TPL % user_id
+    slugs = cache.cache.get(key)
+    if slugs is None:
+        slugs = load_awarded_badges(user_id)
+        cache.cache.add(key, slugs, badge_counters.get_timeout())
+    return slugs
+
+def forget_awarded_badges(user_id):
+    cache.cache.delete(AWARDED_BADGES_KEY_TPL % user_id)
+
 class Badge(object):
     """base class for the badges
 
@@ -88,7 +131,7 @@ class Badge(object):
         """do award, the recipient was proven to deserve"""
 
         if self.multiple == False:
-            if recipient.badges.filter(slug = self.key).count() != 0:
+            if self.key in get_awarded_badges(recipient.id):
                 return False
         else:
             content_type = ContentType.objects.get_for_model(context_object)
@@ -102,7 +145,7 @@ class Badge(object):
             if Award.objects.filter(**filters).count() != 0:
                 return False
 
-        badge = self.get_stored_data()
+        badge = get_badge_data(self.key)
         award = Award(
                     user = recipient,
                     badge = badge,
@@ -139,7 +182,7 @@ class Disciplined(Badge):
     def consider_award(self, actor = None,
                     context_object = None, timestamp = None):
 
-        if context_object.author != actor:
+        if context_object.author_id != actor.id:
             return False
         if context_object.score >= \
             askbot_settings.DISCIPLINED_BADGE_MIN_UPVOTES:
@@ -161,7 +204,7 @@ class PeerPressure(Badge):
     def consider_award(self, actor = None,
                     context_object = None, timestamp = None):
 
-        if context_object.author != actor:
+        if context_object.author_id != actor.id:
             return False
         if context_object.score <= \
             -1 * askbot_settings.PEER_PRESSURE_BADGE_MIN_DOWNVOTES:
@@ -244,8 +287,13 @@ class CivicDuty(Badge):
             context_object = None, timestamp = None):
         if context_object.post_type not in ('question', 'answer'):
             return False
-        if actor.votes.count() == askbot_settings.CIVIC_DUTY_BADGE_MIN_VOTES:
+        #cached counters may lag by a change, so the badge is
+        #considered at any count over the limit, ``award``
+        #does not award it twice
+        vote_count = badge_counters.get_counter('votes', actor.id)
+        if vote_count >= askbot_settings.CIVIC_DUTY_BADGE_MIN_VOTES:
             return self.award(actor, context_object, timestamp)
+        return False
 
 class SelfLearner(Badge):
     def __init__(self):
@@ -265,11 +313,14 @@ class SelfLearner(Badge):
             return False
 
         min_upvotes = askbot_settings.SELF_LEARNER_BADGE_MIN_UPVOTES
-        question = context_object.thread._question_post()
         answer = context_object
+        if answer.score < min_upvotes:
+            return False
 
-        if question.author == answer.author and answer.score >= min_upvotes:
-            self.award(context_object.author, context_object, timestamp)
+        question = context_object.thread._question_post()
+        if question.author_id == answer.author_id:
+            return self.award(context_object.author, context_object, timestamp)
+        return False
 
 class QualityPost(Badge):
     """Generic Badge for Nice/Good/Great Question or Answer
@@ -461,7 +512,7 @@ class Scholar(Badge):
         if context_object.post_type != 'answer':
             return False
         answer = context_object
-        if answer.thread._question_post().author != actor:
+        if answer.thread._question_post().author_id != actor.id:
             return False
         return self.award(actor, context_object, timestamp)
 
@@ -533,11 +584,12 @@ class Necromancer(Badge):
         if context_object.post_type != 'answer':
             return False
         answer = context_object
+        min_score = askbot_settings.NECROMANCER_BADGE_MIN_UPVOTES
+        if answer.score < min_score:
+            return False
         question = answer.thread._question_post()
         delta = datetime.timedelta(askbot_settings.NECROMANCER_BADGE_MIN_DELAY)
-        min_score = askbot_settings.NECROMANCER_BADGE_MIN_UPVOTES
-        if answer.added_at - question.added_at >= delta \
-            and answer.score >= min_score:
+        if answer.added_at - question.added_at >= delta:
             return self.award(answer.author, answer, timestamp)
         return False
 
@@ -597,13 +649,9 @@ class EditorTypeBadge(Badge):
     def consider_award(self, actor = None,
             context_object = None, timestamp = None):
 
-        atypes = (
-            const.TYPE_ACTIVITY_UPDATE_QUESTION,
-            const.TYPE_ACTIVITY_UPDATE_ANSWER
-        )
-        filters = {'user': actor, 'activity_type__in': atypes}
-        if Activity.objects.filter(**filters).count() == self.min_edits:
+        if badge_counters.get_counter('edits', actor.id) >= self.min_edits:
             return self.award(actor, context_object, timestamp)
+        return False
 
 class Editor(EditorTypeBadge):
     def __new__(cls):
@@ -672,13 +720,8 @@ class FavoriteTypeBadge(Badge):
     def consider_award(self, actor = None,
             context_object = None, timestamp = None):
         question = context_object
-        #model FavoriteQuestion imported under alias of Fave
-        count = Fave.objects.filter(
-                                        thread = question.thread
-                                    ).exclude(
-                                        user = question.author
-                                    ).count()
-        if count == self.min_stars:
+        count = badge_counters.get_counter('faves', question.thread_id)
+        if count >= self.min_stars:
             return self.award(question.author, question, timestamp)
         return False
 
@@ -739,7 +782,7 @@ class Commentator(Badge):
 
     def consider_award(self, actor = None,
             context_object = None, timestamp = None):
-        num_comments = Post.objects.get_comments().filter(author=actor).count()
+        num_comments = badge_counters.get_counter('comments', actor.id)
         if num_comments >= askbot_settings.COMMENTATOR_BADGE_MIN_COMMENTS:
             return self.award(actor, context_object, timestamp)
         return False
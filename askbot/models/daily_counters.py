@@ -0,0 +1,122 @@
+"""Daily counters of the votes given by the users and of the
+reputation received by the users for the upvotes
+
+Users may cast ``MAX_VOTES_PER_USER_PER_DAY`` votes per day and gain
+at most ``MAX_REP_GAIN_PER_USER_PER_DAY`` points per day from the
+upvotes. Instead of counting the votes and summing the reputation
+changes of the day on every vote, the counters are kept in the cache:
+
+* the date is a part of the key, so the counters start over every day
+* a counter is loaded from the database when it is read for
+  the first time in the day
+* the limits are checked with the atomic ``incr`` of the cache,
+  if the counter was already at the limit the change is taken back,
+  so two concurrent votes cannot both take the last vote of the day
+* the values are stored shifted by ``OFFSET``, because the
+  memcached counters cannot go below zero and the reputation
+  counter can (upvotes canceled today may have been given yesterday)
+
+Counters are turned off by setting ``ASKBOT_DAILY_COUNTERS``
+to ``False``, then the values are read from the database.
+"""
+import datetime
+from django.conf import settings as django_settings
+from django.core import cache
+
+COUNTER_KEY_TPL = 'daily-counter-%s-%s-%d'
+OFFSET = 1000000
+
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_DAILY_COUNTERS', True)
+
+def get_today_range():
+    today = datetime.date.today()
+    return (today, today + datetime.timedelta(1))
+
+def count_votes(user_id):
+    from askbot.models import Vote
+    return Vote.objects.filter(
+                        user = user_id,
+                        voted_at__range = get_today_range()
+                    ).count()
+
+def count_upvote_reputation(user_id):
+    from askbot.models import Repute
+    return Repute.objects.get_reputation_by_upvoted_today(user_id)
+
+#counter name -> function that counts the value in the database
+COUNTERS = {
+    'votes': count_votes,
+    'upvote_reputation': count_upvote_reputation,
+}
+
+def get_key(name, user_id):
+    return COUNTER_KEY_TPL % (name, datetime.date.today().isoformat(), user_id)
+
+def get_counter(name, user_id):
+    """returns today's value of the counter of the user"""
+    if not is_enabled():
+        return COUNTERS[name](user_id)
+    key = get_key(name, user_id)
+    value = cache.cache.get(key)
+    if value is None:
+        value = COUNTERS[name](user_id) + OFFSET
+        cache.cache.add(key, value, 24*3600)
+    return value - OFFSET
+
+def change_counter(name, user_id, delta):
+    """applies the change to the cached counter,
+    a counter that is not cached will be loaded from the
+    database when it is needed"""
+    key = get_key(name, user_id)
+    try:
+        if delta > 0:
+            cache.cache.incr(key, delta)
+        elif delta < 0:
+            cache.cache.decr(key, -delta)
+    except ValueError:
+        pass
+
+def add_within_limit(name, user_id, delta, limit):
+    """adds positive ``delta`` to the counter, if the value
+    of the counter is below the ``limit``,
+    returns True if the counter was changed"""
+    if not is_enabled():
+        return COUNTERS[name](user_id) < limit
+    get_counter(name, user_id)#load the counter into the cache
+    try:
+        value = cache.cache.incr(get_key(name, user_id), delta) - OFFSET
+    except ValueError:
+        #the counter was evicted in the meantime
+        return COUNTERS[name](user_id) < limit
+    if value - delta < limit:
+        return True
+    change_counter(name, user_id, -delta)
+    return False
+
+def get_votes_left(user_id):
+    """returns number of votes the user may still give today"""
+    from askbot.conf import settings as askbot_settings
+    votes_used = get_counter('votes', user_id)
+    return max(0, askbot_settings.MAX_VOTES_PER_USER_PER_DAY - votes_used)
+
+def take_vote(user_id):
+    """counts a new vote of the user, if the user
+    has votes left today, returns True if the vote was counted"""
+    from askbot.conf import settings as askbot_settings
+    return add_within_limit(
+                'votes',
+                user_id,
+                1,
+                askbot_settings.MAX_VOTES_PER_USER_PER_DAY
+            )
+
+def count_vote(user_id):
+    """counts a new vote of the user without the limit"""
+    change_counter('votes', user_id, 1)
+
+def uncount_vote(vote):
+    """takes back a deleted vote, if it was given today"""
+    if vote.voted_at and vote.voted_at.date() == datetime.date.today():
+        change_counter('votes', vote.user_id, -1)
@@ -0,0 +1,327 @@
+"""Permissions of one user, evaluated for the template filters
+
+The ``User.assert_can_...`` methods build the translated error
+messages, read the live settings and raise exceptions on every
+call, and the template filters ``can_edit_post``, ``can_flag_offensive``
+and others call them once per post. ``PermissionMatrix`` answers the
+same questions without the exceptions:
+
+* status and reputation of the user are read once, when the
+  matrix is created, the settings - once, when they are needed
+* ownership is checked by the ids, without loading the authors
+* the flags of the user are loaded with one query
+* the decisions are remembered per post
+
+Within a request the template filters use one matrix per user,
+the matrices are dropped when the request is finished. Outside of
+the requests every call gets a fresh matrix, so the decisions always
+follow the current state of the user.
+
+The rules must be kept in agreement with the assertions in
+``askbot.models``, the tests compare the decisions of both.
+"""
+import datetime
+import threading
+from django.contrib.contenttypes.models import ContentType
+from askbot import const
+from askbot.conf import settings as askbot_settings
+
+#outcomes of the generic check
+ALLOWED = 'allowed'
+DENIED = 'denied'
+LOW_REPUTATION = 'low reputation'
+
+_local = threading.local()
+
+
+class PermissionMatrix(object):
+    """answers the permission questions for one user"""
+
+    def __init__(self, user):
+        self.user_id = user.id
+        self.reputation = user.reputation
+        self.is_blocked = user.is_blocked()
+        self.is_suspended = user.is_suspended()
+        self.is_administrator = user.is_administrator()
+        self.is_staff = self.is_administrator or user.is_moderator()
+        self.settings = dict()
+        self.decisions = dict()
+        self.question_author_ids = dict()#thread id -> author id
+        self._flags = None
+
+    def get_setting(self, name):
+        """settings are read once, when they are needed"""
+        if name not in self.settings:
+            self.settings[name] = getattr(askbot_settings, name)
+        return self.settings[name]
+
+    def is_owner(self, post):
+        return post.author_id == self.user_id
+
+    def check(
+            self,
+            post = None,
+            admin_or_moderator_required = False,
+            owner_can = False,
+            suspended_owner_cannot = False,
+            owner_min_rep = None,
+            blocked_cannot = False,
+            suspended_cannot = False,
+            min_rep = None
+        ):
+        """same rules as in ``askbot.models._assert_user_can``,
+        returns ``ALLOWED``, ``DENIED`` or ``LOW_REPUTATION``"""
+        if blocked_cannot and self.is_blocked:
+            return DENIED
+        elif post and owner_can and self.is_owner(post):
+            if owner_min_rep and self.reputation < owner_min_rep:
+                if self.is_staff:
+                    return ALLOWED
+                return LOW_REPUTATION
+            if suspended_owner_cannot and self.is_suspended:
+                return DENIED
+            return ALLOWED
+        elif suspended_cannot and self.is_suspended:
+            return DENIED
+        elif self.is_staff:
+            return ALLOWED
+        elif min_rep is not None and self.reputation < min_rep:
+            return LOW_REPUTATION
+        elif admin_or_moderator_required:
+            return DENIED
+        return ALLOWED
+
+    def is_allowed(self, rule, post):
+        """returns the decision of the rule - name of a method
+        of this class - for the post, decisions are remembered"""
+        key = (rule, post.id)
+        if key not in self.decisions:
+            self.decisions[key] = getattr(self, rule)(post)
+        return self.decisions[key]
+
+    def get_flags(self):
+        """returns tuple of the set of (content type id, object id)
+        flagged by the user and of the number of flags given today"""
+        if self._flags is None:
+            from askbot.models import Activity
+            #same time frame as in ``User.get_flag_count_posted_today``
+            today = datetime.datetime.combine(
+                                datetime.date.today(), datetime.time()
+                            )
+            tomorrow = today + datetime.timedelta(1)
+            flagged = set()
+            count_today = 0
+            rows = Activity.objects.filter(
+                            user = self.user_id,
+                            activity_type = const.TYPE_ACTIVITY_MARK_OFFENSIVE
+                        ).values_list('content_type', 'object_id', 'active_at')
+            for content_type_id, object_id, active_at in rows:
+                flagged.add((content_type_id, object_id))
+                if today <= active_at <= tomorrow:
+                    count_today += 1
+            self._flags = (flagged, count_today)
+        return self._flags
+
+    def has_flagged(self, post):
+        content_type = ContentType.objects.get_for_model(post)
+        return (content_type.id, post.id) in self.get_flags()[0]
+
+    def get_question_author_id(self, post):
+        thread_id = post.thread_id
+        if thread_id not in self.question_author_ids:
+            author_id = post.thread._question_post().author_id
+            self.question_author_ids[thread_id] = author_id
+        return self.question_author_ids[thread_id]
+
+    def can_see_deleted_post(self, post):
+        return self.check(
+                    post = post,
+                    admin_or_moderator_required = True,
+                    owner_can = True
+                ) == ALLOWED
+
+    def can_edit_post(self, post):
+        if post.deleted == True:
+            return self.can_see_deleted_post(post)
+        if post.wiki == True:
+            min_rep = self.get_setting('MIN_REP_TO_EDIT_WIKI')
+        else:
+            min_rep = self.get_setting('MIN_REP_TO_EDIT_OTHERS_POSTS')
+        return self.check(
+                    post = post,
+                    owner_can = True,
+                    blocked_cannot = True,
+                    suspended_cannot = True,
+                    min_rep = min_rep
+                ) == ALLOWED
+
+    def can_retag_question(self, question):
+        if question.deleted == True:
+            if not self.can_see_deleted_post(question):
+                return False
+        return self.check(
+                    post = question,
+                    owner_can = True,
+                    blocked_cannot = True,
+                    suspended_cannot = True,
+                    min_rep = self.get_setting('MIN_REP_TO_RETAG_OTHERS_QUESTIONS')
+                ) == ALLOWED
+
+    def can_delete_answer(self, answer):
+        return self.check(
+                    post = answer,
+                    owner_can = True,
+                    blocked_cannot = True,
+                    suspended_cannot = True,
+                    min_rep = self.get_setting('MIN_REP_TO_DELETE_OTHERS_POSTS')
+                ) == ALLOWED
+
+    def can_delete_question(self, question):
+        if not self.can_delete_answer(question):
+            return False
+        if self.is_owner(question) and not self.is_staff:
+            #owner cannot delete question with upvoted answers of others
+            return not question.thread.all_answers().exclude(
+                                        author = self.user_id
+                                    ).exclude(
+                                        score__lte = 0
+                                    ).exists()
+        return True
+
+    def can_delete_comment(self, comment):
+        return self.check(
+                    post = comment,
+                    owner_can = True,
+                    blocked_cannot = True,
+                    suspended_cannot = True,
+                    min_rep = self.get_setting('MIN_REP_TO_DELETE_OTHERS_COMMENTS')
+                ) == ALLOWED
+
+    def can_delete_post(self, post):
+        post_type = getattr(post, 'post_type', '')
+        if post_type == 'question':
+            return self.can_delete_question(post)
+        elif post_type == 'answer':
+            return self.can_delete_answer(post)
+        elif post_type == 'comment':
+            return self.can_delete_comment(post)
+        else:
+            raise ValueError('Invalid post_type!')
+
+    def can_edit_comment(self, comment):
+        if self.is_staff:
+            return True
+        if not self.is_owner(comment):
+            return False
+        if self.get_setting('USE_TIME_LIMIT_TO_EDIT_COMMENT'):
+            minutes = self.get_setting('MINUTES_TO_EDIT_COMMENT')
+            edit_period = datetime.timedelta(0, 60 * minutes)
+            if datetime.datetime.now() - comment.added_at > edit_period:
+                return comment.is_last()
+        return True
+
+    def can_post_comment(self, parent_post):
+        result = self.check(
+                    post = parent_post,
+                    owner_can = True,
+                    blocked_cannot = True,
+                    suspended_cannot = True,
+                    min_rep = self.get_setting('MIN_REP_TO_LEAVE_COMMENTS')
+                )
+        if result == LOW_REPUTATION and parent_post.post_type == 'answer':
+            #answers to own questions can be commented
+            return self.get_question_author_id(parent_post) == self.user_id
+        return result == ALLOWED
+
+    def can_close_question(self, question):
+        return self.check(
+                    post = question,
+                    owner_can = True,
+                    suspended_owner_cannot = True,
+                    owner_min_rep = self.get_setting('MIN_REP_TO_CLOSE_OWN_QUESTIONS'),
+                    blocked_cannot = True,
+                    suspended_cannot = True,
+                    min_rep = self.get_setting('MIN_REP_TO_CLOSE_OTHERS_QUESTIONS')
+                ) == ALLOWED
+
+    def can_reopen_question(self, question):
+        return self.check(
+                    post = question,
+                    admin_or_moderator_required = True,
+                    owner_can = True,
+                    suspended_owner_cannot = True,
+                    owner_min_rep = self.get_setting('MIN_REP_TO_REOPEN_OWN_QUESTIONS')
+                ) == ALLOWED
+
+    def can_flag_offensive(self, post):
+        #repeated flagging is not an error for the templates
+        if self.has_flagged(post):
+            return True
+        result = self.check(
+                    post = post,
+                    blocked_cannot = True,
+                    suspended_cannot = True,
+                    min_rep = self.get_setting('MIN_REP_TO_FLAG_OFFENSIVE')
+                )
+        if result != ALLOWED:
+            return False
+        if self.is_staff:
+            return True
+        flag_count_today = self.get_flags()[1]
+        return flag_count_today < self.get_setting('MAX_FLAGS_PER_USER_PER_DAY')
+
+    def can_remove_flag_offensive(self, post):
+        if not self.has_flagged(post):
+            return False
+        return self.check(
+                    post = post,
+                    blocked_cannot = True,
+                    suspended_cannot = True,
+                    min_rep = self.get_setting('MIN_REP_TO_FLAG_OFFENSIVE')
+                ) == ALLOWED
+
+    def can_remove_all_flags_offensive(self, post):
+        if not self.is_staff:
+            return False
+        from askbot.models import Activity
+        return Activity.objects.filter(
+                        activity_type = const.TYPE_ACTIVITY_MARK_OFFENSIVE,
+                        content_type = ContentType.objects.get_for_model(post),
+                        object_id = post.id
+                    ).exists()
+
+    def can_accept_best_answer(self, answer):
+        if self.is_blocked or self.is_suspended:
+            return False
+        if self.get_question_author_id(answer) == self.user_id:
+            if self.is_owner(answer) and not self.is_administrator:
+                if self.is_staff:
+                    return True
+                min_rep = self.get_setting('MIN_REP_TO_ACCEPT_OWN_ANSWER')
+                return self.reputation >= min_rep
+            return True
+        elif self.is_staff:
+            days = self.get_setting('MIN_DAYS_FOR_STAFF_TO_ACCEPT_ANSWER')
+            will_be_able_at = answer.added_at + datetime.timedelta(days = days)
+            return datetime.datetime.now() >= will_be_able_at
+        return False
+
+
+def start_request(**kwargs):
+    """matrices are shared until the end of the request"""
+    _local.matrices = dict()
+
+def finish_request(**kwargs):
+    _local.matrices = None
+
+def get_matrix(user):
+    """returns permission matrix of the user, the same
+    within one request, a new one outside of the requests"""
+    matrices = getattr(_local, 'matrices', None)
+    if matrices is None:
+        return PermissionMatrix(user)
+    matrix = matrices.get(user.id)
+    if matrix is None:
+        matrix = PermissionMatrix(user)
+        matrices[user.id] = matrix
+    return matrix
@@ -27,8 +27,8 @@ from askbot.models.tag import MarkedTag, tags_match_some_wildcard
 from askbot.conf import settings as askbot_settings
 from askbot import exceptions
 from askbot.utils import markup
-from askbot.utils.html import sanitize_html
 from askbot.models.base import BaseQuerySetManager
+from askbot.search import wildcard_index
 
 #todo: maybe merge askbot.utils.markup and forum.utils.html
 from askbot.utils.diff import textDiff as htmldiff
@@ -321,7 +321,7 @@ class Post(models.Model):
             text = html.urlize(text)
 
         if _use_markdown:
-            text = sanitize_html(markup.get_parser().convert(text))
+            text = markup.markdown_to_html(text)
 
         #todo, add markdown parser call conditional on
         #post.use_markdown flag
@@ -337,12 +337,16 @@ class Post(models.Model):
 
             extra_name_seeds = markup.extract_mentioned_name_seeds(text)
 
-            extra_authors = set()
-            for name_seed in extra_name_seeds:
-                extra_authors.update(User.objects.filter(
-                    username__istartswith = name_seed
-                )
-                )
+            extra_authors = list()
+            if extra_name_seeds:
+                #one query for all the seeds
+                seed_filters = [
+                    models.Q(username__istartswith = name_seed)
+                    for name_seed in extra_name_seeds
+                ]
+                extra_authors = User.objects.filter(
+                                    reduce(operator.or_, seed_filters)
+                                )
 
             #it is important to preserve order here so that authors of post
             #get mentioned first
@@ -627,36 +631,40 @@ class Post(models.Model):
         )
 
         #part 2 - find users who follow or not ignore tags via wildcard selections
-        #inside there is a potentially time consuming loop
         if askbot_settings.USE_WILDCARD_TAGS:
-            #todo: fix this
-            #this branch will not scale well
-            #because we have to loop through the list of users
-            #in python
-            if tag_mark_reason == 'good':
-                empty_wildcard_filter = {'interesting_tags__exact': ''}
-                wildcard_tags_attribute = 'interesting_tags'
-                update_subscribers = lambda the_set, item: the_set.add(item)
-            elif tag_mark_reason == 'bad':
-                empty_wildcard_filter = {'ignored_tags__exact': ''}
-                wildcard_tags_attribute = 'ignored_tags'
-                update_subscribers = lambda the_set, item: the_set.discard(item)
+            if tag_mark_reason == 'bad':
+                #only the subscribers found above may be excluded,
+                #their ignored wildcards are checked directly
+                for subscriber in list(subscribers):
+                    if subscriber.ignored_tags == '':
+                        continue
+                    wildcard_tags = subscriber.ignored_tags.split(' ')
+                    if tags_match_some_wildcard(tag_names, wildcard_tags):
+                        subscribers.discard(subscriber)
+                return subscribers
+
+            #candidates are looked up in the wildcard index,
+            #then the matches are verified as the index may lag behind
+            matching_user_ids = wildcard_index.get_matching_user_ids(
+                                                    tag_names,
+                                                    tag_mark_reason
+                                                )
+            if len(matching_user_ids) == 0:
+                return subscribers
 
             potential_wildcard_subscribers = User.objects.filter(
+                id__in = matching_user_ids
+            ).filter(
                 notification_subscriptions__in = subscription_records
             ).filter(
                 email_tag_filter_strategy = email_tag_filter_strategy
             ).exclude(
-                **empty_wildcard_filter #need this to limit size of the loop
+                interesting_tags__exact = '' #need this to limit size of the loop
             )
             for potential_subscriber in potential_wildcard_subscribers:
-                wildcard_tags = getattr(
-                    potential_subscriber,
-                    wildcard_tags_attribute
-                ).split(' ')
-
+                wildcard_tags = potential_subscriber.interesting_tags.split(' ')
                 if tags_match_some_wildcard(tag_names, wildcard_tags):
-                    update_subscribers(subscribers, potential_subscriber)
+                    subscribers.add(potential_subscriber)
 
         return subscribers
 
@@ -1541,9 +1549,11 @@ class PostRevision(models.Model):
         #INFO: ack-grepping shows that it's only used for Questions, so there's no code for Answers
         return self.question.thread.title
 
-    def as_html(self, **kwargs):
-        markdowner = markup.get_parser()
-        sanitized_html = sanitize_html(markdowner.convert(self.text))
+    def as_html(self, sanitized_html = None, **kwargs):
+        """``sanitized_html`` - html of the revision text,
+        if already known"""
+        if sanitized_html is None:
+            sanitized_html = markup.markdown_to_html(self.text)
 
         if self.is_question_revision():
             return self.QUESTION_REVISION_TEMPLATE_NO_TAGS % {
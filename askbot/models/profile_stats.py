@@ -0,0 +1,334 @@
+"""Statistics shown on the overview tab of the user profile
+
+The vote totals and the badges of the user are kept in one
+``ProfileStats`` record per user, and the tag usage counts
+in the ``ProfileTagUsage`` records, so the profile page reads
+them with two indexed queries:
+
+* the record is built from the database when the profile
+  is shown for the first time
+* new and deleted votes change the vote totals, a vote changed
+  from up to down or back recounts the totals of the voter
+* new awards are added to the badges, deleted awards
+  recount the badges of the user, only ids of the awarded posts
+  are stored, the titles and links are read when the badges are shown
+* new posts and retags recount the tag usage of the affected
+  users and tags only
+
+The handlers are connected in ``askbot.models``. The records are
+checked against the database and corrected with the management
+command ``rebuild_profile_stats``.
+"""
+from django.db import models
+from django.db import IntegrityError
+from django.db import transaction
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.utils import simplejson
+from askbot.utils.db import bulk_insert
+
+
+class ProfileStats(models.Model):
+    user = models.OneToOneField(User, related_name = 'profile_stats')
+    up_votes = models.IntegerField(default = 0)
+    down_votes = models.IntegerField(default = 0)
+    #json list of the badges of the user, see load_badges()
+    badges = models.TextField(default = '[]')
+
+    class Meta:
+        app_label = 'askbot'
+
+    def __unicode__(self):
+        return u'Profile statistics of user %d' % self.user_id
+
+    def get_badges(self):
+        """returns list of tuples
+        ``(badge data, number of awards, list of awarded posts)``,
+        the awarded posts are dictionaries returned by
+        ``get_awarded_post_data``, all posts are read with one query
+        """
+        from askbot.models import badges, Post
+        items = simplejson.loads(self.badges)
+        post_ids = set()
+        for item in items:
+            post_ids.update(item['post_ids'])
+        posts = Post.objects.filter(
+                                id__in = post_ids
+                            ).select_related('thread')
+        posts_data = dict(
+            [(post.id, get_awarded_post_data(post)) for post in posts]
+        )
+        return [
+            (
+                badges.get_badge_data(item['slug']),
+                item['count'],
+                #protect from the posts deleted in the meantime
+                [
+                    posts_data[post_id] for post_id in item['post_ids']
+                    if post_id in posts_data
+                ]
+            )
+            for item in items
+        ]
+
+
+class ProfileTagUsage(models.Model):
+    """number of threads with the tag
+    where the user has posted"""
+    user = models.ForeignKey(User, related_name = 'profile_tag_usage')
+    tag = models.ForeignKey('Tag', related_name = '+')
+    count = models.PositiveIntegerField(default = 0)
+
+    class Meta:
+        app_label = 'askbot'
+        unique_together = ('user', 'tag')
+
+
+def count_votes(user_id):
+    """returns tuple of numbers of the up and down votes"""
+    from askbot.models import Vote
+    counts = dict(
+        Vote.objects.filter(
+                    user = user_id
+                ).values_list(
+                    'vote'
+                ).annotate(
+                    models.Count('id')
+                )
+    )
+    return counts.get(Vote.VOTE_UP, 0), counts.get(Vote.VOTE_DOWN, 0)
+
+def get_awarded_post_data(post):
+    return {
+        'title': post.thread.title,
+        'url': post.get_absolute_url(),
+        'snippet': post.get_snippet(),
+        'is_answer': post.is_answer()
+    }
+
+def sort_badges(items):
+    items.sort(key = lambda item: (-item['count'], item['slug']))
+
+def load_badges(user_id):
+    """returns list of dictionaries with keys ``slug``,
+    ``count`` and ``post_ids``, one per badge of the user,
+    the badges with more awards go first, see ``sort_badges``
+
+    ``post_ids`` - list of ids of the awarded posts"""
+    from askbot.models import Award, Post
+    awards = list(
+        Award.objects.filter(
+                        user = user_id
+                    ).select_related(
+                        'badge'
+                    ).order_by('awarded_at')
+    )
+    post_type = ContentType.objects.get_for_model(Post)
+    awarded_post_ids = [
+        award.object_id for award in awards
+        if award.content_type_id == post_type.id
+    ]
+    existing_post_ids = set(
+        Post.objects.filter(
+                    id__in = awarded_post_ids
+                ).values_list('id', flat = True)
+    )
+
+    items = dict()
+    for award in awards:
+        slug = award.badge.slug
+        if slug not in items:
+            items[slug] = {'slug': slug, 'count': 0, 'post_ids': list()}
+        item = items[slug]
+        item['count'] += 1
+        if award.content_type_id == post_type.id:
+            #protect from awards of the deleted posts
+            if award.object_id in existing_post_ids:
+                item['post_ids'].append(award.object_id)
+
+    items = items.values()
+    sort_badges(items)
+    return items
+
+def load_tag_usage(user_ids, tag_ids = None):
+    """returns dictionary ``(user id, tag id) -> count``
+    of the threads with the tag where the user has posted,
+    only the tags with ids ``tag_ids`` are counted, if given
+    """
+    from askbot.models import Post
+    posts = Post.objects.filter(author__in = user_ids)
+    if tag_ids is not None:
+        posts = posts.filter(thread__tags__in = tag_ids)
+    rows = posts.values_list(
+                        'author', 'thread', 'thread__tags'
+                    ).distinct()
+    counts = dict()
+    for user_id, thread_id, tag_id in rows:
+        if tag_id is None:
+            continue
+        key = (user_id, tag_id)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+def save_tag_usage(user_ids, tag_ids, counts):
+    """replaces the tag usage records of the users,
+    only the records of ``tag_ids`` are replaced, if given"""
+    records = ProfileTagUsage.objects.filter(user__in = user_ids)
+    if tag_ids is not None:
+        records = records.filter(tag__in = tag_ids)
+    records.delete()
+    rows = [
+        (user_id, tag_id, count)
+        for (user_id, tag_id), count in counts.items()
+    ]
+    bulk_insert(ProfileTagUsage, ('user', 'tag', 'count'), rows)
+
+def update_tag_usage(user_ids, tag_ids = None):
+    """recounts tag usage of the users, only for the ``tag_ids``
+    if given, otherwise for all tags"""
+    if len(user_ids) == 0:
+        return
+    if tag_ids is not None and len(tag_ids) == 0:
+        return
+    counts = load_tag_usage(user_ids, tag_ids)
+    save_tag_usage(user_ids, tag_ids, counts)
+
+def build_stats(user_id):
+    """returns unsaved statistics record
+    of the user counted in the database"""
+    up_votes, down_votes = count_votes(user_id)
+    return ProfileStats(
+                user_id = user_id,
+                up_votes = up_votes,
+                down_votes = down_votes,
+                badges = simplejson.dumps(load_badges(user_id))
+            )
+
+def get_stats(user):
+    """returns statistics record of the user,
+    the record is created when it does not exist yet
+
+    when the record is created by a concurrent request
+    in the meantime, that record is returned"""
+    try:
+        return ProfileStats.objects.get(user = user)
+    except ProfileStats.DoesNotExist:
+        stats = build_stats(user.id)
+        savepoint_id = transaction.savepoint()
+        try:
+            stats.save()
+        except IntegrityError:
+            transaction.savepoint_rollback(savepoint_id)
+            return ProfileStats.objects.get(user = user)
+        transaction.savepoint_commit(savepoint_id)
+        update_tag_usage([user.id])
+        return stats
+
+def get_tag_usage(user, limit):
+    """returns list of the tag usage records of the user,
+    most used tags first"""
+    return list(
+        ProfileTagUsage.objects.filter(
+                            user = user
+                        ).select_related(
+                            'tag'
+                        ).order_by(
+                            '-count'
+                        )[:limit]
+    )
+
+def change_vote_count(vote, delta):
+    """adds ``delta`` to the vote total of the voter,
+    a missing record is left to be built when it is needed"""
+    from askbot.models import Vote
+    if vote.vote == Vote.VOTE_UP:
+        field = 'up_votes'
+    else:
+        field = 'down_votes'
+    ProfileStats.objects.filter(
+                    user = vote.user_id
+                ).update(
+                    **{field: models.F(field) + delta}
+                )
+
+def recount_votes(user_id):
+    up_votes, down_votes = count_votes(user_id)
+    ProfileStats.objects.filter(
+                    user = user_id
+                ).update(
+                    up_votes = up_votes,
+                    down_votes = down_votes
+                )
+
+def add_award(award):
+    """adds the new award to the badges of the user"""
+    from askbot.models import Post
+    try:
+        stats = ProfileStats.objects.get(user = award.user_id)
+    except ProfileStats.DoesNotExist:
+        return
+    items = simplejson.loads(stats.badges)
+    slug = award.badge.slug
+    for item in items:
+        if item['slug'] == slug:
+            break
+    else:
+        item = {'slug': slug, 'count': 0, 'post_ids': list()}
+        items.append(item)
+    item['count'] += 1
+    if isinstance(award.content_object, Post):
+        item['post_ids'].append(award.object_id)
+    sort_badges(items)
+    ProfileStats.objects.filter(
+                    id = stats.id
+                ).update(
+                    badges = simplejson.dumps(items)
+                )
+
+def recount_badges(user_id):
+    ProfileStats.objects.filter(
+                    user = user_id
+                ).update(
+                    badges = simplejson.dumps(load_badges(user_id))
+                )
+
+def rebuild(progress_callback = None):
+    """counts the statistics of every user in the database
+    and corrects the stored records which differ, missing
+    statistics records are left to be built when they are needed
+
+    ``progress_callback`` is called with the number
+    of processed users
+
+    returns number of the corrected users"""
+    corrected_count = 0
+    user_ids = User.objects.order_by('id').values_list('id', flat = True)
+    for done, user_id in enumerate(user_ids.iterator()):
+        is_correct = True
+
+        stored = ProfileStats.objects.filter(user = user_id)
+        if len(stored) == 1:
+            stats = build_stats(user_id)
+            stats.id = stored[0].id
+            if (stats.up_votes, stats.down_votes) != \
+                (stored[0].up_votes, stored[0].down_votes) or \
+                simplejson.loads(stats.badges) != simplejson.loads(stored[0].badges):
+                stats.save()
+                is_correct = False
+
+        counts = load_tag_usage([user_id])
+        stored_counts = dict(
+            ((user_id, tag_id), count)
+            for tag_id, count in ProfileTagUsage.objects.filter(
+                            user = user_id
+                        ).values_list('tag', 'count')
+        )
+        if counts != stored_counts:
+            save_tag_usage([user_id], None, counts)
+            is_correct = False
+
+        if not is_correct:
+            corrected_count += 1
+        if progress_callback:
+            progress_callback(done + 1)
+    return corrected_count
@@ -1,6 +1,7 @@
 import datetime
 import operator
 import re
+import time
 
 from django.conf import settings
 from django.db import models
@@ -22,6 +23,66 @@ from askbot.utils import mysql
 from askbot.utils.slug import slugify
 from askbot.skins.loaders import get_template #jinja2 template loading enviroment
 from askbot.search.state_manager import DummySearchState
+from askbot.search import tag_index
+
+# use `<<<` and `>>>` because they cannot be confused with user input
+# - if user accidentialy types <<<tag-name>>> into question title or body,
+# then in html it'll become escaped like this: &lt;&lt;&lt;tag-name&gt;&gt;&gt;
+SUMMARY_TAG_PLACEHOLDER_RE = re.compile(
+    r'<<<(%s)>>>' % const.TAG_REGEX_BARE,
+    re.UNICODE
+)
+
+def fill_summary_tag_urls(html, search_state, url_memo=None):
+    """replaces tag placeholders in the cached question summary html
+    with the search urls, in one pass over the html.
+    ``url_memo`` - a dictionary tag -> url, may be shared
+    between the threads rendered for the same search state
+    """
+    if url_memo is None:
+        url_memo = dict()
+
+    def get_tag_url(match):
+        tag = match.group(1)  # e.g "my-tag"
+        url = url_memo.get(tag)
+        if url is None:
+            url = search_state.add_tag(tag).full_url()
+            url_memo[tag] = url
+        return url
+
+    return SUMMARY_TAG_PLACEHOLDER_RE.sub(get_tag_url, html)
+
+
+def get_summary_update_delay():
+    """number of seconds during which invalidations of the
+    thread summary html are coalesced before it is re-rendered,
+    zero means re-rendering right away"""
+    return getattr(settings, 'ASKBOT_SUMMARY_UPDATE_DELAY', 5)
+
+def get_summary_max_staleness():
+    """number of seconds for which the stale summary html
+    may be served while the re-rendering is pending"""
+    return getattr(settings, 'ASKBOT_SUMMARY_MAX_STALENESS', 60)
+
+def summary_is_too_stale(stale_since):
+    """``stale_since`` - value of the stale summary marker"""
+    if stale_since is None:
+        return False
+    return time.time() - stale_since > get_summary_max_staleness()
+
+
+QUESTION_ORDER_BY_MAP = {
+    'age-desc': '-added_at',
+    'age-asc': 'added_at',
+    'activity-desc': '-last_activity_at',
+    'activity-asc': 'last_activity_at',
+    'answers-desc': '-answer_count',
+    'answers-asc': 'answer_count',
+    'votes-desc': '-score',
+    'votes-asc': 'score',
+
+    'relevance-desc': '-relevance', # special Postgresql-specific ordering, 'relevance' quaso-column is added by get_for_query()
+}
 
 
 class ThreadManager(models.Manager):
@@ -168,9 +229,35 @@ class ThreadManager(models.Manager):
             if query_users:
                 qs = qs.filter(posts__post_type='question', posts__author__in=query_users) # TODO: unify with search_state.author ?
 
+        # INFO: when the tag index is used, tag selections are resolved
+        #       into a sorted list of thread ids (`index_ids`), which is finally
+        #       passed into the `id__in` filter. `tag_filters` keep the equivalent
+        #       ORM filters, they are applied when the index is not used
+        #       or when the selection turns out to be too large for `id__in`
+        #       (the index returns `None` for the too large lists)
+        use_tag_index = tag_index.is_enabled()
+        index_ids = None
+        tag_filters = list()
+
+        def combine_index_ids(ids, combine_function):
+            """returns new `index_ids` or `None` when
+            the index cannot answer the selection"""
+            if ids is None:
+                return None
+            if index_ids is None:
+                return ids
+            return combine_function(index_ids, ids)
+
         tags = search_state.unified_tags()
-        for tag in tags:
-            qs = qs.filter(tags__name=tag) # Tags or AND-ed here, not OR-ed (i.e. we fetch only threads with all tags)
+        if tags:
+            def filter_by_all_tags(qs):
+                for tag in tags:
+                    qs = qs.filter(tags__name=tag) # Tags or AND-ed here, not OR-ed (i.e. we fetch only threads with all tags)
+                return qs
+            tag_filters.append(filter_by_all_tags)
+            if use_tag_index:
+                index_ids = tag_index.get_thread_ids(tags, match_all=True)
+                use_tag_index = index_ids is not None
 
         if search_state.scope == 'unanswered':
             qs = qs.filter(closed = False) # Do not show closed questions in unanswered section
@@ -182,6 +269,14 @@ class ThreadManager(models.Manager):
                 raise NotImplementedError()
             else:
                 raise Exception('UNANSWERED_QUESTION_MEANING setting is wrong')
+            if use_tag_index and index_ids is not None:
+                index_ids = combine_index_ids(
+                    tag_index.get_unanswered_thread_ids(
+                        askbot_settings.UNANSWERED_QUESTION_MEANING
+                    ),
+                    tag_index.intersect
+                )
+                use_tag_index = index_ids is not None
 
         elif search_state.scope == 'favorite':
             favorite_filter = models.Q(favorited_by=request_user)
@@ -214,39 +309,71 @@ class ThreadManager(models.Manager):
             if request_user.display_tag_filter_strategy == const.INCLUDE_INTERESTING and (interesting_tags or request_user.has_interesting_wildcard_tags()):
                 #filter by interesting tags only
                 interesting_tag_filter = models.Q(tags__in=interesting_tags)
+                extra_interesting_tags = Tag.objects.none()
                 if request_user.has_interesting_wildcard_tags():
                     interesting_wildcards = request_user.interesting_tags.split()
                     extra_interesting_tags = Tag.objects.get_by_wildcards(interesting_wildcards)
                     interesting_tag_filter |= models.Q(tags__in=extra_interesting_tags)
-                qs = qs.filter(interesting_tag_filter)
+                tag_filters.append(lambda qs: qs.filter(interesting_tag_filter))
+                if use_tag_index:
+                    interesting_tag_names = meta_data['interesting_tag_names'] + \
+                        list(extra_interesting_tags.values_list('name', flat=True))
+                    interesting_ids = tag_index.get_thread_ids(
+                                                interesting_tag_names,
+                                                match_all=False
+                                            )
+                    index_ids = combine_index_ids(
+                                            interesting_ids,
+                                            tag_index.intersect
+                                        )
+                    use_tag_index = index_ids is not None
 
             # get the list of interesting and ignored tags (interesting_tag_names, ignored_tag_names) = (None, None)
             if request_user.display_tag_filter_strategy == const.EXCLUDE_IGNORED and (ignored_tags or request_user.has_ignored_wildcard_tags()):
                 #exclude ignored tags if the user wants to
-                qs = qs.exclude(tags__in=ignored_tags)
+                extra_ignored_tags = Tag.objects.none()
                 if request_user.has_ignored_wildcard_tags():
                     ignored_wildcards = request_user.ignored_tags.split()
                     extra_ignored_tags = Tag.objects.get_by_wildcards(ignored_wildcards)
-                    qs = qs.exclude(tags__in = extra_ignored_tags)
+
+                def exclude_ignored_tags(qs):
+                    qs = qs.exclude(tags__in=ignored_tags)
+                    if request_user.has_ignored_wildcard_tags():
+                        qs = qs.exclude(tags__in = extra_ignored_tags)
+                    return qs
+
+                if use_tag_index and index_ids is not None:
+                    tag_filters.append(exclude_ignored_tags)
+                    ignored_tag_names = meta_data['ignored_tag_names'] + \
+                        list(extra_ignored_tags.values_list('name', flat=True))
+                    ignored_ids = tag_index.get_thread_ids(
+                                                ignored_tag_names,
+                                                match_all=False
+                                            )
+                    index_ids = combine_index_ids(
+                                            ignored_ids,
+                                            tag_index.difference
+                                        )
+                    use_tag_index = index_ids is not None
+                else:
+                    #there is no selection to subtract from
+                    qs = exclude_ignored_tags(qs)
 
             if askbot_settings.USE_WILDCARD_TAGS:
                 meta_data['interesting_tag_names'].extend(request_user.interesting_tags.split())
                 meta_data['ignored_tag_names'].extend(request_user.ignored_tags.split())
 
-        QUESTION_ORDER_BY_MAP = {
-            'age-desc': '-added_at',
-            'age-asc': 'added_at',
-            'activity-desc': '-last_activity_at',
-            'activity-asc': 'last_activity_at',
-            'answers-desc': '-answer_count',
-            'answers-asc': 'answer_count',
-            'votes-desc': '-score',
-            'votes-asc': 'score',
-
-            'relevance-desc': '-relevance', # special Postgresql-specific ordering, 'relevance' quaso-column is added by get_for_query()
-        }
+        if use_tag_index and index_ids is not None \
+                and len(index_ids) <= tag_index.get_max_id_list_size():
+            qs = qs.filter(id__in=index_ids)
+        else:
+            for tag_filter in tag_filters:
+                qs = tag_filter(qs)
+
         orderby = QUESTION_ORDER_BY_MAP[search_state.sort]
-        qs = qs.extra(order_by=[orderby])
+        # INFO: thread id is a tie-breaker, so that the order is stable
+        #       and pages can be selected with the (orderby, id) cursors
+        qs = qs.extra(order_by=[orderby, '-id' if orderby.startswith('-') else 'id'])
 
         # HACK: We add 'ordering_key' column as an alias and order by it, because when distict() is used,
         #       qs.extra(order_by=[orderby,]) is lost if only `orderby` column is from askbot_post!
@@ -255,7 +382,7 @@ class ThreadManager(models.Manager):
         # qs = qs.extra(select={'ordering_key': orderby.lstrip('-')}, order_by=['-ordering_key' if orderby.startswith('-') else 'ordering_key'])
         # qs = qs.distinct()
 
-        qs = qs.only('id', 'title', 'view_count', 'answer_count', 'last_activity_at', 'last_activity_by', 'closed', 'tagnames', 'accepted_answer')
+        qs = qs.only('id', 'title', 'view_count', 'answer_count', 'last_activity_at', 'last_activity_by', 'closed', 'tagnames', 'accepted_answer', 'added_at', 'score')
 
         #print qs.query
 
@@ -286,6 +413,54 @@ class ThreadManager(models.Manager):
             thread._last_activity_by_cache = user_map[thread.last_activity_by_id]
 
 
+    def get_summary_html_for_threads(self, threads, search_state):
+        """returns list of question summary html fragments
+        for the ``threads``, in the same order.
+
+        Cached fragments are fetched with one cache request,
+        the missing ones are rendered together and
+        stored back with one request too.
+        """
+        key_tpl = self.model.SUMMARY_CACHE_KEY_TPL
+        stale_key_tpl = self.model.SUMMARY_STALE_KEY_TPL
+        keys = [key_tpl % thread.id for thread in threads]
+        keys.extend([stale_key_tpl % thread.id for thread in threads])
+        cached = cache.cache.get_many(keys)
+
+        # stale summaries are served until the scheduled re-rendering lands,
+        # unless it is late for too long
+        missing_threads = [
+            thread for thread in threads
+            if key_tpl % thread.id not in cached \
+                or summary_is_too_stale(cached.get(stale_key_tpl % thread.id))
+        ]
+        if missing_threads:
+            unfetched_threads = dict([
+                (thread.id, thread) for thread in missing_threads
+                if getattr(thread, '_question_cache', None) is None
+            ])
+            if unfetched_threads:
+                questions = Post.objects.filter(
+                                    post_type='question',
+                                    thread__in=unfetched_threads.keys()
+                                )
+                for question in questions:
+                    unfetched_threads[question.thread_id]._question_cache = question
+
+            template = get_template('widgets/question_summary.html')
+            rendered = dict()
+            for thread in missing_threads:
+                rendered[key_tpl % thread.id] = thread.render_summary_html(template=template)
+            cache.cache.set_many(rendered, timeout=const.LONG_TIME)
+            cache.cache.delete_many([stale_key_tpl % thread.id for thread in missing_threads])
+            cached.update(rendered)
+
+        url_memo = dict()
+        return [
+            fill_summary_tag_urls(cached[key_tpl % thread.id], search_state, url_memo)
+            for thread in threads
+        ]
+
     #todo: this function is similar to get_response_receivers - profile this function against the other one
     def get_thread_contributors(self, thread_list):
         """Returns query set of Thread contributors"""
@@ -305,6 +480,8 @@ class ThreadManager(models.Manager):
 
 class Thread(models.Model):
     SUMMARY_CACHE_KEY_TPL = 'thread-question-summary-%d'
+    SUMMARY_STALE_KEY_TPL = 'thread-question-summary-stale-%d'
+    SUMMARY_UPDATE_KEY_TPL = 'thread-question-summary-update-%d'
     ANSWER_LIST_KEY_TPL = 'thread-answer-list-%d'
 
     title = models.CharField(max_length=300)
@@ -447,13 +624,48 @@ class Thread(models.Model):
         """needs to be called when anything notable 
         changes in the post data - on votes, adding,
         deleting, editing content"""
-        #we can call delete_many() here if using Django > 1.2
-        for sort_method in const.ANSWER_SORT_METHODS:
-            cache.cache.delete(self.get_post_data_cache_key(sort_method))
-
-    def invalidate_cached_data(self):
+        cache.cache.delete_many([
+            self.get_post_data_cache_key(sort_method)
+            for sort_method in const.ANSWER_SORT_METHODS
+        ])
+
+    def invalidate_cached_data(self, lazy=False):
+        """if ``lazy`` is True, the summary html is re-rendered
+        in the background, see :meth:`schedule_summary_update`"""
         self.invalidate_cached_post_data()
         #self.invalidate_cached_thread_content_fragment()
+        if lazy:
+            self.schedule_summary_update()
+        else:
+            self.update_summary_html()
+
+    def schedule_summary_update(self):
+        """marks the cached summary html as stale and schedules
+        its re-rendering by a celery task. Invalidations arriving
+        within the delay window are coalesced into one re-rendering,
+        meanwhile the stale html is served (for at most
+        the max staleness period)"""
+        delay = get_summary_update_delay()
+        if delay <= 0:
+            self.update_summary_html()
+            return
+        cache.cache.set(
+            self.SUMMARY_STALE_KEY_TPL % self.id,
+            time.time(),
+            timeout=const.LONG_TIME
+        )
+        #add() succeeds only for the first invalidation in the window
+        if cache.cache.add(self.SUMMARY_UPDATE_KEY_TPL % self.id, True, delay):
+            from askbot import tasks
+            tasks.update_thread_summary_html_celery_task.apply_async(
+                                                        args=(self.id,),
+                                                        countdown=delay
+                                                    )
+
+    def apply_scheduled_summary_update(self):
+        """runs the re-rendering scheduled by :meth:`schedule_summary_update`"""
+        #invalidations from now on must schedule a new re-rendering
+        cache.cache.delete(self.SUMMARY_UPDATE_KEY_TPL % self.id)
         self.update_summary_html()
 
     def get_cached_post_data(self, sort_method = None):
@@ -536,57 +748,50 @@ class Thread(models.Model):
         others_tags = set(other_thread.get_tag_names())
         return len(my_tags & others_tags)
 
+    def get_similar_threads_cache_key(self):
+        return 'similar-threads-%s' % self.id
+
+    def invalidate_similar_threads_cache(self):
+        cache.cache.delete(self.get_similar_threads_cache_key())
+
     def get_similar_threads(self):
         """
-        Get 10 similar threads for given one.
-        Threads with the individual tags will be added to list if above questions are not full.
-
-        This function has a limitation that it will
-        retrieve only 100 records then select 10 most similar
-        from that list as querying entire database may
-        be very expensive - this function will benefit from
-        some sort of optimization
+        Get similar threads for given one,
+        precomputed by :mod:`askbot.search.similarity`
+        and stored in the :class:`SimilarThread` table.
+        Similar threads are computed on the first request
+        if the thread does not have them yet.
         """
 
+        def get_records():
+            return SimilarThread.objects.filter(
+                                        thread = self,
+                                        question__deleted = False
+                                    ).select_related(
+                                        'similar_thread', 'question'
+                                    ).order_by('-score')
+
         def get_data():
-            tags_list = self.get_tag_names()
-            similar_threads = Thread.objects.filter(
-                                        tags__name__in=tags_list
-                                    ).exclude(
-                                        id = self.id
-                                    ).exclude(
-                                        posts__post_type='question',
-                                        posts__deleted = True
-                                    ).distinct()[:100]
-            similar_threads = list(similar_threads)
-
-            for thread in similar_threads:
-                thread.similarity = self.get_similarity(other_thread=thread)
-
-            similar_threads.sort(key=operator.attrgetter('similarity'), reverse=True)
-            similar_threads = similar_threads[:10]
-
-            # Denormalize questions to speed up template rendering
-            thread_map = dict([(thread.id, thread) for thread in similar_threads])
-            questions = Post.objects.get_questions()
-            questions = questions.select_related('thread').filter(thread__in=similar_threads)
-            for q in questions:
-                thread_map[q.thread_id].question_denorm = q
-
-            # Postprocess data
-            similar_threads = [
+            records = list(get_records())
+            if len(records) == 0:
+                from askbot.search import similarity
+                if similarity.refresh_thread(self):
+                    records = list(get_records())
+
+            return [
                 {
-                    'url': thread.question_denorm.get_absolute_url(),
-                    'title': thread.get_title(thread.question_denorm)
-                } for thread in similar_threads
+                    'url': record.question.get_absolute_url(
+                                            thread = record.similar_thread
+                                        ),
+                    'title': record.similar_thread.get_title(record.question)
+                } for record in records
             ]
-            return similar_threads
 
         def get_cached_data():
-            """similar thread data will expire
-            with the default expiration delay
+            """similar thread data is invalidated when
+            the similar threads are recomputed
             """
-            key = 'similar-threads-%s' % self.id
+            key = self.get_similar_threads_cache_key()
             data = cache.cache.get(key)
             if data is None:
                 data = get_data()
@@ -619,12 +824,14 @@ class Thread(models.Model):
         Updates Tag associations for a thread to match the given
         tagname string.
 
-        When tags are removed and their use count hits 0 - the tag is
-        automatically deleted.
+        When tags are removed and they are no longer on any thread -
+        the tag is automatically deleted, tags left only on the
+        deleted questions are marked deleted.
 
         When an added tag does not exist - it is created
 
-        Tag use counts are recalculated
+        Tag use counts are changed by one, unless the question
+        is deleted, see :func:`~askbot.models.tag.recount_use_counts`
 
         A signal tags updated is sent
 
@@ -638,60 +845,93 @@ class Thread(models.Model):
         removed_tagnames = previous_tagnames - updated_tagnames
         added_tagnames = updated_tagnames - previous_tagnames
 
+        #use counts of the tags do not include the deleted questions
+        if self._question_post().deleted:
+            count_delta = 0
+        else:
+            count_delta = 1
+
         modified_tags = list()
         #remove tags from the question's tags many2many relation
         if removed_tagnames:
             removed_tags = [tag for tag in previous_tags if tag.name in removed_tagnames]
             self.tags.remove(*removed_tags)
 
-            #if any of the removed tags reached use count == 1 that means they must be deleted
-            for tag in removed_tags:
-                if tag.used_count == 1:
-                    #we won't modify used count b/c it's done below anyway
-                    removed_tags.remove(tag)
-                    #todo - do we need to use fields deleted_by and deleted_at?
-                    tag.delete()#auto-delete tags whose use count dwindled
+            if count_delta:
+                Tag.objects.filter(
+                            id__in = [tag.id for tag in removed_tags]
+                        ).change_use_counts(-count_delta)
 
-            #remember modified tags, we'll need to update use counts on them
-            modified_tags = removed_tags
+            unused_tags = list()
+            for tag in removed_tags:
+                tag.used_count = max(tag.used_count - count_delta, 0)
+                if tag.used_count == 0 and not tag.threads.exists():
+                    #auto-delete tags that are no longer on any thread
+                    tag.delete()
+                    continue
+                if tag.used_count == 0 and not tag.deleted:
+                    #the tag is left only on the deleted questions
+                    unused_tags.append(tag)
+                #remember modified tags, they are sent with the signal
+                modified_tags.append(tag)
+
+            if unused_tags:
+                Tag.objects.filter(
+                            id__in = [tag.id for tag in unused_tags]
+                        ).update(
+                            deleted = True,
+                            deleted_by = user,
+                            deleted_at = timestamp
+                        )
+                for tag in unused_tags:
+                    tag.deleted = True
+                    tag.deleted_by = user
+                    tag.deleted_at = timestamp
 
         #add new tags to the relation
         if added_tagnames:
             #find reused tags
-            reused_tags = Tag.objects.filter(name__in = added_tagnames)
-            #undelete them, because we are using them
-            reused_count = reused_tags.update(
-                                    deleted = False,
-                                    deleted_by = None,
-                                    deleted_at = None
-                                )
+            added_tags = list(Tag.objects.filter(name__in = added_tagnames))
+            if added_tags:
+                #undelete them, because we are using them
+                Tag.objects.filter(
+                            id__in = [tag.id for tag in added_tags]
+                        ).update(
+                            deleted = False,
+                            deleted_by = None,
+                            deleted_at = None,
+                            used_count = models.F('used_count') + count_delta
+                        )
+                for tag in added_tags:
+                    tag.deleted = False
+                    tag.deleted_by = None
+                    tag.deleted_at = None
+                    tag.used_count += count_delta
+
             #if there are brand new tags, create them and finalize the added tag list
-            if reused_count < len(added_tagnames):
-                added_tags = list(reused_tags)
-
-                reused_tagnames = set([tag.name for tag in reused_tags])
-                new_tagnames = added_tagnames - reused_tagnames
-                for name in new_tagnames:
-                    new_tag = Tag.objects.create(
-                                            name = name,
-                                            created_by = user,
-                                            used_count = 1
-                                        )
-                    added_tags.append(new_tag)
-            else:
-                added_tags = reused_tags
+            reused_tagnames = set([tag.name for tag in added_tags])
+            new_tagnames = added_tagnames - reused_tagnames
+            for name in new_tagnames:
+                new_tag = Tag.objects.create(
+                                        name = name,
+                                        created_by = user,
+                                        used_count = count_delta
+                                    )
+                added_tags.append(new_tag)
 
             #finally add tags to the relation and extend the modified list
             self.tags.add(*added_tags)
             modified_tags.extend(added_tags)
 
+        #lists of the changed tags are rebuilt when needed
+        tag_index.invalidate_tags(list(removed_tagnames) + list(added_tagnames))
+
         ####################################################################
         self.update_summary_html() # regenerate question/thread summary html
         ####################################################################
 
-        #if there are any modified tags, update their use counts
+        #use counts of the modified tags are already updated above
         if modified_tags:
-            Tag.objects.update_use_counts(modified_tags)
             signals.tags_updated.send(None,
                                 thread = self,
                                 tags = modified_tags,
@@ -754,39 +994,35 @@ class Thread(models.Model):
         return last_updated_at, last_updated_by
 
     def get_summary_html(self, search_state):
-        html = self.get_cached_summary_html()
-        if not html:
+        html_key = self.SUMMARY_CACHE_KEY_TPL % self.id
+        stale_key = self.SUMMARY_STALE_KEY_TPL % self.id
+        cached = cache.cache.get_many([html_key, stale_key])
+        html = cached.get(html_key)
+        if not html or summary_is_too_stale(cached.get(stale_key)):
             html = self.update_summary_html()
-
-        # use `<<<` and `>>>` because they cannot be confused with user input
-        # - if user accidentialy types <<<tag-name>>> into question title or body,
-        # then in html it'll become escaped like this: &lt;&lt;&lt;tag-name&gt;&gt;&gt;
-        regex = re.compile(
-            r'<<<(%s)>>>' % const.TAG_REGEX_BARE,
-            re.UNICODE
-        )
-
-        while True:
-            match = regex.search(html)
-            if not match:
-                break
-            seq = match.group(0)  # e.g "<<<my-tag>>>"
-            tag = match.group(1)  # e.g "my-tag"
-            full_url = search_state.add_tag(tag).full_url()
-            html = html.replace(seq, full_url)
-
-        return html
+        return fill_summary_tag_urls(html, search_state)
 
     def get_cached_summary_html(self):
         return cache.cache.get(self.SUMMARY_CACHE_KEY_TPL % self.id)
 
-    def update_summary_html(self):
+    def render_summary_html(self, question=None, template=None):
+        """renders question summary html with tag placeholders,
+        does not touch the cache"""
+        if question is None:
+            question = self._question_post()
+        if template is None:
+            template = get_template('widgets/question_summary.html')
         context = {
             'thread': self,
-            'question': self._question_post(refresh=True),  # fetch new question post to make sure we're up-to-date
+            'question': question,
             'search_state': DummySearchState(),
         }
-        html = get_template('widgets/question_summary.html').render(context)
+        return template.render(context)
+
+    def update_summary_html(self):
+        html = self.render_summary_html(
+            question=self._question_post(refresh=True)  # fetch new question post to make sure we're up-to-date
+        )
         # INFO: Timeout is set to 30 days:
         # * timeout=0/None is not a reliable cross-backend way to set infinite timeout
         # * We probably don't need to pollute the cache with threads older than 30 days
@@ -797,11 +1033,25 @@ class Thread(models.Model):
             html,
             timeout=const.LONG_TIME
         )
+        cache.cache.delete(self.SUMMARY_STALE_KEY_TPL % self.id)
         return html
 
     def summary_html_cached(self):
         return cache.cache.has_key(self.SUMMARY_CACHE_KEY_TPL % self.id)
 
+class SimilarThread(models.Model):
+    """a thread similar to the given one, records are
+    maintained by :mod:`askbot.search.similarity`"""
+    thread = models.ForeignKey(Thread, related_name='similar_thread_records')
+    similar_thread = models.ForeignKey(Thread, related_name='+')
+    #question post of the similar thread, to build the url
+    question = models.ForeignKey(Post, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        app_label = 'askbot'
+        unique_together = ('thread', 'similar_thread')
+
 class QuestionView(models.Model):
     question = models.ForeignKey(Post, related_name='viewed')
     who = models.ForeignKey(User, related_name='question_views')
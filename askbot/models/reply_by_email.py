@@ -8,6 +8,11 @@ from askbot.models.post import Post
 from askbot.models.base import BaseQuerySetManager
 from askbot.conf import settings as askbot_settings
 from askbot.utils import mail
+from askbot.utils.db import bulk_insert
+
+def generate_address():
+    return ''.join(random.choice(string.letters +
+        string.digits) for i in xrange(random.randint(12, 25))).lower()
 
 class ReplyAddressManager(BaseQuerySetManager):
 
@@ -25,12 +30,50 @@ class ReplyAddressManager(BaseQuerySetManager):
             allowed_from_email = user.email
         )
         while True:
-            reply_address.address = ''.join(random.choice(string.letters +
-                string.digits) for i in xrange(random.randint(12, 25))).lower()
+            reply_address.address = generate_address()
             if self.filter(address = reply_address.address).count() == 0:
                 break
         reply_address.save()
         return reply_address
+
+    def create_many(self, post, users):
+        """creates reply addresses to the post for all users
+        with one insert query and returns dictionary
+        of user id -> address"""
+        #one address per user
+        users = dict([(user.id, user) for user in users]).values()
+        addresses = dict()
+        pending_users = users
+        while pending_users:
+            new_addresses = dict()
+            for user in pending_users:
+                new_addresses[user.id] = generate_address()
+            taken = set(
+                self.filter(
+                    address__in = new_addresses.values()
+                ).values_list('address', flat = True)
+            )
+            #addresses must be unique within the batch as well
+            used = set(addresses.values())
+            retry_users = list()
+            for user in pending_users:
+                address = new_addresses[user.id]
+                if address in taken or address in used:
+                    retry_users.append(user)
+                else:
+                    used.add(address)
+                    addresses[user.id] = address
+            pending_users = retry_users
+
+        bulk_insert(
+            ReplyAddress,
+            ('address', 'post', 'user', 'allowed_from_email'),
+            [
+                (addresses[user.id], post.id, user.id, user.email)
+                for user in users
+            ]
+        )
+        return addresses
 			
 
 class ReplyAddress(models.Model):
@@ -1,5 +1,5 @@
 import re
-from django.db import models
+from django.db import connection, models, transaction
 from django.contrib.auth.models import User
 from django.utils.translation import ugettext as _
 from askbot.models.base import BaseQuerySetManager
@@ -34,9 +34,22 @@ class TagQuerySet(models.query.QuerySet):
 
     def update_use_counts(self, tags):
         """Updates the given Tags with their current use counts."""
+        tag_ids = [tag.id for tag in tags]
+        recount_use_counts(tag_ids)
+        counts = dict(
+            self.filter(id__in = tag_ids).values_list('id', 'used_count')
+        )
         for tag in tags:
-            tag.used_count = tag.threads.count()
-            tag.save()
+            tag.used_count = counts.get(tag.id, 0)
+
+    def change_use_counts(self, delta):
+        """adds ``delta`` to the use counts of the tags
+        in the query set with one UPDATE, the counts
+        do not go below zero"""
+        tags = self
+        if delta < 0:
+            tags = tags.filter(used_count__gte = -delta)
+        return tags.update(used_count = models.F('used_count') + delta)
 
     def tags_match_some_wildcard(self, wildcard_tags = None):
         """True if any one of the tags in the query set
@@ -75,6 +88,70 @@ class TagQuerySet(models.query.QuerySet):
         return list(tags[:50])
 
 
+def recount_use_counts(tag_ids = None):
+    """sets use counts of the tags (all or those with ``tag_ids``)
+    to the numbers of the threads with the tag, whose questions
+    are not deleted, with one UPDATE statement"""
+    from askbot.models import Post, Thread
+    if tag_ids is not None and len(tag_ids) == 0:
+        return
+    quote_name = connection.ops.quote_name
+    thread_tags = Thread.tags.through._meta
+    sql = 'UPDATE %(tag)s SET %(used_count)s = (' \
+            'SELECT COUNT(*) FROM %(thread_tags)s ' \
+            'INNER JOIN %(post)s ON %(post)s.%(post_thread)s = ' \
+                '%(thread_tags)s.%(thread)s ' \
+            'WHERE %(thread_tags)s.%(tag_fk)s = %(tag)s.%(tag_id)s ' \
+            'AND %(post)s.%(post_type)s = %%s AND %(post)s.%(deleted)s = %%s' \
+        ')' % {
+            'tag': quote_name(Tag._meta.db_table),
+            'tag_id': quote_name(Tag._meta.pk.column),
+            'used_count': quote_name(Tag._meta.get_field('used_count').column),
+            'thread_tags': quote_name(thread_tags.db_table),
+            'thread': quote_name(thread_tags.get_field('thread').column),
+            'tag_fk': quote_name(thread_tags.get_field('tag').column),
+            'post': quote_name(Post._meta.db_table),
+            'post_thread': quote_name(Post._meta.get_field('thread').column),
+            'post_type': quote_name(Post._meta.get_field('post_type').column),
+            'deleted': quote_name(Post._meta.get_field('deleted').column),
+        }
+    params = ['question', False]
+    if tag_ids is not None:
+        sql += ' WHERE %s.%s IN (%s)' % (
+                            quote_name(Tag._meta.db_table),
+                            quote_name(Tag._meta.pk.column),
+                            ', '.join(['%s'] * len(tag_ids))
+                        )
+        params.extend(tag_ids)
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    transaction.commit_unless_managed()
+
+def get_use_count_errors():
+    """returns list of tuples ``(tag name, stored count, actual count)``
+    for the tags whose stored use count differs from the number
+    of the threads with the tag, whose questions are not deleted,
+    the counts are compared with two queries"""
+    from askbot.models import Post
+    actual_counts = dict(
+        Post.objects.filter(
+                    post_type = 'question',
+                    deleted = False,
+                    thread__tags__isnull = False
+                ).values_list(
+                    'thread__tags'
+                ).annotate(
+                    models.Count('id')
+                ).order_by()
+    )
+    errors = list()
+    tags = Tag.objects.values_list('id', 'name', 'used_count').order_by('name')
+    for tag_id, name, used_count in tags.iterator():
+        actual_count = actual_counts.get(tag_id, 0)
+        if used_count != actual_count:
+            errors.append((name, used_count, actual_count))
+    return errors
+
 class TagManager(BaseQuerySetManager):
     """chainable custom filter query set manager
     for :class:``~askbot.models.Tag`` objects
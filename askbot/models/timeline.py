@@ -0,0 +1,266 @@
+"""Timeline of the user activity shown on the "recent" tab
+of the user profile
+
+The timeline is a denormalized copy of the ``Activity`` records
+of the types listed in ``TIMELINE_ACTIVITY_TYPES``:
+
+* an event is appended when the activity is recorded
+  (see ``record_post_update`` in ``askbot.tasks``,
+  ``record_award_event`` and ``record_answer_accepted``
+  in ``askbot.models``)
+* title, link and summary of the event are rendered when
+  the event is recorded, so the profile page reads the timeline
+  with one query and without loading the posts
+* the only field that changes later is ``is_hidden`` - it is set
+  when the post of the event or its question is deleted and
+  cleared when they are restored
+* the timeline is rebuilt from the ``Activity`` history with the
+  management command ``rebuild_timeline``
+"""
+import datetime
+from django.db import models
+from django.contrib.auth.models import User
+from askbot import const
+from askbot.utils.db import bulk_insert
+
+TIMELINE_ACTIVITY_TYPES = (
+    const.TYPE_ACTIVITY_ASK_QUESTION,
+    const.TYPE_ACTIVITY_ANSWER,
+    const.TYPE_ACTIVITY_COMMENT_QUESTION,
+    const.TYPE_ACTIVITY_COMMENT_ANSWER,
+    const.TYPE_ACTIVITY_UPDATE_QUESTION,
+    const.TYPE_ACTIVITY_UPDATE_ANSWER,
+    const.TYPE_ACTIVITY_MARK_ANSWER,
+    const.TYPE_ACTIVITY_PRIZE,
+)
+REVISION_ACTIVITY_TYPES = (
+    const.TYPE_ACTIVITY_UPDATE_QUESTION,
+    const.TYPE_ACTIVITY_UPDATE_ANSWER,
+)
+COMMENT_ACTIVITY_TYPES = (
+    const.TYPE_ACTIVITY_COMMENT_QUESTION,
+    const.TYPE_ACTIVITY_COMMENT_ANSWER,
+)
+EVENT_FIELD_NAMES = (
+    'user', 'activity', 'activity_type', 'active_at', 'post', 'thread',
+    'title', 'link', 'summary', 'badge_slug', 'is_hidden'
+)
+REBUILD_CHUNK_SIZE = 500
+
+
+class TimelineEvent(models.Model):
+    """an entry on the user activity timeline"""
+    user = models.ForeignKey(User, related_name = 'timeline_events')
+    activity = models.ForeignKey('Activity', unique = True)
+    activity_type = models.SmallIntegerField(choices = const.TYPE_ACTIVITY)
+    active_at = models.DateTimeField(default = datetime.datetime.now)
+    #question or answer of the event, the event is hidden
+    #when the post or its question is deleted
+    post = models.ForeignKey('Post', null = True, related_name = '+')
+    thread = models.ForeignKey('Thread', null = True, related_name = '+')
+    title = models.CharField(max_length = 300, default = '')
+    link = models.TextField(default = '')
+    summary = models.TextField(default = '')
+    #slug of the badge for the award events
+    badge_slug = models.CharField(max_length = 50, default = '')
+    is_hidden = models.BooleanField(default = False)
+
+    class Meta:
+        app_label = 'askbot'
+
+    def __unicode__(self):
+        return u'[%s] %s at %s' % (
+                            self.user_id,
+                            self.get_activity_type_display(),
+                            self.active_at
+                        )
+
+    @property
+    def is_badge(self):
+        return self.badge_slug != ''
+
+    @property
+    def badge(self):
+        from askbot.models import badges
+        return badges.get_badge_data(self.badge_slug)
+
+
+def get_post_link(post, question):
+    return post.get_absolute_url(question_post = question, thread = post.thread)
+
+def is_post_hidden(post, question):
+    return post.deleted or question.deleted
+
+def get_revision_summary(post, timestamp):
+    """summary of the revision of the post made by the edit
+    at the time, the latest revision - if there is no such"""
+    revisions = post.revisions.order_by('-revised_at')
+    if timestamp is not None:
+        earlier_revisions = revisions.filter(revised_at__lte = timestamp)
+        if earlier_revisions.exists():
+            revisions = earlier_revisions
+    revisions = list(revisions[:1])
+    if len(revisions) == 0:
+        return ''
+    return revisions[0].summary
+
+def fill_post_event(event, activity_type, content_object):
+    """sets title, link and summary of the event about
+    a question or an answer"""
+    summary = ''
+    if activity_type in REVISION_ACTIVITY_TYPES:
+        #edit activities point to the post,
+        #older records may point to the revision
+        if hasattr(content_object, 'post_type'):
+            post = content_object
+            summary = get_revision_summary(post, event.active_at)
+        else:
+            post = content_object.post
+            summary = content_object.summary
+    elif activity_type in COMMENT_ACTIVITY_TYPES:
+        post = content_object.parent
+    else:
+        post = content_object
+
+    question = post.thread._question_post()
+    if activity_type == const.TYPE_ACTIVITY_ANSWER:
+        summary = question.summary
+
+    event.post = post
+    event.thread_id = post.thread_id
+    event.title = post.thread.title
+    event.link = get_post_link(post, question)
+    event.summary = summary
+    event.is_hidden = is_post_hidden(post, question)
+
+def fill_award_event(event, award):
+    """sets badge of the event and, if the award
+    was given for a post, the title and link of the post"""
+    event.badge_slug = award.badge.slug
+    source = award.content_object
+    if getattr(source, 'post_type', None) not in ('question', 'answer'):
+        return
+    question = source.thread._question_post()
+    event.title = source.thread.title
+    event.link = get_post_link(source, question)
+    if source.is_question():
+        event.summary = source.summary
+    else:
+        event.summary = source.text
+
+def build_event(activity):
+    """returns an unsaved ``TimelineEvent`` for the activity
+    or ``None`` when the activity is not shown on the timeline
+    or its object does not exist any more"""
+    activity_type = activity.activity_type
+    if activity_type not in TIMELINE_ACTIVITY_TYPES:
+        return None
+    content_object = activity.content_object
+    if content_object is None:
+        return None
+
+    event = TimelineEvent(
+                    user_id = activity.user_id,
+                    activity_id = activity.id,
+                    activity_type = activity_type,
+                    active_at = activity.active_at
+                )
+    if activity_type == const.TYPE_ACTIVITY_PRIZE:
+        fill_award_event(event, content_object)
+    else:
+        fill_post_event(event, activity_type, content_object)
+    return event
+
+def record_activity(activity):
+    """appends the activity to the timeline of its user"""
+    event = build_event(activity)
+    if event is not None:
+        event.save()
+
+def update_post_visibility(post):
+    """hides or shows events about the question or answer
+    after it was deleted or restored"""
+    question = post.thread._question_post()
+    if post.is_question():
+        events = TimelineEvent.objects.filter(thread = post.thread_id)
+        if question.deleted:
+            events.update(is_hidden = True)
+        else:
+            #answers deleted on their own stay hidden
+            events.exclude(post__deleted = True).update(is_hidden = False)
+    elif post.is_answer():
+        TimelineEvent.objects.filter(
+                            post = post
+                        ).update(
+                            is_hidden = is_post_hidden(post, question)
+                        )
+
+def get_user_events(user, page = 1, page_size = const.USER_VIEW_DATA_SIZE):
+    """returns tuple of the list of visible events of the user
+    on the page, newest first, and a boolean - True when
+    there are older events
+
+    one more event than the page size is read to
+    find out whether there is a next page, so the page
+    is read with a single query, events with the same
+    time are ordered by id, so that the pages do not overlap"""
+    start = (page - 1) * page_size
+    events = list(
+        TimelineEvent.objects.filter(
+                            user = user,
+                            is_hidden = False
+                        ).order_by(
+                            '-active_at', '-id'
+                        )[start:start + page_size + 1]
+    )
+    return events[:page_size], len(events) > page_size
+
+def get_event_row(event):
+    return (
+        event.user_id, event.activity_id, event.activity_type,
+        event.active_at, event.post_id, event.thread_id,
+        event.title, event.link, event.summary, event.badge_slug,
+        event.is_hidden
+    )
+
+def rebuild(progress_callback = None, first_activity_id = None):
+    """deletes the timeline and builds it again
+    from the ``Activity`` history, the activities are read
+    and the events inserted in chunks
+
+    if ``first_activity_id`` is given, the timeline is kept
+    and only the events of the activities with that
+    or greater id are added
+
+    ``progress_callback`` is called with the number
+    of processed activities after each chunk
+
+    returns number of the recorded events
+    """
+    from askbot.models import Activity
+    if first_activity_id is None:
+        TimelineEvent.objects.all().delete()
+        last_id = 0
+    else:
+        last_id = first_activity_id - 1
+    activities = Activity.objects.filter(
+                            activity_type__in = TIMELINE_ACTIVITY_TYPES
+                        ).order_by('id')
+    done = 0
+    event_count = 0
+    while True:
+        chunk = list(activities.filter(id__gt = last_id)[:REBUILD_CHUNK_SIZE])
+        if len(chunk) == 0:
+            break
+        rows = list()
+        for activity in chunk:
+            event = build_event(activity)
+            if event is not None:
+                rows.append(get_event_row(event))
+        bulk_insert(TimelineEvent, EVENT_FIELD_NAMES, rows)
+        event_count += len(rows)
+        done += len(chunk)
+        last_id = chunk[-1].id
+        if progress_callback:
+            progress_callback(done)
+    return event_count
@@ -0,0 +1,158 @@
+"""Write-behind buffer for the question view counts
+and the user ``last_seen`` timestamps
+
+These fields were updated with a single row ``UPDATE`` on
+almost every request, so they are accumulated in the memory
+of the process instead and written with a few batched
+``UPDATE`` queries:
+
+* view counts - one query per distinct increment
+* last seen timestamps (truncated to seconds) -
+  one query per distinct timestamp
+
+The buffer is flushed when it is older than
+``ASKBOT_VISIT_BUFFER_FLUSH_INTERVAL`` seconds (30 by default),
+or holds more than ``ASKBOT_VISIT_BUFFER_MAX_SIZE`` items
+(1000 by default), and on the process exit. So that a process
+that receives no more visits does not keep the values, a timer
+thread flushes the buffer after the interval (turned off with
+``ASKBOT_VISIT_BUFFER_FLUSH_TIMER = False``). Celery workers
+recycled after ``CELERYD_MAX_TASKS_PER_CHILD`` tasks exit without
+running the exit handlers, there the buffer is flushed
+after every task, see ``flush_after_task``.
+
+Latest last seen timestamps are also kept in the cache,
+so that all processes see them before they are flushed.
+
+Buffering is turned off by setting ``ASKBOT_BUFFER_VISITS`` to ``False``.
+"""
+import atexit
+import threading
+import time
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.core import cache
+from django.db import connection, models
+
+LAST_SEEN_KEY_TPL = 'user-last-seen-%d'
+
+_lock = threading.Lock()
+_view_counts = dict()#thread id -> number of views
+_last_seen = dict()#user id -> timestamp
+_last_flush_time = time.time()
+_timer = None#pending flush of the buffer
+
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_BUFFER_VISITS', True)
+
+def get_flush_interval():
+    return getattr(django_settings, 'ASKBOT_VISIT_BUFFER_FLUSH_INTERVAL', 30)
+
+def get_max_size():
+    return getattr(django_settings, 'ASKBOT_VISIT_BUFFER_MAX_SIZE', 1000)
+
+def is_timer_enabled():
+    return getattr(django_settings, 'ASKBOT_VISIT_BUFFER_FLUSH_TIMER', True)
+
+def _schedule_flush():
+    """starts the flush timer, unless it is already
+    running, must be called with the lock held"""
+    global _timer
+    if _timer is None and is_timer_enabled():
+        _timer = threading.Timer(get_flush_interval(), _flush_from_timer)
+        _timer.setDaemon(True)
+        _timer.start()
+
+def _flush_from_timer():
+    global _timer
+    _lock.acquire()
+    try:
+        _timer = None
+    finally:
+        _lock.release()
+    try:
+        flush()
+    finally:
+        #the timer thread has a database connection of its own
+        connection.close()
+
+def add_view(thread_id, increment = 1):
+    """records views of the thread and returns
+    number of the views of the thread in the buffer"""
+    _lock.acquire()
+    try:
+        pending = _view_counts.get(thread_id, 0) + increment
+        _view_counts[thread_id] = pending
+        _schedule_flush()
+    finally:
+        _lock.release()
+    maybe_flush()
+    return pending
+
+def get_pending_views(thread_id):
+    return _view_counts.get(thread_id, 0)
+
+def set_last_seen(user_id, timestamp):
+    timestamp = timestamp.replace(microsecond = 0)
+    cache.cache.set(LAST_SEEN_KEY_TPL % user_id, timestamp)
+    _lock.acquire()
+    try:
+        _last_seen[user_id] = timestamp
+        _schedule_flush()
+    finally:
+        _lock.release()
+    maybe_flush()
+
+def get_last_seen(user_id):
+    """returns last seen timestamp recorded in the
+    buffer of any process, or ``None``"""
+    return cache.cache.get(LAST_SEEN_KEY_TPL % user_id)
+
+def maybe_flush():
+    size = len(_view_counts) + len(_last_seen)
+    if size > get_max_size() \
+        or time.time() - _last_flush_time > get_flush_interval():
+        flush()
+
+def flush():
+    """writes the buffered values to the database"""
+    global _view_counts, _last_seen, _last_flush_time
+    _lock.acquire()
+    try:
+        view_counts, _view_counts = _view_counts, dict()
+        last_seen, _last_seen = _last_seen, dict()
+        _last_flush_time = time.time()
+    finally:
+        _lock.release()
+
+    from askbot.models import Thread
+
+    thread_ids_by_increment = dict()
+    for thread_id, increment in view_counts.items():
+        thread_ids_by_increment.setdefault(increment, list()).append(thread_id)
+    for increment, thread_ids in thread_ids_by_increment.items():
+        Thread.objects.filter(
+            id__in = thread_ids
+        ).update(
+            view_count = models.F('view_count') + increment
+        )
+    if view_counts:
+        #view count is shown in the question summaries
+        for thread in Thread.objects.filter(id__in = view_counts.keys()).only('id'):
+            thread.schedule_summary_update()
+
+    user_ids_by_timestamp = dict()
+    for user_id, timestamp in last_seen.items():
+        user_ids_by_timestamp.setdefault(timestamp, list()).append(user_id)
+    for timestamp, user_ids in user_ids_by_timestamp.items():
+        User.objects.filter(id__in = user_ids).update(last_seen = timestamp)
+
+def flush_after_task(**kwargs):
+    """handler of the celery ``task_postrun`` signal"""
+    if getattr(django_settings, 'CELERYD_MAX_TASKS_PER_CHILD', None):
+        flush()
+    else:
+        maybe_flush()
+
+atexit.register(flush)
@@ -0,0 +1,233 @@
+"""Keyset (cursor) pagination for the question listings
+
+Instead of ``OFFSET`` the next page is selected with a condition
+on the sort column and the thread id of the last (or the first)
+thread of the current page, so the cost of the query does not
+grow with the page number.
+
+Cursor is a url token of the form ``<direction><value>_<id>``,
+where direction is ``a`` (page after the item)
+or ``b`` (page before the item), value is the sort column value
+of the item and id - the thread id.
+
+Total number of matching threads is cached per search state
+for a short time, so that neither of the paging modes runs
+the ``COUNT`` query on every request.
+"""
+import datetime
+import re
+from django.conf import settings as django_settings
+from django.core import cache
+from django.db import models
+from django.utils.hashcompat import md5_constructor
+
+#thread fields by which the question listing may be sorted
+#and paged with the cursors
+DATETIME_SORT_FIELDS = ('added_at', 'last_activity_at')
+INTEGER_SORT_FIELDS = ('answer_count', 'score')
+CURSOR_RE = re.compile(r'^([ab])(-?\d+)_(\d+)$')
+DATETIME_FORMAT = '%Y%m%d%H%M%S'
+COUNT_CACHE_KEY_TPL = 'questions-count-%s'
+
+
+def is_enabled():
+    """True if question listings must use cursor pagination"""
+    return getattr(django_settings, 'ASKBOT_QUESTIONS_KEYSET_PAGINATION', False)
+
+def get_count_cache_timeout():
+    return getattr(django_settings, 'ASKBOT_QUESTIONS_COUNT_CACHE_TIMEOUT', 300)
+
+def supports_sort(order_by):
+    """``order_by`` is a value from the
+    :data:`~askbot.models.question.QUESTION_ORDER_BY_MAP`"""
+    field = order_by.lstrip('-')
+    return field in DATETIME_SORT_FIELDS or field in INTEGER_SORT_FIELDS
+
+def encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATETIME_FORMAT) + '%06d' % value.microsecond
+    return str(int(value))
+
+def decode_value(field, token):
+    if field in DATETIME_SORT_FIELDS:
+        if len(token) != 20:
+            raise ValueError('bad timestamp %s' % token)
+        timestamp = datetime.datetime.strptime(token[:14], DATETIME_FORMAT)
+        return timestamp.replace(microsecond = int(token[14:]))
+    return int(token)
+
+def encode_cursor(direction, thread, order_by):
+    field = order_by.lstrip('-')
+    value = encode_value(getattr(thread, field))
+    return '%s%s_%d' % (direction, value, thread.id)
+
+def decode_cursor(cursor, order_by):
+    """returns tuple (direction, value, thread_id)
+    or ``None`` if the cursor cannot be used with
+    the given sort order"""
+    if not cursor or not supports_sort(order_by):
+        return None
+    match = CURSOR_RE.match(cursor)
+    if match is None:
+        return None
+    direction, value, thread_id = match.groups()
+    try:
+        value = decode_value(order_by.lstrip('-'), value)
+    except ValueError:
+        return None
+    return direction, value, int(thread_id)
+
+def get_count_cache_key(search_state, user):
+    """count depends on the search state (not including the
+    page) and on the tag filters and favorites of the user"""
+    if user is not None and user.is_authenticated():
+        user_key = str(user.id)
+    else:
+        user_key = 'anon'
+    state_key = search_state.change_page(1).query_string()
+    key_hash = md5_constructor(user_key + ':' + state_key).hexdigest()
+    return COUNT_CACHE_KEY_TPL % key_hash
+
+def get_cached_count(queryset, search_state, user):
+    """returns number of items in the queryset,
+    cached for the search state for a short time"""
+    key = get_count_cache_key(search_state, user)
+    count = cache.cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.cache.set(key, count, get_count_cache_timeout())
+    return count
+
+
+class KeysetPage(object):
+    """a page of the keyset paginator, has the same
+    interface as the django paginator page (used by
+    the templates) plus the cursor tokens for the
+    adjacent pages"""
+    def __init__(self, object_list, number, paginator,
+                    has_previous, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_cursor(self):
+        if self.has_previous() and self.object_list:
+            return encode_cursor(
+                        'b', self.object_list[0], self.paginator.order_by
+                    )
+        return None
+
+    def next_cursor(self):
+        if self.has_next() and self.object_list:
+            return encode_cursor(
+                        'a', self.object_list[-1], self.paginator.order_by
+                    )
+        return None
+
+
+class KeysetPaginator(object):
+    """paginates thread query set ordered by
+    ``(order_by, id)`` using the cursors,
+    pages requested by number only are still
+    served with the offset"""
+    def __init__(self, queryset, order_by, per_page, count):
+        self.queryset = queryset
+        self.order_by = order_by
+        self.field = order_by.lstrip('-')
+        self.descending = order_by.startswith('-')
+        self.per_page = per_page
+        self.count = count
+
+    @property
+    def num_pages(self):
+        if self.count == 0:
+            return 1
+        return (self.count + self.per_page - 1) / self.per_page
+
+    def _get_ordering(self, reverse = False):
+        descending = (self.descending != reverse)
+        if descending:
+            return ['-' + self.field, '-id']
+        return [self.field, 'id']
+
+    def _get_keyset_filter(self, value, thread_id, after):
+        """returns Q selecting items after (or before)
+        the item with the given sort value and id"""
+        if self.descending == after:
+            lookup = 'lt'
+        else:
+            lookup = 'gt'
+        field_lookup = {'%s__%s' % (self.field, lookup): value}
+        tie_lookup = {self.field: value, 'id__%s' % lookup: thread_id}
+        return models.Q(**field_lookup) | models.Q(**tie_lookup)
+
+    def page(self, number, cursor = None):
+        per_page = self.per_page
+        position = decode_cursor(cursor, self.order_by)
+        if position is None:
+            #first page or a page requested by number
+            offset = (number - 1) * per_page
+            items = list(self.queryset[offset:offset + per_page + 1])
+            has_next = len(items) > per_page
+            return KeysetPage(
+                        items[:per_page], number, self,
+                        has_previous = (number > 1),
+                        has_next = has_next
+                    )
+
+        direction, value, thread_id = position
+        after = (direction == 'a')
+        queryset = self.queryset.filter(
+                        self._get_keyset_filter(value, thread_id, after)
+                    )
+        if after:
+            queryset = queryset.extra(order_by = self._get_ordering())
+            items = list(queryset[:per_page + 1])
+            has_more = len(items) > per_page
+            items = items[:per_page]
+            has_previous, has_next = True, has_more
+        else:
+            queryset = queryset.extra(
+                                order_by = self._get_ordering(reverse = True)
+                            )
+            items = list(queryset[:per_page + 1])
+            has_more = len(items) > per_page
+            items = items[:per_page]
+            items.reverse()
+            has_previous, has_next = has_more, True
+            #page number is carried in the url and
+            #may be off after the listing has changed
+            if not has_previous:
+                number = 1
+
+        return KeysetPage(
+                    items, max(number, 1), self,
+                    has_previous = has_previous,
+                    has_next = has_next
+                )
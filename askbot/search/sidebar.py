@@ -0,0 +1,138 @@
+"""Data of the questions page sidebar - related tags
+and contributor faces
+
+Related tags used to be counted with a join of the tags to
+the threads of the page and the contributors were selected
+with a random sort over the authors on every listing request.
+Now the sidebar data is cached:
+
+* per search state, including the page, and per user
+  (the tag filters of the user change the listing)
+  for ``ASKBOT_SIDEBAR_CACHE_TIMEOUT`` seconds (60 by default)
+* on a cache miss the authors and the tags of the posts
+  of the page are read with one query, then the shown tags
+  and users are loaded by the ids
+* contributors are a random sample of the authors, users
+  with the uploaded avatars go first, as before
+* ``precompute_popular_tags`` fills the cache for the first
+  pages of the most used tags for the anonymous visitors,
+  it is run by the ``precompute_sidebar_data`` management command
+"""
+import random
+from django.conf import settings as django_settings
+from django.contrib.auth.models import AnonymousUser
+from django.core import cache
+from django.utils.hashcompat import md5_constructor
+
+SIDEBAR_CACHE_KEY_TPL = 'questions-sidebar-%s'
+RELATED_TAGS_LIMIT = 50
+
+
+def get_cache_timeout():
+    return getattr(django_settings, 'ASKBOT_SIDEBAR_CACHE_TIMEOUT', 60)
+
+def get_cache_key(search_state, user):
+    if user is not None and user.is_authenticated():
+        user_key = str(user.id)
+    else:
+        user_key = 'anon'
+    state_key = search_state.query_string()
+    key_hash = md5_constructor(user_key + ':' + state_key).hexdigest()
+    return SIDEBAR_CACHE_KEY_TPL % key_hash
+
+def compute_sidebar_data(threads, ignored_tag_names = None):
+    """returns tuple of the lists of the related tags
+    and of the contributors of the threads
+
+    tags have the attribute ``local_used_count`` -
+    the number of the threads with the tag
+    """
+    from askbot.conf import settings as askbot_settings
+    from askbot.models import Post, Tag, User
+    thread_ids = [thread.id for thread in threads]
+    if len(thread_ids) == 0:
+        return list(), list()
+
+    author_ids = set()
+    tag_thread_ids = dict()
+    rows = Post.objects.filter(
+                    post_type__in = ('question', 'answer'),
+                    thread__in = thread_ids
+                ).values_list('author', 'thread', 'thread__tags')
+    for author_id, thread_id, tag_id in rows:
+        author_ids.add(author_id)
+        if tag_id is not None:
+            tag_thread_ids.setdefault(tag_id, set()).add(thread_id)
+
+    tags = Tag.objects.filter(
+                    id__in = tag_thread_ids.keys(),
+                    deleted = False
+                )
+    if ignored_tag_names:
+        tags = tags.exclude(name__in = ignored_tag_names)
+    tags = list(tags)
+    for tag in tags:
+        tag.local_used_count = len(tag_thread_ids[tag.id])
+    tags.sort(key = lambda tag: (-tag.local_used_count, tag.name))
+
+    users = list(
+        User.objects.filter(
+                    id__in = list(author_ids)
+                ).only('id', 'username', 'gravatar', 'avatar_type')
+    )
+    #random order within the same avatar type
+    random.shuffle(users)
+    users.sort(key = lambda user: user.avatar_type)
+    avatar_limit = askbot_settings.SIDEBAR_MAIN_AVATAR_LIMIT
+    return tags[:RELATED_TAGS_LIMIT], users[:avatar_limit]
+
+def get_sidebar_data(threads, search_state, user, ignored_tag_names = None):
+    """returns cached tuple of the lists of the related tags
+    and of the contributors for the page of the threads,
+    see ``compute_sidebar_data``"""
+    key = get_cache_key(search_state, user)
+    data = cache.cache.get(key)
+    if data is None:
+        data = compute_sidebar_data(threads, ignored_tag_names)
+        cache.cache.set(key, data, get_cache_timeout())
+    return data
+
+def precompute_popular_tags(tag_count):
+    """computes and caches the sidebar data of the first page
+    of the questions with each of the ``tag_count`` most
+    used tags, as seen by the anonymous visitors,
+    returns number of the cached pages"""
+    from askbot.conf import settings as askbot_settings
+    from askbot.models import Tag, Thread
+    from askbot.search.state_manager import SearchState
+    page_size = int(askbot_settings.DEFAULT_QUESTIONS_PAGE_SIZE)
+    user = AnonymousUser()
+    tag_names = Tag.objects.filter(
+                            deleted = False
+                        ).order_by(
+                            '-used_count'
+                        ).values_list('name', flat = True)[:tag_count]
+    cached_count = 0
+    for tag_name in tag_names:
+        search_state = SearchState(
+                            scope = None,
+                            sort = None,
+                            query = None,
+                            tags = tag_name,
+                            author = None,
+                            page = None,
+                            user_logged_in = False
+                        )
+        threads, meta_data = Thread.objects.run_advanced_search(
+                                        request_user = user,
+                                        search_state = search_state
+                                    )
+        data = compute_sidebar_data(
+                        list(threads[:page_size]),
+                        meta_data.get('ignored_tag_names', [])
+                    )
+        cache.cache.set(
+            get_cache_key(search_state, user), data, get_cache_timeout()
+        )
+        cached_count += 1
+    return cached_count
@@ -0,0 +1,182 @@
+"""Precomputed similar threads
+
+For each thread the top ``ASKBOT_SIMILAR_THREADS_COUNT`` (10 by default)
+similar threads are stored in the
+:class:`~askbot.models.question.SimilarThread` table,
+so that the question page reads them with one query.
+
+Similarity of two threads is the sum of the weights
+of the shared tags, divided by the sum of the weights of the
+tags of the thread, plus the title term similarity
+multiplied by ``ASKBOT_SIMILAR_THREADS_TITLE_WEIGHT`` (0.5 by default).
+Weight of a tag is its inverse document frequency, computed from
+the ``Tag.used_count``, so the rare shared tags count for more than
+the popular ones. Title similarity is the cosine of the title
+term sets.
+
+Candidates are the threads that share at least one tag,
+they are collected from the tag index. Tags are processed from
+the rarest, once there are ``ASKBOT_SIMILAR_THREADS_MAX_CANDIDATES``
+candidates, the remaining tags only add to the scores of the
+already found candidates.
+
+Records are refreshed when thread tags are changed,
+the whole table is rebuilt by the
+``rebuild_similar_threads`` management command.
+"""
+import bisect
+import math
+import re
+from django.conf import settings as django_settings
+from askbot.search import tag_index
+from askbot.utils.db import bulk_insert
+
+TITLE_TERM_RE = re.compile(r'\w+', re.UNICODE)
+#terms shorter than that are not considered
+MIN_TERM_LENGTH = 3
+
+
+def get_neighbour_count():
+    return getattr(django_settings, 'ASKBOT_SIMILAR_THREADS_COUNT', 10)
+
+def get_title_weight():
+    return getattr(django_settings, 'ASKBOT_SIMILAR_THREADS_TITLE_WEIGHT', 0.5)
+
+def get_max_candidates():
+    return getattr(django_settings, 'ASKBOT_SIMILAR_THREADS_MAX_CANDIDATES', 2000)
+
+def get_tag_weight(used_count, thread_count):
+    """inverse document frequency of the tag"""
+    return math.log(float(thread_count + 1) / (used_count + 1)) + 1
+
+def get_title_terms(title):
+    return set([
+        term for term in TITLE_TERM_RE.findall(title.lower())
+        if len(term) >= MIN_TERM_LENGTH
+    ])
+
+def get_title_similarity(terms, other_terms):
+    if not terms or not other_terms:
+        return 0.0
+    overlap = len(terms & other_terms)
+    return overlap / math.sqrt(len(terms) * len(other_terms))
+
+def get_tag_scores(thread_id, weighted_tags):
+    """returns dictionary of candidate thread id -> sum of
+    the weights of tags shared with the thread
+
+    ``weighted_tags`` - list of (tag name, weight) tuples
+    """
+    max_candidates = get_max_candidates()
+    scores = dict()
+    #rare tags first, they are the most selective
+    for tag_name, weight in sorted(weighted_tags, key = lambda item: -item[1]):
+        ids = tag_index.get_thread_ids([tag_name])
+        if ids is None:
+            continue#the tag is on too many threads to tell them apart
+        if len(scores) + len(ids) <= max_candidates:
+            for candidate_id in ids:
+                scores[candidate_id] = scores.get(candidate_id, 0) + weight
+        else:
+            id_count = len(ids)
+            for candidate_id in scores:
+                position = bisect.bisect_left(ids, candidate_id)
+                if position < id_count and ids[position] == candidate_id:
+                    scores[candidate_id] += weight
+    scores.pop(thread_id, None)
+    return scores
+
+def compute_similar_threads(thread, thread_count = None):
+    """returns list of tuples (similar thread id, question post id, score)
+    of the most similar threads, best first"""
+    from askbot.models import Post, Thread
+    if thread_count is None:
+        thread_count = Thread.objects.count()
+
+    tags = thread.tags.values_list('name', 'used_count')
+    weighted_tags = [
+        (name, get_tag_weight(used_count, thread_count))
+        for name, used_count in tags
+    ]
+    if len(weighted_tags) == 0:
+        return list()
+    total_weight = sum([weight for name, weight in weighted_tags])
+
+    tag_scores = get_tag_scores(thread.id, weighted_tags)
+    if len(tag_scores) == 0:
+        return list()
+
+    #title similarity may reorder the candidates, but it adds
+    #at most title weight, so only the best by the tags are compared
+    count = get_neighbour_count()
+    best_ids = sorted(
+                    tag_scores,
+                    key = lambda candidate_id: -tag_scores[candidate_id]
+                )[:count * 5]
+
+    questions = Post.objects.get_questions().filter(
+                                    thread__in = best_ids,
+                                    deleted = False
+                                ).values_list('thread', 'id', 'thread__title')
+
+    title_terms = get_title_terms(thread.title)
+    title_weight = get_title_weight()
+    results = list()
+    for candidate_id, question_id, title in questions:
+        score = tag_scores[candidate_id] / total_weight
+        score += title_weight * get_title_similarity(
+                                        title_terms,
+                                        get_title_terms(title)
+                                    )
+        results.append((candidate_id, question_id, score))
+
+    results.sort(key = lambda item: (-item[2], item[0]))
+    return results[:count]
+
+def save_similar_threads(thread, similar_threads):
+    from askbot.models import SimilarThread
+    SimilarThread.objects.filter(thread = thread).delete()
+    bulk_insert(
+        SimilarThread,
+        ('thread', 'similar_thread', 'question', 'score'),
+        [
+            (thread.id, similar_id, question_id, score)
+            for similar_id, question_id, score in similar_threads
+        ]
+    )
+    thread.invalidate_similar_threads_cache()
+
+def refresh_thread(thread, thread_count = None):
+    """recomputes similar threads of the thread"""
+    similar_threads = compute_similar_threads(thread, thread_count)
+    save_similar_threads(thread, similar_threads)
+    return similar_threads
+
+def refresh_around_thread(thread):
+    """recomputes similar threads of the thread, of its
+    new similar threads and of the threads that had it among
+    their similar threads, called after the thread tags are changed"""
+    from askbot.models import SimilarThread, Thread
+    thread_count = Thread.objects.count()
+    related_ids = set(
+        SimilarThread.objects.filter(
+                            similar_thread = thread
+                        ).values_list('thread', flat = True)
+    )
+    similar_threads = refresh_thread(thread, thread_count)
+    related_ids.update([item[0] for item in similar_threads])
+    for related_thread in Thread.objects.filter(id__in = list(related_ids)):
+        refresh_thread(related_thread, thread_count)
+
+def rebuild(progress_callback = None):
+    """recomputes similar threads for all threads,
+    ``progress_callback`` is called after each thread
+    with the number of processed threads"""
+    from askbot.models import Thread
+    thread_count = Thread.objects.count()
+    threads = Thread.objects.only('id', 'title').order_by('id')
+    for done, thread in enumerate(threads.iterator()):
+        refresh_thread(thread, thread_count)
+        if progress_callback is not None:
+            progress_callback(done + 1)
+    return thread_count
@@ -87,7 +87,7 @@ class SearchState(object):
     def get_empty(cls):
         return cls(scope=None, sort=None, query=None, tags=None, author=None, page=None, user_logged_in=None)
 
-    def __init__(self, scope, sort, query, tags, author, page, user_logged_in):
+    def __init__(self, scope, sort, query, tags, author, page, user_logged_in, cursor=None):
         # INFO: zip(*[('a', 1), ('b', 2)])[0] == ('a', 'b')
 
         if (scope not in zip(*const.POST_SCOPE_LIST)[0]) or (scope == 'favorite' and not user_logged_in):
@@ -129,6 +129,10 @@ class SearchState(object):
         if self.page == 0:  # in case someone likes jokes :)
             self.page = 1
 
+        # cursor of the keyset pagination, it is validated
+        # against the sort order by askbot.search.paginator
+        self.cursor = cursor or None
+
         self._questions_url = urlresolvers.reverse('questions')
 
     def __str__(self):
@@ -178,6 +182,8 @@ class SearchState(object):
             lst.append('author:' + str(self.author))
         if self.page:
             lst.append('page:' + str(self.page))
+        if self.cursor:
+            lst.append('cursor:' + self.cursor)
         return '/'.join(lst) + '/'
 
     def deepcopy(self): # TODO: test me
@@ -208,35 +214,49 @@ class SearchState(object):
         if tag not in ss.tags:
             ss.tags.append(tag)
             ss.page = 1 # state change causes page reset
+            ss.cursor = None
         return ss
 
     def remove_author(self):
         ss = self.deepcopy()
         ss.author = None
         ss.page = 1
+        ss.cursor = None
         return ss
 
     def remove_tags(self):
         ss = self.deepcopy()
         ss.tags = []
         ss.page = 1
+        ss.cursor = None
         return ss
 
     def change_scope(self, new_scope):
         ss = self.deepcopy()
         ss.scope = new_scope
         ss.page = 1
+        ss.cursor = None
         return ss
 
     def change_sort(self, new_sort):
         ss = self.deepcopy()
         ss.sort = new_sort
         ss.page = 1
+        ss.cursor = None
         return ss
 
     def change_page(self, new_page):
         ss = self.deepcopy()
         ss.page = new_page
+        ss.cursor = None
+        return ss
+
+    def change_cursor(self, new_cursor, new_page):
+        """page number is kept along with the cursor
+        for display purposes only"""
+        ss = self.deepcopy()
+        ss.cursor = new_cursor
+        ss.page = new_page
         return ss
 
 
@@ -0,0 +1,308 @@
+"""Inverted index of tags to the threads that carry them
+
+For each tag name the index stores a sorted list of thread ids,
+so that tag selections on the questions page can be answered
+with sorted list intersections instead of one SQL join per tag
+plus a ``DISTINCT`` over the result.
+
+The lists are kept in the django cache in a compact binary form
+(one unsigned int per thread id), they are built lazily on the first
+lookup and are deleted from the cache when tags of a thread change,
+so that concurrent changes cannot overwrite each other.
+Lists longer than ``ASKBOT_TAG_INDEX_MAX_IDS`` are not stored,
+a marker is cached instead and the lookups involving such tags
+return ``None`` - the regular SQL joins must be used then.
+A complete rebuild is available via the ``rebuild_tag_index``
+management command.
+
+The index is used only when ``ASKBOT_USE_TAG_INDEX`` setting
+is ``True``.
+"""
+import bisect
+import heapq
+from array import array
+from django.conf import settings as django_settings
+from django.core import cache
+from django.utils.hashcompat import md5_constructor
+from askbot import const
+
+TAG_KEY_TPL = 'tag-index-%s'
+UNANSWERED_KEY_TPL = 'tag-index-unanswered-%s'
+UNANSWERED_MEANINGS = ('NO_ANSWERS', 'NO_ACCEPTED_ANSWERS')
+#when one list is this many times longer than the other
+#it is cheaper to probe it with bisect than to scan it
+GALLOP_RATIO = 16
+ID_ARRAY_TYPECODE = 'I'
+#cached instead of the lists over the size limit
+TOO_LARGE = 'too-large'
+
+
+def is_enabled():
+    """True if tag selections must be resolved via the index"""
+    return getattr(django_settings, 'ASKBOT_USE_TAG_INDEX', False)
+
+def get_max_id_list_size():
+    """maximum number of thread ids that may be passed
+    into the ``id__in`` filter, for the larger selections
+    the regular SQL joins are used"""
+    return getattr(django_settings, 'ASKBOT_TAG_INDEX_MAX_IDS', 20000)
+
+def get_tag_key(tag_name):
+    """tag names may contain characters that are
+    not allowed in the memcached keys, so we hash them"""
+    tag_hash = md5_constructor(tag_name.encode('utf-8')).hexdigest()
+    return TAG_KEY_TPL % tag_hash
+
+def get_unanswered_key(meaning):
+    return UNANSWERED_KEY_TPL % meaning.lower()
+
+def pack_ids(ids):
+    """returns compact string representation of
+    the sorted sequence of thread ids"""
+    return array(ID_ARRAY_TYPECODE, ids).tostring()
+
+def pack_for_cache(ids):
+    """returns value to cache for the id list,
+    the ``TOO_LARGE`` marker for the long lists"""
+    if len(ids) > get_max_id_list_size():
+        return TOO_LARGE
+    return pack_ids(ids)
+
+def unpack_ids(value):
+    ids = array(ID_ARRAY_TYPECODE)
+    ids.fromstring(value)
+    return ids
+
+def intersect(first, second):
+    """returns sorted list of items present in both
+    sorted sequences"""
+    if len(first) > len(second):
+        first, second = second, first
+    if len(first) == 0:
+        return list()
+    if len(second) > GALLOP_RATIO * len(first):
+        result = list()
+        position = 0
+        second_len = len(second)
+        for item in first:
+            position = bisect.bisect_left(second, item, position)
+            if position == second_len:
+                break
+            if second[position] == item:
+                result.append(item)
+        return result
+    return sorted(set(first).intersection(second))
+
+def union(sequences):
+    """returns sorted list of unique items
+    from all of the given sorted sequences"""
+    result = list()
+    last = None
+    for item in heapq.merge(*sequences):
+        if item != last:
+            result.append(item)
+            last = item
+    return result
+
+def difference(first, second):
+    """returns sorted list of items of the ``first``
+    sorted sequence that are not in the ``second``"""
+    if len(first) == 0 or len(second) == 0:
+        return list(first)
+    if len(second) > GALLOP_RATIO * len(first):
+        second_len = len(second)
+        result = list()
+        for item in first:
+            position = bisect.bisect_left(second, item)
+            if position == second_len or second[position] != item:
+                result.append(item)
+        return result
+    excluded = set(second)
+    return [item for item in first if item not in excluded]
+
+def _get_lists(keys_to_names, build_function):
+    """returns a dictionary of name -> sorted id array
+    for all names, the cache is asked once and the missing
+    items are computed with ``build_function``,
+    which receives the list of missing names,
+    returns ``None`` if any of the lists is too large"""
+    cached = cache.cache.get_many(keys_to_names.keys())
+    if TOO_LARGE in cached.values():
+        return None
+    result = dict()
+    for key, value in cached.items():
+        result[keys_to_names[key]] = unpack_ids(value)
+
+    missing_names = [
+        name for key, name in keys_to_names.items() if key not in cached
+    ]
+    if missing_names:
+        built = build_function(missing_names)
+        to_cache = dict()
+        name_to_key = dict((name, key) for key, name in keys_to_names.items())
+        for name in missing_names:
+            ids = array(ID_ARRAY_TYPECODE, built.get(name, ()))
+            result[name] = ids
+            to_cache[name_to_key[name]] = pack_for_cache(ids)
+        cache.cache.set_many(to_cache, const.LONG_TIME)
+        if TOO_LARGE in to_cache.values():
+            return None
+    return result
+
+def _build_tag_lists(tag_names):
+    from askbot.models import Thread
+    id_lists = dict()
+    rows = Thread.tags.through.objects.filter(
+                                tag__name__in = tag_names
+                            ).values_list(
+                                'tag__name', 'thread'
+                            ).order_by('thread')
+    for tag_name, thread_id in rows:
+        id_lists.setdefault(tag_name, list()).append(thread_id)
+    return id_lists
+
+def _get_unanswered_queryset(meaning):
+    from askbot.models import Thread
+    threads = Thread.objects.filter(closed = False)
+    if meaning == 'NO_ANSWERS':
+        return threads.filter(answer_count = 0)
+    elif meaning == 'NO_ACCEPTED_ANSWERS':
+        return threads.filter(accepted_answer__isnull = True)
+    raise NotImplementedError()
+
+def _build_unanswered_lists(meanings):
+    id_lists = dict()
+    for meaning in meanings:
+        threads = _get_unanswered_queryset(meaning)
+        id_lists[meaning] = threads.values_list(
+                                        'id', flat = True
+                                    ).order_by('id')
+    return id_lists
+
+def get_thread_ids(tag_names, match_all = True):
+    """returns sorted list of ids of threads tagged
+    with all (when ``match_all`` is ``True``)
+    or with any of the given tags,
+    ``None`` if some of the tags are on too many threads
+    """
+    from askbot.models import Tag
+    if len(tag_names) == 0:
+        return list()
+    #tag name comparison follows the database collation,
+    #so the names are first resolved to the stored ones
+    resolved_names = set(
+        Tag.objects.filter(
+                    name__in = tag_names
+                ).values_list('name', flat = True)
+    )
+    if match_all:
+        requested = set([name.lower() for name in tag_names])
+        found = set([name.lower() for name in resolved_names])
+        if requested - found:
+            return list()
+    if len(resolved_names) == 0:
+        return list()
+
+    keys = dict([(get_tag_key(name), name) for name in resolved_names])
+    id_lists = _get_lists(keys, _build_tag_lists)
+    if id_lists is None:
+        return None
+    id_lists = id_lists.values()
+    if match_all:
+        id_lists.sort(key = len)
+        result = id_lists[0]
+        for ids in id_lists[1:]:
+            result = intersect(result, ids)
+        return list(result)
+    return union(id_lists)
+
+def get_unanswered_thread_ids(meaning):
+    """sorted list of ids of threads that are
+    unanswered in the sense of the ``meaning``
+    (a value of the ``UNANSWERED_QUESTION_MEANING`` setting),
+    ``None`` if there are too many of them"""
+    keys = {get_unanswered_key(meaning): meaning}
+    id_lists = _get_lists(keys, _build_unanswered_lists)
+    if id_lists is None:
+        return None
+    return id_lists[meaning]
+
+def invalidate_tags(tag_names):
+    """deletes the cached lists of the tags,
+    they will be built from the database when needed"""
+    if tag_names:
+        cache.cache.delete_many([get_tag_key(name) for name in tag_names])
+
+def is_unanswered(thread, meaning):
+    if thread.closed:
+        return False
+    if meaning == 'NO_ANSWERS':
+        return thread.answer_count == 0
+    elif meaning == 'NO_ACCEPTED_ANSWERS':
+        return thread.accepted_answer_id is None
+    raise NotImplementedError()
+
+def update_thread_status(thread):
+    """deletes the cached lists of unanswered threads
+    that disagree with the status of the thread"""
+    if not is_enabled():
+        return
+    keys = dict(
+        (get_unanswered_key(meaning), meaning)
+        for meaning in UNANSWERED_MEANINGS
+    )
+    stale_keys = list()
+    for key, value in cache.cache.get_many(keys.keys()).items():
+        if value == TOO_LARGE:
+            continue
+        ids = unpack_ids(value)
+        position = bisect.bisect_left(ids, thread.id)
+        is_present = (position < len(ids) and ids[position] == thread.id)
+        if is_present != is_unanswered(thread, keys[key]):
+            stale_keys.append(key)
+    if stale_keys:
+        cache.cache.delete_many(stale_keys)
+
+def rebuild(tag_names = None):
+    """builds index lists for the given tags (or all tags)
+    as well as the unanswered thread lists
+    and stores them in the cache,
+    returns number of indexed tags"""
+    from askbot.models import Thread
+    rows = Thread.tags.through.objects.all()
+    if tag_names is not None:
+        rows = rows.filter(tag__name__in = tag_names)
+    rows = rows.values_list(
+                    'tag__name', 'thread'
+                ).order_by('tag__id', 'thread')
+
+    tag_count = 0
+    current_name = None
+    current_ids = array(ID_ARRAY_TYPECODE)
+    for tag_name, thread_id in rows.iterator():
+        if tag_name != current_name:
+            if current_name is not None:
+                cache.cache.set(
+                    get_tag_key(current_name),
+                    pack_for_cache(current_ids),
+                    const.LONG_TIME
+                )
+                tag_count += 1
+            current_name = tag_name
+            current_ids = array(ID_ARRAY_TYPECODE)
+        current_ids.append(thread_id)
+    if current_name is not None:
+        cache.cache.set(
+            get_tag_key(current_name),
+            pack_for_cache(current_ids),
+            const.LONG_TIME
+        )
+        tag_count += 1
+
+    for meaning, ids in _build_unanswered_lists(UNANSWERED_MEANINGS).items():
+        cache.cache.set(
+            get_unanswered_key(meaning),
+            pack_for_cache(ids),
+            const.LONG_TIME
+        )
+    return tag_count
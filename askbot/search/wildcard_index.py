@@ -0,0 +1,173 @@
+"""Index of the wildcard tag selections of the users
+
+Wildcard selections are stored on the user records
+(``interesting_tags`` and ``ignored_tags`` fields) as space
+separated patterns like ``django*``. To find out who follows
+a set of tags via wildcards, the patterns
+are gathered into a prefix tree, where the nodes
+ending a pattern carry the ids of the users who selected it.
+Matching a tag name is then a walk down the tree along
+the letters of the name.
+
+Each process builds the tree from the database and keeps it
+in memory, only a small version stamp is shared via the django
+cache. When a user changes the wildcard selections the stamp is
+replaced and the processes rebuild their trees on the next
+lookup. Within a request the stamp is replaced once more when the
+request is finished, after the transaction is committed, so that
+a tree built from the data before the commit is not kept. The
+stamp expires after ``ASKBOT_WILDCARD_INDEX_TIMEOUT`` seconds
+(one hour by default), so the trees are rebuilt at least that often.
+
+Every saved ``User`` record is compared with the selections
+it was loaded with, see :func:`remember_selections` and
+:func:`user_saved`, connected to the ``post_init`` and ``post_save``
+signals in ``askbot.models``, and :func:`update_user` replaces
+the stamp when they differ - this covers
+``user_update_wildcard_tag_selections`` as well as the edits
+in the admin, the importers and other direct saves.
+Selections written without ``save()`` (``QuerySet.update()``,
+raw sql) must be followed by a call to :func:`invalidate`,
+otherwise they are not seen until the stamp expires.
+"""
+import threading
+import uuid
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.core import cache
+
+REASON_FIELDS = {'good': 'interesting_tags', 'bad': 'ignored_tags'}
+VERSION_KEY_TPL = 'wildcard-index-version-%s'
+#key in the tree node that holds the set of user ids
+USER_IDS = None
+
+#reason -> (version, tree) compiled in this process
+_trees = dict()
+_local = threading.local()
+
+
+def get_timeout():
+    return getattr(django_settings, 'ASKBOT_WILDCARD_INDEX_TIMEOUT', 3600)
+
+def get_prefixes(wildcards):
+    """returns set of prefixes matched by the space separated
+    wildcard tags, the same way as
+    :func:`~askbot.models.tag.tags_match_some_wildcard` does"""
+    if wildcards == '':
+        return set()
+    return set([wildcard[:-1] for wildcard in wildcards.split(' ')])
+
+def build_mapping(reason):
+    """reads wildcard selections of all users
+    and returns dictionary prefix -> set of user ids"""
+    field = REASON_FIELDS[reason]
+    rows = User.objects.exclude(**{field: ''}).values_list('id', field)
+    mapping = dict()
+    for user_id, wildcards in rows.iterator():
+        for prefix in get_prefixes(wildcards):
+            mapping.setdefault(prefix, set()).add(user_id)
+    return mapping
+
+def compile_tree(mapping):
+    root = dict()
+    for prefix, user_ids in mapping.items():
+        node = root
+        for char in prefix:
+            node = node.setdefault(char, dict())
+        node.setdefault(USER_IDS, set()).update(user_ids)
+    return root
+
+def get_version(reason):
+    """returns the shared version stamp of the index,
+    a new one is made if it has expired"""
+    key = VERSION_KEY_TPL % reason
+    version = cache.cache.get(key)
+    if version is None:
+        cache.cache.add(key, uuid.uuid4().hex, get_timeout())
+        version = cache.cache.get(key)
+    return version
+
+def get_tree(reason):
+    """returns prefix tree for the tag mark reason
+    (``'good'`` or ``'bad'``), compiled tree is reused
+    while the version in the cache is the same"""
+    version = get_version(reason)
+    local_version, tree = _trees.get(reason, (None, None))
+    if version is None or local_version != version:
+        tree = compile_tree(build_mapping(reason))
+        #the version read before the data, a change in the meantime
+        #replaces the version and the tree is built again
+        _trees[reason] = (version, tree)
+    return tree
+
+def get_matching_user_ids(tag_names, reason):
+    """returns set of ids of users whose wildcard selections
+    for the reason match at least one of the tag names"""
+    tree = get_tree(reason)
+    user_ids = set()
+    for tag_name in tag_names:
+        node = tree
+        user_ids.update(node.get(USER_IDS, ()))
+        for char in tag_name:
+            node = node.get(char)
+            if node is None:
+                break
+            user_ids.update(node.get(USER_IDS, ()))
+    return user_ids
+
+def invalidate(reason):
+    """makes all processes rebuild the index for the reason"""
+    cache.cache.set(VERSION_KEY_TPL % reason, uuid.uuid4().hex, get_timeout())
+    pending_reasons = getattr(_local, 'pending_reasons', None)
+    if pending_reasons is not None:
+        pending_reasons.add(reason)
+
+def update_user(user_id, reason, old_wildcards, new_wildcards):
+    """invalidates the index after the user
+    has changed wildcard selections for the reason,
+    wildcards are space separated strings"""
+    if get_prefixes(old_wildcards) != get_prefixes(new_wildcards):
+        invalidate(reason)
+
+def get_selections(user):
+    """returns tuple of the wildcard selections of the user,
+    ``None`` in place of the fields not loaded from the database"""
+    return tuple([
+        user.__dict__.get(field) for field in sorted(REASON_FIELDS.values())
+    ])
+
+def remember_selections(sender, instance = None, **kwargs):
+    """remembers the selections the user record was loaded with"""
+    instance._wildcard_selections = get_selections(instance)
+
+def user_saved(sender, instance = None, created = False, **kwargs):
+    """invalidates the index when the selections
+    of the saved user record have changed"""
+    if created:
+        old_selections = ('', '')
+    else:
+        old_selections = getattr(instance, '_wildcard_selections', (None, None))
+    new_selections = get_selections(instance)
+    fields = sorted(REASON_FIELDS.values())
+    for reason, field in REASON_FIELDS.items():
+        position = fields.index(field)
+        old_wildcards = old_selections[position]
+        new_wildcards = new_selections[position]
+        if new_wildcards is None:
+            continue#the field was not loaded, so it was not saved
+        if old_wildcards is None:
+            invalidate(reason)
+        else:
+            update_user(instance.id, reason, old_wildcards, new_wildcards)
+    instance._wildcard_selections = new_selections
+
+def start_request(**kwargs):
+    _local.pending_reasons = set()
+
+def finish_request(**kwargs):
+    """the transaction of the request is committed by now,
+    the trees built before the commit are invalidated"""
+    pending_reasons = getattr(_local, 'pending_reasons', None)
+    _local.pending_reasons = None
+    for reason in pending_reasons or ():
+        cache.cache.set(VERSION_KEY_TPL % reason, uuid.uuid4().hex, get_timeout())
@@ -7,11 +7,17 @@ the lookup resolution process for templates and media works as follows:
 """
 import os
 import logging
+import tempfile
 import urllib
 from django.conf import settings as django_settings
+from django.utils import simplejson
 from django.utils.datastructures import SortedDict
 from askbot.utils import hasher
 
+#the media url manifest of the current skin and its key
+_media_url_manifest_key = None
+_media_url_manifest = dict()
+
 class MediaNotFound(Exception):
     """raised when media file is not found"""
     pass
@@ -92,10 +98,12 @@ def get_media_url(url, ignore_missing = False):
     if file is not found - returns None
     and logs an error message
 
+    the urls of the skin media are looked up in the manifest,
+    see ``get_media_url_manifest``, files missing in the manifest
+    are looked up in the skin directories
+
     todo: move this to the skin environment class
     """
-    #import datetime
-    #before = datetime.datetime.now()
     url = urllib.unquote(unicode(url))
     while url[0] == '/': url = url[1:]
 
@@ -144,6 +152,11 @@ def get_media_url(url, ignore_missing = False):
         use_skin = 'default'
         resource_revision = None
 
+    if is_media_url_manifest_enabled():
+        manifest = get_media_url_manifest(use_skin, resource_revision)
+        if url in manifest:
+            return manifest[url][0]
+
     #determine from which skin take the media file
     try:
         use_skin = resolve_skin_for_media(media=url, preferred_skin = use_skin)
@@ -154,45 +167,163 @@ def get_media_url(url, ignore_missing = False):
             logging.critical(log_message)
         return None
 
-    url = django_settings.STATIC_URL + use_skin + '/media/' + url
+    return make_media_url(use_skin, url, resource_revision)
+
+def make_media_url(skin, resource, resource_revision):
+    """returns url of the media resource of the skin"""
+    url = django_settings.STATIC_URL + skin + '/media/' + resource
     url = os.path.normpath(url).replace('\\', '/')
-    
     if resource_revision:
         url +=  '?v=%d' % resource_revision
-
-    #after = datetime.datetime.now()
-    #print after - before
     return url
 
-def update_media_revision(skin = None):
-    """update skin media revision number based on the contents
-    of the skin media directory"""
+def is_media_url_manifest_enabled():
+    return getattr(django_settings, 'ASKBOT_MEDIA_URL_MANIFEST', True)
+
+def build_media_url_manifest(skin, resource_revision):
+    """returns dictionary of all media resources available to the skin,
+    looked up the same way as in ``resolve_skin_for_media``,
+    to the tuples of the url and of the path to the file"""
+    manifest = dict()
+    #walk from the last fallback to the skin, so that the skin wins
+    skins = get_available_skins(selected = skin).items()
+    for skin_name, skin_dir in reversed(skins):
+        media_dir = os.path.join(skin_dir, 'media')
+        for root, dirs, files in os.walk(media_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                resource = path[len(media_dir) + 1:].replace('\\', '/')
+                url = make_media_url(skin_name, resource, resource_revision)
+                manifest[resource] = (url, path)
+    return manifest
+
+def get_media_url_manifest(skin, resource_revision):
+    """returns the manifest of the skin media urls, it is
+    built once per process and rebuilt when the skin, the media
+    revision or the ``STATIC_URL`` change, so that the lookup
+    of the media urls does not touch the file system"""
+    global _media_url_manifest_key, _media_url_manifest
+    key = (skin, resource_revision, django_settings.STATIC_URL)
+    if key != _media_url_manifest_key:
+        _media_url_manifest = build_media_url_manifest(skin, resource_revision)
+        _media_url_manifest_key = key
+    return _media_url_manifest
+
+def export_media_url_manifest(skin = None):
+    """returns the media url manifest as a dictionary
+    ready for json, with the url and the path of every
+    resource, for example for the upload to a CDN"""
     from askbot.conf import settings as askbot_settings
+    skin = skin or askbot_settings.ASKBOT_DEFAULT_SKIN
     resource_revision = askbot_settings.MEDIA_RESOURCE_REVISION
+    resources = dict()
+    for resource, (url, path) in get_media_url_manifest(
+                                        skin, resource_revision
+                                    ).items():
+        resources[resource] = {'url': url, 'path': path}
+    return {
+        'skin': skin,
+        'revision': resource_revision,
+        'static_url': django_settings.STATIC_URL,
+        'resources': resources
+    }
 
-    if skin:
-        if skin in get_skin_choices():
-            skin_path = get_path_to_skin(skin)
-        else:
-            raise MediaNotFound('Skin %s not found' % skin) 
-    else:
-        skin = 'default'
-        skin_path = get_path_to_skin(askbot_settings.ASKBOT_DEFAULT_SKIN)
-
+def get_media_dirs(skin):
+    """returns list of the media directories used by the skin"""
     media_dirs = [
-        os.path.join(skin_path, 'media'),
+        os.path.join(get_path_to_skin(skin), 'media'),
         os.path.join(get_path_to_skin('common'), 'media')#we always use common
     ]
-
     if skin != 'default':
         #we have default skin as parent of the custom skin
         default_skin_path = get_path_to_skin('default')
         media_dirs.append(os.path.join(default_skin_path, 'media'))
+    return media_dirs
+
+def get_media_manifest_path():
+    """the manifest of the media hashes is stored in the file
+    ``ASKBOT_MEDIA_MANIFEST_FILE``, by default - in the temporary
+    directory"""
+    default_path = os.path.join(
+                        tempfile.gettempdir(),
+                        'askbot-media-manifest.json'
+                    )
+    return getattr(django_settings, 'ASKBOT_MEDIA_MANIFEST_FILE', default_path)
+
+def load_media_manifest():
+    """returns dictionary of the media hashes by the
+    list of the media directories, empty if
+    the manifest cannot be read"""
+    try:
+        manifest_file = open(get_media_manifest_path(), 'r')
+        try:
+            manifest = simplejson.load(manifest_file)
+        finally:
+            manifest_file.close()
+    except (IOError, ValueError):
+        return dict()
+    if not isinstance(manifest, dict):
+        return dict()
+    return manifest
+
+def save_media_manifest(manifest):
+    """writes the manifest into a temporary file
+    and moves it into place, so that the processes
+    starting at the same time never read a partial file"""
+    path = get_media_manifest_path()
+    temp_path = '%s.%d' % (path, os.getpid())
+    try:
+        manifest_file = open(temp_path, 'w')
+        try:
+            simplejson.dump(manifest, manifest_file)
+        finally:
+            manifest_file.close()
+        os.rename(temp_path, path)
+    except (IOError, OSError), error:
+        logging.critical('cannot save media manifest %s: %s', path, error)
+
+def get_media_hash(media_dirs, rebuild = False):
+    """returns hash of the contents of the media directories
+
+    the hash is taken from the manifest, unless the modification
+    times of the media files have changed since it was recorded
+    or ``rebuild`` is ``True``, then the files are hashed and the
+    manifest is updated
+    """
+    key = os.pathsep.join(media_dirs)
+    signature = hasher.get_mtime_signature(media_dirs)
+    manifest = load_media_manifest()
+    entry = manifest.get(key)
+    if rebuild == False and signature and entry:
+        if entry.get('signature') == signature:
+            return entry['hash']
 
     current_hash = hasher.get_hash_of_dirs(media_dirs)
+    if signature and isinstance(current_hash, basestring):
+        manifest[key] = {'signature': signature, 'hash': current_hash}
+        save_media_manifest(manifest)
+    return current_hash
+
+def update_media_revision(skin = None):
+    """update skin media revision number based on the contents
+    of the skin media directory"""
+    from askbot.conf import settings as askbot_settings
+    resource_revision = askbot_settings.MEDIA_RESOURCE_REVISION
+
+    if skin:
+        if skin not in dict(get_skin_choices()):
+            raise MediaNotFound('Skin %s not found' % skin) 
+    else:
+        skin = askbot_settings.ASKBOT_DEFAULT_SKIN
+
+    current_hash = get_media_hash(get_media_dirs(skin))
 
     if current_hash != askbot_settings.MEDIA_RESOURCE_REVISION_HASH:
         askbot_settings.update('MEDIA_RESOURCE_REVISION', resource_revision + 1)
         askbot_settings.update('MEDIA_RESOURCE_REVISION_HASH', current_hash) 
         logging.debug('MEDIA_RESOURCE_REVISION changed')
-    askbot_settings.MEDIA_RESOURCE_REVISION
+    if is_media_url_manifest_enabled():
+        get_media_url_manifest(
+                    askbot_settings.ASKBOT_DEFAULT_SKIN,
+                    askbot_settings.MEDIA_RESOURCE_REVISION
+                )
@@ -6,14 +6,22 @@ the purpose of this module is to validate deployment of askbot
 question: why not run these from askbot/__init__.py?
 
 the main function is run_startup_tests
+
+with ``ASKBOT_STARTUP_PROCEDURES = 'once'`` in the settings.py
+the tests and the initialization of the badges are run once per
+deployment version - see ``get_deployment_version`` - and the success
+is recorded in the file ``ASKBOT_STARTUP_STAMP_FILE``, the following
+starts skip them; by default (``'always'``) they are run on every start
 """
 import sys
 import os
 import re
+import tempfile
 import askbot
 from django.db import transaction
 from django.conf import settings as django_settings
 from django.core.exceptions import ImproperlyConfigured
+from django.utils.hashcompat import md5_constructor
 from askbot.utils.loading import load_module
 from askbot.utils.functions import enumerate_string_list
 from urlparse import urlparse
@@ -519,9 +527,73 @@ def run_startup_tests():
     if 'manage.py test' in ' '.join(sys.argv):
         test_settings_for_test_runner()
 
+def get_deployment_version():
+    """returns string identifying the deployment: version
+    of askbot, optional ``ASKBOT_DEPLOYMENT_VERSION`` setting
+    and modification time of the settings module, so that
+    the procedures are repeated after the settings are edited
+    """
+    settings_mtime = None
+    settings_module = sys.modules.get(django_settings.SETTINGS_MODULE)
+    settings_file = getattr(settings_module, '__file__', None)
+    if settings_file:
+        try:
+            settings_mtime = os.stat(settings_file).st_mtime
+        except OSError:
+            pass
+    return '%s:%s:%r' % (
+                askbot.get_version(),
+                getattr(django_settings, 'ASKBOT_DEPLOYMENT_VERSION', ''),
+                settings_mtime
+            )
+
+def get_stamp_path():
+    """by default the stamp is kept in the temporary directory,
+    one per settings module and database"""
+    database_name = django_settings.DATABASES['default'].get('NAME', '')
+    site_key = md5_constructor(
+                    '%s:%s' % (django_settings.SETTINGS_MODULE, database_name)
+                ).hexdigest()
+    default_path = os.path.join(
+                        tempfile.gettempdir(),
+                        'askbot-startup-%s' % site_key
+                    )
+    return getattr(django_settings, 'ASKBOT_STARTUP_STAMP_FILE', default_path)
+
+def is_recorded(version):
+    """True if the procedures succeeded for the deployment version"""
+    try:
+        stamp_file = open(get_stamp_path(), 'r')
+        try:
+            return stamp_file.read() == version
+        finally:
+            stamp_file.close()
+    except IOError:
+        return False
+
+def record(version):
+    path = get_stamp_path()
+    temp_path = '%s.%d' % (path, os.getpid())
+    try:
+        stamp_file = open(temp_path, 'w')
+        try:
+            stamp_file.write(version)
+        finally:
+            stamp_file.close()
+        os.rename(temp_path, path)
+    except (IOError, OSError), error:
+        print 'cannot record startup in %s: %s' % (path, error)
+
 @transaction.commit_manually
 def run():
     """runs all the startup procedures"""
+    run_once = getattr(django_settings, 'ASKBOT_STARTUP_PROCEDURES', 'always') == 'once'
+    if 'manage.py test' in ' '.join(sys.argv):
+        run_once = False#the test runner settings are always checked
+    if run_once:
+        version = get_deployment_version()
+        if is_recorded(version):
+            return
     try:
         run_startup_tests()
     except AskbotConfigError, error:
@@ -535,3 +607,6 @@ def run():
     except Exception, error:
         print error
         transaction.rollback()
+        return
+    if run_once:
+        record(version)
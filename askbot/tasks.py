@@ -22,11 +22,18 @@ import traceback
 
 from django.contrib.contenttypes.models import ContentType
 from celery.decorators import task
+from celery.signals import task_postrun
 from askbot.conf import settings as askbot_settings
 from askbot.models import Activity, Post, Thread, User
 from askbot.models import send_instant_notifications_about_activity_in_post
+from askbot.models import timeline
+from askbot.models import visit_buffer
 from askbot.models.badges import award_badges_signal
 
+#buffered visits of the worker processes must not be lost
+#when the workers are recycled
+task_postrun.connect(visit_buffer.flush_after_task)
+
 # TODO: Make exceptions raised inside record_post_update_celery_task() ...
 #       ... propagate upwards to test runner, if only CELERY_ALWAYS_EAGER = True
 #       (i.e. if Celery tasks are not deferred but executed straight away)
@@ -102,6 +109,7 @@ def record_post_update(
                     summary = summary
                 )
     update_activity.save()
+    timeline.record_activity(update_activity)
 
     #what users are included depends on the post type
     #for example for question - all Q&A contributors
@@ -172,7 +180,13 @@ def record_question_visit(
     #    id = question_post_id
     #).select_related('thread')[0]
     if update_view_count:
-        question_post.thread.increase_view_count()
+        thread = question_post.thread
+        if visit_buffer.is_enabled():
+            #the count in the database is behind by the buffered views,
+            #which is accounted for the badges below
+            thread.view_count += visit_buffer.add_view(thread.id)
+        else:
+            thread.increase_view_count()
 
     if user.is_anonymous():
         return
@@ -190,3 +204,25 @@ def record_question_visit(
                     actor = user,
                     context_object = question_post,
                 )
+
+@task(ignore_result = True)
+def update_thread_summary_html_celery_task(thread_id):
+    """re-renders the cached summary html of the thread,
+    scheduled by :meth:`askbot.models.Thread.schedule_summary_update`
+    at most once per delay window"""
+    try:
+        thread = Thread.objects.get(id = thread_id)
+    except Thread.DoesNotExist:
+        return
+    thread.apply_scheduled_summary_update()
+
+@task(ignore_result = True)
+def update_similar_threads_celery_task(thread_id):
+    """recomputes similar threads around the thread
+    after its tags have changed"""
+    from askbot.search import similarity
+    try:
+        thread = Thread.objects.get(id = thread_id)
+    except Thread.DoesNotExist:
+        return
+    similarity.refresh_around_thread(thread)
@@ -11,6 +11,7 @@ from django.core.urlresolvers import reverse, resolve
 from django.http import Http404
 from askbot import exceptions as askbot_exceptions
 from askbot.conf import settings as askbot_settings
+from askbot.models import permissions
 from django.conf import settings as django_settings
 from askbot.skins import utils as skin_utils
 from askbot.utils import functions
@@ -150,7 +151,14 @@ def make_template_filter_from_permission_assertion(
                             ):
     """a decorator-like function that will create a True/False test from
     permission assertion
+
+    if the permission matrix has a rule for the assertion
+    (the name without the ``assert_`` prefix), the decision
+    is taken from the matrix of the user
     """
+    rule_name = assertion_name.replace('assert_', '', 1)
+    has_rule = hasattr(permissions.PermissionMatrix, rule_name)
+
     def filter_function(user, post):
 
         if askbot_settings.ALWAYS_SHOW_ALL_UI_FUNCTIONS:
@@ -159,6 +167,9 @@ def make_template_filter_from_permission_assertion(
         if user.is_anonymous():
             return False
 
+        if has_rule:
+            return permissions.get_matrix(user).is_allowed(rule_name, post)
+
         assertion = getattr(user, assertion_name)
         if allowed_exception:
             try:
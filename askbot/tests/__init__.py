@@ -1,3 +1,7 @@
+from django.conf import settings as django_settings
+#the test database is not visible to the connections of other threads,
+#tests flush the visit buffer explicitly
+django_settings.ASKBOT_VISIT_BUFFER_FLUSH_TIMER = False
 from askbot.tests.cache_tests import *
 from askbot.tests.email_alert_tests import *
 from askbot.tests.on_screen_notification_tests import *
@@ -15,3 +19,5 @@ from askbot.tests.markup_test import *
 from askbot.tests.misc_tests import *
 from askbot.tests.post_model_tests import *
 from askbot.tests.reply_by_email_tests import *
+from askbot.tests.upload_tests import *
+from askbot.tests.zendesk_import_tests import *
@@ -4,6 +4,7 @@ from django.test.client import Client
 from askbot.tests.utils import AskbotTestCase
 from askbot.conf import settings
 from askbot import models
+from askbot.models import badge_counters
 from askbot.models.badges import award_badges_signal
 
 class BadgeTests(AskbotTestCase):
@@ -264,6 +265,36 @@ class BadgeTests(AskbotTestCase):
         self.u3.downvote(answer)
         self.assert_have_badge('civic-duty', recipient = self.u3, expected_count = 1)
 
+    def test_civic_duty_badge_counts_cancelled_votes_out(self):
+        settings.update('CIVIC_DUTY_BADGE_MIN_VOTES', 2)
+        question = self.post_question(user = self.u1)
+        answer = self.post_answer(user = self.u2, question = question)
+        self.u3.upvote(question)
+        self.assertEquals(badge_counters.get_counter('votes', self.u3.id), 1)
+        self.u3.upvote(question, cancel = True)
+        self.assertEquals(badge_counters.get_counter('votes', self.u3.id), 0)
+        self.u3.upvote(answer)
+        self.assert_have_badge('civic-duty', recipient = self.u3, expected_count = 0)
+        self.u3.upvote(question)
+        self.assert_have_badge('civic-duty', recipient = self.u3, expected_count = 1)
+
+    def test_civic_duty_badge_after_missed_count(self):
+        """a counter that skipped the limit still leads
+        to the award, which is given only once"""
+        settings.update('CIVIC_DUTY_BADGE_MIN_VOTES', 5)
+        question = self.post_question(user = self.u1)
+        answer = self.post_answer(user = self.u2, question = question)
+        answer2 = self.post_answer(user = self.u1, question = question)
+        self.u3.upvote(question)
+        self.u3.upvote(answer)
+        self.assert_have_badge('civic-duty', recipient = self.u3, expected_count = 0)
+        settings.update('CIVIC_DUTY_BADGE_MIN_VOTES', 1)
+        self.u3.upvote(answer2)
+        self.assert_have_badge('civic-duty', recipient = self.u3, expected_count = 1)
+        self.u3.upvote(answer2, cancel = True)
+        self.u3.upvote(answer2)
+        self.assert_have_badge('civic-duty', recipient = self.u3, expected_count = 1)
+
     def test_scholar_badge(self):
         question = self.post_question(user = self.u1)
         answer = self.post_answer(user = self.u2, question = question)
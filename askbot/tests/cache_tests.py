@@ -1,4 +1,5 @@
 from django.db import connection
+from django.core import cache
 from django.core.urlresolvers import reverse
 from django.conf import settings
 from askbot.tests.utils import AskbotTestCase
@@ -41,3 +42,38 @@ class CacheTests(AskbotTestCase):
         settings.DEBUG = False
 
 
+
+class SidebarCacheTests(AskbotTestCase):
+    def test_sidebar_data_matches_related_tags(self):
+        from askbot import models
+        from askbot.search import sidebar
+        from askbot.search.state_manager import SearchState
+        user = self.create_user('other_user')
+        self.post_question(user = user, tags = 'one two')
+        question = self.post_question(user = user, tags = 'one')
+        answerer = self.create_user('answerer')
+        self.post_answer(user = answerer, question = question)
+
+        threads = list(models.Thread.objects.all())
+        tags, contributors = sidebar.compute_sidebar_data(threads)
+        expected = models.Tag.objects.get_related_to_search(
+                                        threads = threads,
+                                        ignored_tag_names = []
+                                    )
+        self.assertEqual(
+            [(tag.name, tag.local_used_count) for tag in tags],
+            [(tag.name, tag.local_used_count) for tag in expected]
+        )
+        self.assertEqual(
+            set([contributor.id for contributor in contributors]),
+            set([user.id, answerer.id])
+        )
+
+        #second call is answered from the cache
+        cache.cache.clear()
+        search_state = SearchState(*[None for x in range(7)])
+        cached = sidebar.get_sidebar_data(threads, search_state, user)
+        self.assertEqual(
+            sidebar.get_sidebar_data(list(), search_state, user),
+            cached
+        )
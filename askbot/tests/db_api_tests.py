@@ -3,7 +3,9 @@ functions that happen on behalf of users
 
 e.g. ``some_user.do_something(...)``
 """
+from django.core import cache
 from django.core import exceptions
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.urlresolvers import reverse
 from django.test.client import Client
 from django.conf import settings
@@ -12,6 +14,7 @@ from askbot.tests.utils import AskbotTestCase
 from askbot import models
 from askbot import const
 from askbot.conf import settings as askbot_settings
+from askbot.search import wildcard_index
 import datetime
 
 class DBApiTests(AskbotTestCase):
@@ -143,6 +146,76 @@ class DBApiTests(AskbotTestCase):
         saved_question = models.Post.objects.get_questions().get(id = self.question.id)
         self.assertTrue(saved_question.thread.answer_count == 1)
 
+    def test_timeline_follows_question_deletion(self):
+        self.post_answer(user = self.other_user)
+        events, has_next = models.timeline.get_user_events(self.other_user)
+        self.assertEquals(len(events), 1)
+        self.assertEquals(events[0].activity_type, const.TYPE_ACTIVITY_ANSWER)
+        self.assertEquals(events[0].title, self.question.thread.title)
+        self.assertFalse(has_next)
+
+        self.user.delete_question(self.question)
+        events, has_next = models.timeline.get_user_events(self.other_user)
+        self.assertEquals(len(events), 0)
+
+        self.user.restore_post(self.question)
+        events, has_next = models.timeline.get_user_events(self.other_user)
+        self.assertEquals(len(events), 1)
+
+    def test_timeline_pages_of_simultaneous_events(self):
+        for number in range(5):
+            self.post_comment(
+                user = self.other_user,
+                parent_post = self.question,
+                body_text = 'comment number %d' % number
+            )
+        models.TimelineEvent.objects.filter(
+                        user = self.other_user
+                    ).update(
+                        active_at = datetime.datetime(2012, 1, 1)
+                    )
+        event_ids = list()
+        for page in range(1, 4):
+            events, has_next = models.timeline.get_user_events(
+                                        self.other_user,
+                                        page = page,
+                                        page_size = 2
+                                    )
+            event_ids.extend([event.id for event in events])
+            self.assertEquals(has_next, page < 3)
+        expected_ids = models.TimelineEvent.objects.filter(
+                                    user = self.other_user
+                                ).order_by('-id').values_list('id', flat = True)
+        self.assertEquals(event_ids, list(expected_ids))
+
+    def test_timeline_records_edits(self):
+        self.post_answer(user = self.other_user)
+        self.other_user.edit_answer(
+                        answer = self.answer,
+                        body_text = 'edited answer text',
+                        revision_comment = 'fixed a typo',
+                        force = True
+                    )
+        events, has_next = models.timeline.get_user_events(self.other_user)
+        self.assertEquals(
+            [event.activity_type for event in events],
+            [const.TYPE_ACTIVITY_UPDATE_ANSWER, const.TYPE_ACTIVITY_ANSWER]
+        )
+        self.assertEquals(events[0].post_id, self.answer.id)
+        self.assertEquals(events[0].summary, 'fixed a typo')
+        self.assertEquals(events[0].title, self.question.thread.title)
+
+        self.assertEquals(models.timeline.rebuild(), models.TimelineEvent.objects.count())
+        events, has_next = models.timeline.get_user_events(self.other_user)
+        self.assertEquals(events[0].summary, 'fixed a typo')
+
+    def test_rebuild_timeline(self):
+        self.post_answer(user = self.other_user)
+        events = models.TimelineEvent.objects.filter(user = self.other_user)
+        links = list(events.values_list('link', flat = True))
+        self.assertEquals(models.timeline.rebuild(), models.TimelineEvent.objects.count())
+        self.assertEquals(list(events.values_list('link', flat = True)), links)
+
     def test_unused_tag_is_auto_deleted(self):
         self.user.retag_question(self.question, tags = 'one-tag')
         tag = models.Tag.objects.get(name='one-tag')
@@ -153,6 +226,55 @@ class DBApiTests(AskbotTestCase):
         count = models.Tag.objects.filter(name='one-tag').count()
         self.assertEquals(count, 0)
 
+    def test_tag_use_counts_follow_edits(self):
+        other_question = self.post_question(tags = 'one two')
+        self.user.retag_question(self.question, tags = 'one three')
+        self.user.retag_question(other_question, tags = 'one three four')
+        self.assertEquals(models.tag.get_use_count_errors(), [])
+        self.user.delete_question(self.question)
+        self.assertEquals(models.tag.get_use_count_errors(), [])
+        self.assertEquals(models.Tag.objects.get(name = 'one').used_count, 1)
+        self.user.restore_post(self.question)
+        self.assertEquals(models.tag.get_use_count_errors(), [])
+        self.assertEquals(models.Tag.objects.get(name = 'one').used_count, 2)
+
+    def test_tag_of_deleted_question_is_kept_on_retag(self):
+        self.user.retag_question(self.question, tags = 'one test')
+        deleted_question = self.post_question(tags = 'one two')
+        self.user.delete_question(deleted_question)
+        self.user.retag_question(self.question, tags = 'test')
+        self.assertEquals(models.tag.get_use_count_errors(), [])
+        tag = models.Tag.objects.get(name = 'one')
+        self.assertEquals(tag.used_count, 0)
+        self.assertTrue(tag.deleted)
+        self.assertEquals(
+            list(deleted_question.thread.tags.values_list('name', flat = True)),
+            [u'one', u'two']
+        )
+        self.user.restore_post(deleted_question)
+        self.assertEquals(models.tag.get_use_count_errors(), [])
+        self.assertFalse(models.Tag.objects.get(name = 'one').deleted)
+
+    def test_repeated_delete_and_restore_keep_tag_use_counts(self):
+        self.user.restore_post(self.question)
+        self.assertEquals(models.tag.get_use_count_errors(), [])
+        self.user.delete_question(self.question)
+        self.user.delete_question(self.question)
+        self.assertEquals(models.tag.get_use_count_errors(), [])
+        self.user.restore_post(self.question)
+        self.user.restore_post(self.question)
+        self.assertEquals(models.tag.get_use_count_errors(), [])
+
+    def test_recount_tag_use_counts(self):
+        self.post_question(tags = 'one two')
+        models.Tag.objects.filter(name = 'one').update(used_count = 5)
+        self.assertEquals(
+            models.tag.get_use_count_errors(),
+            [('one', 5, 1)]
+        )
+        models.tag.recount_use_counts()
+        self.assertEquals(models.tag.get_use_count_errors(), [])
+
     def test_search_with_apostrophe_works(self):
         self.post_question(
             user = self.user,
@@ -356,6 +478,95 @@ class GlobalTagSubscriberGetterTests(AskbotTestCase):
             reason = 'bad'
         )
 
+    def test_wildcard_index_follows_selection_changes(self):
+        old_cache = cache.cache
+        cache.cache = LocMemCache('', {})
+        try:
+            self.set_email_tag_filter_strategy(const.INCLUDE_INTERESTING)
+            askbot_settings.update('USE_WILDCARD_TAGS', True)
+            self.u1.mark_tags(wildcards = ('da*',), reason = 'good', action = 'add')
+            self.u2.mark_tags(wildcards = ('go*', 'x*'), reason = 'good', action = 'add')
+            self.assertEqual(
+                set([self.u1.id, self.u2.id]),
+                wildcard_index.get_matching_user_ids(['day', 'good'], 'good')
+            )
+            self.assert_subscribers_are(
+                expected_subscribers = set([self.u1, self.u2]),
+                reason = 'good'
+            )
+            self.u2.mark_tags(wildcards = ('go*',), reason = 'good', action = 'remove')
+            self.assert_subscribers_are(
+                expected_subscribers = set([self.u1,]),
+                reason = 'good'
+            )
+            #selection changed behind the index back must not be matched
+            self.u1.interesting_tags = ''
+            self.u1.save()
+            self.assert_subscribers_are(
+                expected_subscribers = set(),
+                reason = 'good'
+            )
+        finally:
+            cache.cache = old_cache
+
+    def test_wildcard_index_follows_direct_saves(self):
+        old_cache = cache.cache
+        cache.cache = LocMemCache('', {})
+        try:
+            self.set_email_tag_filter_strategy(const.INCLUDE_INTERESTING)
+            askbot_settings.update('USE_WILDCARD_TAGS', True)
+            self.assert_subscribers_are(
+                expected_subscribers = set(),
+                reason = 'good'
+            )
+            #as the admin or an importer would save the user
+            user = models.User.objects.get(id = self.u1.id)
+            user.interesting_tags = 'da*'
+            user.save()
+            self.assert_subscribers_are(
+                expected_subscribers = set([self.u1,]),
+                reason = 'good'
+            )
+            #saves not changing the selections keep the index
+            version = wildcard_index.get_version('good')
+            user.reputation += 1
+            user.save()
+            self.assertEqual(version, wildcard_index.get_version('good'))
+        finally:
+            cache.cache = old_cache
+
+    def test_ignored_wildcards_are_always_checked(self):
+        old_cache = cache.cache
+        cache.cache = LocMemCache('', {})
+        try:
+            self.set_email_tag_filter_strategy(const.EXCLUDE_IGNORED)
+            askbot_settings.update('USE_WILDCARD_TAGS', True)
+            self.assert_subscribers_are(
+                expected_subscribers = set([self.u1, self.u2]),
+                reason = 'bad'
+            )
+            #selection changed behind the index back must still exclude
+            self.u1.ignored_tags = 'da*'
+            self.u1.save()
+            self.assert_subscribers_are(
+                expected_subscribers = set([self.u2,]),
+                reason = 'bad'
+            )
+        finally:
+            cache.cache = old_cache
+
+    def test_wildcard_index_is_invalidated_after_request(self):
+        old_cache = cache.cache
+        cache.cache = LocMemCache('', {})
+        try:
+            wildcard_index.start_request()
+            self.u1.mark_tags(wildcards = ('da*',), reason = 'good', action = 'add')
+            version = wildcard_index.get_version('good')
+            wildcard_index.finish_request()
+            self.assertNotEqual(version, wildcard_index.get_version('good'))
+        finally:
+            cache.cache = old_cache
+
 class CommentTests(AskbotTestCase):
     """unfortunately, not very useful tests,
     as assertions of type "user can" are not inside
@@ -387,3 +598,140 @@ class CommentTests(AskbotTestCase):
         self.other_user.upvote(comment, cancel = True)
         comment = models.Post.objects.get_comments().get(id = self.comment.id)
         self.assertEquals(comment.score, 0)
+
+class ProfileStatsTests(AskbotTestCase):
+    def setUp(self):
+        self.u1 = self.create_user('user1')
+        self.u2 = self.create_user('user2')
+        self.question = self.post_question(user = self.u1, tags = 'one two')
+        self.answer = self.post_answer(user = self.u2, question = self.question)
+
+    def get_tag_usage(self, user):
+        return dict(
+            (tag_usage.tag.name, tag_usage.count)
+            for tag_usage in models.profile_stats.get_tag_usage(user, 10)
+        )
+
+    def test_tag_usage_follows_retag(self):
+        models.profile_stats.get_stats(self.u2)
+        self.assertEquals(self.get_tag_usage(self.u2), {'one': 1, 'two': 1})
+        self.u1.retag_question(self.question, tags = 'one three')
+        self.assertEquals(self.get_tag_usage(self.u2), {'one': 1, 'three': 1})
+        self.assertEquals(models.profile_stats.rebuild(), 0)
+
+    def test_vote_counts_follow_votes(self):
+        models.profile_stats.get_stats(self.u2)
+        self.u2.upvote(self.question, force = True)
+        stats = models.profile_stats.get_stats(self.u2)
+        self.assertEquals((stats.up_votes, stats.down_votes), (1, 0))
+        self.u2.downvote(self.question, force = True)
+        stats = models.profile_stats.get_stats(self.u2)
+        self.assertEquals((stats.up_votes, stats.down_votes), (0, 1))
+        self.assertEquals(models.profile_stats.rebuild(), 0)
+
+    def test_awarded_posts_follow_edits(self):
+        models.profile_stats.get_stats(self.u2)
+        models.badges.get_badge('nice-answer').award(
+                                recipient = self.u2,
+                                context_object = self.answer,
+                                timestamp = datetime.datetime.now()
+                            )
+        self.u1.edit_question(
+                    question = self.question,
+                    title = 'edited question title',
+                    body_text = self.question.text,
+                    revision_comment = 'retitled',
+                    tags = 'one two',
+                    force = True
+                )
+        badges = models.profile_stats.get_stats(self.u2).get_badges()
+        self.assertEquals(len(badges), 1)
+        badge, award_count, awarded_posts = badges[0]
+        self.assertEquals(badge.slug, 'nice-answer')
+        self.assertEquals(award_count, 1)
+        self.assertEquals(len(awarded_posts), 1)
+        self.assertEquals(awarded_posts[0]['title'], 'edited question title')
+        self.assertEquals(awarded_posts[0]['url'], self.answer.get_absolute_url())
+        self.assertEquals(models.profile_stats.rebuild(), 0)
+
+    def test_concurrently_created_stats_are_returned(self):
+        build_stats = models.profile_stats.build_stats
+        def build_stats_after_other_request(user_id):
+            #the other request saves the record first
+            build_stats(user_id).save()
+            return build_stats(user_id)
+        models.profile_stats.build_stats = build_stats_after_other_request
+        try:
+            stats = models.profile_stats.get_stats(self.u2)
+        finally:
+            models.profile_stats.build_stats = build_stats
+        self.assertEquals(
+            stats.id,
+            models.ProfileStats.objects.get(user = self.u2).id
+        )
+
+class VoteTests(AskbotTestCase):
+    def setUp(self):
+        self.author = self.create_user('author')
+        self.u1 = self.create_user('user1')
+        self.u2 = self.create_user('user2')
+        self.question = self.post_question(user = self.author)
+
+    def test_concurrent_votes_are_not_lost(self):
+        #both voters hold a copy of the post loaded before the other vote
+        copy1 = models.Post.objects.get(id = self.question.id)
+        copy2 = models.Post.objects.get(id = self.question.id)
+        reputation = self.reload_object(self.author).reputation
+        self.u1.upvote(copy1)
+        self.u2.upvote(copy2)
+        question = self.reload_object(self.question)
+        self.assertEquals(question.score, 2)
+        self.assertEquals(question.vote_up_count, 2)
+        self.assertEquals(question.thread.score, 2)
+        self.assertEquals(copy2.score, 2)
+        author = self.reload_object(self.author)
+        gain = askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE
+        self.assertEquals(author.reputation, reputation + 2*gain)
+
+        self.u1.upvote(copy1, cancel = True)
+        question = self.reload_object(self.question)
+        self.assertEquals(question.score, 1)
+        self.assertEquals(question.vote_up_count, 1)
+
+    def test_daily_vote_limit(self):
+        max_votes = askbot_settings.MAX_VOTES_PER_USER_PER_DAY
+        askbot_settings.update('MAX_VOTES_PER_USER_PER_DAY', 1)
+        try:
+            answer = self.post_answer(user = self.author, question = self.question)
+            self.u1.upvote(self.question, limit_votes = True)
+            self.assertEquals(self.u1.get_unused_votes_today(), 0)
+            self.assertRaises(
+                exceptions.PermissionDenied,
+                self.u1.upvote,
+                answer,
+                limit_votes = True
+            )
+            self.assertEquals(self.reload_object(answer).score, 0)
+            #canceled vote is given back
+            self.u1.upvote(self.question, cancel = True)
+            self.assertEquals(self.u1.get_unused_votes_today(), 1)
+            self.u1.upvote(answer, limit_votes = True)
+        finally:
+            askbot_settings.update('MAX_VOTES_PER_USER_PER_DAY', max_votes)
+
+    def test_daily_reputation_cap(self):
+        max_gain = askbot_settings.MAX_REP_GAIN_PER_USER_PER_DAY
+        gain = askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE
+        askbot_settings.update('MAX_REP_GAIN_PER_USER_PER_DAY', gain)
+        try:
+            reputation = self.reload_object(self.author).reputation
+            self.u1.upvote(self.question)
+            self.u2.upvote(self.question)
+            author = self.reload_object(self.author)
+            self.assertEquals(author.reputation, reputation + gain)
+            self.assertEquals(
+                models.Repute.objects.get_reputation_by_upvoted_today(author),
+                gain
+            )
+        finally:
+            askbot_settings.update('MAX_REP_GAIN_PER_USER_PER_DAY', max_gain)
@@ -798,6 +798,76 @@ class TagFollowedInstantWholeForumEmailAlertTests(utils.AskbotTestCase):
             self.user1.email in outbox[0].recipients()
         )
 
+class InstantNotificationFanOutTests(utils.AskbotTestCase):
+    def setUp(self):
+        self.create_user(username = 'user1')
+        self.create_user(username = 'user2')
+        self.create_user(username = 'user3')
+        self.user3.reputation = 10000
+        self.user3.save()
+        self.question = self.post_question(user = self.user1, tags = 'one two')
+        self.activity = models.Activity(
+                            user = self.user1,
+                            activity_type = const.TYPE_ACTIVITY_ASK_QUESTION
+                        )
+
+    def test_renderer_matches_single_message_formatting(self):
+        from askbot.skins.loaders import get_template
+        template = get_template('instant_notification_reply_by_email.html')
+        renderer = models.InstantNotificationRenderer(
+                        template = template,
+                        post_data = models.get_instant_notification_post_data(
+                                                from_user = self.user1,
+                                                post = self.question,
+                                                update_type = 'new_question'
+                                            )
+                    )
+        for user in (self.user2, self.user3):
+            subject_line, body_text = models.format_instant_notification_email(
+                                                to_user = user,
+                                                from_user = self.user1,
+                                                post = self.question,
+                                                update_type = 'new_question',
+                                                template = template
+                                            )
+            self.assertEqual(renderer.render(user), body_text)
+
+    def test_messages_sent_per_recipient(self):
+        django.core.mail.outbox = list()
+        models.send_instant_notifications_about_activity_in_post(
+                                update_activity = self.activity,
+                                post = self.question,
+                                recipients = [self.user2, self.user3]
+                            )
+        outbox = django.core.mail.outbox
+        self.assertEqual(len(outbox), 2)
+        self.assertEqual(
+            set([self.user2.email, self.user3.email]),
+            set([message.recipients()[0] for message in outbox])
+        )
+        for message in outbox:
+            self.assertEqual(len(message.recipients()), 1)
+            self.assertTrue(self.question.thread.title in message.subject)
+
+    def test_email_server_failure_is_not_raised(self):
+        class BrokenConnection(object):
+            closed = False
+            def open(self):
+                raise IOError('connection refused')
+            def close(self):
+                self.closed = True
+        connection = BrokenConnection()
+        django.core.mail.outbox = list()
+        models.send_instant_notifications_about_activity_in_post(
+                                update_activity = self.activity,
+                                post = self.question,
+                                recipients = [self.user2, self.user3],
+                                connection = connection
+                            )
+        self.assertEqual(len(django.core.mail.outbox), 0)
+        self.assertTrue(connection.closed)
+
+
 class EmailReminderTestCase(utils.AskbotTestCase):
     #subclass must define these (example below)
     #enable_setting_name = 'ENABLE_UNANSWERED_REMINDERS'
@@ -949,3 +1019,25 @@ class EmailFeedSettingTests(utils.AskbotTestCase):
         new_user.add_missing_askbot_subscriptions()
         data_after = TO_JSON(self.get_user_feeds())
         self.assertEquals(data_before, data_after)
+
+class EmailAlertsDryRunTests(utils.AskbotTestCase):
+    def setUp(self):
+        self.create_user('user1', notification_schedule = {'q_all': 'd'})
+        self.create_user('user2')
+
+    def get_feed(self):
+        return models.EmailFeedSetting.objects.get(
+                                            subscriber = self.user1,
+                                            feed_type = 'q_all'
+                                        )
+
+    def test_dry_run_does_not_send_nor_save(self):
+        self.post_question(user = self.user2)
+        django.core.mail.outbox = list()
+        management.call_command('send_email_alerts', dry_run = True)
+        self.assertEqual(len(django.core.mail.outbox), 0)
+        self.assertEqual(self.get_feed().reported_at, None)
+        self.assertEqual(
+            models.EmailFeedSetting.objects.filter(subscriber = self.user1).count(),
+            1
+        )
@@ -1,7 +1,10 @@
+import shutil
+import tempfile
 from django.core import management
 from django.contrib import auth
 from askbot.tests.utils import AskbotTestCase
 from askbot import models
+from askbot.utils import forum_dump
 
 class ManagementCommandTests(AskbotTestCase):
     def test_add_askbot_user(self):
@@ -49,3 +52,35 @@ class ManagementCommandTests(AskbotTestCase):
         user_two = models.User.objects.get(pk=2)
         self.assertEqual(user_two.gold, number_of_gold) 
         self.assertEqual(user_two.reputation, reputation)
+
+    def test_forum_dump_restores_changed_rows(self):
+        user = self.create_user()
+        question = self.post_question(user = user)
+        answer = self.post_answer(user = user, question = question)
+        comment = self.post_comment(user = user, parent_post = answer)
+        dump_dir = tempfile.mkdtemp()
+        try:
+            forum_dump.dump(dump_dir + '/dump', workers = 1)
+            models.Post.objects.filter(
+                            id = answer.id
+                        ).update(text = 'changed')
+            models.Post.objects.filter(id = comment.id).update(parent = None)
+            forum_dump.load(dump_dir + '/dump', workers = 1)
+        finally:
+            shutil.rmtree(dump_dir)
+        answer = self.reload_object(answer)
+        self.assertEqual(answer.text, 'test answer text')
+        self.assertEqual(self.reload_object(comment).parent_id, answer.id)
+
+    def test_forum_dump_load_order(self):
+        groups, deferred = forum_dump.get_load_groups(
+                                    forum_dump.get_dumped_models()
+                                )
+        positions = dict()
+        for position, group in enumerate(groups):
+            for label in group:
+                positions[label] = position
+        self.assertTrue(positions['auth.User'] < positions['askbot.Post'])
+        self.assertTrue(positions['askbot.Thread'] < positions['askbot.Post'])
+        self.assertTrue('parent' in deferred['askbot.Post'])
+        self.assertTrue('accepted_answer' in deferred['askbot.Thread'])
@@ -1,4 +1,7 @@
 from django.conf import settings as django_settings
+from django.core import cache
+from django.core.cache.backends.locmem import LocMemCache
+from askbot.conf import settings as askbot_settings
 from askbot.tests.utils import AskbotTestCase
 from askbot.utils import markup
 
@@ -22,3 +25,41 @@ class MarkupTest(AskbotTestCase):
         text = "oh hai @user1 how are you?"
         output = markup.extract_mentioned_name_seeds(text)
         self.assertEquals(output, set(['user1']))
+
+    def test_mentionize_text_many_mentions(self):
+        u2 = self.create_user('user10')
+        text = "@user10! a@user1 @@USER1, mail@user1 @user"
+        expected_output = '<a href="%s">@user10</a>! a@user1 ' % u2.get_profile_url()
+        expected_output += '@<a href="%s">@user1</a>, ' % self.u1.get_profile_url()
+        expected_output += 'mail@user1 @user'
+        mentioned_authors, output = markup.mentionize_text(
+                                                    text,
+                                                    [self.u1, u2]
+                                                )
+        self.assertEquals(mentioned_authors, [u2, self.u1])
+        self.assertEquals(output, expected_output)
+
+    def test_parser_is_reused_until_settings_change(self):
+        code_friendly = askbot_settings.MARKUP_CODE_FRIENDLY
+        parser = markup.get_parser()
+        self.assertTrue(markup.get_parser() is parser)
+        askbot_settings.update('MARKUP_CODE_FRIENDLY', not code_friendly)
+        self.assertFalse(markup.get_parser() is parser)
+        askbot_settings.update('MARKUP_CODE_FRIENDLY', code_friendly)
+
+    def test_markdown_to_html_is_cached(self):
+        old_cache = cache.cache
+        cache.cache = LocMemCache('', {})
+        try:
+            html = markup.markdown_to_html('some *text*')
+            self.assertEquals(html.strip(), '<p>some <em>text</em></p>')
+            key = markup.get_html_cache_key(
+                                    'some *text*',
+                                    markup.get_markup_settings()
+                                )
+            self.assertEquals(cache.cache.get(key), html)
+            html_by_text = markup.markdown_to_html_many(['some *text*', 'more'])
+            self.assertEquals(html_by_text['some *text*'], html)
+            self.assertEquals(html_by_text['more'].strip(), '<p>more</p>')
+        finally:
+            cache.cache = old_cache
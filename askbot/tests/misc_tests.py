@@ -1,4 +1,12 @@
+import datetime
+from django.conf import settings as django_settings
+from askbot.conf import settings as askbot_settings
+from askbot.conf import settings_wrapper
 from askbot.tests.utils import AskbotTestCase
+from askbot.models import signals
+from askbot.models import visit_buffer
+from askbot.models import Thread, User
+from askbot.models.badges import award_badges_signal
 from askbot.models.post import PostRevision
 
 class MiscTests(AskbotTestCase):
@@ -13,3 +21,94 @@ class MiscTests(AskbotTestCase):
         question = self.post_question(user=self.u1)
         self.assertRaises(NotImplementedError, question.revisions.create)
         self.assertRaises(NotImplementedError, PostRevision.objects.create)
+
+
+class VisitBufferTests(AskbotTestCase):
+
+    def setUp(self):
+        self.u1 = self.create_user(username='user1')
+        visit_buffer.flush()
+
+    def test_view_counts_are_aggregated(self):
+        question = self.post_question(user=self.u1)
+        thread_id = question.thread.id
+        self.assertEqual(1, visit_buffer.add_view(thread_id))
+        self.assertEqual(2, visit_buffer.add_view(thread_id))
+        self.assertEqual(0, Thread.objects.get(id=thread_id).view_count)
+        visit_buffer.flush()
+        self.assertEqual(0, visit_buffer.get_pending_views(thread_id))
+        self.assertEqual(2, Thread.objects.get(id=thread_id).view_count)
+
+    def test_recycled_worker_flushes_after_task(self):
+        question = self.post_question(user=self.u1)
+        thread_id = question.thread.id
+        visit_buffer.add_view(thread_id)
+        visit_buffer.flush_after_task()
+        self.assertEqual(1, visit_buffer.get_pending_views(thread_id))
+        django_settings.CELERYD_MAX_TASKS_PER_CHILD = 100
+        try:
+            visit_buffer.flush_after_task()
+        finally:
+            del django_settings.CELERYD_MAX_TASKS_PER_CHILD
+        self.assertEqual(0, visit_buffer.get_pending_views(thread_id))
+        self.assertEqual(1, Thread.objects.get(id=thread_id).view_count)
+
+    def test_site_visit_event_is_sent_once(self):
+        events = list()
+        def record_event(sender, event = None, **kwargs):
+            if event == 'site_visit':
+                events.append(event)
+        award_badges_signal.connect(record_event)
+        try:
+            yesterday = datetime.datetime.now() - datetime.timedelta(days = 1, hours = 1)
+            User.objects.filter(id=self.u1.id).update(last_seen=yesterday)
+            now = datetime.datetime.now()
+            for minutes in (0, 1, 2):
+                #each request loads the user from the database
+                user = User.objects.get(id=self.u1.id)
+                signals.site_visited.send(None,
+                    user = user,
+                    timestamp = now + datetime.timedelta(minutes = minutes)
+                )
+        finally:
+            award_badges_signal.disconnect(record_event)
+        self.assertEqual(['site_visit'], events)
+
+        visit_buffer.flush()
+        last_seen = User.objects.get(id=self.u1.id).last_seen
+        expected = (now + datetime.timedelta(minutes = 2)).replace(microsecond = 0)
+        self.assertEqual(expected, last_seen)
+
+
+class LivesettingsSnapshotTests(AskbotTestCase):
+
+    def setUp(self):
+        self.check_interval = settings_wrapper.get_check_interval()
+        django_settings.ASKBOT_LIVESETTINGS_CHECK_INTERVAL = 0
+
+    def tearDown(self):
+        django_settings.ASKBOT_LIVESETTINGS_CHECK_INTERVAL = self.check_interval
+
+    def test_update_is_seen_at_once(self):
+        min_votes = askbot_settings.CIVIC_DUTY_BADGE_MIN_VOTES
+        askbot_settings.update('CIVIC_DUTY_BADGE_MIN_VOTES', min_votes + 1)
+        self.assertEqual(askbot_settings.CIVIC_DUTY_BADGE_MIN_VOTES, min_votes + 1)
+        self.assertEqual(
+            askbot_settings.get_stored_value('CIVIC_DUTY_BADGE_MIN_VOTES'),
+            min_votes + 1
+        )
+
+    def test_update_in_other_process_is_seen(self):
+        min_votes = askbot_settings.CIVIC_DUTY_BADGE_MIN_VOTES
+        #simulate another process that changed the setting:
+        #it stores all values in the cache and changes the version stamp
+        values = askbot_settings.as_dict()
+        values['CIVIC_DUTY_BADGE_MIN_VOTES'] = min_votes + 1
+        settings_wrapper.cache.set(settings_wrapper.SETTINGS_KEY, values)
+        settings_wrapper.cache.set(settings_wrapper.VERSION_KEY, 'other-process')
+        self.assertEqual(askbot_settings.CIVIC_DUTY_BADGE_MIN_VOTES, min_votes + 1)
+
+    def test_as_dict_returns_copy(self):
+        values = askbot_settings.as_dict()
+        values['CIVIC_DUTY_BADGE_MIN_VOTES'] = None
+        self.assertNotEqual(askbot_settings.CIVIC_DUTY_BADGE_MIN_VOTES, None)
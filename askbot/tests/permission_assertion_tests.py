@@ -7,6 +7,8 @@ from django.core import exceptions
 from askbot.tests import utils
 from askbot.conf import settings as askbot_settings
 from askbot import models
+from askbot import exceptions as askbot_exceptions
+from askbot.models import permissions
 from askbot.templatetags import extra_filters_jinja as template_filters
 from askbot.tests.utils import skipIf, AskbotTestCase
 
@@ -1618,3 +1620,93 @@ class ClosedForumTests(utils.AskbotTestCase):
 
     def tearDown(self):
         askbot_settings.ASKBOT_CLOSED_FORUM_MODE = False
+
+class PermissionMatrixTests(utils.AskbotTestCase):
+    """decisions of the permission matrix used by the template
+    filters must be the same as of the permission assertions"""
+
+    #assertion, checked post types, exception that does not deny
+    RULES = (
+        ('assert_can_edit_post', ('question', 'answer', 'comment'), None),
+        ('assert_can_retag_question', ('question',), None),
+        ('assert_can_close_question', ('question',), None),
+        ('assert_can_reopen_question', ('question',), None),
+        ('assert_can_delete_post', ('question', 'answer', 'comment'), None),
+        ('assert_can_delete_comment', ('comment',), None),
+        ('assert_can_edit_comment', ('comment',), None),
+        ('assert_can_post_comment', ('question', 'answer'), None),
+        ('assert_can_accept_best_answer', ('answer',), None),
+        (
+            'assert_can_flag_offensive',
+            ('question', 'answer'),
+            askbot_exceptions.DuplicateCommand
+        ),
+        ('assert_can_remove_flag_offensive', ('question', 'answer'), None),
+        ('assert_can_remove_all_flags_offensive', ('question', 'answer'), None),
+    )
+
+    def setUp(self):
+        self.u1 = self.create_user('user1')
+        self.u2 = self.create_user('user2')
+        question = self.post_question(user = self.u1)
+        answer = self.post_answer(user = self.u2, question = question)
+        own_answer = self.post_answer(user = self.u1, question = question)
+        deleted_question = self.post_question(user = self.u2)
+        models.Post.objects.filter(
+                        id = deleted_question.id
+                    ).update(deleted = True)
+        comments = (
+            self.post_comment(user = self.u2, parent_post = question),
+            self.post_comment(user = self.u1, parent_post = answer),
+        )
+        self.u1.upvote(answer)
+        self.u1.flag_post(answer, force = True)
+        self.post_ids = [
+            post.id for post in
+            (question, answer, own_answer, deleted_question) + comments
+        ]
+
+    def set_user_state(self, user, status, reputation):
+        user = self.reload_object(user)
+        user.remove_admin_status()
+        if status == 'd':
+            user.status = 'a'
+            user.set_admin_status()
+        else:
+            user.status = status
+        user.reputation = reputation
+        user.save()
+        return user
+
+    def get_assertion_decision(self, user, assertion_name, post, allowed_exception):
+        try:
+            getattr(user, assertion_name)(post)
+        except exceptions.PermissionDenied, e:
+            if allowed_exception:
+                return isinstance(e, allowed_exception)
+            return False
+        return True
+
+    def test_matrix_decisions_match_assertions(self):
+        for status in ('a', 'w', 'm', 'd', 's', 'b'):
+            for reputation in (1, 100000):
+                for user in (self.u1, self.u2):
+                    user = self.set_user_state(user, status, reputation)
+                    matrix = permissions.PermissionMatrix(user)
+                    posts = models.Post.objects.filter(id__in = self.post_ids)
+                    for assertion_name, post_types, allowed_exception in self.RULES:
+                        rule_name = assertion_name.replace('assert_', '', 1)
+                        for post in posts:
+                            if post.post_type not in post_types:
+                                continue
+                            expected = self.get_assertion_decision(
+                                user, assertion_name, post, allowed_exception
+                            )
+                            self.assertEquals(
+                                matrix.is_allowed(rule_name, post),
+                                expected,
+                                '%s of post %d by %s, status %s, reputation %d' % (
+                                    rule_name, post.id, user.username,
+                                    status, reputation
+                                )
+                            )
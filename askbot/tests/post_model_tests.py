@@ -5,14 +5,20 @@ import time
 from askbot.search.state_manager import SearchState
 from askbot.skins.loaders import get_template
 from django.contrib.auth.models import User
+from django.conf import settings as django_settings
 from django.core import cache, urlresolvers
 from django.core.cache.backends.dummy import DummyCache
 from django.core.cache.backends.locmem import LocMemCache
 
 from django.core.exceptions import ValidationError
 from askbot.tests.utils import AskbotTestCase
-from askbot.models import Post, PostRevision, Thread, Tag
+from askbot.models import Post, PostRevision, Thread, Tag, SimilarThread
+from askbot.models.question import fill_summary_tag_urls
+from askbot.models import visit_buffer
 from askbot.search.state_manager import DummySearchState
+from askbot.search import tag_index
+from askbot.search import paginator as search_paginator
+from askbot import tasks
 from django.utils import simplejson
 
 
@@ -222,6 +228,30 @@ class ThreadTagModelsTests(AskbotTestCase):
         self.assertListEqual([3, 2, 2, 2, 1], [t.local_used_count for t in tags])
         self.assertListEqual([3, 2, 2, 2, 2], [t.used_count for t in tags])
 
+    def test_similar_threads(self):
+        similar = [item['url'] for item in self.q1.thread.get_similar_threads()]
+        self.assertEqual([self.q4.get_absolute_url(), self.q2.get_absolute_url()], similar)
+
+        self.assertEqual(2, SimilarThread.objects.filter(thread=self.q1.thread).count())
+        records = SimilarThread.objects.filter(thread=self.q1.thread).order_by('-score')
+        self.assertEqual(
+            [self.q4.thread.id, self.q2.thread.id],
+            [record.similar_thread_id for record in records]
+        )
+
+        #retagged thread is found in the similar threads of its new neighbours
+        self.user2.retag_question(question=self.q3, tags='tag1')
+        similar_ids = SimilarThread.objects.filter(
+                                thread=self.q1.thread
+                            ).values_list('similar_thread', flat=True)
+        self.assertTrue(self.q3.thread.id in similar_ids)
+
+        #deleted questions are not shown
+        self.user3.delete_question(self.q4)
+        self.q1.thread.invalidate_similar_threads_cache()
+        similar = [item['url'] for item in self.q1.thread.get_similar_threads()]
+        self.assertFalse(self.q4.get_absolute_url() in similar)
+
     def test_run_adv_search_1(self):
         ss = SearchState.get_empty()
         qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
@@ -276,6 +306,27 @@ class ThreadTagModelsTests(AskbotTestCase):
         self.assertEqual(1, len(qs))
         self.assertEqual(self.q4.thread_id, qs[0].id)
 
+    def test_keyset_pagination(self):
+        ss = SearchState(scope=None, sort='age-desc', query=None, tags=None, author=None, page=None, user_logged_in=None)
+        qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
+        expected_ids = [thread.id for thread in qs]
+
+        paginator = search_paginator.KeysetPaginator(qs, '-added_at', 3, len(expected_ids))
+        self.assertEqual(2, paginator.num_pages)
+        page1 = paginator.page(1)
+        self.assertEqual(expected_ids[:3], [thread.id for thread in page1])
+        self.assertFalse(page1.has_previous())
+        self.assertTrue(page1.has_next())
+
+        page2 = paginator.page(2, cursor=page1.next_cursor())
+        self.assertEqual(expected_ids[3:], [thread.id for thread in page2])
+        self.assertTrue(page2.has_previous())
+        self.assertFalse(page2.has_next())
+
+        back_page = paginator.page(1, cursor=page2.previous_cursor())
+        self.assertEqual(expected_ids[:3], [thread.id for thread in back_page])
+        self.assertFalse(back_page.has_previous())
+
     def test_thread_caching_1(self):
         ss = SearchState.get_empty()
         qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
@@ -308,6 +359,88 @@ class ThreadTagModelsTests(AskbotTestCase):
             self.assertTrue(thread.last_activity_by is thread._last_activity_by_cache)
 
 
+class TagIndexTests(AskbotTestCase):
+    def setUp(self):
+        self.create_user()
+        self.q1 = self.post_question(tags='tag1 tag2 tag3')
+        self.q2 = self.post_question(tags='tag3 tag4 tag5')
+        self.q3 = self.post_question(tags='tag6')
+        self.q4 = self.post_question(tags='tag1 tag2 tag3 tag4 tag5 tag6')
+
+        self.old_cache = cache.cache
+        cache.cache = LocMemCache('', {})  # Enable local caching
+        self.old_use_tag_index = getattr(django_settings, 'ASKBOT_USE_TAG_INDEX', False)
+        self.old_max_ids = getattr(django_settings, 'ASKBOT_TAG_INDEX_MAX_IDS', 20000)
+        django_settings.ASKBOT_USE_TAG_INDEX = True
+
+    def tearDown(self):
+        cache.cache = self.old_cache  # Restore caching
+        django_settings.ASKBOT_USE_TAG_INDEX = self.old_use_tag_index
+        django_settings.ASKBOT_TAG_INDEX_MAX_IDS = self.old_max_ids
+
+    def thread_ids(self, *questions):
+        return sorted([q.thread_id for q in questions])
+
+    def test_sorted_list_operations(self):
+        self.assertEqual([3, 5], tag_index.intersect([1, 3, 5, 7], [2, 3, 4, 5]))
+        self.assertEqual([40], tag_index.intersect([40], range(100)))
+        self.assertEqual([], tag_index.intersect([], [1, 2]))
+        self.assertEqual([1, 2, 3, 5], tag_index.union([[1, 3], [2, 3], [5]]))
+        self.assertEqual([1, 7], tag_index.difference([1, 3, 5, 7], [3, 4, 5]))
+        self.assertEqual([1, 3], tag_index.unpack_ids(tag_index.pack_ids([1, 3])).tolist())
+
+    def test_and_or_selections(self):
+        self.assertEqual(
+            self.thread_ids(self.q1, self.q4),
+            tag_index.get_thread_ids(['tag1', 'tag3'])
+        )
+        self.assertEqual(
+            self.thread_ids(self.q2, self.q3, self.q4),
+            tag_index.get_thread_ids(['tag4', 'tag6'], match_all=False)
+        )
+        self.assertEqual([], tag_index.get_thread_ids(['tag1', 'no-such-tag']))
+
+    def test_index_follows_retag(self):
+        self.assertEqual(self.thread_ids(self.q3, self.q4), tag_index.get_thread_ids(['tag6']))
+        self.user.retag_question(question=self.q1, tags='tag6 tag7')
+        self.assertEqual(self.thread_ids(self.q4), tag_index.get_thread_ids(['tag1']))
+        self.assertEqual(self.thread_ids(self.q1, self.q3, self.q4), tag_index.get_thread_ids(['tag6']))
+        self.assertEqual(self.thread_ids(self.q1), tag_index.get_thread_ids(['tag7']))
+
+    def test_unanswered_list_follows_answers(self):
+        all_ids = self.thread_ids(self.q1, self.q2, self.q3, self.q4)
+        self.assertEqual(all_ids, list(tag_index.get_unanswered_thread_ids('NO_ANSWERS')))
+        self.post_answer(question=self.q2)
+        all_ids.remove(self.q2.thread_id)
+        self.assertEqual(all_ids, list(tag_index.get_unanswered_thread_ids('NO_ANSWERS')))
+
+    def test_search_results_match_orm(self):
+        ss = SearchState(scope='unanswered', sort=None, query="#tag3", tags='tag5', author=None, page=None, user_logged_in=None)
+        django_settings.ASKBOT_USE_TAG_INDEX = False
+        qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
+        orm_ids = sorted([thread.id for thread in qs])
+        django_settings.ASKBOT_USE_TAG_INDEX = True
+        qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
+        self.assertEqual(orm_ids, sorted([thread.id for thread in qs]))
+        self.assertEqual(self.thread_ids(self.q2, self.q4), orm_ids)
+
+    def test_too_large_lists_are_not_cached(self):
+        django_settings.ASKBOT_TAG_INDEX_MAX_IDS = 2
+        self.assertEqual(None, tag_index.get_thread_ids(['tag3']))
+        self.assertEqual(
+            tag_index.TOO_LARGE,
+            cache.cache.get(tag_index.get_tag_key('tag3'))
+        )
+        self.assertEqual(None, tag_index.get_thread_ids(['tag3', 'tag6']))
+        self.assertEqual(self.thread_ids(self.q3, self.q4), tag_index.get_thread_ids(['tag6']))
+        #the search falls back to the joins
+        ss = SearchState(scope=None, sort=None, query=None, tags='tag3', author=None, page=None, user_logged_in=None)
+        qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
+        self.assertEqual(
+            self.thread_ids(self.q1, self.q2, self.q4),
+            sorted([thread.id for thread in qs])
+        )
+
 class ThreadRenderLowLevelCachingTests(AskbotTestCase):
     def setUp(self):
         self.create_user()
@@ -428,6 +561,33 @@ class ThreadRenderLowLevelCachingTests(AskbotTestCase):
         )
 
 
+    def test_bulk_summary_html(self):
+        cache.cache = LocMemCache('', {})  # Enable local caching
+
+        q2 = self.post_question(title="second question", tags='tag1 tag4')
+        threads = [self.q.thread, q2.thread]
+        ss = SearchState.get_empty().add_tag('tag2')
+        expected = [thread.get_summary_html(search_state=ss) for thread in threads]
+
+        cache.cache.delete(Thread.SUMMARY_CACHE_KEY_TPL % q2.thread.id)
+        self.assertFalse(q2.thread.summary_html_cached())
+
+        threads = list(Thread.objects.filter(id__in=[thread.id for thread in threads]).order_by('id'))
+        self.assertEqual(expected, Thread.objects.get_summary_html_for_threads(threads, ss))
+        self.assertTrue(q2.thread.summary_html_cached())
+        self.assertFalse('<<<' in ''.join(expected))
+
+    def test_fill_summary_tag_urls(self):
+        ss = SearchState.get_empty()
+        url_memo = dict()
+        html = fill_summary_tag_urls('<<<tag1>>> <<<tag2>>> <<<tag1>>>', ss, url_memo)
+        tag1_url = ss.add_tag('tag1').full_url()
+        self.assertEqual(
+            '%s %s %s' % (tag1_url, ss.add_tag('tag2').full_url(), tag1_url),
+            html
+        )
+        self.assertEqual(tag1_url, url_memo['tag1'])
+
 
 class ThreadRenderCacheUpdateTests(AskbotTestCase):
     def setUp(self):
@@ -604,6 +764,7 @@ class ThreadRenderCacheUpdateTests(AskbotTestCase):
             HTTP_ACCEPT_LANGUAGE='en',
             HTTP_USER_AGENT='Mozilla Gecko'
         )
+        visit_buffer.flush()
         thread = Thread.objects.all()[0]
         self.assertEqual(1, thread.view_count)
 
@@ -669,6 +830,36 @@ class ThreadRenderCacheUpdateTests(AskbotTestCase):
         html = self._html_for_question(thread._question_post())
         self.assertEqual(html, thread.get_cached_summary_html())
 
+    def test_votes_coalesce_summary_update(self):
+        question = self.post_question(user=self.user2)
+        thread = question.thread
+        old_html = thread.get_cached_summary_html()
+
+        scheduled = list()
+        task = tasks.update_thread_summary_html_celery_task
+        old_apply_async = task.apply_async
+        task.apply_async = lambda args, countdown: scheduled.append(args)
+        try:
+            self.user.upvote(question)
+            self.create_user(username='user3')
+            self.user3.upvote(question)
+        finally:
+            task.apply_async = old_apply_async
+
+        #two votes - one deferred re-rendering, stale html is served meanwhile
+        self.assertEqual([(thread.id,)], scheduled)
+        self.assertEqual(old_html, thread.get_cached_summary_html())
+        stale_key = Thread.SUMMARY_STALE_KEY_TPL % thread.id
+        self.assertTrue(cache.cache.get(stale_key) is not None)
+
+        thread = Thread.objects.get(id=thread.id)
+        thread.apply_scheduled_summary_update()
+        self.assertEqual(2, thread.score)
+        html = self._html_for_question(thread._question_post())
+        self.assertEqual(html, thread.get_cached_summary_html())
+        self.assertEqual(None, cache.cache.get(stale_key))
+
+
 
 # TODO: (in spare time - those cases should pass without changing anything in code but we should have them eventually for completness)
 # - Publishing anonymous questions / answers
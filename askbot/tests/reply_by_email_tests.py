@@ -83,6 +83,18 @@ class ReplyAddressModelTests(AskbotTestCase):
         self.assertTrue(len(result.address) >= 12 and len(result.address) <= 25)
         self.assertEquals(ReplyAddress.objects.all().count(), 1)
 
+    def test_bulk_address_creation(self):
+        users = [self.u1, self.u2, self.u3]
+        addresses = ReplyAddress.objects.create_many(self.answer, users)
+        self.assertEquals(ReplyAddress.objects.all().count(), 3)
+        self.assertEquals(len(set(addresses.values())), 3)
+        for user in users:
+            reply_address = ReplyAddress.objects.get(address = addresses[user.id])
+            self.assertEquals(reply_address.user, user)
+            self.assertEquals(reply_address.post, self.answer)
+            self.assertEquals(reply_address.allowed_from_email, user.email)
+            self.assertFalse(reply_address.was_used)
+
 
     def test_create_answer_reply(self):
         result = ReplyAddress.objects.create_new( self.answer, self.u1)
@@ -1,5 +1,7 @@
+import datetime
 from askbot.tests.utils import AskbotTestCase
 from askbot.search.state_manager import SearchState
+from askbot.search import paginator as search_paginator
 import askbot.conf
 from django.core import urlresolvers
 
@@ -291,3 +293,41 @@ class SearchStateTests(AskbotTestCase):
         )
 
 
+
+    def test_cursor_selector(self):
+        ss = SearchState(
+            scope=None,
+            sort='age-desc',
+            query=None,
+            tags=None,
+            author=None,
+            page='3',
+            user_logged_in=False,
+            cursor='a20120115103000000000_42'
+        )
+        self.assertEqual(
+            'scope:all/sort:age-desc/page:3/cursor:a20120115103000000000_42/',
+            ss.query_string()
+        )
+        # any change of the search state resets the cursor
+        self.assertEqual(None, ss.add_tag('alfa').cursor)
+        self.assertEqual(None, ss.change_sort('votes-desc').cursor)
+        self.assertEqual(None, ss.change_page(1).cursor)
+        ss2 = ss.change_cursor('b20120115103000000000_42', 2)
+        self.assertEqual(
+            'scope:all/sort:age-desc/page:2/cursor:b20120115103000000000_42/',
+            ss2.query_string()
+        )
+
+    def test_cursor_decoding(self):
+        self.assertEqual(
+            ('a', datetime.datetime(2012, 1, 15, 10, 30, 0, 123), 42),
+            search_paginator.decode_cursor('a20120115103000000123_42', '-added_at')
+        )
+        self.assertEqual(
+            ('b', -5, 7),
+            search_paginator.decode_cursor('b-5_7', 'score')
+        )
+        self.assertEqual(None, search_paginator.decode_cursor('a-5_7', '-added_at'))
+        self.assertEqual(None, search_paginator.decode_cursor('a5_7', '-relevance'))
+        self.assertEqual(None, search_paginator.decode_cursor('junk', 'score'))
@@ -1,11 +1,14 @@
 import os
 import shutil
+import tempfile
+import time
 from django.test import TestCase
 from django.core.files.uploadedfile import UploadedFile
 from django.conf import settings as django_settings
 from askbot.conf import settings as askbot_settings
 from askbot.utils.path import mkdir_p
 from askbot.skins import utils as skin_utils
+from askbot.utils import hasher
 import askbot
 
 class SkinTests(TestCase):
@@ -50,6 +53,24 @@ class SkinTests(TestCase):
         askbot_settings.update('ASKBOT_DEFAULT_SKIN', 'test_skin')
         self.assert_default_logo_in_skin('test_skin')
 
+    def test_media_url_manifest(self):
+        askbot_settings.update('ASKBOT_DEFAULT_SKIN', 'test_skin')
+        revision = askbot_settings.MEDIA_RESOURCE_REVISION
+        manifest = skin_utils.get_media_url_manifest('test_skin', revision)
+        #resources of the skin override the ones of the default skin
+        self.assertTrue('/test_skin/' in manifest['images/logo.gif'][0])
+        self.assertTrue('/default/' in manifest['style/style.css'][0])
+        self.assertTrue('/common/' in manifest['js/utils.js'][0])
+        for resource in ('images/logo.gif', 'style/style.css', 'js/utils.js'):
+            url, path = manifest[resource]
+            self.assertTrue(os.path.isfile(path))
+            self.assertEqual(skin_utils.get_media_url(resource), url)
+            skin_name = skin_utils.resolve_skin_for_media(resource, 'test_skin')
+            self.assertEqual(
+                url,
+                skin_utils.make_media_url(skin_name, resource, revision)
+            )
+
     def test_uploaded_logo(self):
         logo_src = os.path.join(
                             askbot.get_install_directory(),
@@ -64,3 +85,56 @@ class SkinTests(TestCase):
         self.assertTrue(logo_url.startswith(django_settings.MEDIA_URL))
         response = self.client.get(logo_url)
         self.assertTrue(response.status_code == 200)
+
+
+class MediaManifestTests(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.media_dir = os.path.join(self.temp_dir, 'media')
+        mkdir_p(self.media_dir)
+        self.write_media('style.css', 'body {}')
+        self.old_manifest_file = getattr(
+                                    django_settings,
+                                    'ASKBOT_MEDIA_MANIFEST_FILE',
+                                    None
+                                )
+        django_settings.ASKBOT_MEDIA_MANIFEST_FILE = os.path.join(
+                                                    self.temp_dir,
+                                                    'manifest.json'
+                                                )
+
+    def tearDown(self):
+        if self.old_manifest_file is None:
+            del django_settings.ASKBOT_MEDIA_MANIFEST_FILE
+        else:
+            django_settings.ASKBOT_MEDIA_MANIFEST_FILE = self.old_manifest_file
+        shutil.rmtree(self.temp_dir)
+
+    def write_media(self, name, content, mtime = None):
+        path = os.path.join(self.media_dir, name)
+        media_file = open(path, 'w')
+        media_file.write(content)
+        media_file.close()
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def test_hash_is_read_from_manifest(self):
+        media_dirs = [self.media_dir]
+        media_hash = skin_utils.get_media_hash(media_dirs)
+        self.assertEqual(media_hash, hasher.get_hash_of_dirs(media_dirs))
+        #a fake hash in the manifest proves that the files are not hashed
+        manifest = skin_utils.load_media_manifest()
+        manifest[os.pathsep.join(media_dirs)]['hash'] = 'fake'
+        skin_utils.save_media_manifest(manifest)
+        self.assertEqual(skin_utils.get_media_hash(media_dirs), 'fake')
+
+    def test_hash_is_updated_when_files_change(self):
+        media_dirs = [self.media_dir]
+        old_hash = skin_utils.get_media_hash(media_dirs)
+        self.write_media('style.css', 'body {color: red}', time.time() + 10)
+        new_hash = skin_utils.get_media_hash(media_dirs)
+        self.assertNotEqual(old_hash, new_hash)
+        self.assertEqual(new_hash, hasher.get_hash_of_dirs(media_dirs))
+        self.write_media('extra.js', '')
+        self.assertNotEqual(skin_utils.get_media_hash(media_dirs), new_hash)
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from django.conf import settings as django_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.core.urlresolvers import reverse
+from askbot.tests.utils import AskbotTestCase
+from askbot.utils import file_utils
+
+
+class HashingUploadHandlerTests(AskbotTestCase):
+
+    def receive(self, handler, chunks):
+        handler.new_file('file-upload', 'test.png', 'image/png', None)
+        start = 0
+        for chunk in chunks:
+            self.assertEqual(handler.receive_data_chunk(chunk, start), chunk)
+            start += len(chunk)
+        handler.file_complete(start)
+
+    def test_hash_of_the_chunks(self):
+        handler = file_utils.HashingUploadHandler(max_size = 100)
+        self.receive(handler, ['a' * 40, 'b' * 40])
+        self.assertEqual(
+            handler.hashes['file-upload'],
+            hashlib.sha1('a' * 40 + 'b' * 40).hexdigest()
+        )
+        self.assertEqual(handler.rejected_fields, set())
+
+    def test_upload_is_stopped_at_the_limit(self):
+        handler = file_utils.HashingUploadHandler(max_size = 100)
+        self.assertRaises(
+            StopUpload,
+            self.receive,
+            handler,
+            ['a' * 60, 'b' * 60, 'c' * 60]
+        )
+        self.assertEqual(handler.rejected_fields, set(['file-upload']))
+        self.assertFalse('file-upload' in handler.hashes)
+
+
+class UploadTests(AskbotTestCase):
+
+    def setUp(self):
+        self.create_user(status = 'm')
+        self.client.login(method = 'force', user_id = self.user.id)
+        self.media_root = tempfile.mkdtemp()
+        self.old_media_root = django_settings.MEDIA_ROOT
+        self.old_max_size = django_settings.ASKBOT_MAX_UPLOAD_FILE_SIZE
+        django_settings.MEDIA_ROOT = self.media_root
+
+    def tearDown(self):
+        django_settings.MEDIA_ROOT = self.old_media_root
+        django_settings.ASKBOT_MAX_UPLOAD_FILE_SIZE = self.old_max_size
+        shutil.rmtree(self.media_root)
+
+    def upload(self, name, content):
+        """returns tuple of the file url and of the error message"""
+        data = {'file-upload': SimpleUploadedFile(name, content)}
+        response = self.client.post(reverse('upload'), data)
+        self.assertEqual(response.status_code, 200)
+        file_url = re.search(r'<file_url>(.*)</file_url>', response.content)
+        error = re.search(r'<error><!\[CDATA\[(.*)\]\]></error>', response.content)
+        return file_url.group(1), error.group(1)
+
+    def get_stored_files(self):
+        return os.listdir(self.media_root)
+
+    def test_same_contents_are_stored_once(self):
+        content = os.urandom(1024)
+        url1, error = self.upload('screenshot.png', content)
+        self.assertEqual(error, '')
+        url2, error = self.upload('another-name.PNG', content)
+        self.assertEqual(error, '')
+        self.assertEqual(url1, url2)
+        file_name = hashlib.sha1(content).hexdigest() + '.png'
+        self.assertTrue(url1.endswith(file_name))
+        self.assertEqual(self.get_stored_files(), [file_name])
+
+    def test_file_is_hashed_by_the_upload_handler(self):
+        """the middleware must not parse the body before
+        the view installs the handler, otherwise the stored
+        file is hashed once more after the upload"""
+        get_content_hash = file_utils.get_content_hash
+        hashed_files = list()
+        def get_content_hash_again(file_object):
+            hashed_files.append(file_object.name)
+            return get_content_hash(file_object)
+        file_utils.get_content_hash = get_content_hash_again
+        try:
+            content = os.urandom(1024)
+            url, error = self.upload('screenshot.png', content)
+        finally:
+            file_utils.get_content_hash = get_content_hash
+        self.assertEqual(error, '')
+        self.assertEqual(hashed_files, [])
+        file_name = hashlib.sha1(content).hexdigest() + '.png'
+        self.assertTrue(url.endswith(file_name))
+
+    def test_too_large_file_is_not_stored(self):
+        django_settings.ASKBOT_MAX_UPLOAD_FILE_SIZE = 1024 * 1024
+        url, error = self.upload('large.png', os.urandom(3 * 1024 * 1024))
+        self.assertEqual(url, '')
+        self.assertTrue('maximum upload file size' in error)
+        self.assertEqual(self.get_stored_files(), [])
+
+    def test_large_file_throughput(self):
+        """large files go through the handler and are stored
+        with the hash computed on the fly, the upload over the limit
+        is stopped before the whole file is buffered"""
+        size = 16 * 1024 * 1024
+        django_settings.ASKBOT_MAX_UPLOAD_FILE_SIZE = size
+        content = os.urandom(size)
+        url, error = self.upload('large.png', content)
+        self.assertEqual(error, '')
+        stored_file = open(os.path.join(self.media_root, url.split('/')[-1]), 'rb')
+        self.assertEqual(
+            hashlib.sha1(stored_file.read()).hexdigest(),
+            hashlib.sha1(content).hexdigest()
+        )
+        stored_file.close()
+
+        url, error = self.upload('larger.png', content + 'x')
+        self.assertEqual(url, '')
+        self.assertTrue('maximum upload file size' in error)
+        self.assertEqual(len(self.get_stored_files()), 1)
@@ -1,8 +1,11 @@
 """utility functions used by Askbot test cases
 """
+from django.core import cache
 from django.test import TestCase
 from functools import wraps
 from askbot import models
+from askbot.conf import settings as askbot_settings
+from askbot.models import badges
 
 def create_user(
             username = None, 
@@ -62,6 +65,14 @@ class AskbotTestCase(TestCase):
     to django TestCase class
     """
 
+    def _pre_setup(self):
+        super(AskbotTestCase, self)._pre_setup()
+        #cached counters, badge data and settings would outlive
+        #the database rows rolled back after the previous test
+        cache.cache.clear()
+        badges.clear_cached_badge_data()
+        askbot_settings.reset_snapshot()
+
     def create_user(
                 self,
                 username = 'user',
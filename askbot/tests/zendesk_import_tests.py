@@ -0,0 +1,237 @@
+import datetime
+from django.conf import settings as django_settings
+from askbot.tests.utils import AskbotTestCase
+from askbot import const
+from askbot import models
+
+if 'askbot.importers.zendesk' in django_settings.INSTALLED_APPS:
+    from askbot.importers.zendesk import bulk
+    from askbot.importers.zendesk import models as zendesk_models
+    TEST_PROTOTYPE = AskbotTestCase
+else:
+    TEST_PROTOTYPE = object
+
+START_TIME = datetime.datetime(2012, 1, 1, 10, 0)
+
+
+class ZendeskImportTests(TEST_PROTOTYPE):
+    """the zendesk tables are filled with a few users,
+    one forum and two tickets with comments, the bulk import
+    must make the same records as the regular import"""
+
+    def setUp(self):
+        #the first user of the forum is made an administrator
+        #by the regular signal handlers, so the forum is not empty
+        self.admin = self.create_user('admin')
+        zendesk_models.TAGS.clear()
+        self.add_zendesk_forum(10, 'General Questions')
+        self.add_zendesk_user(1, 'alice', 'alice@example.com')
+        self.add_zendesk_user(2, 'bob', '')
+        #the name is taken - the username is made unique
+        self.add_zendesk_user(3, 'alice', 'other.alice@example.com')
+        #the email is known - linked to the first user
+        self.add_zendesk_user(4, 'alice smith', 'alice@example.com')
+
+        self.add_zendesk_post(
+            1, 100, 1, 0, 'How do I import the tickets from zendesk?'
+        )
+        self.add_zendesk_post(
+            2, 100, 2, 1, 'Run the import_zendesk management command.'
+        )
+        self.add_zendesk_post(
+            3, 101, 2, 2, 'Are the comments of the tickets imported too?'
+        )
+        self.add_zendesk_post(
+            4, 101, 3, 3, 'Yes, the comments become the answers.'
+        )
+        self.add_zendesk_post(
+            5, 101, 4, 4, 'And the authors are matched by the email.'
+        )
+
+    def add_zendesk_forum(self, forum_id, name):
+        zendesk_models.Forum.objects.create(
+            forum_id = forum_id,
+            name = name,
+            display_type_id = 1,
+            entries_count = 0,
+            is_locked = False,
+            updated_at = START_TIME,
+            use_for_suggestions = False,
+            visibility_restriction_id = 1,
+            is_public = True
+        )
+
+    def add_zendesk_user(self, user_id, name, email):
+        zendesk_models.User.objects.create(
+            user_id = user_id,
+            name = name,
+            email = email,
+            created_at = START_TIME,
+            updated_at = START_TIME,
+            is_active = True,
+            is_verified = True,
+            restriction_id = 1,
+            roles = 0,
+            time_zone = 'UTC',
+            uses_12_hour_clock = False,
+            photo_url = ''
+        )
+
+    def add_zendesk_post(self, post_id, entry_id, user_id, minutes, body):
+        created_at = START_TIME + datetime.timedelta(minutes = minutes)
+        zendesk_models.Post.objects.create(
+            post_id = post_id,
+            entry_id = entry_id,
+            user_id = user_id,
+            forum_id = 10,
+            body = body,
+            created_at = created_at,
+            updated_at = created_at,
+            is_informative = False
+        )
+
+    def import_regular(self):
+        #the command module needs lxml to read the xml files
+        from askbot.importers.zendesk.management.commands import import_zendesk
+        command = import_zendesk.Command()
+        command.import_users()
+        command.import_content()
+
+    def import_bulk(self, batch_size = None):
+        if batch_size is None:
+            batch_size = bulk.DEFAULT_BATCH_SIZE
+        importer = bulk.BulkImporter(batch_size = batch_size)
+        importer.import_users()
+        importer.import_content()
+        importer.rebuild()
+
+    def delete_imported(self):
+        """deletes the imported askbot records and
+        marks the zendesk records as not imported"""
+        models.Activity.objects.all().delete()
+        models.Thread.objects.all().delete()
+        models.Tag.objects.all().delete()
+        models.User.objects.exclude(id = self.admin.id).delete()
+        zendesk_models.User.objects.update(askbot_user_id = None)
+        zendesk_models.Post.objects.update(is_processed = False)
+
+    def get_import_summary(self):
+        """returns the imported records
+        as sorted lists of comparable tuples,
+        the activities of the notifications sent by the regular
+        import are left out, the bulk import sends none"""
+        post_activity_types = (
+            const.TYPE_ACTIVITY_ASK_QUESTION,
+            const.TYPE_ACTIVITY_ANSWER
+        )
+        users = models.User.objects.values_list(
+                                'username', 'email', 'is_active',
+                                'email_isvalid', 'date_joined'
+                            )
+        threads = models.Thread.objects.values_list(
+                                'title', 'tagnames', 'answer_count',
+                                'last_activity_at',
+                                'last_activity_by__username', 'added_at'
+                            )
+        posts = models.Post.objects.values_list(
+                                'post_type', 'thread__title',
+                                'author__username', 'text', 'html',
+                                'added_at'
+                            )
+        revisions = models.PostRevision.objects.values_list(
+                                'post__text', 'revision', 'revision_type',
+                                'author__username', 'revised_at'
+                            )
+        activities = models.Activity.objects.filter(
+                                activity_type__in = post_activity_types
+                            ).values_list(
+                                'activity_type', 'user__username',
+                                'active_at'
+                            )
+        events = models.TimelineEvent.objects.filter(
+                                activity_type__in = post_activity_types
+                            ).values_list(
+                                'activity_type', 'user__username',
+                                'active_at', 'title', 'is_hidden'
+                            )
+        tags = models.Tag.objects.values_list(
+                                'name', 'used_count', 'deleted'
+                            )
+        subscriptions = models.EmailFeedSetting.objects.values_list(
+                                'subscriber__username', 'feed_type',
+                                'frequency'
+                            )
+        return dict([
+            (name, sorted(rows)) for name, rows in (
+                ('users', users),
+                ('threads', threads),
+                ('posts', posts),
+                ('revisions', revisions),
+                ('activities', activities),
+                ('events', events),
+                ('tags', tags),
+                ('subscriptions', subscriptions),
+            )
+        ])
+
+    def test_bulk_import(self):
+        #batches of one user and one thread
+        self.import_bulk(batch_size = 1)
+
+        users = models.User.objects.exclude(
+                                id = self.admin.id
+                            ).order_by('username')
+        self.assertEqual(
+            [(user.username, user.email) for user in users],
+            [
+                ('alice', 'alice@example.com'),
+                ('alice1', 'other.alice@example.com'),
+                ('bob', ''),
+            ]
+        )
+        alice = users[0]
+        self.assertEqual(
+            zendesk_models.User.objects.get(user_id = 4).askbot_user_id,
+            alice.id
+        )
+
+        threads = models.Thread.objects.order_by('added_at')
+        self.assertEqual(
+            [(thread.tagnames, thread.answer_count) for thread in threads],
+            [('general-questions', 1), ('general-questions', 2)]
+        )
+        question = threads[0].posts.get(post_type = 'question')
+        self.assertEqual(question.author, alice)
+        self.assertEqual(question.revisions.count(), 1)
+        self.assertTrue('<p>' in question.html)
+        self.assertEqual(
+            threads[1].posts.filter(post_type = 'answer').count(), 2
+        )
+        self.assertEqual(
+            models.Activity.objects.filter(
+                activity_type = const.TYPE_ACTIVITY_ANSWER
+            ).count(),
+            3
+        )
+        self.assertEqual(
+            models.Tag.objects.get(name = 'general-questions').used_count, 2
+        )
+        events, has_next = models.timeline.get_user_events(alice)
+        self.assertEqual(
+            [event.activity_type for event in events],
+            [const.TYPE_ACTIVITY_ANSWER, const.TYPE_ACTIVITY_ASK_QUESTION]
+        )
+        self.assertEqual(
+            zendesk_models.Post.objects.filter(is_processed = False).count(),
+            0
+        )
+
+    def test_bulk_import_matches_regular_import(self):
+        self.import_regular()
+        regular_summary = self.get_import_summary()
+        self.assertEqual(len(regular_summary['posts']), 5)
+        self.delete_imported()
+        self.import_bulk(batch_size = 1)
+        bulk_summary = self.get_import_summary()
+        for name in sorted(regular_summary.keys()):
+            self.assertEqual(bulk_summary[name], regular_summary[name], name)
@@ -0,0 +1,88 @@
+"""Database utilities that are missing in the django orm"""
+from django.db import connection, transaction
+
+
+def bulk_insert(model, field_names, rows):
+    """inserts rows into the table of the model
+    with one ``executemany`` call, model signals are not sent
+    and the primary keys of the new rows are not returned
+
+    * ``field_names`` - names of the model fields (as in the model
+      definition, e.g. ``'post'`` for the foreign key ``post_id``)
+    * ``rows`` - sequence of tuples of field values
+      in the order of ``field_names``
+    """
+    if len(rows) == 0:
+        return
+    opts = model._meta
+    fields = [opts.get_field(name) for name in field_names]
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+                quote_name(opts.db_table),
+                ', '.join([quote_name(field.column) for field in fields]),
+                ', '.join(['%s'] * len(fields))
+            )
+    params = [
+        [
+            field.get_db_prep_save(value, connection = connection)
+            for field, value in zip(fields, row)
+        ]
+        for row in rows
+    ]
+    cursor = connection.cursor()
+    cursor.executemany(sql, params)
+    transaction.commit_unless_managed()
+
+def bulk_update(model, field_names, rows):
+    """updates rows of the table of the model by the primary key
+    with one ``executemany`` call, model signals are not sent
+
+    * ``field_names`` - names of the updated model fields
+    * ``rows`` - sequence of tuples of field values
+      in the order of ``field_names`` followed by the primary key
+    """
+    if len(rows) == 0:
+        return
+    opts = model._meta
+    fields = [opts.get_field(name) for name in field_names] + [opts.pk]
+    quote_name = connection.ops.quote_name
+    sql = 'UPDATE %s SET %s WHERE %s = %%s' % (
+                quote_name(opts.db_table),
+                ', '.join([
+                    '%s = %%s' % quote_name(field.column)
+                    for field in fields[:-1]
+                ]),
+                quote_name(opts.pk.column)
+            )
+    params = [
+        [
+            field.get_db_prep_save(value, connection = connection)
+            for field, value in zip(fields, row)
+        ]
+        for row in rows
+    ]
+    cursor = connection.cursor()
+    cursor.executemany(sql, params)
+    transaction.commit_unless_managed()
+
+def bulk_insert_objects(objects):
+    """inserts unsaved instances of one model with one
+    ``executemany`` call, model signals are not sent
+
+    field values are prepared as by ``Model.save()``, so the
+    defaults and the ``auto_now`` dates are filled in,
+    the primary keys are inserted if they are set,
+    otherwise they are left to the database
+    """
+    if len(objects) == 0:
+        return
+    opts = objects[0]._meta
+    fields = [
+        field for field in opts.local_fields
+        if field is not opts.pk or objects[0].pk is not None
+    ]
+    rows = [
+        [field.pre_save(obj, True) for field in fields]
+        for obj in objects
+    ]
+    bulk_insert(objects[0].__class__, [field.name for field in fields], rows)
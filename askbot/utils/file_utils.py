@@ -1,31 +1,97 @@
 """file utilities for askbot"""
+import hashlib
 import os
-import random
-import time
 import urlparse
+from django.conf import settings as django_settings
 from django.core.files.storage import get_storage_class
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
 
-def store_file(file_object):
+def get_max_upload_file_size():
+    """maximum size of the uploaded files in bytes"""
+    return getattr(django_settings, 'ASKBOT_MAX_UPLOAD_FILE_SIZE', 1024*1024)
+
+def get_content_hash(file_object):
+    """returns sha1 hex digest of the contents of the file,
+    read by chunks"""
+    sha_hash = hashlib.sha1()
+    if hasattr(file_object, 'seek'):
+        file_object.seek(0)
+    for chunk in file_object.chunks():
+        sha_hash.update(chunk)
+    if hasattr(file_object, 'seek'):
+        file_object.seek(0)
+    return sha_hash.hexdigest()
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """upload handler that hashes the uploaded files on the fly
+    and stops the upload as soon as a file grows over
+    the size limit - before the rest of the file
+    is written to memory or to a temporary file
+
+    must be the first of the upload handlers of the request,
+    the chunks are passed on to the next handlers, which
+    build the uploaded files as usual
+
+    the hashes of the complete files are available in ``hashes``
+    by the field name, names of the fields of the stopped uploads -
+    in ``rejected_fields``
+    """
+    def __init__(self, request = None, max_size = None):
+        super(HashingUploadHandler, self).__init__(request)
+        if max_size is None:
+            max_size = get_max_upload_file_size()
+        self.max_size = max_size
+        self.hashes = dict()
+        self.rejected_fields = set()
+        self.sha_hash = None
+        self.size = 0
+
+    def new_file(self, field_name, *args, **kwargs):
+        super(HashingUploadHandler, self).new_file(field_name, *args, **kwargs)
+        self.sha_hash = hashlib.sha1()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            self.rejected_fields.add(self.field_name)
+            #the rest of the request body is read and dropped,
+            #so that the client still gets the response
+            raise StopUpload(connection_reset = False)
+        self.sha_hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.hashes[self.field_name] = self.sha_hash.hexdigest()
+        return None#the file is built by the next handler
+
+def store_file(file_object, content_hash = None):
     """Creates an instance of django's file storage
     object based on the file-like object,
     returns the storage object, file name, file url
+
+    files are named by the sha1 hash of the contents,
+    so the same contents are stored only once, ``content_hash``
+    is the hash computed in advance, e.g. by
+    the :class:`HashingUploadHandler`
     """
-    file_name = str(
-                    time.time()
-                ).replace(
-                    '.', 
-                    str(random.randint(0,100000))
-                ) + os.path.splitext(file_object.name)[1].lower()
+    if content_hash is None:
+        content_hash = get_content_hash(file_object)
+    file_name = content_hash + os.path.splitext(file_object.name)[1].lower()
 
     file_storage = get_storage_class()()
     # use default storage to store file
-    file_storage.save(file_name, file_object)
+    if not file_storage.exists(file_name):
+        #the storage picks another name if the same file
+        #was saved in the meantime
+        file_name = file_storage.save(file_name, file_object)
 
     file_url = file_storage.url(file_name)
     parsed_url = urlparse.urlparse(file_url)
     file_url = urlparse.urlunparse(
         urlparse.ParseResult(
-            parsed_url.scheme, 
+            parsed_url.scheme,
             parsed_url.netloc,
             parsed_url.path,
             '', '', ''
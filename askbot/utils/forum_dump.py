@@ -0,0 +1,380 @@
+"""Dump of the forum database for the commands
+``dump_forum`` and ``load_forum``
+
+The dump is a directory with the file ``manifest.json`` and one
+gzipped file per model named ``<app_label>.<model name>.jsonl.gz``.
+The first line of a model file is a json list of the field names,
+every following line is a json list of the field values of one row,
+foreign keys are stored as ids.
+
+* the tables are read in chunks ordered by the primary key,
+  so the whole table is never held in memory
+* the rows are inserted with ``executemany`` in batches, the rows
+  whose primary keys already exist are updated instead,
+  as ``loaddata`` would do
+* the manifest lists the models in groups, the models in one
+  group have no foreign keys to each other, so their tables
+  are exported and loaded in parallel, the groups are loaded
+  one after another so that the referenced rows come first
+* nullable foreign keys that refer to the same model or close
+  a cycle of the references are loaded as ``NULL`` first and set
+  after all the tables are loaded
+"""
+import datetime
+import decimal
+import gzip
+import os
+import multiprocessing
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils import simplejson
+from askbot.models import signals
+from askbot.utils.db import bulk_insert, bulk_update
+
+MANIFEST_FILE_NAME = 'manifest.json'
+FORMAT_VERSION = 1
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_WORKERS = 4
+#values of the fields of these types are stored as strings
+STRING_FIELD_TYPES = (
+    models.DateTimeField,
+    models.DateField,
+    models.TimeField,
+    models.DecimalField,
+)
+
+
+def get_label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name)
+
+def get_model(label):
+    app_label, model_name = label.split('.')
+    return models.get_model(app_label, model_name, only_installed = False)
+
+def get_file_name(label):
+    return label + '.jsonl.gz'
+
+def get_fields(model):
+    return model._meta.local_fields
+
+def encode_value(value):
+    if isinstance(value, (datetime.date, datetime.time, decimal.Decimal)):
+        return unicode(value)
+    raise TypeError('%r is not JSON serializable' % value)
+
+def get_dumped_models():
+    """returns list of all installed concrete models,
+    including the automatic m2m tables"""
+    return [
+        model for model in models.get_models(include_auto_created = True)
+        if not model._meta.proxy and model._meta.managed
+    ]
+
+def get_references(model):
+    """returns list of tuples ``(field, related model)``
+    for the foreign keys of the model"""
+    return [
+        (field, field.rel.to)
+        for field in get_fields(model)
+        if isinstance(field, models.ForeignKey)
+    ]
+
+def get_load_groups(dumped_models):
+    """returns tuple of the list of groups of model labels
+    in the order of loading and the dictionary
+    of the deferred fields per model label
+    """
+    dumped = set(dumped_models)
+    deferred = dict()
+    dependencies = dict()
+    for model in dumped_models:
+        label = get_label(model)
+        dependencies[model] = dict()
+        for field, related_model in get_references(model):
+            if related_model not in dumped:
+                continue
+            if related_model is model:
+                #self references are always set after the load
+                deferred.setdefault(label, list()).append(field.name)
+            else:
+                dependencies[model].setdefault(related_model, list()).append(field)
+
+    groups = list()
+    remaining = set(dumped_models)
+    while remaining:
+        group = [
+            model for model in remaining
+            if not (set(dependencies[model]) & remaining)
+        ]
+        if len(group) == 0:
+            #a cycle - defer the nullable references
+            #of the model to the models which are not loaded yet
+            for model in sorted(remaining, key = get_label):
+                fields = [
+                    field
+                    for related_model, related_fields in dependencies[model].items()
+                    if related_model in remaining
+                    for field in related_fields
+                ]
+                if all([field.null for field in fields]):
+                    label = get_label(model)
+                    for field in fields:
+                        deferred.setdefault(label, list()).append(field.name)
+                    group = [model]
+                    break
+            else:
+                raise ValueError('unbreakable cycle of the foreign keys')
+        remaining -= set(group)
+        groups.append(sorted([get_label(model) for model in group]))
+    return groups, deferred
+
+def export_model(args):
+    """writes all rows of the model into the file,
+    returns tuple of the model label and the number of rows"""
+    label, directory, batch_size = args
+    model = get_model(label)
+    fields = get_fields(model)
+    field_names = [field.name for field in fields]
+    pk_position = field_names.index(model._meta.pk.name)
+    count = 0
+    dump_file = gzip.open(os.path.join(directory, get_file_name(label)), 'wb')
+    try:
+        dump_file.write(simplejson.dumps(field_names) + '\n')
+        rows = model._base_manager.order_by('pk').values_list(*field_names)
+        last_pk = None
+        while True:
+            if last_pk is None:
+                batch = list(rows[:batch_size])
+            else:
+                batch = list(
+                    rows.filter(pk__gt = last_pk)[:batch_size]
+                )
+            if len(batch) == 0:
+                break
+            for row in batch:
+                dump_file.write(
+                    simplejson.dumps(
+                        row,
+                        default = encode_value,
+                        separators = (',', ':')
+                    ) + '\n'
+                )
+            count += len(batch)
+            last_pk = batch[-1][pk_position]
+    finally:
+        dump_file.close()
+    return label, count
+
+def read_rows(directory, label):
+    """yields the field names and then the rows from the model file"""
+    dump_file = gzip.open(os.path.join(directory, get_file_name(label)), 'rb')
+    try:
+        for line in dump_file:
+            yield simplejson.loads(line)
+    finally:
+        dump_file.close()
+
+def get_converters(fields):
+    converters = list()
+    for field in fields:
+        if isinstance(field, STRING_FIELD_TYPES):
+            converters.append(field.to_python)
+        else:
+            converters.append(None)
+    return converters
+
+def save_batch(model, field_names, rows):
+    """inserts the rows, or updates the rows which already exist"""
+    pk_position = field_names.index(model._meta.pk.name)
+    ids = [row[pk_position] for row in rows]
+    existing_ids = set(
+        model._base_manager.filter(pk__in = ids).values_list('pk', flat = True)
+    )
+    inserted = list()
+    updated = list()
+    for row in rows:
+        row_id = row[pk_position]
+        if row_id in existing_ids:
+            updated.append(row[:pk_position] + row[pk_position + 1:] + [row_id])
+        else:
+            inserted.append(row)
+    bulk_insert(model, field_names, inserted)
+    updated_names = list(field_names)
+    del updated_names[pk_position]
+    if updated_names:
+        bulk_update(model, updated_names, updated)
+
+def load_model(args):
+    """loads rows of the model from the file, the ``deferred_names``
+    fields are left empty, returns tuple of the model label
+    and the number of rows"""
+    label, directory, batch_size, deferred_names = args
+    model = get_model(label)
+    rows = read_rows(directory, label)
+    field_names = rows.next()
+    converters = get_converters(
+        [model._meta.get_field(name) for name in field_names]
+    )
+    deferred_positions = [
+        field_names.index(name) for name in deferred_names
+    ]
+    count = 0
+    batch = list()
+    for row in rows:
+        for position, convert in enumerate(converters):
+            if convert and row[position] is not None:
+                row[position] = convert(row[position])
+        for position in deferred_positions:
+            row[position] = None
+        batch.append(row)
+        if len(batch) == batch_size:
+            save_batch(model, field_names, batch)
+            count += len(batch)
+            batch = list()
+    save_batch(model, field_names, batch)
+    count += len(batch)
+    return label, count
+
+def load_deferred_fields(args):
+    """sets the deferred foreign keys of the model,
+    returns tuple of the model label and the number of updated rows"""
+    label, directory, batch_size, deferred_names = args
+    model = get_model(label)
+    rows = read_rows(directory, label)
+    field_names = rows.next()
+    pk_position = field_names.index(model._meta.pk.name)
+    positions = [field_names.index(name) for name in deferred_names]
+    count = 0
+    batch = list()
+    for row in rows:
+        values = [row[position] for position in positions]
+        if values == [None] * len(values):
+            continue
+        batch.append(values + [row[pk_position]])
+        if len(batch) == batch_size:
+            bulk_update(model, deferred_names, batch)
+            count += len(batch)
+            batch = list()
+    bulk_update(model, deferred_names, batch)
+    count += len(batch)
+    return label, count
+
+#connection inherited by the worker process from the parent
+_inherited_connection = None
+
+def init_worker():
+    """makes the worker process open its own database connection,
+    the connection inherited from the parent is put aside,
+    not closed - closing it would end the session of the parent,
+    the workers exit without running the finalizers"""
+    global _inherited_connection
+    _inherited_connection = connection.connection
+    connection.connection = None
+
+def run_in_pool(function, args_list, workers, callback = None):
+    """runs function over the arguments in the pool of processes,
+    every worker process opens its own database connection,
+    ``callback`` is called with every result
+
+    with one worker the function runs in this process,
+    within the current transaction"""
+    if workers <= 1:
+        results = map(function, args_list)
+        if callback:
+            map(callback, results)
+        return
+    pool = multiprocessing.Pool(
+                    min(workers, len(args_list)),
+                    initializer = init_worker
+                )
+    try:
+        for result in pool.imap_unordered(function, args_list):
+            if callback:
+                callback(result)
+    finally:
+        pool.close()
+        pool.join()
+
+def dump(directory, batch_size = DEFAULT_BATCH_SIZE,
+        workers = DEFAULT_WORKERS, callback = None):
+    """writes the dump of the database into the directory
+    ``callback`` is called with tuple (model label, number of rows)
+    after each model is exported"""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    dumped_models = get_dumped_models()
+    groups, deferred = get_load_groups(dumped_models)
+    counts = dict()
+
+    def record_count(result):
+        label, count = result
+        counts[label] = count
+        if callback:
+            callback(result)
+
+    run_in_pool(
+        export_model,
+        [(get_label(model), directory, batch_size) for model in dumped_models],
+        workers,
+        callback = record_count
+    )
+    manifest = {
+        'version': FORMAT_VERSION,
+        'groups': groups,
+        'deferred': deferred,
+        'counts': counts,
+    }
+    manifest_file = open(os.path.join(directory, MANIFEST_FILE_NAME), 'w')
+    simplejson.dump(manifest, manifest_file, indent = 4)
+    manifest_file.close()
+
+def is_dump(path):
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE_NAME))
+
+def load(directory, batch_size = DEFAULT_BATCH_SIZE,
+        workers = DEFAULT_WORKERS, callback = None):
+    """loads the dump from the directory, the groups of models
+    are loaded one after another, models within the group
+    are loaded in parallel
+
+    the signal receivers are turned off for the time of the load
+    ``callback`` is called with tuple (model label, number of rows)
+    after each model is loaded"""
+    manifest = simplejson.load(
+                    open(os.path.join(directory, MANIFEST_FILE_NAME))
+                )
+    if manifest['version'] != FORMAT_VERSION:
+        raise ValueError('unsupported dump version %s' % manifest['version'])
+    deferred = manifest['deferred']
+
+    receivers = signals.pop_all_db_signal_receivers()
+    try:
+        for group in manifest['groups']:
+            run_in_pool(
+                load_model,
+                [
+                    (label, directory, batch_size, deferred.get(label, []))
+                    for label in group
+                ],
+                workers,
+                callback = callback
+            )
+        if deferred:
+            run_in_pool(
+                load_deferred_fields,
+                [
+                    (label, directory, batch_size, names)
+                    for label, names in deferred.items()
+                ],
+                workers
+            )
+        loaded_models = [
+            get_model(label)
+            for group in manifest['groups'] for label in group
+        ]
+        cursor = connection.cursor()
+        for sql in connection.ops.sequence_reset_sql(no_style(), loaded_models):
+            cursor.execute(sql)
+        transaction.commit_unless_managed()
+    finally:
+        signals.set_all_db_signal_receivers(receivers)
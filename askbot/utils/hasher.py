@@ -41,3 +41,23 @@ def get_hash_of_dirs(dirs):
             return -2
 
     return sha_hash.hexdigest()
+
+def get_mtime_signature(dirs):
+    """sha1 hash of the paths and of the modification times
+    of the files in the directories, the files are not read,
+    so this is much faster than ``get_hash_of_dirs``
+    """
+    sha_hash = hashlib.sha1()
+    for directory in dirs:
+        if not os.path.exists(directory):
+            return None
+        for root, subdirs, files in os.walk(directory):
+            subdirs.sort()
+            for name in sorted(files):
+                filepath = os.path.join(root, name)
+                try:
+                    mtime = os.stat(filepath).st_mtime
+                except OSError:
+                    mtime = None
+                sha_hash.update('%s:%r;' % (filepath, mtime))
+    return sha_hash.hexdigest()
@@ -117,6 +117,47 @@ def send_mail(
         if raise_on_failure == True:
             raise exceptions.EmailNotSent(unicode(error))
 
+def get_chunk_size():
+    """number of messages sent in one batch by :func:`send_messages`"""
+    return getattr(django_settings, 'ASKBOT_EMAIL_CHUNK_SIZE', 100)
+
+def create_message(
+            subject_line = None,
+            body_text = None,
+            from_email = django_settings.DEFAULT_FROM_EMAIL,
+            recipient_list = None,
+            headers = None,
+        ):
+    """returns html email message, to be sent with :func:`send_messages`"""
+    msg = mail.EmailMessage(
+                    prefix_the_subject_line(subject_line),
+                    body_text,
+                    from_email,
+                    recipient_list,
+                    headers = headers
+                )
+    msg.content_subtype = 'html'
+    return msg
+
+def send_messages(messages, connection = None, raise_on_failure = False):
+    """sends email messages through one connection to the
+    email backend, returns number of sent messages
+
+    errors are logged as critical and
+    if raise_on_failure is True, exceptions.EmailNotSent is raised
+    """
+    if connection is None:
+        connection = mail.get_connection()
+    try:
+        return connection.send_messages(messages) or 0
+    except Exception, error:
+        logging.critical(unicode(error))
+        #connection may be broken, next batch will reopen it
+        connection.close()
+        if raise_on_failure == True:
+            raise exceptions.EmailNotSent(unicode(error))
+        return 0
+
 def mail_moderators(
             subject_line = '',
             body_text = '',
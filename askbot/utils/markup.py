@@ -4,14 +4,40 @@ such as optional link patterns, video embedding and
 Twitter-style @mentions"""
 
 import re
+import hashlib
 import logging
+import threading
+from django.conf import settings as django_settings
+from django.core import cache
 from askbot import const
 from askbot.conf import settings as askbot_settings
+from askbot.utils.html import sanitize_html
 from markdown2 import Markdown
 #url taken from http://regexlib.com/REDetails.aspx?regexp_id=501 by Brian Bothwell
 URL_RE = re.compile("((?<!(href|.src|data)=['\"])((http|https|ftp)\://([a-zA-Z0-9\.\-]+(\:[a-zA-Z0-9\.&amp;%\$\-]+)*@)*((25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9])\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9]|0)\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9]|0)\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[0-9])|localhost|([a-zA-Z0-9\-]+\.)*[a-zA-Z0-9\-]+\.(com|edu|gov|int|mil|net|org|biz|arpa|info|name|pro|aero|coop|museum|[a-zA-Z]{2}))(\:[0-9]+)*(/($|[a-zA-Z0-9\.\,\?\'\\\+&amp;%\$#\=~_\-]+))*))")
 
-def get_parser():
+#livesettings that affect the output of the parser
+MARKUP_SETTINGS = (
+    'ENABLE_MATHJAX',
+    'MARKUP_CODE_FRIENDLY',
+    'ENABLE_VIDEO_EMBEDDING',
+    'ENABLE_AUTO_LINKING',
+    'AUTO_LINK_PATTERNS',
+    'AUTO_LINK_URLS',
+)
+HTML_CACHE_KEY_TPL = 'markdown-html-%s'
+
+#parser keeps state during the conversion,
+#so each thread gets its own instance
+_local = threading.local()
+
+def get_html_cache_timeout():
+    return getattr(django_settings, 'ASKBOT_MARKDOWN_CACHE_TIMEOUT', 7*24*3600)
+
+def get_markup_settings():
+    return tuple([getattr(askbot_settings, name) for name in MARKUP_SETTINGS])
+
+def create_parser():
     """returns an instance of configured ``markdown2`` parser
     """
     extras = ['link-patterns', 'video']  
@@ -61,6 +87,51 @@ def get_parser():
                 link_patterns = link_patterns
             )
 
+def get_parser():
+    """returns configured ``markdown2`` parser,
+    the instance is reused until the markup settings change
+    """
+    markup_settings = get_markup_settings()
+    if getattr(_local, 'markup_settings', None) != markup_settings:
+        _local.parser = create_parser()
+        _local.markup_settings = markup_settings
+    return _local.parser
+
+def get_html_cache_key(text, markup_settings):
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    digest = hashlib.sha1(repr(markup_settings))
+    digest.update(text)
+    return HTML_CACHE_KEY_TPL % digest.hexdigest()
+
+def markdown_to_html_many(texts):
+    """returns dictionary text -> sanitized html
+    of the markdown texts, the html is cached by the hash of
+    the text and the markup settings, so that it is
+    shared by the posts and revisions with the same text"""
+    markup_settings = get_markup_settings()
+    texts_by_key = dict()
+    for text in texts:
+        texts_by_key[get_html_cache_key(text, markup_settings)] = text
+
+    cached_html = cache.cache.get_many(texts_by_key.keys())
+    html_by_text = dict()
+    new_html = dict()
+    for key, text in texts_by_key.items():
+        if key in cached_html:
+            html_by_text[text] = cached_html[key]
+        else:
+            html = sanitize_html(get_parser().convert(text))
+            html_by_text[text] = html
+            new_html[key] = html
+
+    if new_html:
+        cache.cache.set_many(new_html, get_html_cache_timeout())
+    return html_by_text
+
+def markdown_to_html(text):
+    """returns sanitized html of the markdown text"""
+    return markdown_to_html_many([text])[text]
 
 def format_mention_in_html(mentioned_user):
     """formats mention as url to the user profile"""
@@ -91,101 +162,103 @@ def extract_first_matching_mentioned_author(text, anticipated_authors):
             return author, text
     return None, text
 
+#name seed is up to 11 characters following the @ sign,
+#until a termination character or another @ sign
+MENTION_SEED_RE = re.compile(
+    '@([^@%s]{1,11})' % re.escape(const.TWITTER_STYLE_MENTION_TERMINATION_CHARS)
+)
+
 def extract_mentioned_name_seeds(text):
-    """Returns list of strings that
+    """Returns set of strings that
     follow the '@' symbols in the text.
-    The strings will be 10 characters long,
+    The strings will be 11 characters long,
     or shorter, if the subsequent character
     is one of the list accepted to be termination
     characters.
     """
-    extra_name_seeds = set()
-    while '@' in text:
-        pos = text.index('@')
-        text = text[pos+1:]#chop off prefix
-        name_seed = ''
-        for char in text:
-            if char in const.TWITTER_STYLE_MENTION_TERMINATION_CHARS:
-                extra_name_seeds.add(name_seed)
-                name_seed = ''
-                break
-            if len(name_seed) > 10:
-                extra_name_seeds.add(name_seed)
-                name_seed = ''
-                break
-            if char == '@':
-                if len(name_seed) > 0:
-                    extra_name_seeds.add(name_seed)
-                    name_seed = ''
-                break
-            name_seed += char
-        if len(name_seed) > 0:
-            #in case we run off the end of text
-            extra_name_seeds.add(name_seed)
+    return set(MENTION_SEED_RE.findall(text))
+
+class UsernameTrie(object):
+    """case insensitive prefix tree of the usernames,
+    built for the list of the anticipated authors of
+    the @mentions, the earlier authors in the list
+    take precedence when several usernames match"""
 
-    return extra_name_seeds
+    def __init__(self, authors):
+        self.root = dict()
+        for priority, author in enumerate(authors):
+            node = self.root
+            for char in author.username.lower():
+                node = node.setdefault(char, dict())
+            #None key holds the matching author
+            if None not in node:
+                node[None] = (priority, author)
+
+    def match(self, text, start):
+        """returns author with the username matching the
+        ``text`` from position ``start`` up to the end of text or a
+        termination character, and the end position of the username
+        in the text, or ``(None, start)`` if there is no match"""
+        best = None
+        node = self.root
+        text_len = len(text)
+        position = start
+        while position < text_len:
+            node = node.get(text[position].lower())
+            if node is None:
+                break
+            position += 1
+            if None in node:
+                if position == text_len or \
+                    text[position] in const.TWITTER_STYLE_MENTION_TERMINATION_CHARS:
+                    candidate = node[None]
+                    if best is None or candidate[0] < best[0]:
+                        best = candidate + (position,)
+        if best is None:
+            return None, start
+        return best[1], best[2]
 
 def mentionize_text(text, anticipated_authors):
     """Returns a tuple of two items:
     * modified text where @mentions are
       replaced with urls to the corresponding user profiles
     * list of users whose names matched the @mentions
+
+    The text is scanned once, names following the @ signs are
+    looked up in the :class:`UsernameTrie` of the anticipated authors.
     """
-    output = ''
+    output = list()
     mentioned_authors = list()
-    while '@' in text:
-        #the purpose of this loop is to convert any occurance of 
+    trie = None
+    #start of the text that is not yet copied to the output
+    segment_start = 0
+    pos = text.find('@')
+    while pos != -1:
+        #the purpose of this loop is to convert any occurance of
         #'@mention ' syntax
         #to user account links leading space is required unless @ is the first
-        #character in whole text, also, either a punctuation or 
-        #a ' ' char is required after the name
-        pos = text.index('@')
-
-        #save stuff before @mention to the output
-        output += text[:pos]#this works for pos == 0 too
-
-        if len(text) == pos + 1:
-            #finish up if the found @ is the last symbol
-            output += '@'
-            text = ''
-            break
-
-        if pos > 0:
-
-            if text[pos-1] in const.TWITTER_STYLE_MENTION_TERMINATION_CHARS:
-                #if there is a termination character before @mention
-                #indeed try to find a matching person
-                text = text[pos+1:]
-                mentioned_author, text = \
-                                    extract_first_matching_mentioned_author(
-                                                            text, 
-                                                            anticipated_authors
-                                                        )
-                if mentioned_author:
-                    mentioned_authors.append(mentioned_author)
-                    output += format_mention_in_html(mentioned_author)
-                else:
-                    output += '@'
-
-            else:
-                #if there isn't, i.e. text goes like something@mention,
-                #do not look up people
-                output += '@'
-                text = text[pos+1:]
+        #character in whole text (or follows an unmatched @),
+        #also, either a punctuation or a ' ' char is required after the name
+        output.append(text[segment_start:pos])
+        follows_word = pos > segment_start and \
+            text[pos-1] not in const.TWITTER_STYLE_MENTION_TERMINATION_CHARS
+        segment_start = pos + 1
+        if follows_word or pos == len(text) - 1:
+            #@ is the last symbol or text goes like something@mention,
+            #do not look up people
+            output.append('@')
         else:
-            #do this if @ is the first character
-            text = text[1:]
-            mentioned_author, text = \
-                                extract_first_matching_mentioned_author(
-                                                    text, 
-                                                    anticipated_authors
-                                                )
+            if trie is None:
+                trie = UsernameTrie(anticipated_authors)
+            mentioned_author, name_end = trie.match(text, pos + 1)
             if mentioned_author:
                 mentioned_authors.append(mentioned_author)
-                output += format_mention_in_html(mentioned_author)
+                output.append(format_mention_in_html(mentioned_author))
+                segment_start = name_end
             else:
-                output += '@'
+                output.append('@')
+        pos = text.find('@', segment_start)
 
     #append the rest of text that did not have @ symbols
-    output += text
-    return mentioned_authors, output
+    output.append(text[segment_start:])
+    return mentioned_authors, ''.join(output)
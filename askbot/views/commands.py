@@ -122,25 +122,20 @@ def process_vote(user = None, vote_direction = None, post = None):
         response_data['status'] = 1 #this means "cancel"
 
     else:
-        #this is a new vote
-        votes_left = user.get_unused_votes_today()
-        if votes_left <= 0:
-            raise exceptions.PermissionDenied(
-                            _('Sorry you ran out of votes for today')
-                        )
+        #this is a new vote, the daily vote limit is checked
+        #and the vote is counted in one step
+        if vote_direction == 'up':
+            vote = user.upvote(post = post, limit_votes = True)
+        else:
+            vote = user.downvote(post = post, limit_votes = True)
 
-        votes_left -= 1
+        votes_left = user.get_unused_votes_today()
         if votes_left <= \
             askbot_settings.VOTES_LEFT_WARNING_THRESHOLD:
             msg = _('You have %(votes_left)s votes left for today') \
                     % {'votes_left': votes_left }
             response_data['message'] = msg
 
-        if vote_direction == 'up':
-            vote = user.upvote(post = post)
-        else:
-            vote = user.downvote(post = post)
-
         response_data['count'] = post.score
         response_data['status'] = 0 #this means "not cancel", normal operation
 
@@ -253,11 +248,7 @@ def vote(request, id):
                                         vote_direction = vote_direction,
                                         post = post
                                     )
-
-            ####################################################################
-            if vote_type in ('1', '2'): # up/down-vote question
-                post.thread.update_summary_html() # regenerate question/thread summary html
-            ####################################################################
+            #summary html re-rendering is scheduled by the vote processing
 
         elif vote_type in ['7', '8']:
             #flag question or answer
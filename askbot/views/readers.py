@@ -30,11 +30,13 @@ from askbot.utils.diff import textDiff as htmldiff
 from askbot.forms import AnswerForm, ShowQuestionForm
 from askbot import models
 from askbot import schedules
-from askbot.models.tag import Tag
 from askbot import const
 from askbot.utils import functions
+from askbot.utils import markup
 from askbot.utils.decorators import anonymous_forbidden, ajax_only, get_only
 from askbot.search.state_manager import SearchState, DummySearchState
+from askbot.search import paginator as search_paginator
+from askbot.search import sidebar as search_sidebar
 from askbot.templatetags import extra_tags
 import askbot.conf
 from askbot.conf import settings as askbot_settings
@@ -43,6 +45,7 @@ from askbot.skins.loaders import render_into_skin, get_template #jinja2 template
 # used in index page
 #todo: - take these out of const or settings
 from askbot.models import Post, Vote
+from askbot.models.question import QUESTION_ORDER_BY_MAP
 
 INDEX_PAGE_SIZE = 30
 INDEX_AWARD_SIZE = 15
@@ -76,26 +79,49 @@ def questions(request, **kwargs):
 
     qs, meta_data = models.Thread.objects.run_advanced_search(request_user=request.user, search_state=search_state)
 
-    paginator = Paginator(qs, page_size)
+    # INFO: total count is cached per search state for a short time,
+    #       so that paging through the listing does not run COUNT on every request
+    questions_count = search_paginator.get_cached_count(qs, search_state, request.user)
+    order_by = QUESTION_ORDER_BY_MAP[search_state.sort]
+    use_keyset_pagination = search_paginator.supports_sort(order_by) and \
+        (search_paginator.is_enabled() or search_state.cursor)
+
+    if use_keyset_pagination:
+        paginator = search_paginator.KeysetPaginator(qs, order_by, page_size, questions_count)
+    else:
+        paginator = Paginator(qs, page_size)
+        paginator._count = questions_count
+        search_state.cursor = None
     if paginator.num_pages < search_state.page:
         search_state.page = 1
-    page = paginator.page(search_state.page)
+        search_state.cursor = None
 
-    page.object_list = list(page.object_list) # evaluate queryset
+    if use_keyset_pagination:
+        page = paginator.page(search_state.page, cursor=search_state.cursor)
+    else:
+        page = paginator.page(search_state.page)
+        page.object_list = list(page.object_list) # evaluate queryset
 
     # INFO: Because for the time being we need question posts and thread authors
     #       down the pipeline, we have to precache them in thread objects
     models.Thread.objects.precache_view_data_hack(threads=page.object_list)
-
-    related_tags = Tag.objects.get_related_to_search(threads=page.object_list, ignored_tag_names=meta_data.get('ignored_tag_names', []))
+    thread_summaries = models.Thread.objects.get_summary_html_for_threads(
+                                                page.object_list,
+                                                search_state
+                                            )
+
+    related_tags, contributors = search_sidebar.get_sidebar_data(
+                                    threads = page.object_list,
+                                    search_state = search_state,
+                                    user = request.user,
+                                    ignored_tag_names = meta_data.get('ignored_tag_names', [])
+                                )
     tag_list_type = askbot_settings.TAG_LIST_FORMAT
     if tag_list_type == 'cloud': #force cloud to sort by name
         related_tags = sorted(related_tags, key = operator.attrgetter('name'))
 
-    contributors = list(models.Thread.objects.get_thread_contributors(thread_list=page.object_list).only('id', 'username', 'gravatar'))
-
     paginator_context = {
-        'is_paginated' : (paginator.count > page_size),
+        'is_paginated' : (questions_count > page_size),
 
         'pages': paginator.num_pages,
         'page': search_state.page,
@@ -107,6 +133,18 @@ def questions(request, **kwargs):
         'base_url' : search_state.query_string(),
         'page_size' : page_size,
     }
+    if use_keyset_pagination:
+        paginator_context['keyset'] = True
+        paginator_context['page'] = page.number
+        if page.has_previous():
+            paginator_context['previous_url'] = search_state.change_cursor(
+                        page.previous_cursor(), page.previous_page_number()
+                    ).full_url()
+        if page.has_next():
+            paginator_context['next_url'] = search_state.change_cursor(
+                        page.next_cursor(), page.next_page_number()
+                    ).full_url()
+        paginator_context['first_url'] = search_state.change_page(1).full_url()
 
     # We need to pass the rss feed url based
     # on the search state to the template.
@@ -127,7 +165,7 @@ def questions(request, **kwargs):
     reset_method_count = len(filter(None, [search_state.query, search_state.tags, meta_data.get('author_name', None)]))
 
     if request.is_ajax():
-        q_count = paginator.count
+        q_count = questions_count
 
         if search_state.tags:
             question_counter = ungettext('%(q_num)s question, tagged', '%(q_num)s questions, tagged', q_count)
@@ -138,7 +176,7 @@ def questions(request, **kwargs):
         if q_count > page_size:
             paginator_tpl = get_template('main_page/paginator.html', request)
             paginator_html = paginator_tpl.render(Context({
-                'context': functions.setup_paginator(paginator_context),
+                'context': paginator_context,
                 'questions_count': q_count,
                 'page_size' : page_size,
                 'search_state': search_state,
@@ -149,6 +187,7 @@ def questions(request, **kwargs):
         questions_tpl = get_template('main_page/questions_loop.html', request)
         questions_html = questions_tpl.render(Context({
             'threads': page,
+            'thread_summaries': thread_summaries,
             'search_state': search_state,
             'reset_method_count': reset_method_count,
         }))
@@ -190,7 +229,8 @@ def questions(request, **kwargs):
             'page_size': page_size,
             'query': search_state.query,
             'threads' : page,
-            'questions_count' : paginator.count,
+            'thread_summaries': thread_summaries,
+            'questions_count' : questions_count,
             'reset_method_count': reset_method_count,
             'scope': search_state.scope,
             'show_sort_by_relevance': askbot.conf.should_show_sort_by_relevance(),
@@ -559,8 +599,13 @@ def revisions(request, id, object_name=None):
         post = get_object_or_404(models.Post, post_type='answer', id=id)
     revisions = list(models.PostRevision.objects.filter(post=post))
     revisions.reverse()
+    html_by_text = markup.markdown_to_html_many(
+                        [revision.text for revision in revisions]
+                    )
     for i, revision in enumerate(revisions):
-        revision.html = revision.as_html()
+        revision.html = revision.as_html(
+                            sanitized_html = html_by_text[revision.text]
+                        )
         if i == 0:
             revision.diff = revisions[i].html
             revision.summary = _('initial version')
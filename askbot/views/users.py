@@ -7,17 +7,14 @@ and other views showing profile-related information.
 Also this module includes the view listing all forum users.
 """
 import calendar
-import collections
 import functools
 import datetime
 import logging
 import operator
 
-from django.db.models import Count, Q
 from django.conf import settings as django_settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator, EmptyPage, InvalidPage
-from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse, HttpResponseForbidden
@@ -26,7 +23,6 @@ from django.utils.translation import ugettext as _
 from django.utils import simplejson
 from django.views.decorators import csrf
 
-from askbot.utils.slug import slugify
 from askbot.utils.html import sanitize_html
 from askbot.utils.mail import send_mail
 from askbot.utils.http import get_request_info
@@ -300,78 +296,20 @@ def user_stats(request, user, context):
     top_answer_count = len(top_answers)
 
     #
-    # Votes
+    # Votes, tags and badges are read from the statistics
+    # records maintained in askbot.models.profile_stats
     #
-    up_votes = models.Vote.objects.get_up_vote_count_from_user(user)
-    down_votes = models.Vote.objects.get_down_vote_count_from_user(user)
-    votes_today = models.Vote.objects.get_votes_count_today_from_user(user)
+    stats = models.profile_stats.get_stats(user)
+    up_votes = stats.up_votes
+    down_votes = stats.down_votes
+    votes_today = models.daily_counters.get_counter('votes', user.id)
     votes_total = askbot_settings.MAX_VOTES_PER_USER_PER_DAY
 
-    #
-    # Tags
-    #
-    # INFO: There's bug in Django that makes the following query kind of broken (GROUP BY clause is problematic):
-    #       http://stackoverflow.com/questions/7973461/django-aggregation-does-excessive-group-by-clauses
-    #       Fortunately it looks like it returns correct results for the test data
-    user_tags = models.Tag.objects.filter(threads__posts__author=user).distinct().\
-                    annotate(user_tag_usage_count=Count('threads')).\
-                    order_by('-user_tag_usage_count')[:const.USER_VIEW_DATA_SIZE]
-    user_tags = list(user_tags) # evaluate
-
-#    tags = models.Post.objects.filter(author=user).values('id', 'thread', 'thread__tags')
-#    post_ids = set()
-#    thread_ids = set()
-#    tag_ids = set()
-#    for t in tags:
-#        post_ids.add(t['id'])
-#        thread_ids.add(t['thread'])
-#        tag_ids.add(t['thread__tags'])
-#        if t['thread__tags'] == 11:
-#            print t['thread'], t['id']
-#    import ipdb; ipdb.set_trace()
-
-    #
-    # Badges/Awards (TODO: refactor into Managers/QuerySets when a pattern emerges; Simplify when we get rid of Question&Answer models)
-    #
-    post_type = ContentType.objects.get_for_model(models.Post)
-
-    user_awards = models.Award.objects.filter(user=user).select_related('badge')
-
-    awarded_post_ids = []
-    for award in user_awards:
-        if award.content_type_id == post_type.id:
-            awarded_post_ids.append(award.object_id)
-
-    awarded_posts = models.Post.objects.filter(id__in=awarded_post_ids)\
-                    .select_related('thread') # select related to avoid additional queries in Post.get_absolute_url()
-
-    awarded_posts_map = {}
-    for post in awarded_posts:
-        awarded_posts_map[post.id] = post
-
-    badges_dict = collections.defaultdict(list)
-
-    for award in user_awards:
-        # Fetch content object
-        if award.content_type_id == post_type.id:
-            #here we go around a possibility of awards
-            #losing the content objects when the content
-            #objects are deleted for some reason
-            awarded_post = awarded_posts_map.get(award.object_id, None)
-            if awarded_post is not None:
-                #protect from awards that are associated with deleted posts
-                award.content_object = awarded_post
-                award.content_object_is_post = True
-            else:
-                award.content_object_is_post = False
-        else:
-            award.content_object_is_post = False
-
-        # "Assign" to its Badge
-        badges_dict[award.badge].append(award)
-
-    badges = badges_dict.items()
-    badges.sort(key=operator.itemgetter(1), reverse=True)
+    user_tags = models.profile_stats.get_tag_usage(
+                                    user,
+                                    const.USER_VIEW_DATA_SIZE
+                                )
+    badges = stats.get_badges()
 
     data = {
         'active_tab':'users',
@@ -403,146 +341,13 @@ def user_stats(request, user, context):
     return render_into_skin('user_profile/user_stats.html', context, request)
 
 def user_recent(request, user, context):
+    try:
+        page = int(request.GET.get('page', '1'))
+    except ValueError:
+        page = 1
+    page = max(page, 1)
 
-    def get_type_name(type_id):
-        for item in const.TYPE_ACTIVITY:
-            if type_id in item:
-                return item[1]
-
-    class Event(object):
-        is_badge = False
-        def __init__(self, time, type, title, summary, answer_id, question_id):
-            self.time = time
-            self.type = get_type_name(type)
-            self.type_id = type
-            self.title = title
-            self.summary = summary
-            slug_title = slugify(title)
-            self.title_link = reverse(
-                                'question',
-                                kwargs={'id':question_id}
-                            ) + u'%s' % slug_title
-            if int(answer_id) > 0:
-                self.title_link += '#%s' % answer_id
-
-    class AwardEvent(object):
-        is_badge = True
-        def __init__(self, time, type, content_object, badge):
-            self.time = time
-            self.type = get_type_name(type)
-            self.content_object = content_object
-            self.badge = badge
-
-    activities = []
-
-    # TODO: Don't process all activities here for the user, only a subset ([:const.USER_VIEW_DATA_SIZE])
-    for activity in models.Activity.objects.filter(user=user):
-
-        # TODO: multi-if means that we have here a construct for which a design pattern should be used
-
-        # ask questions
-        if activity.activity_type == const.TYPE_ACTIVITY_ASK_QUESTION:
-            q = activity.content_object
-            if q.deleted:
-                activities.append(Event(
-                    time=activity.active_at,
-                    type=activity.activity_type,
-                    title=q.thread.title,
-                    summary='', #q.summary,  # TODO: was set to '' before, but that was probably wrong
-                    answer_id=0,
-                    question_id=q.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_ANSWER:
-            ans = activity.content_object
-            question = ans.thread._question_post()
-            if not ans.deleted and not question.deleted:
-                activities.append(Event(
-                    time=activity.active_at,
-                    type=activity.activity_type,
-                    title=ans.thread.title,
-                    summary=question.summary,
-                    answer_id=ans.id,
-                    question_id=question.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_COMMENT_QUESTION:
-            cm = activity.content_object
-            q = cm.parent
-            assert q.is_question()
-            if not q.deleted:
-                activities.append(Event(
-                    time=cm.added_at,
-                    type=activity.activity_type,
-                    title=q.thread.title,
-                    summary='',
-                    answer_id=0,
-                    question_id=q.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_COMMENT_ANSWER:
-            cm = activity.content_object
-            ans = cm.parent
-            assert ans.is_answer()
-            question = ans.thread._question_post()
-            if not ans.deleted and not question.deleted:
-                activities.append(Event(
-                    time=cm.added_at,
-                    type=activity.activity_type,
-                    title=ans.thread.title,
-                    summary='',
-                    answer_id=ans.id,
-                    question_id=question.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_UPDATE_QUESTION:
-            q = activity.content_object
-            if not q.deleted:
-                activities.append(Event(
-                    time=activity.active_at,
-                    type=activity.activity_type,
-                    title=q.thread.title,
-                    summary=q.summary,
-                    answer_id=0,
-                    question_id=q.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_UPDATE_ANSWER:
-            ans = activity.content_object
-            question = ans.thread._question_post()
-            if not ans.deleted and not question.deleted:
-                activities.append(Event(
-                    time=activity.active_at,
-                    type=activity.activity_type,
-                    title=ans.thread.title,
-                    summary=ans.summary,
-                    answer_id=ans.id,
-                    question_id=question.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_MARK_ANSWER:
-            ans = activity.content_object
-            question = ans.thread._question_post()
-            if not ans.deleted and not question.deleted:
-                activities.append(Event(
-                    time=activity.active_at,
-                    type=activity.activity_type,
-                    title=ans.thread.title,
-                    summary='',
-                    answer_id=0,
-                    question_id=question.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_PRIZE:
-            award = activity.content_object
-            activities.append(AwardEvent(
-                time=award.awarded_at,
-                type=activity.activity_type,
-                content_object=award.content_object,
-                badge=award.badge,
-            ))
-
-    activities.sort(key=operator.attrgetter('time'), reverse=True)
+    activities, has_next = models.timeline.get_user_events(user, page = page)
 
     data = {
         'active_tab': 'users',
@@ -550,7 +355,10 @@ def user_recent(request, user, context):
         'tab_name' : 'recent',
         'tab_description' : _('recent user activity'),
         'page_title' : _('profile - recent activity'),
-        'activities' : activities[:const.USER_VIEW_DATA_SIZE]
+        'activities' : activities,
+        'page': page,
+        'has_previous': page > 1,
+        'has_next': has_next,
     }
     context.update(data)
     return render_into_skin('user_profile/user_recent.html', context, request)
@@ -30,7 +30,7 @@ from askbot.skins.loaders import render_into_skin
 from askbot.utils import decorators
 from askbot.utils.functions import diff_date
 from askbot.utils import url_utils
-from askbot.utils.file_utils import store_file
+from askbot.utils.file_utils import store_file, HashingUploadHandler
 from askbot.templatetags import extra_filters_jinja as template_filters
 from askbot.importers.stackexchange import management as stackexchange#todo: may change
 
@@ -50,6 +50,14 @@ def upload(request):#ajax upload file to a question or answer
     """view that handles file upload via Ajax
     """
 
+    #the handler must be installed before the request body is parsed,
+    #it hashes the file and stops the upload of a too large file early
+    upload_handler = HashingUploadHandler(
+                            request,
+                            max_size = settings.ASKBOT_MAX_UPLOAD_FILE_SIZE
+                        )
+    request.upload_handlers.insert(0, upload_handler)
+
     # check upload permission
     result = ''
     error = ''
@@ -62,8 +70,16 @@ def upload(request):#ajax upload file to a question or answer
 
         request.user.assert_can_upload_file()
 
+        # check file size
+        # byte
+        size_error = _("maximum upload file size is %(file_size)sK") % \
+                {'file_size': settings.ASKBOT_MAX_UPLOAD_FILE_SIZE}
+        files = request.FILES
+        if 'file-upload' in upload_handler.rejected_fields:
+            raise exceptions.PermissionDenied(size_error)
+
         # check file type
-        f = request.FILES['file-upload']
+        f = files['file-upload']
         
         #todo: extension checking should be replaced with mimetype checking
         #and this must be part of the form validation
@@ -74,16 +90,16 @@ def upload(request):#ajax upload file to a question or answer
                     {'file_types': file_types}
             raise exceptions.PermissionDenied(msg)
 
-        # generate new file name and storage object
-        file_storage, new_file_name, file_url = store_file(f)
-        # check file size
-        # byte
-        size = file_storage.size(new_file_name)
-        if size > settings.ASKBOT_MAX_UPLOAD_FILE_SIZE:
-            file_storage.delete(new_file_name)
-            msg = _("maximum upload file size is %(file_size)sK") % \
-                    {'file_size': settings.ASKBOT_MAX_UPLOAD_FILE_SIZE}
-            raise exceptions.PermissionDenied(msg)
+        #the handler is not used if the body was parsed before
+        #the view by some middleware, then the size is checked here
+        if f.size > settings.ASKBOT_MAX_UPLOAD_FILE_SIZE:
+            raise exceptions.PermissionDenied(size_error)
+
+        # store the file under the hash of its contents
+        file_storage, new_file_name, file_url = store_file(
+                                    f,
+                                    upload_handler.hashes.get('file-upload')
+                                )
 
     except exceptions.PermissionDenied, e:
         error = unicode(e)
@@ -107,6 +123,8 @@ def upload(request):#ajax upload file to a question or answer
     xml = xml_template % (result, error, file_url)
 
     return HttpResponse(xml, mimetype="application/xml")
+#the body is parsed in the view, after the upload handler is installed
+upload.HANDLES_UPLOADS = True
 
 def __import_se_data(dump_file):
     """non-view function that imports the SE data